@@ -0,0 +1,425 @@
+"""Shared, content addressed store for image assets.
+
+Items ask the store for an image by file path and get back an ImageAsset
+keyed by the hash of the file's bytes (the same name the .upg container
+stores it under). Every item showing the same picture - on any page of any
+open document - shares one asset and its decoded data. Hashing a large
+scan takes a while, so a file not hashed before is keyed by its path,
+size and mtime at first; the first background decode of it hashes it too,
+and the asset takes its content name (or joins an asset already showing
+the same bytes) when the hash arrives.
+
+Assets are not decoded at full resolution for display. draw_image() picks
+a proxy level for the on-screen size (level n is the image scaled down by
+2**n) and decodes it on the global QThreadPool with QImageReader scaled
+decoding, drawing a lower resolution proxy or a placeholder until it
+arrives. Levels that would still be larger than HUGE_SIDE are decoded as
+TILE_SIZE tiles, and only the visible ones. Printers and PDF writers get
+the full resolution image.
+
+Assets count the items using them. Decoded data is trimmed to the store's
+memory budget: least recently used tiles first, then everything held by
+assets nobody uses any more.
+"""
+import math
+import time
+import weakref
+
+from PyQt6.QtWidgets import QWidget
+from PyQt6.QtCore import Qt, QObject, QRect, QRectF, QSize, QRunnable, QThreadPool, pyqtSignal
+from PyQt6.QtGui import QPixmap, QImage, QImageReader, QColor, QPen, QBrush, QPdfWriter
+from PyQt6.QtPrintSupport import QPrinter
+
+from src.engine.upg_container import file_identity, known_asset_name, remember_asset_name, hash_asset_file
+
+# Proxies whose longest side would exceed this are decoded as tiles instead
+HUGE_SIDE = 4096
+TILE_SIZE = 512
+
+
+def _pixmap_bytes(pixmap):
+    return pixmap.width() * pixmap.height() * max(pixmap.depth(), 8) // 8
+
+
+class _DecodeSignals(QObject):
+    # asset key, request (level or (level, column, row)), decoded image
+    decoded = pyqtSignal(str, object, QImage)
+    # asset key, content name of the file
+    hashed = pyqtSignal(str, str)
+
+
+class _DecodeTask(QRunnable):
+    """Decode (part of) an image file at a reduced size on a worker thread, hashing it first if asked"""
+    def __init__(self, signals, key, request, path, scaled_size, clip_rect=None, hash_file=False):
+        super().__init__()
+        self.signals = signals
+        self.key = key
+        self.request = request
+        self.path = path
+        self.scaled_size = scaled_size
+        self.clip_rect = clip_rect
+        self.hash_file = hash_file
+
+    def run(self):
+        if self.hash_file:
+            try:
+                self.signals.hashed.emit(self.key, hash_asset_file(self.path))
+            except OSError:
+                pass
+        reader = QImageReader(self.path)
+        if self.clip_rect is not None:
+            reader.setClipRect(self.clip_rect)
+        # Formats such as JPEG decode directly at the reduced size
+        reader.setScaledSize(self.scaled_size)
+        self.signals.decoded.emit(self.key, self.request, reader.read())
+
+
+class ImageAsset:
+    """One distinct image, shared by every item displaying it"""
+    def __init__(self, store, key, path, identity=None):
+        self.store = store
+        self.key = key
+        self.path = path
+        self.identity = identity    # file_identity() of the file while `key` stands in for its hash
+        self.users = weakref.WeakSet()
+        self.source_size = QImageReader(path).size()  # Reads the header only
+        self.proxies = {}      # level -> QPixmap
+        self.tiles = {}        # (level, column, row) -> QPixmap
+        self.tile_used = {}    # (level, column, row) -> last use
+        self._full = None
+        self._pending = set()
+        self.last_used = 0.0
+
+    def ref_count(self):
+        return len(self.users)
+
+    def is_valid(self):
+        return self.source_size.isValid() and not self.source_size.isEmpty()
+
+    def is_decoded(self):
+        return self._full is not None or bool(self.proxies) or bool(self.tiles)
+
+    def pixmap(self):
+        """The full resolution image, decoded synchronously (export and print)"""
+        self.last_used = time.monotonic()
+        if self._full is None:
+            self._full = QPixmap(self.path)
+            self.store.trim()
+        return self._full
+
+    def decoded_bytes(self):
+        pixmaps = list(self.proxies.values()) + list(self.tiles.values())
+        if self._full is not None:
+            pixmaps.append(self._full)
+        return sum(_pixmap_bytes(pixmap) for pixmap in pixmaps)
+
+    def drop_decoded(self):
+        self._full = None
+        self.proxies.clear()
+        self.tiles.clear()
+        self.tile_used.clear()
+
+    # Levels
+
+    def level_for(self, source_px_per_device_px):
+        """Coarsest level that still has at least one image pixel per device pixel"""
+        if source_px_per_device_px <= 1:
+            return 0
+        return int(math.floor(math.log2(source_px_per_device_px)))
+
+    def level_size(self, level):
+        return QSize(max(1, math.ceil(self.source_size.width() / 2 ** level)),
+                     max(1, math.ceil(self.source_size.height() / 2 ** level)))
+
+    def is_tiled(self, level):
+        size = self.level_size(level)
+        return max(size.width(), size.height()) > HUGE_SIDE
+
+    def overview_level(self):
+        """Finest level that is decoded as a single proxy"""
+        level = 0
+        while self.is_tiled(level):
+            level += 1
+        return level
+
+    def proxy(self, level, wait=False):
+        """The proxy for `level`, or None while it is being decoded in the background"""
+        self.last_used = time.monotonic()
+        if level == 0 and self._full is not None:
+            return self._full
+        proxy = self.proxies.get(level)
+        if proxy is None:
+            if wait:
+                reader = QImageReader(self.path)
+                reader.setScaledSize(self.level_size(level))
+                proxy = self.proxies[level] = QPixmap.fromImage(reader.read())
+                self.store.trim()
+            else:
+                self.store.request(self, level, self.level_size(level))
+        return proxy
+
+    def best_available(self):
+        """Any decoded single-image proxy (finest first), or None"""
+        if self._full is not None:
+            return self._full
+        if self.proxies:
+            return self.proxies[min(self.proxies)]
+        return None
+
+    def smallest_available(self):
+        """The coarsest decoded single-image proxy (or the full image), or None"""
+        if self.proxies:
+            return self.proxies[max(self.proxies)]
+        return self._full
+
+    def tile(self, level, column, row, wait=False):
+        key = (level, column, row)
+        self.last_used = self.tile_used[key] = time.monotonic()
+        tile = self.tiles.get(key)
+        if tile is None:
+            clip, size = self._tile_geometry(level, column, row)
+            if wait:
+                reader = QImageReader(self.path)
+                reader.setClipRect(clip)
+                reader.setScaledSize(size)
+                tile = self.tiles[key] = QPixmap.fromImage(reader.read())
+                self.store.trim()
+            else:
+                self.tile_used.pop(key, None)
+                self.store.request(self, key, size, clip)
+        return tile
+
+    def _tile_geometry(self, level, column, row):
+        """Source clip rect and decoded size of a tile"""
+        step = TILE_SIZE * 2 ** level
+        clip = QRect(column * step, row * step, step, step).intersected(
+            QRect(0, 0, self.source_size.width(), self.source_size.height()))
+        size = QSize(max(1, math.ceil(clip.width() / 2 ** level)),
+                     max(1, math.ceil(clip.height() / 2 ** level)))
+        return clip, size
+
+    def _decoded(self, request, image):
+        self._pending.discard(request)
+        if image.isNull():
+            return
+        pixmap = QPixmap.fromImage(image)
+        if isinstance(request, tuple):
+            self.tiles[request] = pixmap
+            self.tile_used[request] = time.monotonic()
+        else:
+            self.proxies[request] = pixmap
+        for user in list(self.users):
+            user.update()
+
+
+class AssetStore:
+    """Content addressed image assets with a budget for decoded data"""
+    def __init__(self, memory_budget=192 * 1024 * 1024):
+        self.memory_budget = memory_budget
+        self.assets = {}  # key -> ImageAsset
+        self.thread_pool = QThreadPool.globalInstance()
+        self._signals = _DecodeSignals()
+        self._signals.decoded.connect(self._on_decoded)
+        self._signals.hashed.connect(self._on_hashed)
+        self._renamed = {}  # Key an asset had before its hash arrived -> its content name
+
+    def acquire(self, path, user):
+        """Register `user` (an item) as showing the image at `path`. Returns the asset or None.
+
+        Doesn't read the file beyond its image header: a file not hashed
+        yet is keyed by its identity until a decode task hashes it.
+        """
+        identity = file_identity(path)
+        if identity is None:
+            return None
+        name = known_asset_name(identity)
+        key = name if name is not None else "file:%s:%d:%r" % identity
+        asset = self.assets.get(key)
+        if asset is None:
+            asset = self.assets[key] = ImageAsset(self, key, path, None if name is not None else identity)
+        asset.users.add(user)
+        return asset
+
+    def release(self, asset, user):
+        """`user` no longer shows `asset`"""
+        asset.users.discard(user)
+        self.trim()
+
+    def request(self, asset, request, scaled_size, clip_rect=None):
+        """Decode a proxy level or tile of `asset` in the background (once)"""
+        if request in asset._pending:
+            return
+        # The first decode of a file not hashed yet hashes it on the way
+        hash_file = asset.identity is not None and not asset._pending
+        asset._pending.add(request)
+        self.thread_pool.start(_DecodeTask(self._signals, asset.key, request, asset.path,
+                                           scaled_size, clip_rect, hash_file))
+
+    def _on_decoded(self, key, request, image):
+        asset = self.assets.get(self._renamed.get(key, key))
+        if asset is not None:
+            asset._decoded(request, image)
+            self.trim()
+
+    def _on_hashed(self, key, name):
+        asset = self.assets.get(key)
+        if asset is None or asset.identity is None:
+            return
+        remember_asset_name(asset.identity, name)
+        del self.assets[key]
+        self._renamed[key] = name
+        same = self.assets.get(name)
+        if same is None:
+            asset.key = name
+            asset.identity = None
+            self.assets[name] = asset
+            return
+        # Another file with the same bytes is already shown: its users take that asset
+        same._pending |= asset._pending
+        for user in list(asset.users):
+            user.image_asset = same
+            same.users.add(user)
+            user.update()
+        asset.drop_decoded()
+
+    def memory_used(self):
+        """Bytes held by decoded pixmaps"""
+        return sum(asset.decoded_bytes() for asset in self.assets.values())
+
+    def stats(self):
+        decoded = [asset for asset in self.assets.values() if asset.is_decoded()]
+        return {"assets": len(self.assets), "decoded": len(decoded),
+                "referenced": sum(1 for asset in self.assets.values() if asset.ref_count()),
+                "tiles": sum(len(asset.tiles) for asset in decoded),
+                "memory_used": sum(asset.decoded_bytes() for asset in decoded)}
+
+    def trim(self):
+        """Drop decoded data until within budget: old tiles first, then unreferenced assets"""
+        used = self.memory_used()
+        if used > self.memory_budget:
+            tiles = sorted((last_used, asset, key) for asset in self.assets.values()
+                           for key, last_used in asset.tile_used.items() if key in asset.tiles)
+            for last_used, asset, key in tiles:
+                if used <= self.memory_budget:
+                    break
+                used -= _pixmap_bytes(asset.tiles.pop(key))
+                del asset.tile_used[key]
+
+        for asset in sorted(self.assets.values(), key=lambda a: a.last_used):
+            if used <= self.memory_budget:
+                break
+            if asset.ref_count() == 0:
+                used -= asset.decoded_bytes()
+                asset.drop_decoded()
+
+        # Unreferenced assets without decoded data are just bookkeeping
+        for key in [key for key, asset in self.assets.items()
+                    if asset.ref_count() == 0 and not asset.is_decoded() and not asset._pending]:
+            del self.assets[key]
+
+
+_shared_store = None
+
+
+def shared_store():
+    """The asset store shared by all open documents"""
+    global _shared_store
+    if _shared_store is None:
+        _shared_store = AssetStore()
+    return _shared_store
+
+
+def device_scale(painter):
+    """Device pixels per item unit for the painter's current transform"""
+    transform = painter.worldTransform()
+    scale = math.hypot(transform.m11(), transform.m12())
+    device = painter.device()
+    if device is not None:
+        scale *= device.devicePixelRatioF()
+    return scale
+
+
+def draw_placeholder(painter, target):
+    """Drawn where an image is still being decoded (or can't be read)"""
+    painter.save()
+    painter.setPen(QPen(QColor("#bbbbbb"), 0, Qt.PenStyle.DashLine))
+    painter.setBrush(QBrush(QColor("#eeeeee")))
+    painter.drawRect(target)
+    painter.restore()
+
+
+def draw_image(painter, target, asset, exposed=None, wait=None):
+    """Draw `asset` stretched over `target` (item coordinates) at display resolution.
+
+    `exposed` limits tiled drawing to the visible part of the item. `wait`
+    forces (True) or avoids (False) synchronous decoding; by default only
+    off-screen renders such as thumbnails wait. Returns True if the image
+    was drawn at the resolution it needs, False if something coarser or a
+    placeholder was drawn while decoding continues.
+    """
+    if asset is None or not asset.is_valid():
+        draw_placeholder(painter, target)
+        return False
+
+    device = painter.device()
+    if isinstance(device, (QPrinter, QPdfWriter)):
+        painter.drawPixmap(target, asset.pixmap(), QRectF(asset.pixmap().rect()))
+        return True
+
+    if wait is None:
+        # Off-screen renders happen once and can't wait for a worker
+        wait = not isinstance(device, QWidget)
+    needed = max(target.width() * device_scale(painter), 1.0)
+    level = asset.level_for(asset.source_size.width() / needed)
+
+    if asset.is_tiled(level):
+        return _draw_tiles(painter, target, asset, level, exposed, wait)
+
+    pixmap = asset.proxy(level, wait)
+    complete = pixmap is not None
+    if pixmap is None:
+        pixmap = asset.best_available()
+    if pixmap is None:
+        # Show something as soon as possible: the overview is cheap to decode
+        asset.proxy(max(level, asset.overview_level()))
+        draw_placeholder(painter, target)
+        return False
+    painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+    return complete
+
+
+def _draw_tiles(painter, target, asset, level, exposed, wait):
+    sx = target.width() / asset.source_size.width()
+    sy = target.height() / asset.source_size.height()
+    visible = target if exposed is None else target.intersected(exposed)
+    if visible.isEmpty():
+        return True
+
+    # Coarse background for tiles that are still decoding
+    overview = asset.proxy(asset.overview_level(), wait) or asset.best_available()
+    complete = True
+    step = TILE_SIZE * 2 ** level
+    first_col = int((visible.left() - target.left()) / sx // step)
+    last_col = int((visible.right() - target.left()) / sx // step)
+    first_row = int((visible.top() - target.top()) / sy // step)
+    last_row = int((visible.bottom() - target.top()) / sy // step)
+    for row in range(max(first_row, 0), last_row + 1):
+        for column in range(max(first_col, 0), last_col + 1):
+            clip, _ = asset._tile_geometry(level, column, row)
+            if clip.isEmpty():
+                continue
+            tile_target = QRectF(target.left() + clip.x() * sx, target.top() + clip.y() * sy,
+                                 clip.width() * sx, clip.height() * sy)
+            tile = asset.tile(level, column, row, wait)
+            if tile is not None:
+                painter.drawPixmap(tile_target, tile, QRectF(tile.rect()))
+                continue
+            complete = False
+            if overview is not None:
+                ox = overview.width() / asset.source_size.width()
+                oy = overview.height() / asset.source_size.height()
+                painter.drawPixmap(tile_target, overview,
+                                   QRectF(clip.x() * ox, clip.y() * oy, clip.width() * ox, clip.height() * oy))
+            else:
+                draw_placeholder(painter, tile_target)
+    return complete
@@ -0,0 +1,399 @@
+"""Background autosave into crash-recovery journals.
+
+Every open document gets a journal: a small zip file next to the document
+(``.<name>.upg.recovery``), or in RECOVERY_DIR for untitled documents.
+A journal holds snapshots of the pages that changed since the document was
+last saved (every page, for a document never saved), plus a manifest
+describing the whole page order::
+
+    manifest/<generation>.json    page order; each page points either at a
+                                  snapshot in the journal or at its entry in
+                                  the saved document (highest generation wins)
+    snapshots/<uid>-<revision>.json
+
+Snapshots are taken on the GUI thread with Page.to_dict(), one page at a
+time and only while the document is idle, so the cost per timer tick is
+bounded. Encoding, compressing and writing happen on a worker thread.
+"""
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+import zipfile
+
+from PyQt6.QtCore import QObject, QTimer
+
+from src.engine.upg_container import MANIFEST_DIR, FORMAT_VERSION, _latest_manifest_name, _read_page, read_page_entry
+
+logger = logging.getLogger(__name__)
+
+RECOVERY_DIR = os.path.join(os.path.expanduser("~"), ".page26", "recovery")
+JOURNAL_SUFFIX = ".recovery"
+SNAPSHOTS_DIR = "snapshots/"
+
+# Rewrite the journal once stale snapshots outweigh the live ones
+COMPACT_MIN_GARBAGE = 512 * 1024
+
+
+def journal_path_for(document_path):
+    """Where the journal of a document (or of an untitled one, if None) is kept"""
+    if not document_path:
+        return os.path.join(RECOVERY_DIR, f"untitled-{uuid.uuid4().hex}{JOURNAL_SUFFIX}")
+    directory, name = os.path.split(os.path.abspath(document_path))
+    if not os.access(directory, os.W_OK):
+        digest = hashlib.sha1(os.path.abspath(document_path).encode('utf-8')).hexdigest()[:16]
+        return os.path.join(RECOVERY_DIR, f"{name}-{digest}{JOURNAL_SUFFIX}")
+    return os.path.join(directory, f".{name}{JOURNAL_SUFFIX}")
+
+
+def _ref_path(journal_path):
+    digest = hashlib.sha1(os.path.abspath(journal_path).encode('utf-8')).hexdigest()
+    return os.path.join(RECOVERY_DIR, digest + ".ref")
+
+
+def _register(journal_path):
+    # Journals next to documents are found at startup through these small files
+    os.makedirs(RECOVERY_DIR, exist_ok=True)
+    with open(_ref_path(journal_path), 'w', encoding='utf-8') as f:
+        f.write(os.path.abspath(journal_path))
+
+
+def find_journals():
+    """Paths of all journals left behind by earlier sessions, newest first"""
+    if not os.path.isdir(RECOVERY_DIR):
+        return []
+    journals = []
+    for name in os.listdir(RECOVERY_DIR):
+        if not name.endswith(".ref"):
+            continue
+        ref = os.path.join(RECOVERY_DIR, name)
+        try:
+            with open(ref, 'r', encoding='utf-8') as f:
+                path = f.read().strip()
+        except OSError:
+            continue
+        if os.path.exists(path) and zipfile.is_zipfile(path):
+            journals.append(path)
+        else:
+            os.remove(ref)
+    return sorted(journals, key=os.path.getmtime, reverse=True)
+
+
+def discard_journal(journal_path):
+    """Delete a journal and its registration"""
+    for path in (journal_path, _ref_path(journal_path)):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class JournalReader:
+    """Reads a recovery journal with the same interface as UpgReader.
+
+    Recovered snapshots are parsed up front so the journal can be deleted
+    right away; pages that were unchanged are still read lazily from the
+    saved document.
+    """
+    def __init__(self, path):
+        self.path = path
+        with zipfile.ZipFile(path, 'r') as zf:
+            manifest_name = _latest_manifest_name(zf.namelist())
+            if manifest_name is None:
+                raise ValueError(f"{path} is not a recovery journal (no manifest)")
+            self.manifest = json.loads(zf.read(manifest_name).decode('utf-8'))
+            self._snapshots = {}
+            for info in self.manifest.get("pages", []):
+                if info.get("snapshot"):
+                    self._snapshots[info["snapshot"]] = _read_page(zf, info["snapshot"])
+        self.document_path = self.manifest.get("document")
+        saved = [info["entry"] for info in self.manifest.get("pages", [])
+                 if not info.get("snapshot") and info.get("entry")]
+        if saved:
+            # Fail now, while the journal is kept, rather than when a page is first shown
+            try:
+                with zipfile.ZipFile(self.document_path, 'r') as zf:
+                    missing = set(saved) - set(zf.namelist())
+            except (OSError, TypeError, zipfile.BadZipFile):
+                missing = saved
+            if missing:
+                raise ValueError(f"{path} needs pages of {self.document_path or 'a document'} that can't be read")
+
+    def page_count(self):
+        return len(self.manifest.get("pages", []))
+
+    def page_infos(self):
+        """Manifest records in document order. Recovered pages are flagged "modified"."""
+        infos = []
+        for info in self.manifest.get("pages", []):
+            info = dict(info)
+            if info.get("snapshot"):
+                info["entry"] = info["snapshot"]
+                info["modified"] = True
+            infos.append(info)
+        return infos
+
+    def page_loader(self, entry):
+        if entry in self._snapshots:
+            return self._snapshots[entry]
+        if entry is None:
+            # Journals of older versions left out pages never saved nor edited: they were blank
+            return None
+        return lambda: read_page_entry(self.document_path, entry)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JournalWriter:
+    """Appends page snapshots to a journal. Runs on the autosave worker thread."""
+    def __init__(self, path):
+        self.path = path
+        self.generation = 0
+        self.exists = False       # True once the journal has been written
+        self._snapshot_sizes = {}  # entry -> compressed size
+
+    def write(self, manifest, snapshots):
+        """Write new snapshots (entry -> page dict) and the manifest. Returns bytes written."""
+        mode = 'a' if self.exists and os.path.exists(self.path) else 'w'
+        if mode == 'w':
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._snapshot_sizes = {}
+        before = os.path.getsize(self.path) if mode == 'a' else 0
+
+        self.generation += 1
+        manifest = dict(manifest, generation=self.generation, version=FORMAT_VERSION)
+        with zipfile.ZipFile(self.path, mode, zipfile.ZIP_DEFLATED) as zf:
+            for entry, data in snapshots.items():
+                zf.writestr(entry, json.dumps(data, ensure_ascii=False))
+            zf.writestr(f"{MANIFEST_DIR}{self.generation}.json", json.dumps(manifest, ensure_ascii=False))
+            self._snapshot_sizes.update(
+                (info.filename, info.compress_size) for info in zf.infolist() if info.filename in snapshots)
+        with open(self.path, 'ab') as f:
+            os.fsync(f.fileno())
+        if not self.exists:
+            _register(self.path)
+            self.exists = True
+
+        live = {info["snapshot"] for info in manifest["pages"] if info.get("snapshot")}
+        garbage = sum(size for entry, size in self._snapshot_sizes.items() if entry not in live)
+        live_size = sum(self._snapshot_sizes.get(entry, 0) for entry in live)
+        if garbage > COMPACT_MIN_GARBAGE and garbage > live_size:
+            self._compact(manifest, live)
+        return os.path.getsize(self.path) - before
+
+    def _compact(self, manifest, live):
+        tmp_path = self.path + ".tmp"
+        with zipfile.ZipFile(self.path, 'r') as old, \
+                zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for entry in live:
+                zf.writestr(entry, old.read(entry))
+            self.generation = 1
+            manifest = dict(manifest, generation=1)
+            zf.writestr(f"{MANIFEST_DIR}1.json", json.dumps(manifest, ensure_ascii=False))
+            self._snapshot_sizes = {info.filename: info.compress_size
+                                    for info in zf.infolist() if info.filename in live}
+        os.replace(tmp_path, self.path)
+
+    def discard(self):
+        discard_journal(self.path)
+        self.exists = False
+        self._snapshot_sizes = {}
+        self.generation = 0
+
+
+class AutosaveStats:
+    """Cost of autosaving one document, for tuning and diagnostics"""
+    def __init__(self):
+        self.journal_writes = 0
+        self.pages_snapshotted = 0
+        self.snapshot_ms_last = 0.0   # GUI thread time of the last timer tick
+        self.snapshot_ms_max = 0.0
+        self.write_ms_last = 0.0      # Worker thread time of the last journal write
+        self.bytes_written = 0
+
+    def summary(self):
+        return (f"{self.journal_writes} autosave(s), {self.pages_snapshotted} page snapshot(s), "
+                f"GUI {self.snapshot_ms_last:.1f} ms (max {self.snapshot_ms_max:.1f} ms), "
+                f"write {self.write_ms_last:.1f} ms, {self.bytes_written} bytes")
+
+
+class AutosaveSession:
+    """Autosave state of one open document"""
+    def __init__(self, document_path):
+        self.document_path = document_path
+        self.writer = JournalWriter(journal_path_for(document_path))
+        self.stats = AutosaveStats()
+        self.journaled = {}       # page uid -> (revision, snapshot entry)
+        self.pending = {}         # snapshots taken for the next write
+        self.last_revisions = None
+        self.last_change = 0.0    # When the revisions were last seen changing
+        self.first_unsaved = None # When the oldest unjournaled change was seen
+        self.future = None
+
+    @property
+    def journal_path(self):
+        return self.writer.path
+
+
+def _needs_snapshot(session, page):
+    """Whether a page can't be read back from the saved document, so the journal must hold it"""
+    return page.is_dirty() or page.container_entry is None or not session.document_path
+
+
+def _write_job(writer, manifest, snapshots):
+    start = time.perf_counter()
+    written = writer.write(manifest, snapshots)
+    return written, (time.perf_counter() - start) * 1000
+
+
+class AutosaveManager(QObject):
+    """Periodically journals the unsaved pages of every open document.
+
+    `documents` is a callable returning (key, document_path, page_manager)
+    for each open document. Autosave runs once a document has been idle for
+    `idle_delay` seconds, or after `max_delay` seconds of continuous editing.
+    At most `tick_budget_ms` of GUI time is spent per timer tick; larger
+    snapshots continue on the next tick.
+    """
+    def __init__(self, documents, interval_ms=1000, idle_delay=2.0, max_delay=30.0,
+                 tick_budget_ms=8.0, parent=None):
+        super().__init__(parent)
+        self.documents = documents
+        self.idle_delay = idle_delay
+        self.max_delay = max_delay
+        self.tick_budget_ms = tick_budget_ms
+        self.sessions = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="autosave")
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start()
+
+    def session_for(self, key):
+        return self.sessions.get(key)
+
+    def tick(self):
+        start = time.perf_counter()
+        now = time.monotonic()
+        open_keys = set()
+        for key, document_path, page_manager in self.documents():
+            open_keys.add(key)
+            session = self.sessions.get(key)
+            if session is None or session.document_path != document_path:
+                if session is not None:
+                    self._discard_session(session)
+                session = self.sessions[key] = AutosaveSession(document_path)
+            self._collect_write(session)
+            if (time.perf_counter() - start) * 1000 < self.tick_budget_ms:
+                self._autosave(session, page_manager, now, start)
+
+        # Documents closed normally don't need recovering
+        for key in set(self.sessions) - open_keys:
+            self._discard_session(self.sessions.pop(key))
+
+    def _autosave(self, session, page_manager, now, start):
+        revisions = [(page.uid, page.revision) for page in page_manager.pages]
+        if revisions != session.last_revisions:
+            session.last_revisions = revisions
+            session.last_change = now
+            if session.first_unsaved is None:
+                session.first_unsaved = now
+
+        if session.first_unsaved is None or session.future is not None:
+            return
+        if not session.writer.exists and not any(page.is_dirty() for page in page_manager.pages):
+            # Nothing edited yet (e.g. a new untitled document): nothing worth recovering
+            session.first_unsaved = None
+            return
+        idle = now - session.last_change >= self.idle_delay
+        overdue = now - session.first_unsaved >= self.max_delay
+        if not (idle or overdue):
+            return
+
+        # Snapshot changed pages until this tick's budget is spent
+        tick_start = time.perf_counter()
+        for page in page_manager.pages:
+            if not _needs_snapshot(session, page):
+                continue
+            journaled = session.journaled.get(page.uid)
+            if journaled and journaled[0] == page.revision:
+                continue
+            entry = f"{SNAPSHOTS_DIR}{page.uid}-{page.revision}.json"
+            if entry in session.pending:
+                continue
+            session.pending[entry] = (page.uid, page.revision, page.to_dict())
+            session.stats.pages_snapshotted += 1
+            if (time.perf_counter() - start) * 1000 >= self.tick_budget_ms:
+                break
+        else:
+            self._submit(session, page_manager)
+
+        elapsed = (time.perf_counter() - tick_start) * 1000
+        session.stats.snapshot_ms_last = elapsed
+        session.stats.snapshot_ms_max = max(session.stats.snapshot_ms_max, elapsed)
+
+    def _submit(self, session, page_manager):
+        snapshots = {}
+        for entry, (uid, revision, data) in session.pending.items():
+            snapshots[entry] = data
+            session.journaled[uid] = (revision, entry)
+        session.pending = {}
+
+        pages = []
+        for page in page_manager.pages:
+            journaled = session.journaled.get(page.uid)
+            snapshot = journaled[1] if journaled and _needs_snapshot(session, page) else None
+            pages.append({"uid": page.uid, "entry": page.container_entry, "snapshot": snapshot,
+                          "revision": page.revision, "width": page.width, "height": page.height})
+        manifest = {"document": session.document_path,
+                    "current_page": page_manager.current_page_index,
+                    "saved_at": time.time(),
+                    "pages": pages}
+        session.first_unsaved = None
+        if not any(info["snapshot"] for info in pages) and not session.writer.exists:
+            return
+        session.future = self._executor.submit(_write_job, session.writer, manifest, snapshots)
+
+    def _collect_write(self, session):
+        future = session.future
+        if future is None or not future.done():
+            return
+        session.future = None
+        try:
+            written, write_ms = future.result()
+        except OSError as e:
+            logger.warning("autosave failed for %s: %s", session.journal_path, e)
+            return
+        session.stats.journal_writes += 1
+        session.stats.bytes_written += written
+        session.stats.write_ms_last = write_ms
+
+    def document_saved(self, key):
+        """The document was saved: its journal is no longer needed"""
+        session = self.sessions.pop(key, None)
+        if session is not None:
+            self._discard_session(session)
+
+    def _discard_session(self, session):
+        if session.future is not None:
+            # Let the pending write land before deleting the file it writes to
+            concurrent.futures.wait([session.future])
+        session.writer.discard()
+
+    def shutdown(self):
+        """Stop autosaving and remove the journals of all open documents"""
+        self.timer.stop()
+        for session in self.sessions.values():
+            self._discard_session(session)
+        self.sessions = {}
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,327 @@
+"""Replace All as one planned batch.
+
+Every match in the document is found first: literal text through the
+search index (with its Urdu normalization) or a regular expression over
+each frame's raw text. Then each page is edited box by box. A box gets
+all its replacements inside one edit block, so Qt lays it out once.
+Pages in view are done straight away; the rest are done from the event
+loop a slice at a time, with progress reported through `on_progress`.
+Story flow is held meanwhile, so text doesn't move between pages that
+are done and pages that aren't.
+
+The whole batch is one TextReplaceCommand on the view's undo stack. Flow
+moves text between linked boxes after the replace, so the command
+records its edits as offsets in the story (the text of a chain of boxes).
+Before undoing or redoing, it checks that the story text is still the
+text it left behind. A story edited since is skipped rather than
+corrupted.
+"""
+import re
+import time
+from bisect import bisect_right
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QTextCursor
+
+from src.engine.text_flow import shared_story_flow, story_head, story_boxes, cut_head, append_fragment, is_empty
+from src.engine.undo_stack import UndoCommand
+
+# Longest stretch of background replacing done before returning to the event loop
+REPLACE_SLICE_MS = 30
+# QTextDocument's paragraph separator in raw text
+PARAGRAPH_SEPARATOR = " "
+
+
+# Stories
+
+def story_text(boxes):
+    """Text of a chain of boxes, with a paragraph separator between boxes that don't continue a paragraph"""
+    parts = []
+    continues = True
+    for box in boxes:
+        text = box.document().toRawText()
+        if not text:
+            continue
+        if parts and not continues:
+            parts.append(PARAGRAPH_SEPARATOR)
+        parts.append(text)
+        continues = box.story_continues
+    return "".join(parts)
+
+
+def story_starts(boxes):
+    """Offset in story_text(boxes) of each box's text"""
+    starts = []
+    position = 0
+    continues = None
+    for box in boxes:
+        length = box.document().characterCount() - 1
+        if length and continues is False:
+            position += 1
+        starts.append(position)
+        if length:
+            position += length
+            continues = box.story_continues
+    return starts
+
+
+def _gather(box, length):
+    """Pull the text of the boxes after `box` into it until it holds `length` characters"""
+    document = box.document()
+    following = box.next_box
+    while document.characterCount() - 1 < length and following is not None:
+        source = following.document()
+        if not is_empty(source):
+            fragment, first_format, _ = cut_head(source, None)
+            append_fragment(document, fragment, first_format, separate=not box.story_continues)
+            box.story_continues = following.story_continues
+        following = following.next_box
+
+
+def _replace_range(boxes, starts, start, end, insert):
+    """Replace story_text(boxes)[start:end] with `insert` (text or a QTextDocumentFragment).
+
+    `starts` are the box offsets before the edit; edits have to be made
+    from the end of the story backwards so the ones still to do keep them.
+    """
+    i = max(bisect_right(starts, start) - 1, 0)
+    while i > 0 and is_empty(boxes[i].document()):
+        i -= 1
+    box = boxes[i]
+    local_start, local_end = start - starts[i], end - starts[i]
+    if local_end > box.document().characterCount() - 1:
+        # Flow has moved part of the range on to the next box
+        _gather(box, local_end)
+    cursor = QTextCursor(box.document())
+    cursor.setPosition(local_start)
+    cursor.setPosition(local_end, QTextCursor.MoveMode.KeepAnchor)
+    cursor.beginEditBlock()
+    if isinstance(insert, str):
+        cursor.insertText(insert)
+    else:
+        cursor.insertFragment(insert)
+    cursor.endEditBlock()
+
+
+class _Edit:
+    """One replacement, at story offsets before (`before_start`) and after it (`after_start`)"""
+    __slots__ = ("before_start", "after_start", "old_length", "old_fragment", "new_text")
+
+    def __init__(self, before_start, after_start, old_length, old_fragment, new_text):
+        self.before_start = before_start
+        self.after_start = after_start
+        self.old_length = old_length
+        self.old_fragment = old_fragment    # QTextDocumentFragment, so undo restores the formatting
+        self.new_text = new_text
+
+
+class _StoryEdits:
+    __slots__ = ("head", "edits", "after_hash", "before_hash")
+
+    def __init__(self, head, edits, after_hash):
+        self.head = head
+        self.edits = edits              # In story order
+        self.after_hash = after_hash    # hash() of the story text with the edits made
+        self.before_hash = None         # ... and undone (known once undone)
+
+
+class TextReplaceCommand(UndoCommand):
+    """The replacements of a batch, undone and redone as one step"""
+    def __init__(self, stories, boxes, text="Replace All"):
+        super().__init__(text)
+        self.stories = stories
+        self.boxes = boxes              # Boxes the batch edited
+        self.skipped = 0                # Stories left alone by the last undo/redo (edited meanwhile)
+
+    def undo(self):
+        self._apply(undo=True)
+
+    def redo(self):
+        self._apply(undo=False)
+
+    def _apply(self, undo):
+        flow = shared_story_flow()
+        flow.flush()
+        self.skipped = 0
+        for story in self.stories:
+            if story.head.scene() is None:
+                self.skipped += 1
+                continue
+            boxes = story_boxes(story.head)
+            if hash(story_text(boxes)) != (story.after_hash if undo else story.before_hash):
+                self.skipped += 1
+                continue
+            starts = story_starts(boxes)
+            for edit in reversed(story.edits):
+                if undo:
+                    _replace_range(boxes, starts, edit.after_start, edit.after_start + len(edit.new_text),
+                                   edit.old_fragment)
+                else:
+                    _replace_range(boxes, starts, edit.before_start, edit.before_start + edit.old_length,
+                                   edit.new_text)
+            text_hash = hash(story_text(boxes))
+            if undo:
+                story.before_hash = text_hash
+            else:
+                story.after_hash = text_hash
+            for box in boxes:
+                box.document().clearUndoRedoStacks()
+                flow.schedule(box)
+
+    def cost(self):
+        return 64 + sum(64 + 2 * (edit.old_length + len(edit.new_text))
+                        for story in self.stories for edit in story.edits)
+
+    def scenes(self):
+        return {box.scene() for box in self.boxes if box.scene() is not None}
+
+
+class BatchReplace:
+    """Replaces every match of a search in a document, pages in view first, the rest a slice at a time.
+
+    `pattern` is literal text compared through the search index's
+    normalization, or a regular expression (`regex`) matched against the
+    raw text, with `replace_text` as its template (\\1, \\g<name>).
+    `record(command)` is called once finished, before on_finished, with
+    the TextReplaceCommand (None if nothing was replaced).
+    """
+    def __init__(self, index, pattern, replace_text, case_sensitive=False, ignore_diacritics=True, regex=False,
+                 first_pages=(), record=None):
+        self.index = index
+        self.replace_text = replace_text
+        self.options = (case_sensitive, ignore_diacritics)
+        self.literal = None if regex else pattern
+        self.regex = (re.compile(pattern, 0 if case_sensitive else re.IGNORECASE) if regex else None)
+        self.first_pages = list(first_pages)
+        self.record = record
+        self.replaced = 0
+        self.pages_total = 0
+        self.pages_done = 0
+        self.cancelled = False
+        self.finished = False
+        self.command = None             # TextReplaceCommand of what was replaced, once finished
+        self.scenes = set()             # Scenes of the boxes edited so far (kept from hibernating)
+
+        # Callbacks
+        self.on_progress = None         # on_progress(pages_done, pages_total, replaced)
+        self.on_finished = None         # on_finished(batch)
+
+        self._pages = []
+        self._edits = {}                # box -> [(start after the box's edits, old length, fragment, new text)]
+
+    def plan(self):
+        """The pages with matches, those in view first"""
+        pages = self.index.page_manager.pages
+        if self.literal is not None:
+            seen = set()
+            with_matches = []
+            for match in self.index.find_all(self.literal, *self.options):
+                if match.page.uid not in seen:
+                    seen.add(match.page.uid)
+                    with_matches.append(match.page)
+        else:
+            self.index.refresh()
+            with_matches = [page for page in pages
+                            if any(self.regex.search(_regex_text(text)) for text in self.index.texts(page))]
+        first = [page for page in self.first_pages if page in with_matches]
+        return first + [page for page in with_matches if page not in first]
+
+    def start(self):
+        shared_story_flow().hold()
+        self._pages = self.plan()
+        self.pages_total = len(self._pages)
+        # What the user is looking at is done before returning
+        while self._pages and self._pages[0] in self.first_pages:
+            self._replace_page(self._pages.pop(0))
+        if self.on_progress:
+            self.on_progress(self.pages_done, self.pages_total, self.replaced)
+        QTimer.singleShot(0, self._step)
+
+    def cancel(self):
+        """Stop; what was replaced so far stays (and undoes as one step)"""
+        self.cancelled = True
+
+    def _step(self):
+        deadline = time.perf_counter() + REPLACE_SLICE_MS / 1000.0
+        while self._pages and not self.cancelled and time.perf_counter() < deadline:
+            self._replace_page(self._pages.pop(0))
+        if self._pages and not self.cancelled:
+            if self.on_progress:
+                self.on_progress(self.pages_done, self.pages_total, self.replaced)
+            QTimer.singleShot(0, self._step)
+        else:
+            self._finish()
+
+    def _replace_page(self, page):
+        if page not in self.index.page_manager.pages:
+            return
+        boxes = self.index.boxes(page)
+        spans = [[] for _ in boxes]
+        if self.literal is not None:
+            for frame, start, end in self.index.matches_on(page, self.literal, *self.options):
+                spans[frame].append((start, end, self.replace_text))
+        else:
+            for frame, box in enumerate(boxes):
+                for match in self.regex.finditer(_regex_text(box.document().toRawText())):
+                    spans[frame].append((match.start(), match.end(), match.expand(self.replace_text)))
+        for box, box_spans in zip(boxes, spans):
+            if box_spans:
+                self._replace_in_box(box, box_spans)
+        self.pages_done += 1
+
+    def _replace_in_box(self, box, spans):
+        """Make all replacements [(start, end, text)] of a box in one edit block"""
+        document = box.document()
+        cursor = QTextCursor(document)
+        made = []
+        cursor.beginEditBlock()
+        for start, end, text in reversed(spans):
+            cursor.setPosition(start)
+            cursor.setPosition(min(end, document.characterCount() - 1), QTextCursor.MoveMode.KeepAnchor)
+            made.append((start, cursor.selectionEnd() - start, cursor.selection(), text))
+            cursor.insertText(text)
+        cursor.endEditBlock()
+        document.clearUndoRedoStacks()
+
+        # Offsets once all of them are made
+        shift = 0
+        edits = self._edits.setdefault(box, [])
+        self.scenes.add(box.scene())
+        for start, old_length, fragment, text in reversed(made):
+            edits.append((start + shift, old_length, fragment, text))
+            shift += len(text) - old_length
+        self.replaced += len(made)
+
+    def _finish(self):
+        self.finished = True
+        # In story offsets, as flow is about to move text between linked boxes
+        stories = []
+        heads = {}
+        for box in self._edits:
+            heads.setdefault(story_head(box), []).append(box)
+        for head, edited in heads.items():
+            boxes = story_boxes(head)
+            starts = dict(zip(boxes, story_starts(boxes)))
+            after = []
+            for box in edited:
+                after.extend((starts[box] + start, old_length, fragment, text)
+                             for start, old_length, fragment, text in self._edits[box])
+            after.sort(key=lambda edit: edit[0])
+            edits = []
+            shift = 0
+            for start, old_length, fragment, text in after:
+                edits.append(_Edit(start - shift, start, old_length, fragment, text))
+                shift += len(text) - old_length
+            stories.append(_StoryEdits(head, edits, hash(story_text(boxes))))
+        if stories:
+            self.command = TextReplaceCommand(stories, list(self._edits))
+        shared_story_flow().release()
+        if self.record:
+            self.record(self.command)
+        if self.on_finished:
+            self.on_finished(self)
+
+
+def _regex_text(text):
+    # Paragraphs are lines to a regular expression (same length, so offsets hold)
+    return text.replace(PARAGRAPH_SEPARATOR, "\n")
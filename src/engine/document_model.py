@@ -0,0 +1,249 @@
+"""Qt-free page records.
+
+Plain Python records for everything a page contains, so pages that
+aren't built can be kept, searched and counted without a scene.
+Records use __slots__ and share interned styles to stay small; polygon
+and line geometry is kept in array('d').
+
+Unmaterialized pages are stored as PageRecords, and Page.to_record()
+gives a built page's current content in the same form. Search
+(SearchIndex) and word counts (DocumentStats) read the stories of
+records for pages that aren't built; a story's plain text is the raw
+text its QTextDocument would have, so both agree with built pages.
+
+The record dicts are the same as Page.to_dict() produces, so the model
+reads .upg containers and document streams directly.
+"""
+from array import array
+from html.parser import HTMLParser
+import re
+
+
+_styles = {}
+
+
+def intern_style(style):
+    """Shared, immutable form of a run style (a dict of CSS-like properties)"""
+    key = tuple(sorted(style.items()))
+    return _styles.setdefault(key, key)
+
+
+class Run:
+    """Text with a single style"""
+    __slots__ = ("text", "style")
+
+    def __init__(self, text, style=()):
+        self.text = text
+        self.style = style
+
+    def style_dict(self):
+        return dict(self.style)
+
+
+_CSS_PROPERTY = re.compile(r"\s*([-\w]+)\s*:\s*([^;]+)")
+
+
+# Separators of QTextDocument.toRawText()
+PARAGRAPH_SEPARATOR = "\u2029"
+LINE_SEPARATOR = "\u2028"
+
+
+class _RunParser(HTMLParser):
+    """Splits the rich text HTML written by QTextDocument.toHtml() into runs.
+
+    The text of the runs is the document's raw text: paragraphs are
+    separated by U+2029 and line breaks within one are U+2028.
+    """
+    BLOCK_TAGS = {"p", "li", "h1", "h2", "h3", "h4", "h5", "h6", "div", "tr"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.runs = []
+        self._stack = [{}]
+        self._skip = 0
+        self._blocks = 0
+        self._empty_block = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("head", "style", "title"):
+            self._skip += 1
+            return
+        if tag == "br":
+            # An empty paragraph is written as one holding a <br />
+            if not self._empty_block:
+                self._append(LINE_SEPARATOR)
+            return
+        attrs = dict(attrs)
+        if tag in self.BLOCK_TAGS:
+            if self._blocks:
+                self._append(PARAGRAPH_SEPARATOR)
+            self._blocks += 1
+            self._empty_block = "-qt-paragraph-type:empty" in (attrs.get("style") or "")
+        style = dict(self._stack[-1])
+        for name, value in _CSS_PROPERTY.findall(attrs.get("style") or ""):
+            style[name.lower()] = value.strip().strip("'\"")
+        if attrs.get("dir"):
+            style["direction"] = attrs["dir"]
+        if tag == "b" or tag == "strong":
+            style["font-weight"] = "700"
+        elif tag == "i" or tag == "em":
+            style["font-style"] = "italic"
+        elif tag == "u":
+            style["text-decoration"] = "underline"
+        self._stack.append(style)
+
+    def handle_endtag(self, tag):
+        if tag in ("head", "style", "title"):
+            self._skip = max(self._skip - 1, 0)
+            return
+        if tag != "br" and len(self._stack) > 1:
+            self._stack.pop()
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        # Line breaks in the HTML source are not part of the text
+        data = data.replace("\n", "")
+        if data:
+            self._append(data, self._stack[-1])
+
+    def _append(self, text, style=None):
+        style = intern_style(style if style is not None else self._stack[-1])
+        if self.runs and self.runs[-1].style is style:
+            self.runs[-1].text += text
+        else:
+            self.runs.append(Run(text, style))
+
+
+class Story:
+    """The text of a text frame.
+
+    `html` is kept as written by the editor so the frame can be rebuilt
+    exactly; runs and plain text are derived from it on demand.
+    """
+    __slots__ = ("html", "_runs")
+
+    def __init__(self, html=""):
+        self.html = html
+        self._runs = None
+
+    def runs(self):
+        if self._runs is None:
+            parser = _RunParser()
+            parser.feed(self.html)
+            parser.close()
+            self._runs = parser.runs
+        return self._runs
+
+    def plain_text(self):
+        """The frame's text as QTextDocument.toRawText() gives it"""
+        return "".join(run.text for run in self.runs())
+
+    def set_html(self, html):
+        self.html = html
+        self._runs = None
+
+
+class ItemRecord:
+    """One frame or shape on a page.
+
+    `kind` is the item registry type name ("text", "rect", "image", ...).
+    Type specific values that are not geometry are kept in `props`.
+    """
+    __slots__ = ("kind", "x", "y", "z", "rotation", "geometry", "story", "props", "children")
+
+    # Keys stored as flat float arrays instead of lists
+    GEOMETRY_KEYS = {"rect": "rect", "ellipse": "rect", "line": "line", "polygon": "points"}
+    COMMON_KEYS = ("type", "x", "y", "z", "rotation", "content", "children")
+
+    def __init__(self, kind, x=0.0, y=0.0, z=0.0, rotation=0.0):
+        self.kind = kind
+        self.x = x
+        self.y = y
+        self.z = z
+        self.rotation = rotation
+        self.geometry = None
+        self.story = None
+        self.props = None
+        self.children = None
+
+    @classmethod
+    def from_dict(cls, data):
+        record = cls(data.get("type"), data.get("x", 0.0), data.get("y", 0.0),
+                     data.get("z", 0.0), data.get("rotation", 0.0))
+        geometry_key = cls.GEOMETRY_KEYS.get(record.kind)
+        if geometry_key and geometry_key in data:
+            values = data[geometry_key]
+            if values and isinstance(values[0], (list, tuple)):
+                values = [v for point in values for v in point]
+            record.geometry = array('d', values)
+        if "content" in data:
+            record.story = Story(data["content"])
+        if "children" in data:
+            record.children = [cls.from_dict(child) for child in data["children"]]
+        props = {key: value for key, value in data.items()
+                 if key not in cls.COMMON_KEYS and key != geometry_key}
+        record.props = props or None
+        return record
+
+    def to_dict(self):
+        data = {"type": self.kind}
+        if self.props:
+            data.update(self.props)
+        geometry_key = self.GEOMETRY_KEYS.get(self.kind)
+        if self.geometry is not None and geometry_key:
+            values = list(self.geometry)
+            if geometry_key == "points":
+                values = [[values[i], values[i + 1]] for i in range(0, len(values), 2)]
+            data[geometry_key] = values
+        if self.story is not None:
+            data["content"] = self.story.html
+        if self.children is not None:
+            data["children"] = [child.to_dict() for child in self.children]
+        data.update({"x": self.x, "y": self.y, "z": self.z, "rotation": self.rotation})
+        return data
+
+    @property
+    def image_path(self):
+        return self.props.get("image_path") if self.props else None
+
+    def walk(self):
+        """This record and, recursively, its group children"""
+        yield self
+        for child in self.children or ():
+            yield from child.walk()
+
+
+class PageRecord:
+    """A page: its size, identity and items (bottom to top)"""
+    __slots__ = ("uid", "width", "height", "page_number", "revision", "items")
+
+    def __init__(self, uid, width=794, height=1123, page_number=1, revision=0, items=None):
+        self.uid = uid
+        self.width = width
+        self.height = height
+        self.page_number = page_number
+        self.revision = revision
+        self.items = items if items is not None else []
+
+    @classmethod
+    def from_dict(cls, data, revision=0):
+        return cls(data.get("uid"), data.get("width", 794), data.get("height", 1123),
+                   data.get("page_number", 1), revision,
+                   [ItemRecord.from_dict(item) for item in data.get("items", [])])
+
+    def to_dict(self):
+        return {"uid": self.uid, "width": self.width, "height": self.height,
+                "page_number": self.page_number,
+                "items": [item.to_dict() for item in self.items]}
+
+    def iter_item_dicts(self):
+        for item in self.items:
+            yield item.to_dict()
+
+    def walk_items(self):
+        for item in self.items:
+            yield from item.walk()
+
+    def stories(self):
+        return [item.story for item in self.walk_items() if item.story is not None]
@@ -0,0 +1,87 @@
+"""Page hibernation: releasing the scenes of pages nobody is looking at.
+
+Every live page keeps a QGraphicsScene with all its items and text
+documents. When the live pages of all open documents are estimated to use
+more than the memory budget, the least recently viewed pages are
+hibernated: their scene is dropped and the page goes back to being a
+record (see Page.hibernate). Pages of inactive documents go first. Touching
+a hibernated page's `scene` (switch_page, rendering, editing) rebuilds it
+transparently.
+
+The pages the active document is showing are never hibernated, nor pages
+the document's guard wants kept (undo history, linked text frames). Pages
+of inactive documents can go even if their window shows them, current
+page included: the window builds its page again when it is activated or
+next painted.
+"""
+import time
+
+from PyQt6.QtCore import QObject, QTimer
+
+
+class HibernationManager(QObject):
+    """Keeps the live pages of all open documents within a memory budget.
+
+    `documents` is a callable returning (key, page_manager, active) for each
+    open document. Pages viewed less than `min_idle` seconds ago are left
+    alone (this also protects freshly prefetched neighbours). At most
+    `tick_budget_ms` of GUI time is spent per timer tick.
+    """
+    def __init__(self, documents, memory_budget=128 * 1024 * 1024, min_idle=10.0,
+                 interval_ms=2000, tick_budget_ms=8.0, parent=None):
+        super().__init__(parent)
+        self.documents = documents
+        self.memory_budget = memory_budget
+        self.min_idle = min_idle
+        self.tick_budget_ms = tick_budget_ms
+        self.pages_hibernated = 0
+        self.timer = QTimer(self)
+        self.timer.setInterval(interval_ms)
+        self.timer.timeout.connect(self.tick)
+        self.timer.start()
+
+    def tick(self):
+        start = time.perf_counter()
+        now = time.monotonic()
+        live = []
+        total = 0
+        for key, page_manager, active in self.documents():
+            for page in page_manager.pages:
+                if page.is_materialized():
+                    size = page.memory_estimate()
+                    total += size
+                    live.append((active, page.last_viewed, size, page, page_manager))
+        if total <= self.memory_budget:
+            return
+
+        # Inactive documents first, then least recently viewed
+        live.sort(key=lambda entry: (entry[0], entry[1]))
+        for active, last_viewed, size, page, page_manager in live:
+            if total <= self.memory_budget or (time.perf_counter() - start) * 1000 >= self.tick_budget_ms:
+                break
+            if now - last_viewed < self.min_idle:
+                continue
+            if page_manager.hibernate_page(page, in_view=active):
+                total -= size
+                self.pages_hibernated += 1
+
+    def stats(self):
+        """Live / hibernated page counts and estimated live memory over all documents"""
+        counts = {"live": 0, "hibernated": 0, "unloaded": 0, "live_bytes": 0,
+                  "budget": self.memory_budget, "total_hibernations": self.pages_hibernated}
+        for key, page_manager, active in self.documents():
+            for page in page_manager.pages:
+                if page.is_materialized():
+                    counts["live"] += 1
+                    counts["live_bytes"] += page.memory_estimate()
+                elif page.hibernated:
+                    counts["hibernated"] += 1
+                else:
+                    counts["unloaded"] += 1
+        return counts
+
+    def summary(self):
+        counts = self.stats()
+        return (f"{counts['live']} live pages ({counts['live_bytes'] / (1024 * 1024):.1f} of "
+                f"{counts['budget'] / (1024 * 1024):.0f} MB), {counts['hibernated']} hibernated, "
+                f"{counts['unloaded']} not loaded")
@@ -1,38 +1,51 @@
-from PyQt6.QtCore import Qt
+import logging
+import os
+
+from src.engine.keyboard_layout import DEFAULT_LAYOUT, KeySequencer, load_layout
+
+# Set PAGE26_TRACE_KEYS=1 to log every key through the input pipeline. Checked
+# once at import, so with tracing off a key press costs one global lookup.
+TRACE_KEYS = bool(os.environ.get("PAGE26_TRACE_KEYS"))
+logger = logging.getLogger(__name__)
+
 
 class InputHandler:
-    def __init__(self):
-        self.phonetic_map = {
-            'a': 'ا', 'A': 'آ', 'b': 'ب', 'B': 'ب', 'c': 'چ', 'C': 'ث',
-            'd': 'د', 'D': 'ڈ', 'e': 'ع', 'E': 'ے', 'f': 'ف', 'F': 'غ',
-            'g': 'گ', 'G': 'غ', 'h': 'ح', 'H': 'ھ', 'i': 'ی', 'I': 'ی',
-            'j': 'ج', 'J': 'ض', 'k': 'ک', 'K': 'خ', 'l': 'ل', 'L': 'ل',
-            'm': 'م', 'M': 'م', 'n': 'ن', 'N': 'ں', 'o': 'ہ', 'O': 'ہ',
-            'p': 'پ', 'P': 'پ', 'q': 'ق', 'Q': 'ق', 'r': 'ر', 'R': 'ڑ',
-            's': 'س', 'S': 'ص', 't': 'ت', 'T': 'ٹ', 'u': 'ء', 'U': 'ئ',
-            'v': 'ط', 'V': 'ظ', 'w': 'و', 'W': 'و', 'x': 'ش', 'X': 'ژ',
-            'y': 'ے', 'Y': 'ے', 'z': 'ز', 'Z': 'ذ',
-            ' ': ' ', '.': '۔', ',': '،', '?': '؟'
-        }
+    def __init__(self, layout_name=DEFAULT_LAYOUT):
         self.current_language = 'UR'  # Track current language
+        self.sequencer = KeySequencer(load_layout(layout_name))
+
+    @property
+    def layout(self):
+        return self.sequencer.layout
 
     def set_language(self, lang):
         """Set current input language"""
         self.current_language = lang
-        print(f"DEBUG: Language set to {lang}")  # Debug output
+        self.sequencer.reset()
+        if TRACE_KEYS:
+            logger.debug("language set to %s", lang)
+
+    def set_layout(self, name):
+        """Switch to the keyboard layout `name` (see keyboard_layout.available_layouts)"""
+        self.sequencer = KeySequencer(load_layout(name))
+        if TRACE_KEYS:
+            logger.debug("layout set to %s", name)
+
+    def reset(self):
+        """The caret moved: the next key starts a new sequence"""
+        self.sequencer.reset()
 
     def process_key(self, event):
+        """(characters to delete before the caret, text to insert) for a key press, None to let it through"""
         if self.current_language == 'EN':
             return None  # Let default English input through
-            
+
         text = event.text()
-        if not text:
+        if len(text) != 1:
+            self.sequencer.reset()
             return None
-            
-        # Debug output
-        print(f"DEBUG: Processing key '{text}', language={self.current_language}")
-            
-        # Return mapped Urdu character
-        mapped_char = self.phonetic_map.get(text, text)
-        print(f"DEBUG: Mapped '{text}' to '{mapped_char}'")
-        return mapped_char
\ No newline at end of file
+
+        edit = self.sequencer.feed(text)
+        if TRACE_KEYS:
+            logger.debug("key %r -> %r", text, edit)
+        return edit
@@ -0,0 +1,261 @@
+"""Serialization of scene items, one registered handler per item type.
+
+Every handler turns an item into a plain dict (JSON compatible) and back.
+Position, z-order and rotation are common to all items and handled here,
+so handlers only deal with what is specific to their type. Items whose
+class has no handler (page background, guides, selection handles) are
+skipped.
+"""
+from PyQt6.QtWidgets import (QGraphicsItem, QGraphicsItemGroup,
+                             QGraphicsProxyWidget, QTableWidget, QTableWidgetItem)
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QColor, QPen, QBrush
+
+from src.engine.text_box import TextBox
+from src.engine.shape_items import ResizableRectItem, ResizableEllipseItem, ResizableLineItem, PolygonItem, ImageItem
+
+
+class ItemType:
+    """How to serialize one kind of item"""
+    def __init__(self, name, cls, to_dict, from_dict):
+        self.name = name
+        self.cls = cls
+        self.to_dict = to_dict        # item -> dict
+        self.from_dict = from_dict    # dict -> new item (not yet in a scene)
+
+
+_types_by_name = {}
+_types_by_class = {}
+
+
+def register_item_type(name, cls, to_dict, from_dict):
+    """Register (or replace) the handler for items of class `cls`, stored as type `name`"""
+    item_type = ItemType(name, cls, to_dict, from_dict)
+    _types_by_name[name] = item_type
+    _types_by_class[cls] = item_type
+    return item_type
+
+
+def item_type_for(item):
+    """Handler for `item`, looked up along its class hierarchy (None if unsupported)"""
+    if isinstance(item, QGraphicsProxyWidget) and not isinstance(item.widget(), QTableWidget):
+        return None
+    for cls in type(item).__mro__:
+        item_type = _types_by_class.get(cls)
+        if item_type is not None:
+            return item_type
+    return None
+
+
+def serialize_item(item):
+    """Item -> dict, or None if the item type isn't registered"""
+    item_type = item_type_for(item)
+    if item_type is None:
+        return None
+    data = {"type": item_type.name}
+    data.update(item_type.to_dict(item))
+    data.update({"x": item.x(), "y": item.y(), "z": item.zValue(), "rotation": item.rotation()})
+    return data
+
+
+def deserialize_item(data):
+    """Dict -> new item, or None if its type is unknown"""
+    item_type = _types_by_name.get(data.get("type"))
+    if item_type is None:
+        return None
+    item = item_type.from_dict(data)
+    item.setPos(data.get("x", 0), data.get("y", 0))
+    item.setZValue(data.get("z", 0))
+    item.setRotation(data.get("rotation", 0))
+    if hasattr(item, 'update_handles'):
+        item.update_handles()
+    return item
+
+
+def pen_to_dict(pen):
+    return {"color": pen.color().name(QColor.NameFormat.HexArgb), "width": pen.widthF(),
+            "style": pen.style().value}
+
+
+def pen_from_dict(data):
+    pen = QPen(QColor(data.get("color", "#ff000000")))
+    pen.setWidthF(data.get("width", 1))
+    pen.setStyle(Qt.PenStyle(data.get("style", Qt.PenStyle.SolidLine.value)))
+    return pen
+
+
+def brush_to_dict(brush):
+    return {"color": brush.color().name(QColor.NameFormat.HexArgb), "style": brush.style().value}
+
+
+def brush_from_dict(data):
+    return QBrush(QColor(data.get("color", "#ff000000")),
+                  Qt.BrushStyle(data.get("style", Qt.BrushStyle.NoBrush.value)))
+
+
+# Text
+
+def _box_link(box):
+    """[page uid, box uid] of a linked box, None if it isn't on a page"""
+    page = getattr(box.scene(), 'page', None) if box is not None else None
+    return [page.uid, box.uid] if page is not None else None
+
+
+def _text_to_dict(item):
+    data = {"content": item.toHtml(), "width": item.textWidth(), "height": item.box_height,
+            "locked": item.is_locked, "uid": item.uid}
+    next_link, prev_link = _box_link(item.next_box), _box_link(item.prev_box)
+    if next_link:
+        data["next_box"] = next_link
+        data["story_continues"] = item.story_continues
+    if prev_link:
+        data["prev_box"] = prev_link
+    return data
+
+
+def _text_from_dict(data):
+    tb = TextBox(font_family="Noorin Nastaleeq", locked=data.get("locked", True))
+    tb.setHtml(data["content"])
+    tb.setTextWidth(data["width"])
+    tb.box_height = data.get("height", tb.box_height)
+    tb.uid = data.get("uid", tb.uid)
+    tb.story_continues = data.get("story_continues", False)
+    if "next_box" in data or "prev_box" in data:
+        tb.saved_links = (data.get("next_box"), data.get("prev_box"))
+    return tb
+
+
+# Shapes
+
+def _shape_to_dict(item):
+    data = {"pen": pen_to_dict(item.pen())}
+    if getattr(item, 'image_path', None):
+        data["image_path"] = item.image_path
+    return data
+
+
+def _shape_finish(item, data):
+    item.setPen(pen_from_dict(data.get("pen", {})))
+    if data.get("image_path") and hasattr(item, 'set_image'):
+        item.set_image(data["image_path"])
+    return item
+
+
+def _rect_to_dict(item):
+    rect = item.rect()
+    data = _shape_to_dict(item)
+    data.update({"rect": [rect.x(), rect.y(), rect.width(), rect.height()],
+                 "brush": brush_to_dict(item.brush()),
+                 "aspect_mode": item.image_aspect_mode.value})
+    if isinstance(item, ResizableRectItem):
+        data["corner_radius"] = item.corner_radius
+    return data
+
+
+def _rect_from_dict(data, cls=ResizableRectItem):
+    item = cls(*data["rect"])
+    item.setBrush(brush_from_dict(data.get("brush", {})))
+    item.image_aspect_mode = Qt.AspectRatioMode(
+        data.get("aspect_mode", Qt.AspectRatioMode.KeepAspectRatio.value))
+    if cls is ResizableRectItem:
+        item.set_corner_radius(data.get("corner_radius", 0))
+    return _shape_finish(item, data)
+
+
+def _ellipse_from_dict(data):
+    return _rect_from_dict(data, ResizableEllipseItem)
+
+
+def _polygon_to_dict(item):
+    data = _shape_to_dict(item)
+    data.update({"points": [[p.x(), p.y()] for p in item.polygon()],
+                 "brush": brush_to_dict(item.brush())})
+    return data
+
+
+def _polygon_from_dict(data):
+    item = PolygonItem([QPointF(x, y) for x, y in data["points"]])
+    item.setBrush(brush_from_dict(data.get("brush", {})))
+    return _shape_finish(item, data)
+
+
+def _line_to_dict(item):
+    line = item.line()
+    data = _shape_to_dict(item)
+    data.update({"line": [line.x1(), line.y1(), line.x2(), line.y2()],
+                 "start_arrow": item.start_arrow, "end_arrow": item.end_arrow})
+    return data
+
+
+def _line_from_dict(data):
+    item = ResizableLineItem(*data["line"])
+    item.start_arrow = data.get("start_arrow", False)
+    item.end_arrow = data.get("end_arrow", False)
+    return _shape_finish(item, data)
+
+
+# Images, tables and groups
+
+def _movable(item):
+    item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
+    item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
+    return item
+
+
+def _image_to_dict(item):
+    return {"image_path": getattr(item, 'image_path', None)}
+
+
+def _image_from_dict(data):
+    item = ImageItem()
+    if data.get("image_path") and not item.set_image(data["image_path"]):
+        # Keep the reference so the picture isn't lost if the file comes back
+        item.image_path = data["image_path"]
+    return item
+
+
+def _table_to_dict(item):
+    table = item.widget()
+    cells = []
+    for r in range(table.rowCount()):
+        row = []
+        for c in range(table.columnCount()):
+            cell = table.item(r, c)
+            row.append(cell.text() if cell else "")
+        cells.append(row)
+    return {"rows": table.rowCount(), "cols": table.columnCount(), "cells": cells}
+
+
+def _table_from_dict(data):
+    table = QTableWidget(data.get("rows", 0), data.get("cols", 0))
+    for r, row in enumerate(data.get("cells", [])):
+        for c, text in enumerate(row):
+            table.setItem(r, c, QTableWidgetItem(text))
+    item = QGraphicsProxyWidget()
+    item.setWidget(table)
+    return _movable(item)
+
+
+def _group_to_dict(item):
+    children = (serialize_item(child) for child in item.childItems())
+    return {"children": [child for child in children if child is not None]}
+
+
+def _group_from_dict(data):
+    group = QGraphicsItemGroup()
+    for child_data in data.get("children", []):
+        child = deserialize_item(child_data)
+        if child is not None:
+            # Child coordinates are stored relative to the group
+            child.setParentItem(group)
+    return _movable(group)
+
+
+register_item_type("text", TextBox, _text_to_dict, _text_from_dict)
+register_item_type("rect", ResizableRectItem, _rect_to_dict, _rect_from_dict)
+register_item_type("ellipse", ResizableEllipseItem, _rect_to_dict, _ellipse_from_dict)
+register_item_type("polygon", PolygonItem, _polygon_to_dict, _polygon_from_dict)
+register_item_type("line", ResizableLineItem, _line_to_dict, _line_from_dict)
+register_item_type("image", ImageItem, _image_to_dict, _image_from_dict)
+register_item_type("table", QGraphicsProxyWidget, _table_to_dict, _table_from_dict)
+register_item_type("group", QGraphicsItemGroup, _group_to_dict, _group_from_dict)
@@ -0,0 +1,115 @@
+"""Keyboard layouts for Urdu input, compiled into transition tables.
+
+A layout file (assets/keyboards/<name>.json) maps key sequences to the
+text they type:
+
+    {"title": "Phonetic", "keys": {"k": "ک", "kh": "خ", ...},
+     "dead_keys": {"`": {"a": "َ", ...}}}
+
+Sequences are compiled into a trie stored as a table of states, so each
+key press is one dict lookup. A sequence that is the prefix of a longer
+one types its own text provisionally ("k" shows ک), and the longer
+sequence replaces it ("kh" turns it into خ). Dead keys type nothing
+until the key after them.
+"""
+import json
+import os
+
+LAYOUT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                          "assets", "keyboards")
+DEFAULT_LAYOUT = "phonetic"
+
+
+class KeyboardLayout:
+    """A layout's key sequences compiled into a transition table"""
+    def __init__(self, name, title, sequences):
+        self.name = name
+        self.title = title
+        self.sequences = sequences
+        self.transitions = [{}]     # state -> {key: next state}; state 0 is the start
+        self.outputs = [None]       # state -> text typed on reaching it (None for dead keys/prefixes)
+        for sequence, text in sequences.items():
+            self._add(sequence, text)
+
+    def _add(self, sequence, text):
+        state = 0
+        for key in sequence:
+            next_state = self.transitions[state].get(key)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions.append({})
+                self.outputs.append(None)
+                self.transitions[state][key] = next_state
+            state = next_state
+        self.outputs[state] = text
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        sequences = dict(data.get("keys", {}))
+        for dead_key, follows in data.get("dead_keys", {}).items():
+            for key, text in follows.items():
+                sequences[dead_key + key] = text
+        name = os.path.splitext(os.path.basename(path))[0]
+        return cls(name, data.get("title", name), sequences)
+
+
+_layouts = {}
+
+
+def available_layouts():
+    """{name: title} of the layout files in LAYOUT_DIR"""
+    layouts = {}
+    if os.path.isdir(LAYOUT_DIR):
+        for filename in sorted(os.listdir(LAYOUT_DIR)):
+            if filename.lower().endswith(".json"):
+                name = os.path.splitext(filename)[0]
+                try:
+                    layouts[name] = load_layout(name).title
+                except (OSError, ValueError):
+                    continue
+    return layouts
+
+
+def load_layout(name):
+    """The compiled layout `name`, compiled once per session"""
+    layout = _layouts.get(name)
+    if layout is None:
+        layout = _layouts[name] = KeyboardLayout.from_file(os.path.join(LAYOUT_DIR, name + ".json"))
+    return layout
+
+
+class KeySequencer:
+    """Runs typed keys through a layout's transition table"""
+    def __init__(self, layout):
+        self.layout = layout
+        self.state = 0
+        self.provisional = 0    # Length of the text typed so far for the sequence in progress
+
+    def reset(self):
+        """Forget the sequence in progress (the caret moved, or a key bypassed the layout)"""
+        self.state = 0
+        self.provisional = 0
+
+    def feed(self, key):
+        """Returns (characters to delete before the caret, text to insert), None if `key` isn't in the layout"""
+        transitions = self.layout.transitions
+        next_state = transitions[self.state].get(key)
+        if next_state is None and self.state:
+            # The sequence in progress can't go on: keep what it typed and start over
+            self.reset()
+            next_state = transitions[0].get(key)
+        if next_state is None:
+            return None
+        text = self.layout.outputs[next_state]
+        if text is None:
+            edit = (0, "")
+        else:
+            edit = (self.provisional, text)
+            self.provisional = len(text)
+        if transitions[next_state]:
+            self.state = next_state
+        else:
+            self.reset()
+        return edit
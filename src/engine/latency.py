@@ -0,0 +1,229 @@
+"""Keystroke-to-paint latency of text boxes.
+
+Every key press reaching DocumentView.eventFilter for a TextBox is
+timestamped, then followed until the box has repainted with its effect:
+
+    mapping  the key through the keyboard layout (or the decision to let Qt have it)
+    queued   waiting for the typing batch to be inserted
+    insert   editing the document, up to its contentsChange signal
+    layout   Qt laying the change out, up to contentsChanged
+    paint    until the box's next paint() has finished
+
+Keys that don't change the text (arrows, shortcuts) aren't recorded,
+nor keys whose box never paints (`dropped`). The last WINDOW samples of
+each stage are kept per document, and the percentiles and histograms
+are computed from them when asked for.
+Recording costs a few perf_counter() calls per key; boxes that aren't
+waiting for a sample pay one attribute check per paint.
+"""
+import json
+import platform
+import time
+from collections import deque
+
+from PyQt6.QtCore import QT_VERSION_STR, PYQT_VERSION_STR
+
+STAGES = ("mapping", "queued", "insert", "layout", "paint")
+# Samples kept per stage
+WINDOW = 1000
+# Upper bucket edges (ms) of the histograms; the last bucket is open
+BUCKETS_MS = (1, 2, 4, 8, 16, 33, 50, 100, 200, 500)
+PERCENTILES = (50, 95, 99)
+# A sample whose box hasn't painted by then (box off screen, window hidden) is dropped
+STALE_SECONDS = 2.0
+
+
+def percentile(ordered, p):
+    """The p-th percentile (nearest rank) of a sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * p // 100))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def histogram(values):
+    """Counts of `values` (ms) per bucket of BUCKETS_MS, plus one for the rest"""
+    counts = [0] * (len(BUCKETS_MS) + 1)
+    for value in values:
+        for i, edge in enumerate(BUCKETS_MS):
+            if value <= edge:
+                counts[i] += 1
+                break
+        else:
+            counts[-1] += 1
+    return counts
+
+
+class _Sample:
+    __slots__ = ("box", "key", "mapped", "edit_start", "changed", "laid_out")
+
+    def __init__(self, box, key, mapped):
+        self.box = box
+        self.key = key              # perf_counter() when the key entered the event filter
+        self.mapped = mapped        # ... when it was mapped
+        self.edit_start = None      # ... when the edit carrying it began
+        self.changed = None         # ... at contentsChange
+        self.laid_out = None        # ... at contentsChanged
+
+
+class LatencyRecorder:
+    """Rolling keystroke-to-paint latencies of one document"""
+    def __init__(self, window=WINDOW):
+        self.samples = {stage: deque(maxlen=window) for stage in STAGES}
+        self.samples["total"] = deque(maxlen=window)
+        self.recorded = 0
+        self.dropped = 0
+        self._queued = []           # Mapped keys waiting for the typing batch
+        self._editing = []          # Keys of the edit in progress
+        self._painting = []         # Keys laid out, waiting for their box to paint
+        self._armed = None          # Document whose signals are connected
+
+    # Stamps, in the order a key goes through them
+
+    def key_mapped(self, box, key_time, batched):
+        """A key for `box` that entered the event filter at `key_time` has been handled.
+
+        `batched` keys wait for edit_started(); the others go to Qt's
+        handler, which edits the document right after the filter returns.
+        """
+        now = time.perf_counter()
+        sample = _Sample(box, key_time, now)
+        if batched:
+            self._queued.append(sample)
+        else:
+            self._disarm()
+            sample.edit_start = now
+            self._editing = [sample]
+            self._arm(box.document())
+
+    def edit_started(self, box):
+        """The typing batch is about to be inserted into `box`"""
+        self._disarm()
+        now = time.perf_counter()
+        self._drop_stale(now)
+        self._editing = [sample for sample in self._queued if sample.box is box]
+        self._queued = [sample for sample in self._queued if sample.box is not box]
+        for sample in self._editing:
+            sample.edit_start = now
+        if self._editing:
+            self._arm(box.document())
+
+    def edit_finished(self):
+        """The typing batch is in; keys that didn't change the text are dropped"""
+        self._disarm()
+
+    def painted(self, box):
+        """`box` has finished painting (called from TextBox.paint through latency_probe)"""
+        now = time.perf_counter()
+        waiting = []
+        for sample in self._painting:
+            if sample.box is box:
+                self._record(sample, now)
+            else:
+                waiting.append(sample)
+        self._painting = waiting
+        box.latency_probe = None
+        if waiting:
+            self._drop_stale(now)
+
+    def _drop_stale(self, now):
+        stale = [sample for sample in self._painting if now - sample.key > STALE_SECONDS]
+        for sample in stale:
+            self._painting.remove(sample)
+            if not any(other.box is sample.box for other in self._painting):
+                sample.box.latency_probe = None
+        self.dropped += len(stale)
+
+    def _record(self, sample, painted):
+        ms = 1000.0
+        self.samples["mapping"].append((sample.mapped - sample.key) * ms)
+        self.samples["queued"].append((sample.edit_start - sample.mapped) * ms)
+        self.samples["insert"].append((sample.changed - sample.edit_start) * ms)
+        self.samples["layout"].append((sample.laid_out - sample.changed) * ms)
+        self.samples["paint"].append((painted - sample.laid_out) * ms)
+        self.samples["total"].append((painted - sample.key) * ms)
+        self.recorded += 1
+
+    # Document signals of the edit in progress
+
+    def _arm(self, document):
+        document.contentsChange.connect(self._on_change)
+        document.contentsChanged.connect(self._on_changed)
+        self._armed = document
+
+    def _disarm(self):
+        if self._armed is None:
+            return
+        try:
+            self._armed.contentsChange.disconnect(self._on_change)
+            self._armed.contentsChanged.disconnect(self._on_changed)
+        except (TypeError, RuntimeError):
+            pass  # Document already deleted
+        self._armed = None
+        self._editing = []
+
+    def _on_change(self, position, removed, added):
+        now = time.perf_counter()
+        for sample in self._editing:
+            if sample.changed is None:
+                sample.changed = now
+
+    def _on_changed(self):
+        now = time.perf_counter()
+        editing, self._editing = self._editing, []
+        for sample in editing:
+            if sample.changed is None:
+                sample.changed = now
+            sample.laid_out = now
+            sample.box.latency_probe = self
+        self._painting.extend(editing)
+        self._disarm()
+
+    # Results
+
+    def clear(self):
+        for values in self.samples.values():
+            values.clear()
+        self.recorded = self.dropped = 0
+
+    def stats(self):
+        """{stage: {"count", "p50", "p95", "p99", "max", "histogram"}} over the rolling window"""
+        stats = {}
+        for stage, values in self.samples.items():
+            ordered = sorted(values)
+            entry = {"count": len(ordered)}
+            for p in PERCENTILES:
+                entry[f"p{p}"] = percentile(ordered, p)
+            entry["max"] = ordered[-1] if ordered else None
+            entry["histogram"] = histogram(ordered)
+            stats[stage] = entry
+        return stats
+
+    def summary(self):
+        total = self.stats()["total"]
+        if not total["count"]:
+            return "Typing latency: no samples"
+        return (f"Typing latency: p50 {total['p50']:.1f} ms, p95 {total['p95']:.1f} ms, "
+                f"p99 {total['p99']:.1f} ms over {total['count']} keys")
+
+    def report(self, document=None):
+        """Everything needed to compare runs, as a JSON-serializable dict"""
+        return {
+            "format": "page26-latency",
+            "version": 1,
+            "document": document,
+            "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "platform": platform.platform(),
+            "python": platform.python_version(),
+            "qt": QT_VERSION_STR,
+            "pyqt": PYQT_VERSION_STR,
+            "window": self.samples["total"].maxlen,
+            "keys_recorded": self.recorded,
+            "keys_dropped": self.dropped,
+            "buckets_ms": list(BUCKETS_MS),
+            "stages": self.stats(),
+        }
+
+    def export_json(self, path, document=None):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(document), f, indent=2)
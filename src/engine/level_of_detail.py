@@ -0,0 +1,108 @@
+"""Level of detail for zoomed-out views.
+
+At 10-30% zoom Nastaliq text is a few device pixels high and can't be
+read, yet painting it costs as much as at 100%. Below `greek_below_px`
+(line height on screen) text boxes draw greeked bars where their lines
+are, computed once per document revision. Image fills that small draw
+straight from the coarsest proxy instead of a smoothly scaled copy.
+Printing and PDF export always get full detail, and zooming back in
+returns to it on the next paint.
+"""
+from PyQt6.QtWidgets import QWidget
+from PyQt6.QtCore import Qt, QRectF
+from PyQt6.QtGui import QColor, QPainter, QPdfWriter
+from PyQt6.QtPrintSupport import QPrinter
+
+from src.engine.asset_store import device_scale, draw_placeholder
+from src.engine.text_layout import shared_paragraph_layouts
+
+# Text whose lines are less than this many device pixels high is greeked (0 disables)
+GREEK_BELOW_PX = 10.0
+# Image fills whose longer side is below this many device pixels draw from a proxy
+COARSE_IMAGE_BELOW_PX = 96
+GREEK_COLOR = QColor(0, 0, 0, 70)
+
+_greek_below_px = GREEK_BELOW_PX
+
+
+def greek_below_px():
+    return _greek_below_px
+
+
+def set_greek_below_px(px):
+    """Change the on-screen line height below which text is greeked (0 disables greeking)"""
+    global _greek_below_px
+    _greek_below_px = max(0.0, float(px))
+
+
+def wants_full_detail(painter):
+    """Print and PDF output is always drawn in full"""
+    return isinstance(painter.device(), (QPrinter, QPdfWriter))
+
+
+def line_bars(document):
+    """Rects of the lines of `document` (document coordinates) and their median height.
+
+    Measured through the shared paragraph layouts, so a box first seen
+    zoomed out isn't laid out by Qt just to be greeked.
+    """
+    margin = document.documentMargin()
+    bars = []
+    for _, lines, top in shared_paragraph_layouts().document_lines(document):
+        for line in lines.lines:
+            if line.width > 0:
+                bars.append(QRectF(margin + line.x, margin + top + line.top, line.width, line.height))
+    heights = sorted(bar.height() for bar in bars)
+    return bars, heights[len(heights) // 2] if heights else 0.0
+
+
+def may_greek(painter, line_height):
+    """Cheap test before measuring lines: whether text with lines about `line_height` high
+    could be greeked at the painter's scale"""
+    if _greek_below_px <= 0 or wants_full_detail(painter):
+        return False
+    # The lines may have changed since they were measured; allow for them having shrunk
+    return line_height * device_scale(painter) < 2 * _greek_below_px
+
+
+def should_greek(painter, line_height):
+    if _greek_below_px <= 0 or line_height <= 0 or wants_full_detail(painter):
+        return False
+    return line_height * device_scale(painter) < _greek_below_px
+
+
+def draw_greeked(painter, bars, clip):
+    """Grey bars a little thinner than the lines they stand for, clipped to `clip`"""
+    painter.save()
+    painter.setClipRect(clip, Qt.ClipOperation.IntersectClip)
+    painter.setPen(Qt.PenStyle.NoPen)
+    painter.setBrush(GREEK_COLOR)
+    painter.drawRects([bar.adjusted(0, bar.height() * 0.3, 0, -bar.height() * 0.25) for bar in bars])
+    painter.restore()
+
+
+def should_coarsen_image(painter, rect):
+    if wants_full_detail(painter):
+        return False
+    scale = device_scale(painter)
+    return max(rect.width(), rect.height()) * scale < COARSE_IMAGE_BELOW_PX
+
+
+def draw_coarse_image(painter, target, asset):
+    """Draw `asset` over `target` from the smallest proxy that is good enough, without smoothing.
+
+    On screen the needed proxy is decoded in the background and the smallest
+    decoded one (or a placeholder) stands in; off-screen renders wait for it.
+    """
+    needed = max(target.width() * device_scale(painter), 1.0)
+    level = max(asset.level_for(asset.source_size.width() / needed), asset.overview_level())
+    pixmap = asset.proxy(level, wait=not isinstance(painter.device(), QWidget))
+    if pixmap is None:
+        pixmap = asset.smallest_available()
+    if pixmap is None:
+        draw_placeholder(painter, target)
+        return
+    painter.save()
+    painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, False)
+    painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+    painter.restore()
@@ -1,25 +1,185 @@
 from PyQt6.QtWidgets import QGraphicsScene, QGraphicsRectItem
-from PyQt6.QtCore import Qt, QRectF
+from PyQt6.QtCore import Qt, QRectF, QTimer
 from PyQt6.QtGui import QColor, QPen, QBrush, QImage, QPainter
+import functools
 import json
+import time
+import uuid
+
+from src.engine.document_model import PageRecord
+from src.engine.upg_container import read_page_entry
+from src.engine.selection_overlay import SelectionOverlay
+
+# Rough memory held by an empty page scene (scene, BSP index, background)
+SCENE_OVERHEAD = 16 * 1024
+
+
+class PageScene(QGraphicsScene):
+    """Graphics scene that knows which Page it belongs to"""
+    def __init__(self, page):
+        super().__init__()
+        self.page = page
+        # Draws the handles of whatever is selected
+        self.selection_overlay = SelectionOverlay()
+        self.selection_overlay.attach(self)
+
+
+def mark_scene_dirty(scene):
+    """Flag the page owning `scene` as modified since the last save"""
+    page = getattr(scene, 'page', None)
+    if page is not None:
+        page.mark_dirty()
+
+
+def record_text_step(box):
+    """Pass a new undo step of a linked box's document to the undo history of the box's document"""
+    page = getattr(box.scene(), 'page', None)
+    manager = page.manager if page is not None else None
+    if manager is not None and manager.on_text_step:
+        manager.on_text_step(box)
+
+
+def _free_link(box):
+    # A link end is free if it is unset or still points at a box of a released scene
+    try:
+        return box is None or box.scene() is None
+    except RuntimeError:
+        # The box was deleted with its scene
+        return True
+
 
 class Page:
-    """Represents a single page in the document"""
-    def __init__(self, width=794, height=1123, page_number=1):
+    """Represents a single page in the document.
+
+    The QGraphicsScene is only built when `scene` is first accessed. Until
+    then the page is just its record (a document model PageRecord, a dict,
+    or a callable returning a dict), which keeps opening long documents
+    cheap. to_record() gives the page as a Qt-free PageRecord.
+    """
+    def __init__(self, width=794, height=1123, page_number=1, record=None):
         self.width = width
         self.height = height
         self.page_number = page_number
-        self.scene = QGraphicsScene()
-        self.scene.setSceneRect(0, 0, width, height)
+        self.manager = None  # PageManager the page belongs to
+
+        # Stable identity and change tracking (used for partial saves)
+        self.uid = uuid.uuid4().hex
+        self.revision = 0
+        self.saved_revision = 0
+        self.container_entry = None  # Entry name of this page in the saved .upg file
+
+        self._record = record
+        self._scene = None
+        self.background = None
+        self._model_record = None  # PageRecord of a materialized page, rebuilt per revision
+
+        # Hibernation bookkeeping (see hibernation.HibernationManager)
+        self.last_viewed = 0.0
+        self.hibernated = False
+        self._memory_estimate = None  # (revision, bytes)
+
+    @property
+    def scene(self):
+        if self._scene is None:
+            self.materialize()
+        return self._scene
+
+    def is_materialized(self):
+        return self._scene is not None
+
+    def materialize(self):
+        """Build the scene (and its items) from the stored record"""
+        if self._scene is not None:
+            return
+        self._scene = PageScene(self)
+        self._scene.setSceneRect(0, 0, self.width, self.height)
         
         # Add page background
-        self.background = QGraphicsRectItem(0, 0, width, height)
+        self.background = QGraphicsRectItem(0, 0, self.width, self.height)
         self.background.setBrush(QBrush(QColor("white")))
         self.background.setPen(QPen(Qt.GlobalColor.black))
-        self.scene.addItem(self.background)
-        
+        self._scene.addItem(self.background)
+
+        record = self._load_record()
+        self._record = None
+        self.hibernated = False
+        self.last_viewed = time.monotonic()
+        if record is not None:
+            # Building the scene is not an edit: keep the change tracking as it was
+            revision, saved_revision = self.revision, self.saved_revision
+            self.from_dict(record)
+            self.revision, self.saved_revision = revision, saved_revision
+
+    def hibernate(self, saved_loader=None):
+        """Release the scene, keeping the page as a record until it is needed again.
+
+        A page that is unchanged since it was saved is read back through
+        `saved_loader` (if given); otherwise its compact PageRecord stays in memory.
+        """
+        if self._scene is None:
+            return False
+        if saved_loader is not None and self.container_entry and not self.is_dirty():
+            record = saved_loader
+        else:
+            record = self.to_record()
+        scene = self._scene
+        self._scene = None
+        self.background = None
+        self._model_record = None
+        self._memory_estimate = None
+        self._record = record
+        self.hibernated = True
+        # Deletes the items (and their text documents) right away
+        scene.clear()
+        return True
+
+    def touch(self):
+        """Note that the page is being viewed"""
+        self.last_viewed = time.monotonic()
+
+    def memory_estimate(self):
+        """Approximate bytes held by the page's scene (0 when not materialized)"""
+        if self._scene is None:
+            return 0
+        if self._memory_estimate is None or self._memory_estimate[0] != self.revision:
+            from src.engine.undo_stack import _item_cost
+            size = SCENE_OVERHEAD + sum(_item_cost(item) for item in self._scene.items())
+            self._memory_estimate = (self.revision, size)
+        return self._memory_estimate[1]
+
+    def _load_record(self):
+        record = self._record
+        if isinstance(record, PageRecord):
+            return record.to_dict()
+        if callable(record):
+            record = record()
+        return record
+
+    def to_record(self):
+        """This page in the Qt-free document model"""
+        if not self.is_materialized():
+            if not isinstance(self._record, PageRecord):
+                # Parse once and keep the compact form
+                self._record = PageRecord.from_dict(self._load_record() or {})
+            record = self._record
+        else:
+            record = self._model_record
+            if record is None or record.revision != self.revision:
+                record = self._model_record = PageRecord.from_dict(self.to_dict())
+        record.uid = self.uid
+        record.width, record.height = self.width, self.height
+        record.page_number = self.page_number
+        record.revision = self.revision
+        return record
+
     def get_thumbnail(self, width=150):
         """Generate thumbnail image of the page"""
+        if not self.is_materialized():
+            # Render from a throwaway copy so the page itself stays unmaterialized
+            temp = Page(self.width, self.height, self.page_number, record=self._load_record())
+            temp.materialize()
+            return temp.get_thumbnail(width)
+
         aspect_ratio = self.height / self.width
         height = int(width * aspect_ratio)
         
@@ -28,69 +188,140 @@ class Page:
         
         painter = QPainter(image)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-        self.scene.render(painter)
+        self.render(painter)
         painter.end()
         
         return image
+
+    def render(self, painter, target=QRectF(), source=None):
+        """Render the page area (or `source` within it) of the scene, whose scene
+        rect may be larger in continuous layouts"""
+        if source is None:
+            source = QRectF(0, 0, self.width, self.height)
+        self.scene.render(painter, target, source)
+
+    def mark_dirty(self):
+        """Record that the page changed since it was last saved"""
+        self.revision += 1
+        if self.manager is not None:
+            self.manager._modified()
+
+    def mark_saved(self, entry=None):
+        """Record that the current revision is what's on disk"""
+        self.saved_revision = self.revision
+        if entry is not None:
+            self.container_entry = entry
+
+    def is_dirty(self):
+        return self.revision != self.saved_revision
     
     def to_dict(self):
         """Serialize page data"""
-        items_data = []
-        for item in self.scene.items():
-            # Skip background
-            if item == self.background:
-                continue
-            
-            # Import here to avoid circular dependency
-            from src.engine.text_box import TextBox
-            
-            if isinstance(item, TextBox):
-                items_data.append({
-                    "type": "text",
-                    "x": item.x(),
-                    "y": item.y(),
-                    "content": item.toHtml(),
-                    "width": item.textWidth(),
-                    "rotation": item.rotation()
-                })
-        
+        if not self.is_materialized():
+            record = dict(self._load_record() or {"items": []})
+            record.update({"uid": self.uid, "width": self.width, "height": self.height,
+                           "page_number": self.page_number})
+            return record
+
         return {
+            "uid": self.uid,
             "width": self.width,
             "height": self.height,
             "page_number": self.page_number,
-            "items": items_data
+            "items": list(self.iter_item_dicts())
         }
+
+    def iter_item_dicts(self):
+        """Yield the serialized items of the page one at a time, bottom to top"""
+        if not self.is_materialized():
+            if isinstance(self._record, PageRecord):
+                yield from self._record.iter_item_dicts()
+            else:
+                yield from (self._load_record() or {}).get("items", [])
+            return
+
+        # Import here to avoid circular dependency
+        from src.engine.item_registry import serialize_item
+
+        for item in self.scene.items(Qt.SortOrder.AscendingOrder):
+            # Skip background, selection overlay and child items (grouped items)
+            if item == self.background or item.parentItem() is not None:
+                continue
+            data = serialize_item(item)
+            if data is not None:
+                yield data
     
     def from_dict(self, data):
         """Deserialize page data"""
-        from src.engine.text_box import TextBox
+        from src.engine.item_registry import deserialize_item
         
+        self.uid = data.get("uid", self.uid)
         self.width = data.get("width", 794)
         self.height = data.get("height", 1123)
         self.page_number = data.get("page_number", 1)
+        self.scene.setSceneRect(0, 0, self.width, self.height)
+        self.background.setRect(0, 0, self.width, self.height)
         
-        # Clear scene (except background)
+        # Clear scene (except background and selection overlay)
         for item in list(self.scene.items()):
-            if item != self.background:
+            if item not in (self.background, self.scene.selection_overlay) and item.parentItem() is None:
                 self.scene.removeItem(item)
         
         # Recreate items
         for item_data in data.get("items", []):
-            if item_data["type"] == "text":
-                tb = TextBox(font_family="Noorin Nastaleeq")
-                tb.setPos(item_data["x"], item_data["y"])
-                tb.setHtml(item_data["content"])
-                tb.setTextWidth(item_data["width"])
-                if "rotation" in item_data:
-                    tb.setRotation(item_data["rotation"])
-                self.scene.addItem(tb)
+            item = deserialize_item(item_data)
+            if item is not None:
+                self.scene.addItem(item)
+        if self.manager is not None:
+            self.manager.relink_text_boxes(self)
+
+        # Freshly loaded content matches what is stored
+        self.mark_saved()
+
+
+class PrefetchPolicy:
+    """Decides which pages to materialize ahead of time. The base policy prefetches nothing."""
+    def pages_to_prefetch(self, page_manager, index):
+        return []
+
+
+class NeighbourPrefetchPolicy(PrefetchPolicy):
+    """Prefetch a few pages on either side of the current one (nearest first)"""
+    def __init__(self, before=1, after=2):
+        self.before = before
+        self.after = after
+
+    def pages_to_prefetch(self, page_manager, index):
+        indices = []
+        for distance in range(1, max(self.before, self.after) + 1):
+            if distance <= self.after:
+                indices.append(index + distance)
+            if distance <= self.before:
+                indices.append(index - distance)
+        return [i for i in indices if 0 <= i < page_manager.page_count()]
 
 
 class PageManager:
     """Manages multiple pages in a document"""
-    def __init__(self):
+    def __init__(self, prefetch_policy=None):
         self.pages = []
         self.current_page_index = 0
+        self.prefetch_policy = prefetch_policy or NeighbourPrefetchPolicy()
+        self._prefetch_queue = []
+        # Saved document that clean pages can be re-read from when hibernated
+        self.container_path = None
+        # Optional callable(page, in_view) -> True if the page must stay live (e.g. undo history
+        # uses it); `in_view` is False when the document's window isn't the active one
+        self.hibernation_guard = None
+        # Optional callable(page) told after a page's scene was released
+        self.on_hibernated = None
+        # Optional callable(box) recording a new undo step of a linked text box (see record_text_step)
+        self.on_text_step = None
+        # Optional callable() told whenever a page changes or pages are added or removed
+        self.on_modified = None
+        # Pages whose saved text box links are still to be connected (see relink_text_boxes)
+        self._relink_queue = []
+        self._relinking = False
         
         # Create initial page
         self.add_page()
@@ -99,12 +330,14 @@ class PageManager:
         """Add a new page at the specified index (or at the end)"""
         page_number = len(self.pages) + 1
         page = Page(page_number=page_number)
+        page.manager = self
         
         if index is None:
             self.pages.append(page)
         else:
             self.pages.insert(index, page)
             self._renumber_pages()
+        self._modified()
         
         return page
     
@@ -120,23 +353,112 @@ class PageManager:
             # Adjust current page if needed
             if self.current_page_index >= len(self.pages):
                 self.current_page_index = len(self.pages) - 1
+            self._modified()
             
             return True
         return False
     
+    def remove_page(self, page):
+        """Take `page` out of the document (e.g. undoing its creation), keeping the current page.
+
+        Returns the index it had, None if it isn't in the document or is its last page.
+        """
+        if page not in self.pages or len(self.pages) <= 1:
+            return None
+        current = self.pages[self.current_page_index]
+        index = self.pages.index(page)
+        del self.pages[index]
+        self._renumber_pages()
+        if current in self.pages:
+            self.current_page_index = self.pages.index(current)
+        else:
+            self.current_page_index = min(self.current_page_index, len(self.pages) - 1)
+        self._modified()
+        return index
+
+    def insert_page(self, index, page):
+        """Put a page taken out with remove_page() back at `index`"""
+        current = self.pages[self.current_page_index] if self.pages else None
+        page.manager = self
+        self.pages.insert(index, page)
+        self._renumber_pages()
+        if current is not None:
+            self.current_page_index = self.pages.index(current)
+        self._modified()
+
+    def _modified(self):
+        if self.on_modified:
+            self.on_modified()
+
     def move_page(self, from_index, to_index):
         """Move a page from one position to another"""
         if 0 <= from_index < len(self.pages) and 0 <= to_index < len(self.pages):
+            current = self.pages[self.current_page_index]
             page = self.pages.pop(from_index)
             self.pages.insert(to_index, page)
+            # The page being shown stays current wherever it ends up
+            self.current_page_index = self.pages.index(current)
             self._renumber_pages()
             return True
         return False
     
+    def relink_text_boxes(self, page):
+        """Connect the text boxes of a page just built to the boxes they were linked to when saved.
+
+        The pages holding those boxes are built as well: a story's pages
+        are live together, as the hibernation guard keeps them. Pages are
+        relinked one after another rather than recursively, so a story
+        over a thousand pages doesn't exhaust the stack.
+        """
+        self._relink_queue.append(page)
+        if self._relinking:
+            return
+        self._relinking = True
+        try:
+            while self._relink_queue:
+                self._relink_page(self._relink_queue.pop(0))
+        finally:
+            self._relinking = False
+
+    def _relink_page(self, page):
+        from src.engine.text_box import TextBox
+
+        if not page.is_materialized():
+            return
+        for box in page.scene.items():
+            if not isinstance(box, TextBox) or box.saved_links is None:
+                continue
+            (next_link, prev_link), box.saved_links = box.saved_links, None
+            following = self._find_text_box(next_link) if box.next_box is None else None
+            if following is not None and _free_link(following.prev_box):
+                box.next_box, following.prev_box = following, box
+            previous = self._find_text_box(prev_link) if box.prev_box is None else None
+            if previous is not None and _free_link(previous.next_box):
+                previous.next_box, box.prev_box = box, previous
+            box.update_handles()
+
+    def _find_text_box(self, link):
+        """The text box a saved [page uid, box uid] link refers to (building its page), if it still exists"""
+        from src.engine.text_box import TextBox
+
+        if not link:
+            return None
+        page_uid, box_uid = link
+        for page in self.pages:
+            if page.uid == page_uid:
+                for item in page.scene.items():
+                    if isinstance(item, TextBox) and item.uid == box_uid:
+                        return item
+        return None
+
     def get_page(self, index):
-        """Get page at the specified index"""
+        """Get page at the specified index (materializing it)"""
         if 0 <= index < len(self.pages):
-            return self.pages[index]
+            page = self.pages[index]
+            page.materialize()
+            page.touch()
+            self.schedule_prefetch(index)
+            return page
         return None
     
     def get_current_page(self):
@@ -147,8 +469,68 @@ class PageManager:
         """Set the current page by index"""
         if 0 <= index < len(self.pages):
             self.current_page_index = index
+            self.pages[index].touch()
+            self.schedule_prefetch(index)
             return True
         return False
+
+    def materialized_count(self):
+        """Number of pages whose scene has been built"""
+        return sum(1 for page in self.pages if page.is_materialized())
+
+    def hibernated_count(self):
+        """Number of pages whose scene was released by hibernation"""
+        return sum(1 for page in self.pages if page.hibernated)
+
+    def can_hibernate(self, page, in_view=True):
+        """True if `page` is live and may release its scene.
+
+        The current page stays live while the document is `in_view` (its
+        window is the active one). Pages with linked text frames stay live:
+        boxes on other pages refer to their items.
+        """
+        from src.engine.text_box import TextBox
+
+        if not page.is_materialized() or (in_view and page is self.pages[self.current_page_index]):
+            return False
+        if any(isinstance(item, TextBox) and (item.next_box or item.prev_box) for item in page.scene.items()):
+            return False
+        return not (self.hibernation_guard and self.hibernation_guard(page, in_view))
+
+    def hibernate_page(self, page, in_view=True):
+        if not self.can_hibernate(page, in_view):
+            return False
+        loader = functools.partial(self._read_saved_page, page) if self.container_path else None
+        if not page.hibernate(loader):
+            return False
+        if self.on_hibernated:
+            self.on_hibernated(page)
+        return True
+
+    def _read_saved_page(self, page):
+        # Resolved when read: a save (or Save As) may have moved the entry since
+        return read_page_entry(self.container_path, page.container_entry)
+
+    def schedule_prefetch(self, index):
+        """Materialize the policy's pages around `index` from the event loop, one per tick"""
+        self.prefetch([self.pages[i] for i in self.prefetch_policy.pages_to_prefetch(self, index)])
+
+    def prefetch(self, pages):
+        """Materialize `pages` from the event loop, one per tick (replaces earlier requests)"""
+        queued = bool(self._prefetch_queue)
+        self._prefetch_queue = [page for page in pages if not page.is_materialized()]
+        if self._prefetch_queue and not queued:
+            QTimer.singleShot(0, self._prefetch_step)
+
+    def _prefetch_step(self):
+        while self._prefetch_queue:
+            page = self._prefetch_queue.pop(0)
+            # The page may have been deleted or built meanwhile
+            if page in self.pages and not page.is_materialized():
+                page.materialize()
+                break
+        if self._prefetch_queue:
+            QTimer.singleShot(0, self._prefetch_step)
     
     def next_page(self):
         """Navigate to next page"""
@@ -189,15 +571,50 @@ class PageManager:
         }
     
     def from_dict(self, data):
-        """Deserialize all pages"""
+        """Deserialize all pages (scenes are built lazily)"""
+        self.load_pages(data.get("pages", []), data.get("current_page", 0))
+
+    def load_pages(self, page_records, current_page=0):
+        """Replace all pages with unmaterialized pages built from an iterable of page dicts"""
         self.pages = []
-        for page_data in data.get("pages", []):
-            page = Page()
-            page.from_dict(page_data)
+        self._prefetch_queue = []
+        self.container_path = None
+        for page_data in page_records:
+            page = Page(page_data.get("width", 794), page_data.get("height", 1123),
+                        page_data.get("page_number", 1), record=PageRecord.from_dict(page_data))
+            page.uid = page_data.get("uid", page.uid)
+            page.manager = self
             self.pages.append(page)
         
-        self.current_page_index = data.get("current_page", 0)
+        self.current_page_index = min(current_page, max(len(self.pages) - 1, 0))
         
         # Ensure at least one page
         if not self.pages:
             self.add_page()
+
+    def load_container(self, reader):
+        """Load all pages from an opened .upg container (see upg_container.UpgReader)
+        or recovery journal (see autosave.JournalReader)"""
+        self.pages = []
+        self._prefetch_queue = []
+        # Unchanged pages of a recovery journal live in the document it belongs to
+        self.container_path = getattr(reader, 'document_path', reader.path)
+        for page_info in reader.page_infos():
+            # Page entries are only parsed when the page is first needed
+            page = Page(page_info.get("width", 794), page_info.get("height", 1123),
+                        record=reader.page_loader(page_info["entry"]))
+            page.uid = page_info["uid"]
+            # Continue the stored revision count so entry names stay unique
+            page.revision = page_info.get("revision", 0)
+            page.mark_saved(page_info["entry"])
+            if page_info.get("modified"):
+                # Recovered from an autosave journal: not in the saved document yet
+                page.mark_dirty()
+            page.manager = self
+            self.pages.append(page)
+
+        self._renumber_pages()
+        self.current_page_index = min(reader.manifest.get("current_page", 0), max(len(self.pages) - 1, 0))
+
+        if not self.pages:
+            self.add_page()
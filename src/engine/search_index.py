@@ -0,0 +1,357 @@
+"""Document-wide text search with Urdu normalization.
+
+The index keeps the text of every text frame on every page of a
+PageManager, so Find Next, match counts and highlight-all don't touch
+QTextDocument.find or rebuild pages. It is kept per page and checked
+against Page.revision, which every contentsChange of a box on the page
+bumps (TextBox._on_contents_changed marks the page dirty): a query
+re-reads only the pages edited since the last one. Pages that aren't
+materialized are read from their records without building their scenes.
+
+Text and queries are compared in normalized form:
+
+    - Arabic yeh/alef maqsura, kaf and heh are folded into their Urdu
+      letters (ی ک ہ); bari yeh and do-chashmi heh stay distinct
+    - Arabic presentation forms become the letters they present
+    - precomposed hamza/madda letters are split into letter + mark, so
+      typed and precomposed forms match
+    - ZWNJ/ZWJ, bidi marks, tatweel and soft hyphens are ignored
+    - aerab (harakat, superscript alef, Quranic marks) are ignored unless
+      the search asks to match them; so is case
+
+Normalization is a table applied through a compiled regex, so indexing
+a frame is mostly a C loop. Matches are kept per page in normalized offsets, so an edit only
+re-searches its page, and are mapped back to the original text only
+when shown. warm() indexes a document from the event loop ahead of its
+first search.
+"""
+import re
+import time
+import unicodedata
+from bisect import bisect_left
+
+from PyQt6.QtCore import Qt, QTimer
+
+from src.engine.text_box import TextBox
+
+# Letters folded into the form Urdu text uses
+LETTER_FOLDS = {
+    "\u064a": "\u06cc",  # Arabic yeh -> Farsi yeh
+    "\u0649": "\u06cc",  # Alef maqsura
+    "\u06d0": "\u06cc",  # E
+    "\u0643": "\u06a9",  # Arabic kaf -> keheh
+    "\u0647": "\u06c1",  # Arabic heh -> heh goal
+    "\u06d5": "\u06c1",  # Ae
+}
+# Ignored everywhere: joiners, bidi marks, tatweel, soft hyphen
+IGNORED = "\u200b\u200c\u200d\u200e\u200f\u061c\u2066\u2067\u2068\u2069\u202a\u202b\u202c\u202d\u202e\u0640\u00ad"
+# QTextDocument raw text separators (paragraph, line, frame start/end), searched as line breaks
+SEPARATORS = "\u2029\u2028\ufdd0\ufdd1"
+# Aerab: ignored unless matching diacritics. Hamza and madda (U+0653-0655) belong to their letters.
+_DIACRITIC_RANGES = [(0x064B, 0x0652), (0x0656, 0x065F), (0x0670, 0x0670), (0x0610, 0x061A),
+                     (0x06D6, 0x06DC), (0x06DF, 0x06E4), (0x06E7, 0x06E8), (0x06EA, 0x06ED)]
+DIACRITICS = "".join(chr(c) for first, last in _DIACRITIC_RANGES for c in range(first, last + 1))
+# Arabic letters with hamza or madda that decompose canonically
+_PRECOMPOSED = "\u0622\u0623\u0624\u0625\u0626\u06c0\u06c2\u06d3"
+_PRESENTATION_FORMS = [(0xFB50, 0xFDFF), (0xFE70, 0xFEFF)]
+# (case_sensitive, ignore_diacritics) of a default search, normalized ahead by warm()
+DEFAULT_OPTIONS = (False, True)
+# Queries whose matches are kept
+CACHED_QUERIES = 16
+# Longest stretch of background indexing done before returning to the event loop
+WARM_SLICE_MS = 10
+
+
+def _build_table(ignore_diacritics):
+    def fold(ch):
+        if ch in IGNORED:
+            return ""
+        if ch in SEPARATORS:
+            return "\n"
+        if ignore_diacritics and ch in DIACRITICS:
+            return ""
+        if ch in _PRECOMPOSED:
+            return "".join(fold(part) for part in unicodedata.normalize("NFD", ch))
+        return LETTER_FOLDS.get(ch, ch)
+
+    table = {}
+    for ch in IGNORED + SEPARATORS + DIACRITICS + _PRECOMPOSED + "".join(LETTER_FOLDS):
+        table[ord(ch)] = fold(ch)
+    for first, last in _PRESENTATION_FORMS:
+        for code in range(first, last + 1):
+            ch = chr(code)
+            if ch in SEPARATORS:
+                continue
+            form = unicodedata.normalize("NFKC", ch)
+            if form != ch:
+                table[code] = "".join(fold(part) for part in form)
+    return table
+
+
+_TABLES = {}
+_PATTERNS = {}
+
+
+def normalization_table(ignore_diacritics=True):
+    table = _TABLES.get(ignore_diacritics)
+    if table is None:
+        table = _TABLES[ignore_diacritics] = _build_table(ignore_diacritics)
+    return table
+
+
+def _pattern(ignore_diacritics):
+    # Most characters normalize to themselves: finding the few that don't with
+    # a compiled class is several times faster than str.translate() over it all
+    pattern = _PATTERNS.get(ignore_diacritics)
+    if pattern is None:
+        table = normalization_table(ignore_diacritics)
+        pattern = _PATTERNS[ignore_diacritics] = re.compile(
+            "[" + "".join(re.escape(chr(code)) for code in sorted(table)) + "]")
+    return pattern
+
+
+def normalize(text, case_sensitive=False, ignore_diacritics=True):
+    """`text` in the form the index compares"""
+    table = normalization_table(ignore_diacritics)
+    text = _pattern(ignore_diacritics).sub(lambda m: table[ord(m.group())], text)
+    return text if case_sensitive else text.casefold()
+
+
+def offset_map(text, case_sensitive=False, ignore_diacritics=True):
+    """Offset in `text` of each character of normalize(text), plus len(text) at the end"""
+    table = normalization_table(ignore_diacritics)
+    offsets = []
+    for i, ch in enumerate(text):
+        form = table.get(ord(ch), ch)
+        if not case_sensitive:
+            form = form.casefold()
+        offsets.extend([i] * len(form))
+    offsets.append(len(text))
+    return offsets
+
+
+class Match:
+    """An occurrence in frame `frame` (in page order) of `page`, at normalized offsets [nstart, nend)"""
+    __slots__ = ("page", "frame", "nstart", "nend")
+
+    def __init__(self, page, frame, nstart, nend):
+        self.page = page
+        self.frame = frame
+        self.nstart = nstart
+        self.nend = nend
+
+
+class _PageEntry:
+    """The indexed text of one page"""
+    __slots__ = ("revision", "scene", "boxes", "texts", "normalized", "offsets", "hits")
+
+    def __init__(self, revision, texts, scene=None, boxes=None):
+        self.revision = revision
+        self.texts = texts              # Raw text of each frame
+        self.scene = scene              # Scene the frames were read from, None if read from the record
+        self.boxes = boxes              # The frames' TextBoxes in that scene
+        self.normalized = {}            # options -> normalized text of each frame
+        self.offsets = {}               # (options, frame) -> offset_map() of the frame
+        self.hits = {}                  # (needle, options) -> [(frame, normalized start)]
+
+
+class _Results:
+    """The matches of one query over the document"""
+    __slots__ = ("generation", "matches", "keys")
+
+    def __init__(self, generation, matches, keys):
+        self.generation = generation
+        self.matches = matches
+        self.keys = keys                # (page order, frame, nstart) of each match, for bisecting
+
+
+class SearchIndex:
+    """Normalized text of all frames of a PageManager, brought up to date per query"""
+    def __init__(self, page_manager):
+        self.page_manager = page_manager
+        self._entries = {}              # page uid -> _PageEntry
+        self._results = {}              # (needle, options) -> _Results
+        self._generation = 0            # Bumped when any page is re-read
+        self._warm_timer = None
+        self.pages_indexed = 0
+
+    # Indexing
+
+    def refresh(self, deadline=None):
+        """Re-read the pages changed (or added) since the last query.
+
+        Stops once past `deadline` (a perf_counter() time); returns True if pages are left.
+        """
+        pages = self.page_manager.pages
+        for page in pages:
+            entry = self._entries.get(page.uid)
+            if entry is None or entry.revision != page.revision:
+                if deadline is not None and time.perf_counter() > deadline:
+                    return True
+                self._entries[page.uid] = self._read_page(page)
+                self._generation += 1
+            elif entry.scene is not None and not page.is_materialized():
+                # Hibernated: the text is the same, the boxes are gone
+                entry.scene = entry.boxes = None
+        if len(self._entries) > len(pages):
+            uids = {page.uid for page in pages}
+            for uid in [uid for uid in self._entries if uid not in uids]:
+                del self._entries[uid]
+            self._generation += 1
+        return False
+
+    def warm(self):
+        """Index the document from the event loop, a slice at a time, ahead of the first query"""
+        if self._warm_timer is None:
+            self._warm_timer = QTimer()
+            self._warm_timer.setSingleShot(True)
+            self._warm_timer.timeout.connect(self._warm_slice)
+        if not self._warm_timer.isActive():
+            self._warm_timer.start(0)
+
+    def _warm_slice(self):
+        deadline = time.perf_counter() + WARM_SLICE_MS / 1000.0
+        if self.refresh(deadline):
+            self._warm_timer.start(0)
+            return
+        # Then the normalized text for the default options
+        for entry in self._entries.values():
+            if DEFAULT_OPTIONS not in entry.normalized:
+                if time.perf_counter() > deadline:
+                    self._warm_timer.start(0)
+                    return
+                self._normalized(entry, DEFAULT_OPTIONS)
+
+    def _read_page(self, page):
+        self.pages_indexed += 1
+        if page.is_materialized():
+            boxes = text_boxes(page)
+            return _PageEntry(page.revision, [box.document().toRawText() for box in boxes], page.scene, boxes)
+        return _PageEntry(page.revision, [story.plain_text() for story in page.to_record().stories()])
+
+    def boxes(self, page):
+        """The TextBoxes of `page` in frame order, building its scene if needed"""
+        entry = self._entries.get(page.uid)
+        if (entry is None or entry.revision != page.revision or not page.is_materialized()
+                or entry.scene is not page.scene):
+            page.materialize()
+            # Offsets now refer to the live documents
+            entry = self._entries[page.uid] = self._read_page(page)
+            self._generation += 1
+        return entry.boxes
+
+    def texts(self, page):
+        """Raw text of each frame of `page`, as last indexed (see refresh())"""
+        return self._entries[page.uid].texts
+
+    def _normalized(self, entry, options):
+        texts = entry.normalized.get(options)
+        if texts is None:
+            texts = entry.normalized[options] = [normalize(text, *options) for text in entry.texts]
+        return texts
+
+    def _offsets(self, entry, options, frame):
+        offsets = entry.offsets.get((options, frame))
+        if offsets is None:
+            offsets = entry.offsets[(options, frame)] = offset_map(entry.texts[frame], *options)
+        return offsets
+
+    # Queries
+
+    def find_all(self, query, case_sensitive=False, ignore_diacritics=True):
+        """Every Match of `query`, in page, frame and text order"""
+        return self._query(query, case_sensitive, ignore_diacritics).matches
+
+    def _query(self, query, case_sensitive, ignore_diacritics):
+        self.refresh()
+        options = (case_sensitive, ignore_diacritics)
+        needle = normalize(query, *options)
+        key = (needle, options)
+        results = self._results.get(key)
+        if results is None or results.generation != self._generation:
+            if results is None and len(self._results) >= CACHED_QUERIES:
+                self._results.clear()
+            matches, keys = [], []
+            if needle:
+                for order, page in enumerate(self.page_manager.pages):
+                    for frame, nstart in self._page_hits(self._entries[page.uid], needle, options):
+                        matches.append(Match(page, frame, nstart, nstart + len(needle)))
+                        keys.append((order, frame, nstart))
+            results = self._results[key] = _Results(self._generation, matches, keys)
+        return results
+
+    def _page_hits(self, entry, needle, options):
+        hits = entry.hits.get((needle, options))
+        if hits is None:
+            if len(entry.hits) >= CACHED_QUERIES:
+                entry.hits.clear()
+            hits = entry.hits[(needle, options)] = []
+            for frame, haystack in enumerate(self._normalized(entry, options)):
+                found = haystack.find(needle)
+                while found >= 0:
+                    hits.append((frame, found))
+                    found = haystack.find(needle, found + len(needle))
+        return hits
+
+    def count(self, query, case_sensitive=False, ignore_diacritics=True):
+        return len(self.find_all(query, case_sensitive, ignore_diacritics))
+
+    def span(self, match, case_sensitive=False, ignore_diacritics=True):
+        """(start, end) of `match` in its frame's text, found with these options"""
+        entry = self._entries[match.page.uid]
+        offsets = self._offsets(entry, (case_sensitive, ignore_diacritics), match.frame)
+        return offsets[match.nstart], _match_end(entry.texts[match.frame], offsets, match.nend)
+
+    def matches_on(self, page, query, case_sensitive=False, ignore_diacritics=True):
+        """(frame, start, end) of the matches on `page`, with the page's boxes resolved (see boxes())"""
+        self.boxes(page)
+        options = (case_sensitive, ignore_diacritics)
+        needle = normalize(query, *options)
+        if not needle:
+            return []
+        entry = self._entries[page.uid]
+        spans = []
+        for frame, nstart in self._page_hits(entry, needle, options):
+            offsets = self._offsets(entry, options, frame)
+            spans.append((frame, offsets[nstart], _match_end(entry.texts[frame], offsets, nstart + len(needle))))
+        return spans
+
+    def neighbour(self, query, page, frame, position, backward=False, case_sensitive=False,
+                  ignore_diacritics=True):
+        """(index, matches) of the first match starting at or after `position` in frame `frame` of
+        `page` (the last one starting before it if `backward`), wrapping around the document.
+        Index is None if there is no match."""
+        results = self._query(query, case_sensitive, ignore_diacritics)
+        if not results.matches:
+            return None, results.matches
+        pages = self.page_manager.pages
+        order = pages.index(page)
+        entry = self._entries[page.uid]
+        if 0 <= frame < len(entry.texts):
+            # Caret position in normalized text
+            offsets = self._offsets(entry, (case_sensitive, ignore_diacritics), frame)
+            position = bisect_left(offsets, position)
+        index = bisect_left(results.keys, (order, frame, position))
+        if backward:
+            index = index - 1 if index > 0 else len(results.matches) - 1
+        elif index >= len(results.matches):
+            index = 0
+        return index, results.matches
+
+    def stats(self):
+        return {"pages": len(self._entries), "pages_indexed": self.pages_indexed,
+                "cached_queries": len(self._results)}
+
+
+def _match_end(text, offsets, end):
+    """End offset in `text` of a match ending before normalized offset `end`"""
+    position = offsets[end - 1] + 1
+    # Take marks on the last letter along (an ignored zabar belongs to the word)
+    while position < offsets[end] and unicodedata.combining(text[position]):
+        position += 1
+    return position
+
+
+def text_boxes(page):
+    """TextBoxes on a materialized page, bottom to top"""
+    return [item for item in page.scene.items(Qt.SortOrder.AscendingOrder) if isinstance(item, TextBox)]
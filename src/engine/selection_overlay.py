@@ -0,0 +1,185 @@
+"""Selection handles for the whole scene, drawn and hit-tested by one item.
+
+Items that can be resized describe their handles with handle_positions()
+({handle id: point in item coordinates}) and implement
+begin_handle_drag(handle, scene_pos) / drag_handle(scene_pos) /
+end_handle_drag(). The SelectionOverlay sits above everything else in
+the page scene and only looks at the selected items, so unselected items
+cost nothing and no item creates child items for its handles.
+
+Items call notify_overlay() (through their update_handles()) whenever
+their geometry changes while selected; selection changes are picked up
+from the scene. Notifications are coalesced, so moving a large selection
+recomputes the handles once per event loop pass, not once per item.
+"""
+from PyQt6.QtWidgets import QGraphicsObject
+from PyQt6.QtCore import Qt, QRectF, QPointF, QTimer
+from PyQt6.QtGui import QColor, QPen, QBrush, QPainterPath, QCursor
+
+# Handle ids 0-7 go clockwise from the top-left corner
+RESIZE_CURSORS = [
+    Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor, Qt.CursorShape.SizeBDiagCursor,
+    Qt.CursorShape.SizeHorCursor, Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor,
+    Qt.CursorShape.SizeBDiagCursor, Qt.CursorShape.SizeHorCursor
+]
+
+# handle id -> (half size, brush colour, cursor); other ids are resize handles
+_SPECIAL_HANDLES = {
+    "link": (6, "blue", Qt.CursorShape.PointingHandCursor),
+    "rotate": (5, "green", Qt.CursorShape.PointingHandCursor),
+    "start": (4, "white", Qt.CursorShape.SizeAllCursor),
+    "end": (4, "white", Qt.CursorShape.SizeAllCursor),
+}
+_RESIZE_HALF_SIZE = 4
+
+
+def rect_handle_positions(rect):
+    """The eight resize handle positions around `rect`, by handle id"""
+    w, h = rect.width(), rect.height()
+    return {
+        0: rect.topLeft(),
+        1: QPointF(rect.left() + w / 2, rect.top()),
+        2: rect.topRight(),
+        3: QPointF(rect.right(), rect.top() + h / 2),
+        4: rect.bottomRight(),
+        5: QPointF(rect.left() + w / 2, rect.bottom()),
+        6: rect.bottomLeft(),
+        7: QPointF(rect.left(), rect.top() + h / 2),
+    }
+
+
+def resized_rect(rect, handle, dx, dy):
+    """`rect` with the edges grabbed by resize handle `handle` moved by (dx, dy)"""
+    new_rect = QRectF(rect)
+    if handle in (0, 6, 7):
+        new_rect.setLeft(rect.left() + dx)
+    if handle in (2, 3, 4):
+        new_rect.setRight(rect.right() + dx)
+    if handle in (0, 1, 2):
+        new_rect.setTop(rect.top() + dy)
+    if handle in (4, 5, 6):
+        new_rect.setBottom(rect.bottom() + dy)
+    return new_rect
+
+
+def _handle_style(handle):
+    if handle in _SPECIAL_HANDLES:
+        return _SPECIAL_HANDLES[handle]
+    return _RESIZE_HALF_SIZE, "white", RESIZE_CURSORS[handle % 8]
+
+
+def notify_overlay(item):
+    """Tell the overlay of `item`'s scene that handles may have moved"""
+    scene = item.scene()
+    overlay = getattr(scene, 'selection_overlay', None)
+    if overlay is not None and item.isSelected():
+        overlay.schedule_refresh()
+
+
+class SelectionOverlay(QGraphicsObject):
+    """Draws and hit-tests the handles of the selected items"""
+    def __init__(self):
+        super().__init__()
+        self.setZValue(1e9)
+        self.setAcceptHoverEvents(True)
+        self._handles = []  # [(item, handle id, scene rect)]
+        self._bounds = QRectF()
+        self._drag_item = None
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.timeout.connect(self.refresh)
+
+    def attach(self, scene):
+        scene.addItem(self)
+        scene.selectionChanged.connect(self.schedule_refresh)
+
+    def schedule_refresh(self):
+        """Refresh once control returns to the event loop"""
+        if not self._refresh_timer.isActive():
+            self._refresh_timer.start(0)
+
+    def refresh(self):
+        """Recompute handle rects from the current selection and geometry"""
+        self._refresh_timer.stop()
+        handles = []
+        bounds = QRectF()
+        scene = self.scene()
+        if scene is not None:
+            for item in scene.selectedItems():
+                positions = getattr(item, 'handle_positions', None)
+                if positions is None:
+                    continue
+                for handle, point in positions().items():
+                    half = _handle_style(handle)[0]
+                    center = item.mapToScene(point)
+                    rect = QRectF(center.x() - half, center.y() - half, 2 * half, 2 * half)
+                    handles.append((item, handle, rect))
+                    bounds = bounds.united(rect)
+        if bounds != self._bounds:
+            self.prepareGeometryChange()
+            self._bounds = bounds
+        self._handles = handles
+        self.update()
+
+    def boundingRect(self):
+        return self._bounds.adjusted(-1, -1, 1, 1)
+
+    def shape(self):
+        # Only the handles themselves take clicks; everything else goes to the items below
+        path = QPainterPath()
+        for _, _, rect in self._handles:
+            path.addRect(rect)
+        return path
+
+    def paint(self, painter, option, widget):
+        if widget is None:
+            # Rendering the page (thumbnails, tiles, print, PDF) rather than a view
+            return
+        painter.setPen(QPen(QColor("black"), 0))
+        for item, handle, rect in self._handles:
+            painter.setBrush(QBrush(QColor(_handle_style(handle)[1])))
+            painter.drawRect(rect)
+
+    def handle_at(self, scene_pos):
+        """(item, handle id) under `scene_pos`, topmost first, or (None, None)"""
+        for item, handle, rect in reversed(self._handles):
+            if rect.contains(scene_pos):
+                return item, handle
+        return None, None
+
+    def hoverMoveEvent(self, event):
+        item, handle = self.handle_at(event.scenePos())
+        if item is not None:
+            self.setCursor(QCursor(_handle_style(handle)[2]))
+        else:
+            self.unsetCursor()
+
+    def hoverLeaveEvent(self, event):
+        self.unsetCursor()
+
+    def mousePressEvent(self, event):
+        if self._refresh_timer.isActive():
+            self.refresh()
+        item, handle = self.handle_at(event.scenePos())
+        if item is None or event.button() != Qt.MouseButton.LeftButton:
+            event.ignore()
+            return
+        if handle == "link":
+            if getattr(item, 'on_link_clicked', None):
+                item.on_link_clicked(item)
+            event.accept()
+            return
+        self._drag_item = item
+        item.begin_handle_drag(handle, event.scenePos())
+        event.accept()
+
+    def mouseMoveEvent(self, event):
+        if self._drag_item is not None:
+            self._drag_item.drag_handle(event.scenePos())
+            self.refresh()
+
+    def mouseReleaseEvent(self, event):
+        if self._drag_item is not None:
+            self._drag_item.end_handle_drag()
+            self._drag_item = None
+            self.refresh()
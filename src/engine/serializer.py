@@ -0,0 +1,91 @@
+"""Streaming serialization of pages and documents.
+
+Pages are written the way Page.to_dict() would return them, but one item
+at a time, so saving never holds more than one item worth of JSON; .upg
+containers store each page entry this way (see upg_container).
+
+Whole documents written by earlier versions as JSON Lines are still
+read, one small JSON object per line::
+
+    {"record": "document", "format": "page26-stream", "version": 1, "current_page": 0}
+    {"record": "page", "uid": ..., "width": ..., "height": ..., "page_number": 1}
+    {"record": "item", "item": {...}}        (one line per top-level item)
+    ...
+    {"record": "end", "pages": 3}
+
+Items are serialized through the item type registry (see item_registry).
+"""
+import json
+
+STREAM_FORMAT = "page26-stream"
+STREAM_VERSION = 1
+
+
+def write_page(page, fp, prepare_item=None):
+    """Write `page` as one JSON object to the text file object `fp`, an item at a time.
+
+    `prepare_item`, if given, is called with each item dict before it is written.
+    """
+    header = json.dumps({"uid": page.uid, "width": page.width, "height": page.height,
+                         "page_number": page.page_number}, ensure_ascii=False)
+    fp.write(header[:-1] + ', "items": [')
+    separator = ""
+    for item in page.iter_item_dicts():
+        if prepare_item is not None:
+            prepare_item(item)
+        fp.write(separator)
+        fp.write(json.dumps(item, ensure_ascii=False))
+        separator = ", "
+    fp.write("]}")
+
+
+def is_stream_header(line):
+    """True if `line` is the first line of a document stream"""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return False
+    return isinstance(record, dict) and record.get("format") == STREAM_FORMAT
+
+
+class StreamReader:
+    """Reads a document stream line by line.
+
+    `header` is available right after construction; iterate `pages()` to
+    get one page dict (in Page.to_dict() form) at a time.
+    """
+    def __init__(self, fp):
+        self.fp = fp
+        self.header = json.loads(fp.readline())
+        if self.header.get("format") != STREAM_FORMAT:
+            raise ValueError("Not a page26 document stream")
+        if self.header.get("version", 1) > STREAM_VERSION:
+            raise ValueError("Document stream was written by a newer version of page26")
+        self.current_page = self.header.get("current_page", 0)
+
+    def pages(self):
+        page = None
+        for line in self.fp:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            kind = record.get("record")
+            if kind == "item":
+                if page is None:
+                    raise ValueError("Item record before the first page record")
+                page["items"].append(record["item"])
+            elif kind == "page":
+                if page is not None:
+                    yield page
+                page = {key: value for key, value in record.items() if key != "record"}
+                page["items"] = []
+            elif kind == "end":
+                break
+        if page is not None:
+            yield page
+
+
+def read_document(fp, page_manager):
+    """Replace the pages of `page_manager` with the document streamed from `fp`"""
+    reader = StreamReader(fp)
+    page_manager.load_pages(reader.pages(), reader.current_page)
@@ -1,25 +1,209 @@
-from PyQt6.QtWidgets import QGraphicsItem, QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPolygonItem, QFileDialog, QMenu
-from PyQt6.QtCore import Qt, QRectF, QPointF, QLineF
-from PyQt6.QtGui import QColor, QPen, QBrush, QPolygonF, QCursor, QPixmap, QPainter, QPainterPath
+from PyQt6.QtWidgets import QGraphicsItem, QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPolygonItem, QGraphicsPixmapItem, QFileDialog, QMenu, QWidget
+from PyQt6.QtCore import Qt, QRectF, QPointF, QLineF, QSizeF
+from PyQt6.QtGui import QColor, QPen, QBrush, QPolygonF, QPixmap, QPixmapCache, QPainter, QPainterPath
 import math
 
-class Handle(QGraphicsRectItem):
-    """Resize handle for shapes"""
-    def __init__(self, cursor_shape, parent=None, role="resize"):
-        super().__init__(-4, -4, 8, 8, parent)
-        self.role = role
-        self.setBrush(QBrush(QColor("white")))
-        self.setPen(QPen(QColor("black")))
-        self.setCursor(QCursor(cursor_shape))
-        # Don't set any flags - let parent handle all mouse events
-
-class ResizableRectItem(QGraphicsRectItem):
+from src.engine.asset_store import shared_store, draw_image, device_scale
+from src.engine.selection_overlay import notify_overlay, rect_handle_positions, resized_rect
+from src.engine.level_of_detail import should_coarsen_image, draw_coarse_image
+
+
+def _mark_dirty(item):
+    """Tell the page owning this item that it changed"""
+    if item.scene() is not None:
+        from src.engine.page_manager import mark_scene_dirty
+        mark_scene_dirty(item.scene())
+
+
+# Scaled image fills (and idle text boxes) are cached in QPixmapCache, shared LRU budget in KB
+FILL_CACHE_LIMIT_KB = 64 * 1024
+# Fills larger than this on screen (device pixels) are drawn directly
+FILL_CACHE_MAX_PIXELS = 4096 * 4096
+
+
+def ensure_pixmap_cache_limit():
+    if QPixmapCache.cacheLimit() < FILL_CACHE_LIMIT_KB:
+        QPixmapCache.setCacheLimit(FILL_CACHE_LIMIT_KB)
+
+
+def _aspect_rect(rect, image_size, aspect_mode):
+    """Where an image of `image_size` goes inside `rect` for the given aspect mode"""
+    if aspect_mode == Qt.AspectRatioMode.IgnoreAspectRatio or image_size.isEmpty():
+        return QRectF(rect)
+    scale_x = rect.width() / image_size.width()
+    scale_y = rect.height() / image_size.height()
+    if aspect_mode == Qt.AspectRatioMode.KeepAspectRatio:
+        # Fit: whole image visible
+        scale = min(scale_x, scale_y)
+    else:
+        # Cover: whole area filled
+        scale = max(scale_x, scale_y)
+    new_width = image_size.width() * scale
+    new_height = image_size.height() * scale
+    return QRectF(rect.center().x() - new_width / 2, rect.center().y() - new_height / 2,
+                  new_width, new_height)
+
+
+class RectHandlesMixin:
+    """Selection handles and handle resizing for items with a rect()/setRect() geometry.
+
+    The handles themselves are drawn by the scene's SelectionOverlay.
+    """
+    MIN_SIZE = 10
+
+    def handle_positions(self):
+        rect = self.rect()
+        if rect.width() <= 0 or rect.height() <= 0:
+            return {}
+        return rect_handle_positions(rect)
+
+    def begin_handle_drag(self, handle, scene_pos):
+        self.resizing_handle = handle
+        self.resize_start_pos = self.mapFromScene(scene_pos)
+        self.resize_start_rect = self.rect()
+
+    def drag_handle(self, scene_pos):
+        diff = self.mapFromScene(scene_pos) - self.resize_start_pos
+        new_rect = resized_rect(self.resize_start_rect, self.resizing_handle, diff.x(), diff.y())
+        # Ensure minimum size
+        if new_rect.width() >= self.MIN_SIZE and new_rect.height() >= self.MIN_SIZE:
+            self.setRect(new_rect)
+
+    def end_handle_drag(self):
+        self.resizing_handle = None
+        self.resize_start_pos = None
+        self.resize_start_rect = None
+
+    def update_handles(self):
+        """Tell the selection overlay the geometry changed"""
+        notify_overlay(self)
+
+
+def _geometry_changed(change):
+    """Whether an itemChange() moves the item's handles"""
+    return change in (QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged,
+                      QGraphicsItem.GraphicsItemChange.ItemTransformHasChanged,
+                      QGraphicsItem.GraphicsItemChange.ItemRotationHasChanged,
+                      QGraphicsItem.GraphicsItemChange.ItemScaleHasChanged)
+
+
+class ImageFillMixin:
+    """Image fill shared by the shape items.
+
+    The image comes from the shared asset store, so the same picture used
+    by many items is only decoded and held once, and it is painted from
+    display-resolution proxies (see asset_store.draw_image).
+    """
+    @property
+    def image_pixmap(self):
+        """The full resolution image (decoded on demand)"""
+        if self.image_asset is None:
+            return None
+        return self.image_asset.pixmap()
+
+    def set_image(self, image_path):
+        """Set an image for this shape"""
+        if image_path:
+            asset = shared_store().acquire(image_path, self)
+            if asset is None:
+                return
+            if self.image_asset is not None and self.image_asset is not asset:
+                shared_store().release(self.image_asset, self)
+            self.invalidate_image_fill()
+            self.image_asset = asset
+            self.image_path = image_path
+            self.update()
+            _mark_dirty(self)
+
+    def clear_image(self):
+        """Remove the image from this shape"""
+        if self.image_asset is not None:
+            shared_store().release(self.image_asset, self)
+        self.invalidate_image_fill()
+        self.image_asset = None
+        self.image_path = None
+        self.update()
+        _mark_dirty(self)
+
+    def paint_image_fill(self, painter, rect, aspect_mode, clip_path, clip_key):
+        """Draw the image into `rect` (item coordinates), clipped to `clip_path`.
+
+        The scaled and clipped result is kept in QPixmapCache, keyed by the
+        target size in device pixels, aspect mode, clip shape and device
+        pixel ratio, so repaints while scrolling are a single blit.
+        """
+        target = _aspect_rect(rect, QSizeF(self.image_asset.source_size), aspect_mode)
+        if should_coarsen_image(painter, rect):
+            # A few pixels across: no smoothing, and no cached copy per zoom level
+            painter.save()
+            painter.setClipPath(clip_path, Qt.ClipOperation.IntersectClip)
+            draw_coarse_image(painter, target, self.image_asset)
+            painter.restore()
+            return
+
+        device = painter.device()
+        scale = device_scale(painter)
+        width_px, height_px = round(rect.width() * scale), round(rect.height() * scale)
+        if (not isinstance(device, QWidget) or width_px <= 0 or height_px <= 0
+                or width_px * height_px > FILL_CACHE_MAX_PIXELS):
+            # Print, thumbnails and extreme zoom draw directly
+            painter.save()
+            painter.setClipPath(clip_path, Qt.ClipOperation.IntersectClip)
+            draw_image(painter, target, self.image_asset)
+            painter.restore()
+            return
+
+        key = "fill:%x:%s:%dx%d:%d:%s:%.2f" % (
+            id(self), self.image_asset.key, width_px, height_px, aspect_mode.value,
+            hash((clip_key, rect.x(), rect.y(), rect.width(), rect.height())), device.devicePixelRatioF())
+        if key != getattr(self, '_fill_cache_key', None):
+            # Resized or image changed: the previous rendering can't be reused
+            self.invalidate_image_fill()
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None:
+            ensure_pixmap_cache_limit()
+            pixmap = QPixmap(width_px, height_px)
+            pixmap.fill(Qt.GlobalColor.transparent)
+            p = QPainter(pixmap)
+            p.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+            p.setRenderHint(QPainter.RenderHint.Antialiasing)
+            p.scale(width_px / rect.width(), height_px / rect.height())
+            p.translate(-rect.topLeft())
+            p.setClipPath(clip_path)
+            complete = draw_image(p, target, self.image_asset, wait=False)
+            p.end()
+            # Placeholders and coarse proxies are not worth keeping
+            if complete:
+                QPixmapCache.insert(key, pixmap)
+                self._fill_cache_key = key
+        painter.drawPixmap(rect, pixmap, QRectF(pixmap.rect()))
+
+    def invalidate_image_fill(self):
+        """Forget the cached rendering of the image fill"""
+        key = getattr(self, '_fill_cache_key', None)
+        if key is not None:
+            QPixmapCache.remove(key)
+            self._fill_cache_key = None
+
+    def _add_image_from_dialog(self):
+        """Show file dialog to select an image"""
+        file_dialog = QFileDialog()
+        file_path, _ = file_dialog.getOpenFileName(
+            None, "Select Image", "",
+            "Image Files (*.png *.jpg *.jpeg *.bmp *.gif *.tiff *.webp)"
+        )
+        if file_path:
+            self.set_image(file_path)
+
+
+class ResizableRectItem(RectHandlesMixin, ImageFillMixin, QGraphicsRectItem):
     """Rectangle with resizing handles and image support"""
     def __init__(self, x, y, width, height, parent=None):
         super().__init__(x, y, width, height, parent)
         self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsMovable |
                       QGraphicsItem.GraphicsItemFlag.ItemIsSelectable |
-                      QGraphicsItem.GraphicsItemFlag.ItemIsFocusable)
+                      QGraphicsItem.GraphicsItemFlag.ItemIsFocusable |
+                      QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
 
         # Default styling
         self.setPen(QPen(QColor("black"), 2))
@@ -28,22 +212,18 @@ class ResizableRectItem(QGraphicsRectItem):
         self.corner_radius = 0  # For rounded corners
 
         # Image support
-        self.image_pixmap = None
+        self.image_asset = None
         self.image_path = None
         self.image_aspect_mode = Qt.AspectRatioMode.KeepAspectRatio
 
-        # Resize handles
-        self.handles = {}
+        # Handle drag state
         self.resizing_handle = None
         self.resize_start_pos = None
         self.resize_start_rect = None
 
-        self.create_handles()
-        self.update_handles()
-
     def itemChange(self, change, value):
-        """Handle item changes like selection"""
-        if change == QGraphicsItem.GraphicsItemChange.ItemSelectedHasChanged:
+        """Keep the selection handles on the item as it moves"""
+        if _geometry_changed(change):
             self.update_handles()
         return super().itemChange(change, value)
 
@@ -64,65 +244,17 @@ class ResizableRectItem(QGraphicsRectItem):
         self.corner_radius = radius
         self.update()
 
-    def set_image(self, image_path):
-        """Set an image for this shape"""
-        if image_path:
-            self.image_path = image_path
-            self.image_pixmap = QPixmap(image_path)
-            self.update()
-
-    def clear_image(self):
-        """Remove the image from this shape"""
-        self.image_pixmap = None
-        self.image_path = None
-        self.update()
-
     def paint(self, painter, option, widget):
         """Custom paint to handle images and rounded corners"""
-        if self.image_pixmap and not self.image_pixmap.isNull():
+        if self.image_asset is not None and self.image_asset.is_valid():
             # Draw image within the rectangle bounds
             rect = self.boundingRect()
-            painter.setClipRect(rect)
-
-            # Calculate scaled image rectangle
-            image_rect = self.image_pixmap.rect()
-            scaled_rect = rect
-
-            if self.image_aspect_mode == Qt.AspectRatioMode.KeepAspectRatio:
-                # Scale image to fit while maintaining aspect ratio
-                scale_x = rect.width() / image_rect.width()
-                scale_y = rect.height() / image_rect.height()
-                scale = min(scale_x, scale_y)
-
-                new_width = image_rect.width() * scale
-                new_height = image_rect.height() * scale
-
-                scaled_rect = QRectF(
-                    rect.center().x() - new_width / 2,
-                    rect.center().y() - new_height / 2,
-                    new_width,
-                    new_height
-                )
-            elif self.image_aspect_mode == Qt.AspectRatioMode.KeepAspectRatioByExpanding:
-                # Scale image to cover entire area
-                scale_x = rect.width() / image_rect.width()
-                scale_y = rect.height() / image_rect.height()
-                scale = max(scale_x, scale_y)
-
-                new_width = image_rect.width() * scale
-                new_height = image_rect.height() * scale
-
-                scaled_rect = QRectF(
-                    rect.center().x() - new_width / 2,
-                    rect.center().y() - new_height / 2,
-                    new_width,
-                    new_height
-                )
-
-            painter.drawPixmap(scaled_rect.toRect(), self.image_pixmap)
+            clip = QPainterPath()
+            clip.addRect(rect)
+            self.paint_image_fill(painter, rect, self.image_aspect_mode, clip, ("rect",))
 
         # Draw the shape outline if no image or if selected
-        if not self.image_pixmap or self.isSelected():
+        if self.image_asset is None or self.isSelected():
             if self.corner_radius > 0:
                 # Draw rounded rectangle
                 path = QPainterPath()
@@ -134,14 +266,11 @@ class ResizableRectItem(QGraphicsRectItem):
                 # Draw regular rectangle
                 super().paint(painter, option, widget)
 
-        # Update handles visibility
-        self.update_handles()
-
     def contextMenuEvent(self, event):
         """Show context menu for image operations"""
         menu = QMenu()
 
-        if self.image_pixmap:
+        if self.image_asset is not None:
             clear_action = menu.addAction("Remove Image")
             clear_action.triggered.connect(self.clear_image)
         else:
@@ -162,262 +291,42 @@ class ResizableRectItem(QGraphicsRectItem):
 
         menu.exec(event.screenPos())
 
-    def create_handles(self):
-        """Create resize handles for the rectangle"""
-        cursors = [
-            Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor, Qt.CursorShape.SizeBDiagCursor,
-            Qt.CursorShape.SizeHorCursor, Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor,
-            Qt.CursorShape.SizeBDiagCursor, Qt.CursorShape.SizeHorCursor
-        ]
-
-        for i in range(8):
-            h = Handle(cursors[i], self, role="resize")
-            h.hide()
-            self.handles[i] = h
-
-    def update_handles(self):
-        """Update handle positions and visibility"""
-        rect = self.rect()  # Use the actual rectangle geometry, not bounding rect
-        w, h = rect.width(), rect.height()
-
-        # Only show handles if item has valid size and is selected
-        show_handles = self.isSelected() and w > 0 and h > 0
-
-        # Position handles at the corners of the actual rectangle
-        positions = [
-            rect.topLeft(),                    # Top-left
-            QPointF(rect.left() + w/2, rect.top()),  # Top-center
-            rect.topRight(),                   # Top-right
-            QPointF(rect.right(), rect.top() + h/2),  # Right-center
-            rect.bottomRight(),                # Bottom-right
-            QPointF(rect.left() + w/2, rect.bottom()),  # Bottom-center
-            rect.bottomLeft(),                 # Bottom-left
-            QPointF(rect.left(), rect.top() + h/2)   # Left-center
-        ]
-
-        for i in range(8):
-            self.handles[i].setPos(positions[i])
-            # Show/hide handles based on selection and size
-            if show_handles:
-                self.handles[i].show()
-            else:
-                self.handles[i].hide()
-
-    def mousePressEvent(self, event):
-        """Handle mouse press for resizing"""
-        if event.button() == Qt.MouseButton.LeftButton:
-            # Check if clicking on a resize handle
-            click_pos = event.pos()  # Position in item's local coordinates
-            for i, h in self.handles.items():
-                if h.isVisible():
-                    # Check if click is within handle's bounding rect
-                    handle_rect = h.boundingRect().translated(h.pos())
-                    if handle_rect.contains(click_pos):
-                        self.resizing_handle = i
-                        self.resize_start_pos = event.scenePos()
-                        self.resize_start_rect = self.rect()
-                        event.accept()
-                        return
-
-        super().mousePressEvent(event)
-
-    def mouseMoveEvent(self, event):
-        """Handle mouse move for resizing"""
-        if self.resizing_handle is not None and self.resize_start_pos and self.resize_start_rect:
-            diff = event.scenePos() - self.resize_start_pos  # Use scene coordinates
-            dx = diff.x()
-            dy = diff.y()
-
-            orig_rect = self.resize_start_rect
-            new_rect = QRectF(orig_rect)
-
-            # Handle different resize directions
-            if self.resizing_handle == 0:  # Top-left
-                new_rect.setTopLeft(orig_rect.topLeft() + QPointF(dx, dy))
-            elif self.resizing_handle == 1:  # Top
-                new_rect.setTop(orig_rect.top() + dy)
-            elif self.resizing_handle == 2:  # Top-right
-                new_rect.setTopRight(orig_rect.topRight() + QPointF(dx, dy))
-            elif self.resizing_handle == 3:  # Right
-                new_rect.setRight(orig_rect.right() + dx)
-            elif self.resizing_handle == 4:  # Bottom-right
-                new_rect.setBottomRight(orig_rect.bottomRight() + QPointF(dx, dy))
-            elif self.resizing_handle == 5:  # Bottom
-                new_rect.setBottom(orig_rect.bottom() + dy)
-            elif self.resizing_handle == 6:  # Bottom-left
-                new_rect.setBottomLeft(orig_rect.bottomLeft() + QPointF(dx, dy))
-            elif self.resizing_handle == 7:  # Left
-                new_rect.setLeft(orig_rect.left() + dx)
-
-            # Ensure minimum size
-            if new_rect.width() >= 10 and new_rect.height() >= 10:
-                self.setRect(new_rect)
-                self.update_handles()
-
-            event.accept()
-            return
-
-        super().mouseMoveEvent(event)
-
-    def mouseReleaseEvent(self, event):
-        """Handle mouse release"""
-        self.resizing_handle = None
-        self.resize_start_pos = None
-        self.resize_start_rect = None
-        super().mouseReleaseEvent(event)
-
-    def _add_image_from_dialog(self):
-        """Show file dialog to select an image"""
-        file_dialog = QFileDialog()
-        file_path, _ = file_dialog.getOpenFileName(
-            None, "Select Image", "",
-            "Image Files (*.png *.jpg *.jpeg *.bmp *.gif *.tiff *.webp)"
-        )
-        if file_path:
-            self.set_image(file_path)
-
     def _set_aspect_mode(self, mode):
         """Set the image aspect ratio mode"""
         self.image_aspect_mode = mode
         self.update()
+        _mark_dirty(self)
 
 
-class ResizableEllipseItem(QGraphicsEllipseItem):
+class ResizableEllipseItem(RectHandlesMixin, ImageFillMixin, QGraphicsEllipseItem):
     """Ellipse/Circle with resizing handles and image support"""
     def __init__(self, x, y, width, height, parent=None):
         super().__init__(x, y, width, height, parent)
         self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsMovable |
                       QGraphicsItem.GraphicsItemFlag.ItemIsSelectable |
-                      QGraphicsItem.GraphicsItemFlag.ItemIsFocusable)
+                      QGraphicsItem.GraphicsItemFlag.ItemIsFocusable |
+                      QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
 
         # Default styling
         self.setPen(QPen(QColor("black"), 2))
         self.setBrush(QBrush(Qt.BrushStyle.NoBrush))
 
         # Image support
-        self.image_pixmap = None
+        self.image_asset = None
         self.image_path = None
         self.image_aspect_mode = Qt.AspectRatioMode.KeepAspectRatio
 
-        # Resize handles
-        self.handles = {}
+        # Handle drag state
         self.resizing_handle = None
         self.resize_start_pos = None
         self.resize_start_rect = None
 
-        self.create_handles()
-        self.update_handles()
-
     def itemChange(self, change, value):
-        """Handle item changes like selection"""
-        if change == QGraphicsItem.GraphicsItemChange.ItemSelectedHasChanged:
+        """Keep the selection handles on the item as it moves"""
+        if _geometry_changed(change):
             self.update_handles()
         return super().itemChange(change, value)
 
-    def create_handles(self):
-        """Create resize handles for the ellipse"""
-        cursors = [
-            Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor, Qt.CursorShape.SizeBDiagCursor,
-            Qt.CursorShape.SizeHorCursor, Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor,
-            Qt.CursorShape.SizeBDiagCursor, Qt.CursorShape.SizeHorCursor
-        ]
-
-        for i in range(8):
-            h = Handle(cursors[i], self, role="resize")
-            h.hide()
-            self.handles[i] = h
-
-    def update_handles(self):
-        """Update handle positions and visibility"""
-        rect = self.rect()  # Use the actual ellipse geometry, not bounding rect
-        w, h = rect.width(), rect.height()
-
-        # Only show handles if item has valid size and is selected
-        show_handles = self.isSelected() and w > 0 and h > 0
-
-        # Position handles at the corners of the actual ellipse
-        positions = [
-            rect.topLeft(),                    # Top-left
-            QPointF(rect.left() + w/2, rect.top()),  # Top-center
-            rect.topRight(),                   # Top-right
-            QPointF(rect.right(), rect.top() + h/2),  # Right-center
-            rect.bottomRight(),                # Bottom-right
-            QPointF(rect.left() + w/2, rect.bottom()),  # Bottom-center
-            rect.bottomLeft(),                 # Bottom-left
-            QPointF(rect.left(), rect.top() + h/2)   # Left-center
-        ]
-
-        for i in range(8):
-            self.handles[i].setPos(positions[i])
-            # Show/hide handles based on selection and size
-            if show_handles:
-                self.handles[i].show()
-            else:
-                self.handles[i].hide()
-
-    def mousePressEvent(self, event):
-        """Handle mouse press for resizing"""
-        if event.button() == Qt.MouseButton.LeftButton:
-            # Check if clicking on a resize handle
-            click_pos = event.pos()  # Position in item's local coordinates
-            for i, h in self.handles.items():
-                if h.isVisible():
-                    # Check if click is within handle's bounding rect
-                    handle_rect = h.boundingRect().translated(h.pos())
-                    if handle_rect.contains(click_pos):
-                        self.resizing_handle = i
-                        self.resize_start_pos = event.scenePos()
-                        self.resize_start_rect = self.rect()
-                        event.accept()
-                        return
-
-        super().mousePressEvent(event)
-
-    def mouseMoveEvent(self, event):
-        """Handle mouse move for resizing"""
-        if self.resizing_handle is not None and self.resize_start_pos and self.resize_start_rect:
-            diff = event.scenePos() - self.resize_start_pos  # Use scene coordinates
-            dx = diff.x()
-            dy = diff.y()
-
-            orig_rect = self.resize_start_rect
-            new_rect = QRectF(orig_rect)
-
-            # Handle different resize directions
-            if self.resizing_handle == 0:  # Top-left
-                new_rect.setTopLeft(orig_rect.topLeft() + QPointF(dx, dy))
-            elif self.resizing_handle == 1:  # Top
-                new_rect.setTop(orig_rect.top() + dy)
-            elif self.resizing_handle == 2:  # Top-right
-                new_rect.setTopRight(orig_rect.topRight() + QPointF(dx, dy))
-            elif self.resizing_handle == 3:  # Right
-                new_rect.setRight(orig_rect.right() + dx)
-            elif self.resizing_handle == 4:  # Bottom-right
-                new_rect.setBottomRight(orig_rect.bottomRight() + QPointF(dx, dy))
-            elif self.resizing_handle == 5:  # Bottom
-                new_rect.setBottom(orig_rect.bottom() + dy)
-            elif self.resizing_handle == 6:  # Bottom-left
-                new_rect.setBottomLeft(orig_rect.bottomLeft() + QPointF(dx, dy))
-            elif self.resizing_handle == 7:  # Left
-                new_rect.setLeft(orig_rect.left() + dx)
-
-            # Ensure minimum size
-            if new_rect.width() >= 10 and new_rect.height() >= 10:
-                self.setRect(new_rect)
-                self.update_handles()
-
-            event.accept()
-            return
-
-        super().mouseMoveEvent(event)
-
-    def mouseReleaseEvent(self, event):
-        """Handle mouse release"""
-        self.resizing_handle = None
-        self.resize_start_pos = None
-        self.resize_start_rect = None
-        super().mouseReleaseEvent(event)
-
     def set_fill_color(self, color):
         self.setBrush(QBrush(QColor(color)))
 
@@ -431,57 +340,24 @@ class ResizableEllipseItem(QGraphicsEllipseItem):
         pen.setWidth(width)
         self.setPen(pen)
 
-    def set_image(self, image_path):
-        """Set an image for this shape"""
-        if image_path:
-            self.image_path = image_path
-            self.image_pixmap = QPixmap(image_path)
-            self.update()
-
-    def clear_image(self):
-        """Remove the image from this shape"""
-        self.image_pixmap = None
-        self.image_path = None
-        self.update()
-
     def paint(self, painter, option, widget):
         """Custom paint to handle images in ellipse"""
-        if self.image_pixmap and not self.image_pixmap.isNull():
-            # Create elliptical clipping path
+        if self.image_asset is not None and self.image_asset.is_valid():
+            # Elliptical clip, image scaled to cover the entire ellipse
             rect = self.boundingRect()
             path = QPainterPath()
             path.addEllipse(rect)
-            painter.setClipPath(path)
-
-            # Calculate scaled image rectangle to fit ellipse
-            image_rect = self.image_pixmap.rect()
-            scale_x = rect.width() / image_rect.width()
-            scale_y = rect.height() / image_rect.height()
-            scale = max(scale_x, scale_y)  # Cover the entire ellipse
-
-            new_width = image_rect.width() * scale
-            new_height = image_rect.height() * scale
-
-            scaled_rect = QRectF(
-                rect.center().x() - new_width / 2,
-                rect.center().y() - new_height / 2,
-                new_width,
-                new_height
-            )
-
-            painter.drawPixmap(scaled_rect.toRect(), self.image_pixmap)
+            self.paint_image_fill(painter, rect, Qt.AspectRatioMode.KeepAspectRatioByExpanding, path, ("ellipse",))
 
         # Draw the shape outline if no image or if selected
-        if not self.image_pixmap or self.isSelected():
+        if self.image_asset is None or self.isSelected():
             super().paint(painter, option, widget)
 
-        self.update_handles()
-
     def contextMenuEvent(self, event):
         """Show context menu for image operations"""
         menu = QMenu()
 
-        if self.image_pixmap:
+        if self.image_asset is not None:
             clear_action = menu.addAction("Remove Image")
             clear_action.triggered.connect(self.clear_image)
         else:
@@ -490,15 +366,52 @@ class ResizableEllipseItem(QGraphicsEllipseItem):
 
         menu.exec(event.screenPos())
 
-    def _add_image_from_dialog(self):
-        """Show file dialog to select an image"""
-        file_dialog = QFileDialog()
-        file_path, _ = file_dialog.getOpenFileName(
-            None, "Select Image", "",
-            "Image Files (*.png *.jpg *.jpeg *.bmp *.gif *.tiff *.webp)"
-        )
-        if file_path:
-            self.set_image(file_path)
+
+class ImageItem(QGraphicsPixmapItem):
+    """Placed picture, painted from display-resolution proxies of a shared asset"""
+    def __init__(self, image_path=None, parent=None):
+        super().__init__(parent)
+        self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsMovable |
+                      QGraphicsItem.GraphicsItemFlag.ItemIsSelectable |
+                      QGraphicsItem.GraphicsItemFlag.ItemUsesExtendedStyleOption)
+        self.image_asset = None
+        self.image_path = None
+        if image_path:
+            self.set_image(image_path)
+
+    def set_image(self, image_path):
+        """Show the image at `image_path`. Returns False if it can't be read."""
+        asset = shared_store().acquire(image_path, self)
+        if asset is None or not asset.is_valid():
+            if asset is not None:
+                shared_store().release(asset, self)
+            return False
+        if self.image_asset is not None and self.image_asset is not asset:
+            shared_store().release(self.image_asset, self)
+        self.prepareGeometryChange()
+        self.image_asset = asset
+        self.image_path = image_path
+        self.update()
+        _mark_dirty(self)
+        return True
+
+    def boundingRect(self):
+        if self.image_asset is None:
+            return QRectF()
+        return QRectF(QPointF(0, 0), QSizeF(self.image_asset.source_size))
+
+    def shape(self):
+        path = QPainterPath()
+        path.addRect(self.boundingRect())
+        return path
+
+    def paint(self, painter, option, widget):
+        rect = self.boundingRect()
+        draw_image(painter, rect, self.image_asset, option.exposedRect)
+        if self.isSelected():
+            painter.setPen(QPen(QColor("#0078d7"), 0, Qt.PenStyle.DashLine))
+            painter.setBrush(Qt.BrushStyle.NoBrush)
+            painter.drawRect(rect)
 
 
 class ResizableLineItem(QGraphicsLineItem):
@@ -507,7 +420,8 @@ class ResizableLineItem(QGraphicsLineItem):
         super().__init__(x1, y1, x2, y2, parent)
         self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsMovable | 
                       QGraphicsItem.GraphicsItemFlag.ItemIsSelectable |
-                      QGraphicsItem.GraphicsItemFlag.ItemIsFocusable)
+                      QGraphicsItem.GraphicsItemFlag.ItemIsFocusable |
+                      QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
         
         # Default styling
         self.setPen(QPen(QColor("black"), 2))
@@ -515,65 +429,37 @@ class ResizableLineItem(QGraphicsLineItem):
         self.start_arrow = False
         self.end_arrow = False
         
-        # Handles
-        self.handles = {}
+        # Handle drag state
         self.resizing_handle = None
-        self.resize_start_pos = None
-        self.create_handles()
-        self.update_handles()
-        
+
     def itemChange(self, change, value):
-        if change == QGraphicsItem.GraphicsItemChange.ItemSelectedHasChanged:
+        if _geometry_changed(change):
             self.update_handles()
         return super().itemChange(change, value)
 
-    def create_handles(self):
-        # 0: Start, 1: End
-        self.handles[0] = Handle(Qt.CursorShape.SizeAllCursor, self)
-        self.handles[1] = Handle(Qt.CursorShape.SizeAllCursor, self)
-        self.handles[0].hide()
-        self.handles[1].hide()
+    def handle_positions(self):
+        line = self.line()
+        return {"start": line.p1(), "end": line.p2()}
 
-    def update_handles(self):
+    def begin_handle_drag(self, handle, scene_pos):
+        self.resizing_handle = handle
+
+    def drag_handle(self, scene_pos):
+        pos = self.mapFromScene(scene_pos)
         line = self.line()
-        self.handles[0].setPos(line.p1())
-        self.handles[1].setPos(line.p2())
-        
-        show = self.isSelected()
-        if show:
-            self.handles[0].show()
-            self.handles[1].show()
+        if self.resizing_handle == "start":
+            line.setP1(pos)
         else:
-            self.handles[0].hide()
-            self.handles[1].hide()
-
-    def mousePressEvent(self, event):
-        if event.button() == Qt.MouseButton.LeftButton:
-            for i, h in self.handles.items():
-                if h.isVisible() and h.isUnderMouse():
-                    self.resizing_handle = i
-                    event.accept()
-                    return
-        super().mousePressEvent(event)
-
-    def mouseMoveEvent(self, event):
-        if self.resizing_handle is not None:
-            pos = event.pos() # Local pos
-            line = self.line()
-            if self.resizing_handle == 0:
-                line.setP1(pos)
-            else:
-                line.setP2(pos)
-            self.setLine(line)
-            self.update_handles()
-            event.accept()
-            return
-        super().mouseMoveEvent(event)
-        
-    def mouseReleaseEvent(self, event):
+            line.setP2(pos)
+        self.setLine(line)
+
+    def end_handle_drag(self):
         self.resizing_handle = None
-        super().mouseReleaseEvent(event)
-    
+
+    def update_handles(self):
+        """Tell the selection overlay the geometry changed"""
+        notify_overlay(self)
+
     def set_stroke_color(self, color):
         pen = self.pen()
         pen.setColor(QColor(color))
@@ -593,138 +479,76 @@ class ResizableLineItem(QGraphicsLineItem):
         self.update()
 
 
-class PolygonItem(QGraphicsPolygonItem):
+class PolygonItem(ImageFillMixin, QGraphicsPolygonItem):
     """Custom polygon shape with image support"""
     def __init__(self, points, parent=None):
         polygon = QPolygonF(points)
         super().__init__(polygon, parent)
         self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsMovable |
                       QGraphicsItem.GraphicsItemFlag.ItemIsSelectable |
-                      QGraphicsItem.GraphicsItemFlag.ItemIsFocusable)
+                      QGraphicsItem.GraphicsItemFlag.ItemIsFocusable |
+                      QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
 
         # Default styling
         self.setPen(QPen(QColor("black"), 2))
         self.setBrush(QBrush(Qt.BrushStyle.NoBrush))
 
         # Image support
-        self.image_pixmap = None
+        self.image_asset = None
         self.image_path = None
 
-        # Resize handles
-        self.handles = {}
+        # Handle drag state
         self.resizing_handle = None
         self.resize_start_pos = None
         self.resize_start_rect = None
-
-        self.create_handles()
-        self.update_handles()
+        self.resize_start_polygon = None
 
     def itemChange(self, change, value):
-        """Handle item changes like selection"""
-        if change == QGraphicsItem.GraphicsItemChange.ItemSelectedHasChanged:
+        """Keep the selection handles on the item as it moves"""
+        if _geometry_changed(change):
             self.update_handles()
         return super().itemChange(change, value)
 
-    def create_handles(self):
-        """Create resize handles for the polygon"""
-        cursors = [
-            Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor, Qt.CursorShape.SizeBDiagCursor,
-            Qt.CursorShape.SizeHorCursor, Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor,
-            Qt.CursorShape.SizeBDiagCursor, Qt.CursorShape.SizeHorCursor
-        ]
-
-        for i in range(8):
-            h = Handle(cursors[i], self, role="resize")
-            h.hide()
-            self.handles[i] = h
-
-    def update_handles(self):
-        """Update handle positions and visibility"""
+    def handle_positions(self):
         rect = self.boundingRect()
-        w, h = rect.width(), rect.height()
-
-        # Only show handles if item has valid size and is selected
-        show_handles = self.isSelected() and w > 0 and h > 0
-
-        # Position handles at the corners of the bounding rectangle
-        positions = [
-            rect.topLeft(),                    # Top-left
-            QPointF(rect.left() + w/2, rect.top()),  # Top-center
-            rect.topRight(),                   # Top-right
-            QPointF(rect.right(), rect.top() + h/2),  # Right-center
-            rect.bottomRight(),                # Bottom-right
-            QPointF(rect.left() + w/2, rect.bottom()),  # Bottom-center
-            rect.bottomLeft(),                 # Bottom-left
-            QPointF(rect.left(), rect.top() + h/2)   # Left-center
-        ]
-
-        for i in range(8):
-            self.handles[i].setPos(positions[i])
-            # Show/hide handles based on selection and size
-            if show_handles:
-                self.handles[i].show()
-            else:
-                self.handles[i].hide()
-
-    def mousePressEvent(self, event):
-        """Handle mouse press for resizing"""
-        if event.button() == Qt.MouseButton.LeftButton:
-            # Check if clicking on a resize handle
-            click_pos = event.pos()  # Position in item's local coordinates
-            for i, h in self.handles.items():
-                if h.isVisible():
-                    # Check if click is within handle's bounding rect
-                    handle_rect = h.boundingRect().translated(h.pos())
-                    if handle_rect.contains(click_pos):
-                        self.resizing_handle = i
-                        self.resize_start_pos = event.scenePos()
-                        self.resize_start_rect = self.boundingRect()
-                        event.accept()
-                        return
-
-        super().mousePressEvent(event)
-
-    def mouseMoveEvent(self, event):
-        """Handle mouse move for resizing"""
-        if self.resizing_handle is not None and self.resize_start_pos and self.resize_start_rect:
-            diff = event.scenePos() - self.resize_start_pos  # Use scene coordinates
-            dx = diff.x()
-            dy = diff.y()
-
-            orig_rect = self.resize_start_rect
-            scale_x = 1.0 + (dx / orig_rect.width()) if orig_rect.width() > 0 else 1.0
-            scale_y = 1.0 + (dy / orig_rect.height()) if orig_rect.height() > 0 else 1.0
-
-            # For polygons, we'll scale uniformly for simplicity
-            scale = max(scale_x, scale_y)
-            if scale < 0.1: scale = 0.1  # Minimum scale
-
-            # Scale the polygon
-            center = orig_rect.center()
-            current_polygon = self.polygon()
-
-            new_points = []
-            for point in current_polygon:
-                # Scale relative to center
-                dx = point.x() - center.x()
-                dy = point.y() - center.y()
-                new_point = QPointF(center.x() + dx * scale, center.y() + dy * scale)
-                new_points.append(new_point)
-
-            self.setPolygon(QPolygonF(new_points))
-            self.update_handles()
-
-            event.accept()
-            return
-
-        super().mouseMoveEvent(event)
-
-    def mouseReleaseEvent(self, event):
-        """Handle mouse release"""
+        if rect.width() <= 0 or rect.height() <= 0:
+            return {}
+        return rect_handle_positions(rect)
+
+    def begin_handle_drag(self, handle, scene_pos):
+        self.resizing_handle = handle
+        self.resize_start_pos = self.mapFromScene(scene_pos)
+        self.resize_start_rect = self.boundingRect()
+        self.resize_start_polygon = QPolygonF(self.polygon())
+
+    def drag_handle(self, scene_pos):
+        diff = self.mapFromScene(scene_pos) - self.resize_start_pos
+        orig_rect = self.resize_start_rect
+        scale_x = 1.0 + (diff.x() / orig_rect.width()) if orig_rect.width() > 0 else 1.0
+        scale_y = 1.0 + (diff.y() / orig_rect.height()) if orig_rect.height() > 0 else 1.0
+
+        # For polygons, we'll scale uniformly for simplicity
+        scale = max(scale_x, scale_y)
+        if scale < 0.1: scale = 0.1  # Minimum scale
+
+        # Scale the polygon the drag started with, relative to its center
+        center = orig_rect.center()
+        new_points = []
+        for point in self.resize_start_polygon:
+            dx = point.x() - center.x()
+            dy = point.y() - center.y()
+            new_points.append(QPointF(center.x() + dx * scale, center.y() + dy * scale))
+        self.setPolygon(QPolygonF(new_points))
+
+    def end_handle_drag(self):
         self.resizing_handle = None
         self.resize_start_pos = None
         self.resize_start_rect = None
-        super().mouseReleaseEvent(event)
+        self.resize_start_polygon = None
+
+    def update_handles(self):
+        """Tell the selection overlay the geometry changed"""
+        notify_overlay(self)
 
     def set_fill_color(self, color):
         self.setBrush(QBrush(QColor(color)))
@@ -739,48 +563,23 @@ class PolygonItem(QGraphicsPolygonItem):
         pen.setWidth(width)
         self.setPen(pen)
 
-    def set_image(self, image_path):
-        """Set an image for this polygon (fills the polygon)"""
-        if image_path:
-            self.image_path = image_path
-            self.image_pixmap = QPixmap(image_path)
-            self.update()
-
-    def clear_image(self):
-        """Remove the image from this polygon"""
-        self.image_pixmap = None
-        self.image_path = None
-        self.update()
-
     def paint(self, painter, option, widget):
         """Custom paint to handle images in polygon"""
-        # Hide/show handles based on selection
-        if self.isSelected():
-            for h in self.handles.values():
-                h.show()
-        else:
-            for h in self.handles.values():
-                h.hide()
-
-        if self.image_pixmap and not self.image_pixmap.isNull():
-            # Set clipping to polygon shape
-            painter.setClipPath(self.shape())
-
-            # Draw image scaled to fit the polygon bounding rect
+        if self.image_asset is not None and self.image_asset.is_valid():
+            # Image stretched over the bounding rect, clipped to the polygon
             rect = self.boundingRect()
-            painter.drawPixmap(rect.toRect(), self.image_pixmap)
+            points = tuple((p.x(), p.y()) for p in self.polygon())
+            self.paint_image_fill(painter, rect, Qt.AspectRatioMode.IgnoreAspectRatio, self.shape(), points)
 
         # Draw the shape outline if no image or if selected
-        if not self.image_pixmap or self.isSelected():
+        if self.image_asset is None or self.isSelected():
             super().paint(painter, option, widget)
 
-        self.update_handles()
-
     def contextMenuEvent(self, event):
         """Show context menu for image operations"""
         menu = QMenu()
 
-        if self.image_pixmap:
+        if self.image_asset is not None:
             clear_action = menu.addAction("Remove Image")
             clear_action.triggered.connect(self.clear_image)
         else:
@@ -789,16 +588,6 @@ class PolygonItem(QGraphicsPolygonItem):
 
         menu.exec(event.screenPos())
 
-    def _add_image_from_dialog(self):
-        """Show file dialog to select an image"""
-        file_dialog = QFileDialog()
-        file_path, _ = file_dialog.getOpenFileName(
-            None, "Select Image", "",
-            "Image Files (*.png *.jpg *.jpeg *.bmp *.gif *.tiff *.webp)"
-        )
-        if file_path:
-            self.set_image(file_path)
-
     @staticmethod
     def create_star(x, y, outer_radius, inner_radius, points=5):
         """Create a star polygon"""
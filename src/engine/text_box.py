@@ -1,25 +1,23 @@
-from PyQt6.QtWidgets import QGraphicsTextItem, QGraphicsItem, QGraphicsRectItem, QGraphicsLineItem, QMenu, QApplication
+from PyQt6.QtWidgets import (QGraphicsTextItem, QGraphicsItem, QGraphicsLineItem, QMenu, QApplication,
+                             QStyleOptionGraphicsItem, QWidget)
 from PyQt6.QtCore import Qt, QRectF, QPointF
-from PyQt6.QtGui import QFont, QColor, QPen, QBrush, QCursor, QTextCursor, QAction
+from PyQt6.QtGui import QFont, QFontMetricsF, QColor, QPen, QTextCursor, QAction, QPixmap, QPixmapCache, QPainter, QTransform
 import math
+import uuid
+
+from src.engine.asset_store import device_scale
+from src.engine.shape_items import ensure_pixmap_cache_limit
+
+from src.engine.selection_overlay import notify_overlay, rect_handle_positions, resized_rect
+from src.engine.level_of_detail import line_bars, may_greek, should_greek, draw_greeked
+from src.engine.text_flow import shared_story_flow
+from src.engine.text_layout import shared_paragraph_layouts
+
+# Boxes larger than this on screen (device pixels) are always painted directly
+TEXT_CACHE_MAX_PIXELS = 2048 * 2048
+# Highlighter over search matches (drawn on top of the text)
+SEARCH_HIGHLIGHT = QColor(255, 200, 0, 110)
 
-class Handle(QGraphicsRectItem):
-    def __init__(self, cursor_shape, parent=None, role="resize"):
-        super().__init__(-4, -4, 8, 8, parent)
-        self.role = role
-        
-        if role == "link":
-            self.setBrush(QBrush(QColor("blue")))
-            self.setRect(-6, -6, 12, 12)
-        elif role == "rotate":
-            self.setBrush(QBrush(QColor("green")))
-            self.setRect(-5, -5, 10, 10)
-        else:
-            self.setBrush(QBrush(QColor("white")))
-            self.setPen(QPen(QColor("black")))
-            
-        self.setCursor(QCursor(cursor_shape))
-        self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
 
 class TextBox(QGraphicsTextItem):
     def __init__(self, text="", font_family="Arial", parent=None, locked=True):
@@ -45,93 +43,150 @@ class TextBox(QGraphicsTextItem):
             # Unlocked text box - can move and resize
             self.setFlags(QGraphicsItem.GraphicsItemFlag.ItemIsMovable | 
                          QGraphicsItem.GraphicsItemFlag.ItemIsSelectable | 
-                         QGraphicsItem.GraphicsItemFlag.ItemIsFocusable)
+                         QGraphicsItem.GraphicsItemFlag.ItemIsFocusable |
+                         QGraphicsItem.GraphicsItemFlag.ItemSendsGeometryChanges)
             self.setTextInteractionFlags(Qt.TextInteractionFlag.TextEditorInteraction)
         
         # Linking State
+        self.uid = uuid.uuid4().hex  # Stable identity, so saved links can find the box again
         self.next_box = None
         self.prev_box = None
         self.link_line = None
+        # The last paragraph carries on at the start of next_box's text
+        self.story_continues = False
+        # ((page uid, box uid) of the next box, ... of the previous box) read from a saved page,
+        # until PageManager.relink_text_boxes connects them
+        self.saved_links = None
         
-        # Handles (only for unlocked boxes)
-        self.handles = {}
-        self.link_handle = None
-        self.rotate_handle = None
-        self.create_handles()
-        self.update_handles()
-        
-        # State variables
+        # Handle drag state (handles are drawn by the scene's selection overlay)
         self.resizing_handle = None
         self.resize_start_pos = None
         self.resize_start_rect = None
-        self.start_rotation = 0
+        self.resize_start_item_pos = None
+        # Width while a handle is dragged; the document is laid out at it when the drag ends
+        self.drag_width = None
         
         # Selection preservation
         self.saved_cursor = None
 
-    def create_handles(self):
-        if self.is_locked:
-            return  # No handles for locked boxes
-            
-        cursors = [
-            Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor, Qt.CursorShape.SizeBDiagCursor,
-            Qt.CursorShape.SizeHorCursor, Qt.CursorShape.SizeFDiagCursor, Qt.CursorShape.SizeVerCursor,
-            Qt.CursorShape.SizeBDiagCursor, Qt.CursorShape.SizeHorCursor
-        ]
-        
-        for i in range(8):
-            h = Handle(cursors[i], self, role="resize")
-            h.hide()
-            self.handles[i] = h
-            
-        # Link Handle
-        self.link_handle = Handle(Qt.CursorShape.PointingHandCursor, self, role="link")
-        self.link_handle.hide()
-        
-        # Rotate Handle
-        self.rotate_handle = Handle(Qt.CursorShape.PointingHandCursor, self, role="rotate")
-        self.rotate_handle.hide()
+        # Line rects used when zoomed out too far to read the text, and their last measured height
+        self._greek_cache = None
+        self._greek_line_height = None
 
-    def update_handles(self):
+        # Boxes that aren't being edited repaint from a cached rendering
+        self._render_generation = 0
+        self._render_cache_key = None
+
+        # LatencyRecorder waiting for this box to paint a key's effect
+        self.latency_probe = None
+
+        # (start, end) document ranges marked by Find's highlight-all
+        self.search_highlights = []
+
+        # Word and character counts (text_stats.TextStats), created when first counted
+        self.text_stats = None
+
+        # Any content or format change makes the owning page dirty
+        self.document().contentsChanged.connect(self._on_contents_changed)
+        self.document().undoCommandAdded.connect(self._on_undo_step)
+
+    def _on_contents_changed(self):
+        self._greek_cache = None
+        # The ranges no longer fit the text; the view marks the box again
+        self.search_highlights = []
+        self.invalidate_render_cache()
+        if self.next_box is not None or self.prev_box is not None:
+            # Qt would merge the next edit into this undo step; it gets a step (and a record) of its own
+            self.document().setModified(False)
+        # Linked boxes pass overflowing text along the chain
+        shared_story_flow().schedule(self)
+        scene = self.scene()
+        if scene is not None:
+            from src.engine.page_manager import mark_scene_dirty
+            mark_scene_dirty(scene)
+
+    def _on_undo_step(self):
+        # Linked boxes share one story, so their text history is kept with the document's
+        if self.next_box is not None or self.prev_box is not None:
+            from src.engine.page_manager import record_text_step
+            record_text_step(self)
+
+    def handle_positions(self):
+        """Resize handles around the box, link handle below it, rotate handle off its top-right corner"""
         if self.is_locked:
-            return  # No handles for locked boxes
-            
+            return {}  # No handles for locked boxes
         rect = self.boundingRect()
-        w, h = rect.width(), rect.height()
-        
-        # Position handles at the actual corners of the text box
-        positions = [
-            rect.topLeft(),                    # Top-left
-            QPointF(rect.left() + w/2, rect.top()),  # Top-center
-            rect.topRight(),                   # Top-right
-            QPointF(rect.right(), rect.top() + h/2),  # Right-center
-            rect.bottomRight(),                # Bottom-right
-            QPointF(rect.left() + w/2, rect.bottom()),  # Bottom-center
-            rect.bottomLeft(),                 # Bottom-left
-            QPointF(rect.left(), rect.top() + h/2)   # Left-center
-        ]
-        
-        for i in range(8):
-            self.handles[i].setPos(positions[i])
-            
-        # Position link handle below the text box
-        self.link_handle.setPos(rect.center().x(), rect.bottom() + 15)
-        
-        # Position rotate handle at top-right corner
-        self.rotate_handle.setPos(rect.topRight() + QPointF(15, -15))
-        
-        # Show/hide handles based on selection
-        show_handles = self.isSelected()
-        for handle in list(self.handles.values()) + [self.link_handle, self.rotate_handle]:
-            if show_handles:
-                handle.show()
+        positions = rect_handle_positions(rect)
+        positions["link"] = QPointF(rect.center().x(), rect.bottom() + 15)
+        positions["rotate"] = rect.topRight() + QPointF(15, -15)
+        return positions
+
+    def update_handles(self):
+        """Tell the selection overlay the geometry changed"""
+        notify_overlay(self)
+
+    def itemChange(self, change, value):
+        if change in (QGraphicsItem.GraphicsItemChange.ItemPositionHasChanged,
+                      QGraphicsItem.GraphicsItemChange.ItemRotationHasChanged,
+                      QGraphicsItem.GraphicsItemChange.ItemTransformHasChanged):
+            self.update_handles()
+        return super().itemChange(change, value)
+
+    def begin_handle_drag(self, handle, scene_pos):
+        self.resizing_handle = handle
+        self.resize_start_pos = self.mapFromScene(scene_pos)
+        self.resize_start_rect = self.boundingRect()
+        self.resize_start_item_pos = self.pos()
+
+    def drag_handle(self, scene_pos):
+        if self.resizing_handle == "rotate":
+            center = self.sceneBoundingRect().center()
+            dx = scene_pos.x() - center.x()
+            dy = scene_pos.y() - center.y()
+            self.setRotation(math.degrees(math.atan2(dy, dx)) + 90)
+            return
+
+        # Differences in item coordinates follow the box's rotation and don't depend on its position
+        diff = self.mapFromScene(scene_pos) - self.resize_start_pos
+        orig_rect = self.resize_start_rect
+        new_rect = resized_rect(orig_rect, self.resizing_handle, diff.x(), diff.y())
+
+        # Keep at least 50x50, holding the edge opposite to the dragged one
+        if new_rect.width() < 50:
+            if self.resizing_handle in (0, 6, 7):
+                new_rect.setLeft(new_rect.right() - 50)
+            else:
+                new_rect.setRight(new_rect.left() + 50)
+        if new_rect.height() < 50:
+            if self.resizing_handle in (0, 1, 2):
+                new_rect.setTop(new_rect.bottom() - 50)
             else:
-                handle.hide()
+                new_rect.setBottom(new_rect.top() + 50)
+
+        # Left and top handles move the box as well as resizing it
+        shift = self.mapToParent(new_rect.topLeft()) - self.mapToParent(orig_rect.topLeft())
+        self.prepareGeometryChange()
+        self.box_height = new_rect.height()
+        self.drag_width = new_rect.width()
+        self.setPos(self.resize_start_item_pos + shift)
+        self.update()
+
+    def end_handle_drag(self):
+        if self.drag_width is not None:
+            self.setTextWidth(self.drag_width)
+            self.drag_width = None
+        if self.resizing_handle != "rotate":
+            shared_story_flow().schedule(self)
+        self.resizing_handle = None
+        self.resize_start_pos = None
+        self.resize_start_rect = None
+        self.resize_start_item_pos = None
 
     def boundingRect(self):
         # Override to use box_height if set, or text height if larger (or just box_height for DTP style)
         # For DTP, we want the box to be the authority.
-        return QRectF(0, 0, self.textWidth(), self.box_height)
+        width = self.textWidth() if self.drag_width is None else self.drag_width
+        return QRectF(0, 0, width, self.box_height)
 
     def paint(self, painter, option, widget):
         # Remove the dashed focus border drawn by QGraphicsTextItem when it has focus
@@ -139,25 +194,34 @@ class TextBox(QGraphicsTextItem):
         option.state &= ~QStyle.StateFlag.State_HasFocus
         option.state &= ~QStyle.StateFlag.State_Selected
 
-        # Draw text
-        super().paint(painter, option, widget)
+        # Draw text, or greeked lines when it would be too small to read
+        if self.drag_width is not None:
+            # Resizing: drawn from the paragraph layouts rather than laying the document out per move
+            painter.save()
+            painter.setPen(self.defaultTextColor())
+            shared_paragraph_layouts().draw(painter, self.document(), self.drag_width)
+            painter.restore()
+        elif self.hasFocus():
+            # Being edited: cursor and selection change all the time
+            super().paint(painter, option, widget)
+        else:
+            bars = self._greek_bars(painter)
+            if bars is not None:
+                draw_greeked(painter, bars, self.boundingRect())
+            elif not self._paint_cached(painter, option, widget):
+                super().paint(painter, option, widget)
 
-        # Draw selection border and handles
+        if self.search_highlights:
+            self._draw_search_highlights(painter)
+
+        # Draw selection border (the handles are drawn by the selection overlay)
         if not self.is_locked and self.isSelected():
             # Draw dashed border for unlocked selected boxes
             pen = QPen(QColor("blue"), 1, Qt.PenStyle.DashLine)
             painter.setPen(pen)
             painter.setBrush(Qt.BrushStyle.NoBrush)
             painter.drawRect(self.boundingRect())
-            
-            # Show handles
-            for h in self.handles.values():
-                h.show()
-            if self.link_handle:
-                self.link_handle.show()
-            if self.rotate_handle:
-                self.rotate_handle.show()
-            
+
             # Draw line to rotate handle
             painter.drawLine(int(self.boundingRect().width()/2), 0, int(self.boundingRect().width()/2), -25)
         elif self.is_locked:
@@ -166,88 +230,117 @@ class TextBox(QGraphicsTextItem):
             painter.setPen(pen)
             painter.setBrush(Qt.BrushStyle.NoBrush)
             painter.drawRect(self.boundingRect())
-        else:
-            # Hide handles
-            for h in self.handles.values():
-                h.hide()
-            if self.link_handle:
-                self.link_handle.hide()
-            if self.rotate_handle:
-                self.rotate_handle.hide()
+
+        if self.latency_probe is not None:
+            self.latency_probe.painted(self)
+
+    def _paint_cached(self, painter, option, widget):
+        """Blit the box's text from QPixmapCache, rendering it first if needed.
+
+        Only screen painting is cached, and only while the box's transform
+        keeps it axis-aligned. The cache key covers the content (through
+        the render generation), width, box height, rotation and device
+        scale, so a change to any of them renders afresh. Returns False if
+        the caller has to paint directly. The selection is part of the key
+        as unfocused boxes still show it.
+        """
+        if not isinstance(painter.device(), QWidget):
+            return False
+        if painter.worldTransform().type().value > QTransform.TransformationType.TxScale.value:
+            return False
+        rect = self.boundingRect()
+        scale = device_scale(painter)
+        width_px, height_px = math.ceil(rect.width() * scale), math.ceil(rect.height() * scale)
+        if width_px <= 0 or height_px <= 0 or width_px * height_px > TEXT_CACHE_MAX_PIXELS:
+            return False
+
+        cursor = self.textCursor()
+        key = "textbox:%x:%d:%.2f:%.2f:%.2f:%.4f:%d-%d" % (
+            id(self), self._render_generation, rect.width(), rect.height(), self.rotation(), scale,
+            cursor.selectionStart(), cursor.selectionEnd())
+        if key != self._render_cache_key:
+            self._drop_render_cache()
+        pixmap = QPixmapCache.find(key)
+        if pixmap is None:
+            ensure_pixmap_cache_limit()
+            pixmap = QPixmap(width_px, height_px)
+            pixmap.fill(Qt.GlobalColor.transparent)
+            p = QPainter(pixmap)
+            p.setRenderHints(painter.renderHints())
+            p.scale(width_px / rect.width(), height_px / rect.height())
+            full = QStyleOptionGraphicsItem(option)
+            full.exposedRect = rect
+            super().paint(p, full, widget)
+            p.end()
+            QPixmapCache.insert(key, pixmap)
+            self._render_cache_key = key
+        painter.drawPixmap(rect, pixmap, QRectF(pixmap.rect()))
+        return True
+
+    def invalidate_render_cache(self):
+        """Forget the cached rendering of the text"""
+        self._render_generation += 1
+        self._drop_render_cache()
+
+    def _drop_render_cache(self):
+        if self._render_cache_key is not None:
+            QPixmapCache.remove(self._render_cache_key)
+            self._render_cache_key = None
+
+    def set_search_highlights(self, ranges):
+        """Mark the document ranges [(start, end), ...] as search matches"""
+        if ranges or self.search_highlights:
+            self.search_highlights = list(ranges)
+            self.update()
+
+    def _draw_search_highlights(self, painter):
+        doc = self.document()
+        doc_layout = doc.documentLayout()
+        painter.save()
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(SEARCH_HIGHLIGHT)
+        for start, end in self.search_highlights:
+            block = doc.findBlock(start)
+            while block.isValid() and block.position() < end:
+                layout = block.layout()
+                origin = doc_layout.blockBoundingRect(block).topLeft()
+                first = max(start, block.position()) - block.position()
+                last = min(end, block.position() + block.length() - 1) - block.position()
+                for i in range(layout.lineCount()):
+                    line = layout.lineAt(i)
+                    line_start, line_end = line.textStart(), line.textStart() + line.textLength()
+                    if line_end <= first or line_start >= last:
+                        continue
+                    x1 = line.cursorToX(max(first, line_start))[0]
+                    x2 = line.cursorToX(min(last, line_end))[0]
+                    painter.drawRect(QRectF(origin.x() + min(x1, x2), origin.y() + line.y(),
+                                            abs(x2 - x1), line.height()))
+                block = block.next()
+        painter.restore()
+
+    def _greek_bars(self, painter):
+        """Line rects to draw instead of the text if it is too small to read, else None.
+
+        Lines are only measured when the scale is small enough for greeking,
+        and again only when the text or its layout changes.
+        """
+        doc = self.document()
+        estimate = self._greek_line_height or QFontMetricsF(doc.defaultFont()).height()
+        if not may_greek(painter, estimate):
+            return None
+        key = (self.textWidth(), doc.defaultFont().key())
+        if self._greek_cache is None or self._greek_cache[0] != key:
+            bars, self._greek_line_height = line_bars(doc)
+            self._greek_cache = (key, bars)
+        return self._greek_cache[1] if should_greek(painter, self._greek_line_height) else None
 
     def mouseMoveEvent(self, event):
         if self.is_locked:
             super().mouseMoveEvent(event)
             return
             
-        # Handle rotation
-        if self.resizing_handle == "rotate":
-            center = self.sceneBoundingRect().center()
-            pos = event.scenePos()
-            dx = pos.x() - center.x()
-            dy = pos.y() - center.y()
-            angle = math.degrees(math.atan2(dy, dx)) + 90
-            self.setRotation(angle)
-            return
-
-        # Handle resizing
-        if self.resizing_handle is not None:
-            scene_pos = event.scenePos()
-            # We need to calculate change relative to the item's current state or start state
-            # Using scenePos allows us to handle rotation better if we map correctly, 
-            # but for simple resizing we can use local coords or diffs.
-            # Let's use diff from start screen pos for simplicity, but we need to be careful with rotation.
-            
-            # Better approach: map mouse pos to item coords?
-            # If item is rotated, resizing is tricky.
-            # For now, let's assume no rotation or handle it simply.
-            
-            diff = event.screenPos() - self.resize_start_pos
-            dx = diff.x()
-            dy = diff.y()
-            
-            # Adjust dx/dy based on rotation? 
-            # If rotated, screen dx/dy doesn't map to width/height directly.
-            # We should map scene pos to item pos.
-            
-            local_start = self.mapFromScene(self.mapToScene(self.resize_start_rect.topLeft())) # This is just 0,0
-            local_mouse = self.mapFromScene(event.scenePos())
-            
-            # This is getting complex. Let's stick to the simple rect update logic 
-            # assuming the user drags handles in the direction of the handle.
-            
-            orig_rect = self.resize_start_rect
-            new_rect = QRectF(orig_rect)
-            
-            # Note: QGraphicsTextItem position is top-left.
-            
-            if self.resizing_handle == 0: # Top-Left
-                # Move pos, change size
-                # This is hard because setPos is in parent coords.
-                # Let's just change width/height and move pos if needed.
-                # For TextItem, moving top-left means changing pos.
-                pass 
-                # Implementing full multi-direction resizing for TextItem is complex 
-                # because text flow depends on width.
-                
-            # Simplified resizing:
-            # Right handles (2, 3, 4) change width.
-            # Bottom handles (4, 5, 6) change height.
-            # Left/Top handles are harder because they shift content.
-            
-            if self.resizing_handle in [2, 3, 4]: # Right side
-                new_width = max(50, orig_rect.width() + dx)
-                self.setTextWidth(new_width)
-                
-            if self.resizing_handle in [4, 5, 6]: # Bottom side
-                new_height = max(50, orig_rect.height() + dy)
-                self.box_height = new_height
-                
-            self.update_handles()
-            return
-
         # Snap to Guides Logic
-        if not self.is_locked and self.resizing_handle is None:
+        if not self.is_locked:
             # Check if snapping is enabled in the view
             views = self.scene().views()
             if views and hasattr(views[0], 'snap_to_guides') and views[0].snap_to_guides:
@@ -281,13 +374,15 @@ class TextBox(QGraphicsTextItem):
 
         super().mouseMoveEvent(event)
 
-    def mouseReleaseEvent(self, event):
-        self.resizing_handle = None
-        super().mouseReleaseEvent(event)
+    def focusInEvent(self, event):
+        self.invalidate_render_cache()
+        super().focusInEvent(event)
 
     def focusOutEvent(self, event):
         # Keep text interaction enabled for both locked and unlocked
         self.setTextInteractionFlags(Qt.TextInteractionFlag.TextEditorInteraction)
+        # Done editing: the next paint records the box as it is now
+        self.invalidate_render_cache()
         super().focusOutEvent(event)
 
     def mouseDoubleClickEvent(self, event):
@@ -0,0 +1,398 @@
+"""Story flow across linked text boxes.
+
+A story is the text of a chain of boxes joined by next_box/prev_box,
+possibly on different pages. Each box's document holds the part of the
+story that fits in it. After an edit the chain is re-flowed box by box
+from the box before the edited one: text that no longer fits is pushed
+to the start of the next box, and room left at the bottom is filled
+from the next box's first lines. Fitting is measured through the shared
+paragraph layouts (text_layout), which place lines the way Qt lays the
+box out, so line spacing and paragraph margins set on the text count.
+
+Flow stops at the first box whose boundary with the next box didn't
+move, as everything after it is laid out as before. Long cascades (an
+extra line pushing through a 200 page story) run for at most
+FLOW_SLICE_MS at a time and continue from the event loop, so an edit
+costs the boxes around it rather than the rest of the story. flush()
+completes pending flow before saving or printing.
+
+Qt lays a box's document out in full whenever text goes into it, so an
+overflow of more than a box (a large paste, linking a long story to an
+empty box) isn't pushed through every box on the way. It travels in a
+plain "carry" document instead, and each box it passes is laid out once
+with the text it ends up holding.
+
+Moving text between boxes is an ordinary edit of their documents. The
+view records the steps on its undo stack together with the edit that made
+the text move (see DocumentView._record_text_step), so undo takes both
+back at once.
+"""
+import time
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QTextCursor, QTextDocument, QTextDocumentFragment
+
+from src.engine.text_layout import shared_paragraph_layouts
+
+# Longest stretch of flow work done before returning to the event loop
+FLOW_SLICE_MS = 8
+
+
+def story_head(box):
+    """First box of the chain `box` belongs to"""
+    seen = {id(box)}
+    while box.prev_box is not None and id(box.prev_box) not in seen:
+        box = box.prev_box
+        seen.add(id(box))
+    return box
+
+
+def story_boxes(box):
+    """Boxes of the chain `box` belongs to, in story order"""
+    boxes, seen = [], set()
+    box = story_head(box)
+    while box is not None and id(box) not in seen:
+        boxes.append(box)
+        seen.add(id(box))
+        box = box.next_box
+    return boxes
+
+
+# Measuring
+
+def is_empty(document):
+    return document.characterCount() <= 1
+
+
+def box_room(box):
+    return box.box_height - 2 * box.document().documentMargin()
+
+
+def _line_ends(document, width=None):
+    """(end offset, bottom) of every line of `document` laid out `width` wide (its own width if None).
+
+    Measured through the shared paragraph layouts, which place lines as
+    Qt's document layout does, so line spacing and paragraph margins
+    count; paragraphs already measured at this width aren't laid out
+    again. Bottoms are from the top of the text area.
+    """
+    for block, lines, top in shared_paragraph_layouts().document_lines(document, width):
+        position, last = block.position(), block.length() - 1
+        for line in lines.lines:
+            yield position + min(line.start + line.length, last), top + line.top + line.height
+
+
+def _text_height(document, width=None):
+    return shared_paragraph_layouts().text_height(document, width)
+
+
+def fit_offset(document, width, room):
+    """Offset of the first character of `document` that doesn't fit in `room`, None if it all fits.
+
+    The first line always fits, so a line taller than a box can't bounce
+    along the whole chain. A line ending at a paragraph break leaves the
+    break behind.
+    """
+    text_end = document.characterCount() - 1
+    previous = None
+    for end, bottom in _line_ends(document, width):
+        if bottom > room and previous is not None:
+            if previous >= text_end:
+                return None
+            block = document.findBlock(previous)
+            if previous == block.position() + block.length() - 1:
+                return previous + 1
+            return previous
+        previous = end
+    return None
+
+
+def overflow_offset(box):
+    """Document offset of the first character that doesn't fit in `box`, None if it all fits"""
+    return fit_offset(box.document(), None, box_room(box))
+
+
+# Moving text
+
+def cut_tail(document, split):
+    """Remove document[split:]. Returns (fragment, its paragraph format, whether it starts a paragraph)."""
+    cursor = QTextCursor(document)
+    cursor.setPosition(split)
+    paragraph_format = cursor.blockFormat()
+    starts_paragraph = cursor.atBlockStart() and split > 0
+    cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+    fragment = cursor.selection()
+    if starts_paragraph:
+        # The paragraph break before the moved text goes with it
+        cursor.setPosition(split - 1)
+        cursor.movePosition(QTextCursor.MoveOperation.End, QTextCursor.MoveMode.KeepAnchor)
+    cursor.removeSelectedText()
+    return fragment, paragraph_format, starts_paragraph
+
+
+def cut_head(document, split):
+    """Remove document[:split] (all of it if `split` is None).
+
+    Returns (fragment, its first paragraph format, whether what is left starts a paragraph).
+    """
+    first_format = document.begin().blockFormat()
+    text_end = document.characterCount() - 1
+    if split is None:
+        split = text_end
+    cursor = QTextCursor(document)
+    cursor.setPosition(split)
+    ends_paragraph = cursor.atBlockStart() and 0 < split < text_end
+    cursor.setPosition(split - 1 if ends_paragraph else split)
+    cursor.setPosition(0, QTextCursor.MoveMode.KeepAnchor)
+    fragment = cursor.selection()
+    cursor.setPosition(split)
+    cursor.setPosition(0, QTextCursor.MoveMode.KeepAnchor)
+    cursor.removeSelectedText()
+    return fragment, first_format, ends_paragraph
+
+
+def _prepend(document, fragment, paragraph_format, separate):
+    """Insert `fragment` at the start of `document`, as its own paragraph if `separate`"""
+    separate = separate and not is_empty(document)
+    next_format = document.begin().blockFormat()
+    cursor = QTextCursor(document)
+    cursor.beginEditBlock()
+    cursor.insertFragment(fragment)
+    if separate:
+        cursor.insertBlock(next_format)
+    cursor.setPosition(0)
+    cursor.setBlockFormat(paragraph_format)
+    cursor.endEditBlock()
+
+
+def append_fragment(document, fragment, paragraph_format, separate):
+    """Insert `fragment` at the end of `document`, as its own paragraph if `separate`"""
+    cursor = QTextCursor(document)
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    cursor.beginEditBlock()
+    own_paragraph = separate or is_empty(document)
+    if separate and not is_empty(document):
+        cursor.insertBlock()
+    start = cursor.position()
+    cursor.insertFragment(fragment)
+    if own_paragraph:
+        # Inserting a fragment into an empty paragraph replaces its format
+        cursor.setPosition(start)
+        cursor.setBlockFormat(paragraph_format)
+    cursor.endEditBlock()
+
+
+class StoryFlow:
+    """Re-flows chains of linked text boxes after edits, a slice at a time"""
+    def __init__(self):
+        self.pending = []           # Boxes whose boundary with their next box may have moved
+        self.carries = {}           # box -> (QTextDocument, continues): story text waiting in front of the box's text
+        self.boxes_flowed = 0
+        self.text_moves = 0
+        self.held = 0               # hold() depth: while held, edits are queued but not flowed
+        self._busy = False
+        self._timer = None
+
+    def schedule(self, box):
+        """Re-flow the chain of `box` from just before it once control returns to the event loop"""
+        if self._busy or (box.next_box is None and box.prev_box is None):
+            return
+        # An edit at the top of `box` may let text move back into the box before it
+        for start in (box.prev_box, box):
+            if start is not None:
+                self._queue(start)
+        if self._timer is None:
+            self._timer = QTimer()
+            self._timer.setSingleShot(True)
+            self._timer.timeout.connect(self._run_slice)
+        if not self._timer.isActive():
+            self._timer.start(0)
+
+    def _queue(self, box):
+        if box not in self.pending:
+            self.pending.append(box)
+
+    @property
+    def flowing(self):
+        """True while text is being moved between boxes"""
+        return self._busy
+
+    def hold(self):
+        """Stop flowing text until release(), e.g. while a batch edit is half done"""
+        self.held += 1
+
+    def release(self):
+        self.held = max(self.held - 1, 0)
+        if not self.held and self.pending and self._timer is not None:
+            self._timer.start(0)
+
+    def flush(self):
+        """Complete all pending flow now"""
+        if self._timer is not None:
+            self._timer.stop()
+        self._run(None)
+
+    def _run_slice(self):
+        if self.held:
+            return
+        if self._run(time.perf_counter() + FLOW_SLICE_MS / 1000.0):
+            self._timer.start(0)
+
+    def _run(self, deadline):
+        """Flow pending boxes until done or past `deadline`. Returns True if work is left."""
+        self._busy = True
+        try:
+            while self.pending:
+                if deadline is not None and time.perf_counter() > deadline:
+                    return True
+                box = self.pending.pop(0)
+                following = self.flow_box(box)
+                if following is not None and following not in self.pending:
+                    # Stay on the same chain while its boundaries keep moving
+                    self.pending.insert(0, following)
+            return False
+        finally:
+            self._busy = False
+
+    def flow_box(self, box):
+        """Settle the boundary between `box` and its next box.
+
+        Returns the next box if its content changed (so its own boundary
+        has to be settled next), None once the flow is stable.
+        """
+        if box.scene() is None:
+            if box in self.carries:
+                self._return_carry(box)
+            return None
+        self.boxes_flowed += 1
+        if box in self.carries:
+            self._pour(box)
+        following = box.next_box
+        if following is None or following.scene() is None:
+            if following in self.carries:
+                self._return_carry(following)
+            return None
+
+        document, next_document = box.document(), following.document()
+        before = (next_document.characterCount(), box.story_continues)
+        while True:
+            split = overflow_offset(box)
+            if split is not None:
+                if _text_height(document) - box_room(box) > following.box_height:
+                    self._carry(box, following, split)
+                else:
+                    self._push(box, following, split)
+                break
+            if following in self.carries:
+                # Text waiting in front of the next box comes first
+                self._pour(following)
+            if is_empty(next_document):
+                break
+            room = box_room(box) - _text_height(document)
+            if next(_line_ends(next_document))[1] > room:
+                # Not even the next line fits
+                break
+            self._pull(box, following, room)
+        after = (next_document.characterCount(), box.story_continues)
+        return following if after != before or following in self.carries else None
+
+    def _push(self, box, following, split):
+        """Move box[split:] to the start of `following`"""
+        caret = box.textCursor().position() if box.scene().focusItem() is box else None
+        fragment, paragraph_format, starts_paragraph = cut_tail(box.document(), split)
+        _prepend(following.document(), fragment, paragraph_format, separate=not box.story_continues)
+        box.story_continues = not starts_paragraph
+        self._moved()
+
+        if caret is not None and caret >= split and following.scene() is box.scene():
+            # Typing past the end of a box carries on in the next one
+            caret_cursor = following.textCursor()
+            caret_cursor.setPosition(min(caret - split, following.document().characterCount() - 1))
+            following.setTextCursor(caret_cursor)
+            following.setFocus()
+
+    def _pull(self, box, following, room):
+        """Move the first lines of `following` that fit in `room` to the end of `box`"""
+        source = following.document()
+        split = fit_offset(source, None, room)
+        fragment, first_format, ends_paragraph = cut_head(source, split)
+        append_fragment(box.document(), fragment, first_format, separate=not box.story_continues)
+        box.story_continues = following.story_continues if split is None else not ends_paragraph
+        self._moved()
+
+    def _carry(self, box, following, split):
+        """Take box[split:] out of the chain, to be poured in front of `following`"""
+        carry = QTextDocument()
+        carry.setUndoRedoEnabled(False)
+        carry.setDefaultFont(box.document().defaultFont())
+        carry.setDocumentMargin(box.document().documentMargin())
+        fragment, paragraph_format, starts_paragraph = cut_tail(box.document(), split)
+        append_fragment(carry, fragment, paragraph_format, separate=False)
+        self._add_carry(following, carry, box.story_continues)
+        box.story_continues = not starts_paragraph
+        self._moved()
+
+    def _add_carry(self, box, carry, continues):
+        if box in self.carries:
+            # Text already waiting there follows the new text
+            waiting, continues_after = self.carries[box]
+            append_fragment(carry, QTextDocumentFragment(waiting), waiting.begin().blockFormat(), separate=not continues)
+            continues = continues_after
+        self.carries[box] = (carry, continues)
+
+    def _pour(self, box):
+        """Refill `box` from the text carried in front of it plus its own, carrying the rest on"""
+        carry, continues = self.carries.pop(box)
+        document = box.document()
+        if not is_empty(document):
+            append_fragment(carry, QTextDocumentFragment(document), document.begin().blockFormat(),
+                    separate=not continues)
+            continues = box.story_continues
+            cut_head(document, None)
+
+        following = box.next_box
+        split = None if following is None else fit_offset(carry, box.textWidth(), box_room(box))
+        fragment, first_format, ends_paragraph = cut_head(carry, split)
+        append_fragment(document, fragment, first_format, separate=False)
+        self._moved()
+        if split is None:
+            # All of it fits (or this is the last box, which keeps the overset text)
+            box.story_continues = continues
+            return
+        box.story_continues = not ends_paragraph
+        self._add_carry(following, carry, continues)
+        self._queue(following)
+
+    def _return_carry(self, box):
+        """Put the text carried in front of `box`, which left its scene, back at the end of the
+        nearest box before it that is still in one (where it stays as overset text)"""
+        carry, continues = self.carries.pop(box)
+        fragment, paragraph_format = QTextDocumentFragment(carry), carry.begin().blockFormat()
+        previous = box.prev_box
+        while previous is not None and previous.scene() is None:
+            previous = previous.prev_box
+        if previous is None:
+            # Nothing before it is shown: the text stays with the box, and comes back with it on undo
+            _prepend(box.document(), fragment, paragraph_format, separate=not continues)
+        else:
+            append_fragment(previous.document(), fragment, paragraph_format, separate=not previous.story_continues)
+            previous.story_continues = continues
+        self._moved()
+
+    def _moved(self):
+        self.text_moves += 1
+
+    def stats(self):
+        return {"pending": len(self.pending), "carried": len(self.carries),
+                "boxes_flowed": self.boxes_flowed, "text_moves": self.text_moves}
+
+
+_shared_flow = None
+
+
+def shared_story_flow():
+    """The flow engine shared by all documents"""
+    global _shared_flow
+    if _shared_flow is None:
+        _shared_flow = StoryFlow()
+    return _shared_flow
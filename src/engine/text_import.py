@@ -0,0 +1,263 @@
+"""Streaming text import with autoflow.
+
+Reading a large manuscript in one go and inserting it into one box means
+one enormous layout with the UI frozen. TextImport reads the file in
+chunks from the event loop instead. The text goes into a plain carry
+document (laid out only as far as a box's worth of it is measured), and
+each box is filled from its head up to box_height. When a box is full
+a new linked box is made on a new page through the `new_box`
+callback, and the import carries on there. Each box is laid out once,
+with the text it ends up holding.
+
+Text is inserted at the target box's cursor; whatever followed the
+cursor comes after the imported text, and any boxes the target was
+already linked to follow the new ones. The target's own text is written
+once, when the import reaches it, as one step of its document's undo
+history, so earlier steps of that history stay valid. The finished
+import is one TextImportCommand on the view's undo stack: undo takes
+that step back, restores the target's links and takes the new pages out.
+
+Text is taken a line at a time, except that a line longer than
+LONG_LINE_CHARS goes in as pieces split after a space, so a file
+without line breaks still streams.
+"""
+import codecs
+import os
+import time
+
+from PyQt6.QtCore import QTimer
+from PyQt6.QtGui import QTextCursor
+
+from src.engine.text_flow import (shared_story_flow, fit_offset, box_room, cut_head, cut_tail,
+                                  append_fragment, is_empty)
+from src.engine.undo_stack import UndoCommand, _item_cost
+
+# Bytes read from the file at a time
+CHUNK_BYTES = 16 * 1024
+# Longest stretch of import work done before returning to the event loop
+IMPORT_SLICE_MS = 30
+# Longest text without a line break held back until its line is complete
+LONG_LINE_CHARS = 64 * 1024
+
+
+def _set_text(document, fragment, first_format):
+    """Replace everything in `document` with `fragment`, as one undo step"""
+    cursor = QTextCursor(document)
+    cursor.beginEditBlock()
+    cursor.select(QTextCursor.SelectionType.Document)
+    cursor.removeSelectedText()
+    cursor.insertFragment(fragment)
+    # Inserting a fragment into an empty paragraph replaces its format
+    cursor.setPosition(0)
+    cursor.setBlockFormat(first_format)
+    cursor.endEditBlock()
+
+
+class TextImportCommand(UndoCommand):
+    """A finished import, undone as one step: the target box's text and links, and the pages added"""
+    def __init__(self, page_manager, boxes, following, steps, continues, text="Place Text"):
+        super().__init__(text)
+        self.page_manager = page_manager
+        self.boxes = boxes              # The target box, then the boxes made on new pages
+        self.following = following      # Box the target was linked to before the import (after the new ones)
+        self.steps = steps              # Undo steps of the target's document before and after the import
+        self.continues = continues      # story_continues of the target before and after the import
+        self.pages = [box.scene().page for box in boxes[1:]]
+        self._indices = []              # Where the pages were when taken out
+        self.skipped = False            # The target was edited since, so the last undo/redo left it alone
+
+    def undo(self):
+        target = self.boxes[0]
+        document = target.document()
+        self.skipped = target.scene() is None or document.availableUndoSteps() != self.steps[1]
+        if self.skipped:
+            return
+        self._indices = [self.page_manager.remove_page(page) for page in reversed(self.pages)]
+        document.undo()
+        target.story_continues = self.continues[0]
+        target.next_box = self.following
+        if self.following is not None:
+            self.following.prev_box = target
+
+    def redo(self):
+        target = self.boxes[0]
+        document = target.document()
+        self.skipped = (target.scene() is None or document.availableUndoSteps() != self.steps[0]
+                        or not document.isRedoAvailable())
+        if self.skipped:
+            return
+        for page, index in zip(self.pages, reversed(self._indices)):
+            if index is not None:
+                self.page_manager.insert_page(index, page)
+        document.redo()
+        target.story_continues = self.continues[1]
+        last = self.boxes[-1]
+        target.next_box = self.boxes[1] if len(self.boxes) > 1 else self.following
+        last.next_box = self.following
+        if self.following is not None:
+            self.following.prev_box = last
+
+    def cost(self):
+        # The target's text is kept by its document's undo history
+        return 64 + sum(_item_cost(box) for box in self.boxes[1:])
+
+    def scenes(self):
+        return {box.scene() for box in self.boxes if box.scene() is not None}
+
+
+class TextImport:
+    """Streams a UTF-8 text file into `box` and new boxes linked after it, a slice at a time.
+
+    `record(command)` is called once finished, before on_finished, with
+    the TextImportCommand of the import.
+    """
+    def __init__(self, path, box, new_box, page_manager=None, record=None):
+        self.path = path
+        self.new_box = new_box          # Callable() -> empty TextBox on a new page
+        self.page_manager = page_manager
+        self.record = record
+        self.command = None             # TextImportCommand, once finished
+        self.box = box                  # Box being filled
+        self.boxes = [box]
+        self.total_bytes = os.path.getsize(path)
+        self.read_bytes = 0
+        self.cancelled = False
+        self.finished = False
+        self.error = None               # OSError that ended reading early
+
+        # Callbacks
+        self.on_progress = None         # on_progress(read_bytes, total_bytes, boxes)
+        self.on_finished = None         # on_finished(import)
+
+        self._file = None
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+        self._partial = ""              # Text after the last line break read so far
+        self._eof = False
+
+        document = box.document()
+        self._steps = document.availableUndoSteps()
+        self._continues = box.story_continues
+        # The target's text up to the cursor starts the carry, the rest waits for the end;
+        # the target itself keeps its text until the import reaches it
+        cursor = box.textCursor()
+        position = cursor.position() if cursor.position() < document.characterCount() - 1 else None
+        self._format = cursor.charFormat()
+        self._carry = document.clone()
+        self._carry.setUndoRedoEnabled(False)
+        self._carry.setDocumentMargin(document.documentMargin())
+        self._tail = cut_tail(self._carry, position) if position is not None else None
+        self._separate = self._tail is not None and self._tail[2]
+        # Boxes linked after the target wait until the import is done, so flow leaves them alone
+        self._after = box.next_box
+        if self._after is not None:
+            box.next_box = self._after.prev_box = None
+
+    def start(self):
+        self._file = open(self.path, "rb")
+        # The import places the text itself: flow would move it around boxes still being filled
+        shared_story_flow().hold()
+        QTimer.singleShot(0, self._step)
+
+    def cancel(self):
+        """Stop reading; the text imported so far stays"""
+        self.cancelled = True
+
+    def _step(self):
+        deadline = time.perf_counter() + IMPORT_SLICE_MS / 1000.0
+        while time.perf_counter() < deadline:
+            at_end = self._eof or self.cancelled
+            if at_end and self._tail is not None:
+                fragment, paragraph_format, starts_paragraph = self._tail
+                append_fragment(self._carry, fragment, paragraph_format, separate=starts_paragraph)
+                self._tail = None
+                continue
+            split = fit_offset(self._carry, self.box.textWidth(), box_room(self.box))
+            if split is not None and not (at_end and self._after is not None):
+                self._fill(split)
+            elif at_end:
+                # What's left fits, or flows on into the boxes linked after the import
+                self._finish()
+                return
+            else:
+                self._read_chunk()
+        if self.on_progress:
+            self.on_progress(self.read_bytes, self.total_bytes, len(self.boxes))
+        QTimer.singleShot(0, self._step)
+
+    def _read_chunk(self):
+        try:
+            data = self._file.read(CHUNK_BYTES)
+        except OSError as e:
+            self.error = e
+            data = b""
+        self.read_bytes += len(data)
+        self._eof = not data
+        text = self._partial + self._decoder.decode(data, final=self._eof)
+        if self._eof:
+            complete, self._partial = text, ""
+        else:
+            # Whole lines only, so paragraphs aren't measured half read
+            end = text.rfind("\n")
+            if end < 0:
+                if len(text) < LONG_LINE_CHARS:
+                    self._partial = text
+                    return
+                # A very long paragraph goes in a piece at a time, split after a space
+                # (and not between the \r and \n of a line break)
+                split = text.rfind(" ") + 1
+                if not split:
+                    split = len(text) - 1 if text.endswith("\r") else len(text)
+                complete, self._partial = text[:split], text[split:]
+                self._insert(complete, ends_paragraph=False)
+                return
+            complete, self._partial = text[:end], text[end + 1:]
+        self._insert(complete.replace("\r\n", "\n"))
+
+    def _insert(self, text, ends_paragraph=True):
+        cursor = QTextCursor(self._carry)
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        if self._separate and not is_empty(self._carry):
+            cursor.insertBlock()
+        cursor.insertText(text, self._format)
+        self._separate = ends_paragraph
+
+    def _fill(self, split):
+        """Move the carry up to `split` into the box being filled and go on to a new box"""
+        fragment, first_format, ends_paragraph = cut_head(self._carry, split)
+        self._put(fragment, first_format)
+        self.box.story_continues = not ends_paragraph
+        following = self.new_box()
+        self.box.next_box = following
+        following.prev_box = self.box
+        self.box = following
+        self.boxes.append(following)
+
+    def _put(self, fragment, first_format):
+        """Give the box being filled its text: the target in one undo step, new boxes without history"""
+        document = self.box.document()
+        if self.box is self.boxes[0]:
+            _set_text(document, fragment, first_format)
+        else:
+            append_fragment(document, fragment, first_format, separate=False)
+            document.clearUndoRedoStacks()
+
+    def _finish(self):
+        self._file.close()
+        shared_story_flow().release()
+        fragment, first_format, _ = cut_head(self._carry, None)
+        self._put(fragment, first_format)
+        self.box.story_continues = self._continues
+        if self._after is not None:
+            self.box.next_box = self._after
+            self._after.prev_box = self.box
+            shared_story_flow().schedule(self._after)
+        self.finished = True
+        if self.page_manager is not None:
+            target = self.boxes[0]
+            self.command = TextImportCommand(self.page_manager, self.boxes, self._after,
+                                             [self._steps, target.document().availableUndoSteps()],
+                                             [self._continues, target.story_continues])
+        if self.record:
+            self.record(self.command)
+        if self.on_finished:
+            self.on_finished(self)
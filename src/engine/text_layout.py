@@ -0,0 +1,255 @@
+"""Line breaks of paragraphs, memoized.
+
+Laying Nastaliq out is the most expensive thing the app does, and much
+of it is repeated: autoflow and import measure the same carried text
+after every cut, greeking measures boxes Qt has never laid out, and a
+resize drag lays a box out again at every mouse move. ParagraphLayouts
+keeps one QTextLayout per paragraph, shaped once for its (default font,
+text, run formats, paragraph format), and the line breaks it gets at
+each width. Paragraphs whose text or format changed miss and are shaped
+afresh; the rest are hits. Qt's document layout still does the drawing
+of text being edited, so lines here are placed the way
+QTextDocumentLayout places them: paragraph margins, first line indent,
+alignment and proportional line height.
+"""
+import math
+from collections import OrderedDict, namedtuple
+
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QBrush, QColor, QFont, QTextBlockFormat, QTextLayout, QTextOption
+
+# Paragraphs whose shaped layouts are kept
+MAX_PARAGRAPHS = 4096
+# Widths whose line breaks are kept per paragraph
+MAX_WIDTHS = 8
+
+# One line: text offsets in its paragraph, and the rect of its text relative to the
+# paragraph's top left (x and width cover the glyphs, top and height the whole line)
+Line = namedtuple("Line", "start length x width top height")
+
+
+class ParagraphLines(namedtuple("ParagraphLines", "lines height")):
+    """Lines of one paragraph at one width; `height` excludes the paragraph margins"""
+
+
+def _value_key(value):
+    if isinstance(value, QFont):
+        return value.toString()
+    if isinstance(value, QBrush):
+        return (value.style().value, value.color().rgba())
+    if isinstance(value, QColor):
+        return value.rgba()
+    try:
+        hash(value)
+    except TypeError:
+        return repr(value)
+    return value
+
+
+def _format_key(text_format):
+    return tuple(sorted((key, _value_key(value)) for key, value in text_format.properties().items()))
+
+
+def _block_key(block):
+    document = block.document()
+    formats = tuple((r.start, r.length, _format_key(r.format)) for r in block.textFormats())
+    return (document.defaultFont().toString(), block.text(), formats, _format_key(block.charFormat()),
+            _format_key(block.blockFormat()), block.textDirection().value)
+
+
+class _Paragraph:
+    """A paragraph shaped once, and its lines at the widths it was laid out at"""
+    __slots__ = ("layout", "block_format", "rtl", "widths", "laid_width")
+
+    def __init__(self, block):
+        document = block.document()
+        self.block_format = QTextBlockFormat(block.blockFormat())
+        self.rtl = block.textDirection() == Qt.LayoutDirection.RightToLeft
+        font = document.defaultFont()
+        if not block.text():
+            # An empty paragraph is as high as the format of its paragraph break
+            font = block.charFormat().font().resolve(font)
+        self.layout = QTextLayout(block.text(), font)
+        option = QTextOption(document.defaultTextOption())
+        option.setTextDirection(block.textDirection())
+        option.setAlignment(_visual_alignment(self.block_format.alignment(), self.rtl))
+        if self.block_format.nonBreakableLines():
+            option.setWrapMode(QTextOption.WrapMode.NoWrap)
+        self.layout.setTextOption(option)
+        self.layout.setFormats(block.textFormats())
+        self.widths = OrderedDict()
+        self.laid_width = None          # Width the QTextLayout's own lines are at
+
+    def lines(self, width):
+        lines = self.widths.get(width)
+        if lines is None:
+            lines = self._break(width)
+            self.widths[width] = lines
+            if len(self.widths) > MAX_WIDTHS:
+                self.widths.popitem(last=False)
+        else:
+            self.widths.move_to_end(width)
+        return lines
+
+    def _break(self, width):
+        """Lay the shaped paragraph out `width` wide (the room between the document's margins)"""
+        block_format = self.block_format
+        left, right = block_format.leftMargin(), block_format.rightMargin()
+        indent = block_format.textIndent()
+        available = width - left - right
+        layout = self.layout
+        layout.beginLayout()
+        y = 0.0
+        lines = []
+        while True:
+            line = layout.createLine()
+            if not line.isValid():
+                break
+            first = not lines
+            line.setLineWidth(max(available - (indent if first else 0.0), 0.0))
+            x = left + (indent if first and not self.rtl else 0.0)
+            step = _line_step(block_format, line)
+            line.setPosition(QPointF(x, y))
+            rect = line.naturalTextRect()
+            lines.append(Line(line.textStart(), line.textLength(), rect.x(), rect.width(), y, line.height()))
+            y += step
+        layout.endLayout()
+        self.laid_width = width
+        return ParagraphLines(tuple(lines), y)
+
+    def draw(self, painter, origin, width):
+        if self.laid_width != width:
+            self._break(width)
+        self.layout.draw(painter, origin)
+
+
+def _visual_alignment(alignment, rtl):
+    """Alignment with leading/trailing resolved, as QTextDocumentLayout applies it"""
+    horizontal = alignment & Qt.AlignmentFlag.AlignHorizontal_Mask
+    if horizontal & Qt.AlignmentFlag.AlignAbsolute or not rtl:
+        return alignment
+    if horizontal & Qt.AlignmentFlag.AlignLeft:
+        horizontal = Qt.AlignmentFlag.AlignRight
+    elif horizontal & Qt.AlignmentFlag.AlignRight:
+        horizontal = Qt.AlignmentFlag.AlignLeft
+    return (alignment & ~Qt.AlignmentFlag.AlignHorizontal_Mask) | horizontal
+
+
+def _line_step(block_format, line):
+    """How far the next line starts below `line`, as QTextDocumentLayout spaces them"""
+    if block_format.lineHeightType() == QTextBlockFormat.LineHeightTypes.SingleHeight.value:
+        return line.height()
+    raw = math.ceil(line.ascent() + line.descent() + line.leading())
+    # Qt keeps line positions in 26.6 fixed point
+    return math.floor(block_format.lineHeight(raw, 1.0) * 64) / 64
+
+
+class ParagraphLayouts:
+    """Shaped paragraphs and their line breaks, least recently used dropped first"""
+    def __init__(self, max_paragraphs=MAX_PARAGRAPHS):
+        self.max_paragraphs = max_paragraphs
+        self._paragraphs = OrderedDict()
+        self.hits = 0               # Paragraph and width both known
+        self.width_misses = 0       # Paragraph known, broken into lines at a new width
+        self.misses = 0             # Paragraph shaped afresh
+
+    def _paragraph(self, block, width):
+        key = _block_key(block)
+        paragraph = self._paragraphs.get(key)
+        if paragraph is None:
+            self.misses += 1
+            paragraph = self._paragraphs[key] = _Paragraph(block)
+            if len(self._paragraphs) > self.max_paragraphs:
+                self._paragraphs.popitem(last=False)
+        else:
+            self._paragraphs.move_to_end(key)
+            if width in paragraph.widths:
+                self.hits += 1
+            else:
+                self.width_misses += 1
+        return paragraph
+
+    def paragraph_lines(self, block, width):
+        """ParagraphLines of `block` laid out in a document whose text area is `width` wide"""
+        return self._paragraph(block, width).lines(width)
+
+    def _paragraphs_of(self, document, width):
+        """(block, _Paragraph, its lines, top) for every paragraph of `document`, `width` its text area.
+
+        As in QTextDocumentLayout, the space between paragraphs is the
+        larger of their margins, and the first paragraph's top margin
+        doesn't count.
+        """
+        top = 0.0
+        previous = None
+        block = document.begin()
+        while block.isValid():
+            block_format = block.blockFormat()
+            if previous is not None:
+                top += max(block_format.topMargin(), previous.bottomMargin())
+            paragraph = self._paragraph(block, width)
+            lines = paragraph.lines(width)
+            yield block, paragraph, lines, top
+            top += lines.height
+            previous = block_format
+            block = block.next()
+
+    def document_lines(self, document, width=None):
+        """(block, its ParagraphLines, top of the paragraph) for every paragraph of `document`.
+
+        `width` is the document's text width (its own if None). Tops are
+        from the top of the text area, inside the document margin.
+        """
+        for block, _, lines, top in self._paragraphs_of(document, _text_area_width(document, width)):
+            yield block, lines, top
+
+    def text_height(self, document, width=None):
+        """Height of `document`'s text (without the document margins), laid out with text width `width`"""
+        height = 0.0
+        for _, lines, top in self.document_lines(document, width):
+            height = top + lines.height
+        return height
+
+    def draw(self, painter, document, width):
+        """Paint `document`'s text as it would be laid out with text width `width`"""
+        margin = document.documentMargin()
+        area = _text_area_width(document, width)
+        for _, paragraph, _, top in self._paragraphs_of(document, area):
+            paragraph.draw(painter, QPointF(margin, margin + top), area)
+
+    def clear(self):
+        self._paragraphs.clear()
+
+    def stats(self):
+        lookups = self.hits + self.width_misses + self.misses
+        return {
+            "paragraphs": len(self._paragraphs),
+            "hits": self.hits,
+            "width_misses": self.width_misses,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "shaped_hit_rate": (self.hits + self.width_misses) / lookups if lookups else 0.0,
+        }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Paragraph layouts: {stats['paragraphs']} paragraphs, {stats['hits']} hits / "
+                f"{stats['width_misses']} new widths / {stats['misses']} shaped ({stats['hit_rate']:.0%}, "
+                f"{stats['shaped_hit_rate']:.0%} without shaping)")
+
+
+def _text_area_width(document, width):
+    if width is None:
+        width = document.textWidth()
+    return width - 2 * document.documentMargin()
+
+
+_shared = None
+
+
+def shared_paragraph_layouts():
+    """The ParagraphLayouts every box measures through"""
+    global _shared
+    if _shared is None:
+        _shared = ParagraphLayouts()
+    return _shared
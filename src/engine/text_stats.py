@@ -0,0 +1,229 @@
+"""Word, character and paragraph counts, kept up to date as text is edited.
+
+A TextStats counts a box's document once, paragraph by paragraph, then
+recounts only the paragraphs each contentsChange touched. A page's sums
+are cached by its revision: live pages add up their boxes' counters,
+pages that aren't built count their stored stories. Document
+totals add up the page sums, so a count after an edit recounts one
+paragraph and re-adds the boxes of one page.
+
+Words are runs of letters and digits, with Urdu marks (aerab) and the
+zero-width (non-)joiners inside them: "کتاب‌وں" is one word, while
+punctuation like ۔ ، ؛ ؟ and spaces separate words.
+"""
+import re
+import time
+
+from src.engine.text_box import TextBox
+from src.engine.shape_items import ImageItem
+from src.engine.text_flow import overflow_offset
+
+# Marks and joiners that belong to the word they are in
+_WORD_MARKS = ("\u200c\u200d\u0300-\u036f\u0610-\u061a\u064b-\u065f\u0670"
+               "\u06d6-\u06dc\u06df-\u06e4\u06e7\u06e8\u06ea-\u06ed")
+WORD = re.compile(rf"[{_WORD_MARKS}]*\w[\w{_WORD_MARKS}]*")
+_WORD_CHAR = re.compile(rf"[\w{_WORD_MARKS}]")
+_SPACE = re.compile(r"\s")
+# Paragraph separators of QTextDocument raw text and of stored stories
+_PARAGRAPHS = re.compile("[\n\u2029]")
+
+# Fields of a count, in order
+FIELDS = ("words", "characters", "characters_no_spaces", "paragraphs")
+# Longest stretch of counting done by a refresh with a deadline
+COUNT_SLICE_MS = 10
+
+
+def count_paragraph(text):
+    """(words, characters, characters without spaces, paragraphs) of one paragraph's text"""
+    characters = len(text)
+    spaces = len(_SPACE.findall(text))
+    return (len(WORD.findall(text)), characters, characters - spaces, 1 if characters > spaces else 0)
+
+
+def count_text(text):
+    """Counts of a text whose paragraphs are separated by newlines or U+2029"""
+    totals = [0, 0, 0, 0]
+    for paragraph in _PARAGRAPHS.split(text):
+        for i, value in enumerate(count_paragraph(paragraph)):
+            totals[i] += value
+    return tuple(totals)
+
+
+def as_dict(counts):
+    return dict(zip(FIELDS, counts))
+
+
+class TextStats:
+    """Counts of one QTextDocument, kept per paragraph and updated from contentsChange"""
+    def __init__(self, document):
+        self.document = document
+        self._blocks = None             # counts of each block, built on first use
+        self._totals = [0, 0, 0, 0]
+        self.recounted = 0              # Blocks counted since created (incremental updates included)
+        # A document only emits contentsChange once it has a layout
+        document.documentLayout()
+        document.contentsChange.connect(self._on_change)
+
+    def counts(self):
+        """(words, characters, characters without spaces, paragraphs)"""
+        if self._blocks is None:
+            self._build()
+        return tuple(self._totals)
+
+    def _build(self):
+        self._blocks = []
+        block = self.document.begin()
+        while block.isValid():
+            self._blocks.append(count_paragraph(block.text()))
+            block = block.next()
+        self.recounted += len(self._blocks)
+        self._totals = [sum(values) for values in zip(*self._blocks)] if self._blocks else [0, 0, 0, 0]
+
+    def _on_change(self, position, removed, added):
+        if self._blocks is None:
+            return
+        document = self.document
+        first = document.findBlock(position)
+        last = document.findBlock(position + added)
+        if not last.isValid():
+            last = document.lastBlock()
+        # Blocks before `first` and after `last` are as they were; the count in between changed by
+        # as many blocks as the document did
+        start = first.blockNumber()
+        old_end = last.blockNumber() + 1 - (document.blockCount() - len(self._blocks))
+        if start < 0 or old_end < start or old_end > len(self._blocks):
+            self._blocks = None         # Out of step: count it all again when next asked
+            return
+        counts = []
+        block = first
+        while True:
+            counts.append(count_paragraph(block.text()))
+            if block == last:
+                break
+            block = block.next()
+        self.recounted += len(counts)
+        for old in self._blocks[start:old_end]:
+            for i, value in enumerate(old):
+                self._totals[i] -= value
+        for new in counts:
+            for i, value in enumerate(new):
+                self._totals[i] += value
+        self._blocks[start:old_end] = counts
+
+
+def box_stats(box):
+    """The TextStats of a TextBox, created when first asked for"""
+    if box.text_stats is None:
+        box.text_stats = TextStats(box.document())
+    return box.text_stats
+
+
+def _continued_word(box):
+    """Whether a word is split between `box` and the next box of its story (counted in both)"""
+    following = box.next_box
+    if not box.story_continues or following is None:
+        return False
+    text, next_text = box.document().toRawText(), following.document().toRawText()
+    return bool(text and next_text and _WORD_CHAR.match(text[-1]) and _WORD_CHAR.match(next_text[0]))
+
+
+class _PageCounts:
+    __slots__ = ("revision", "counts", "images", "frames", "overset")
+
+    def __init__(self, revision, counts, images, frames, overset):
+        self.revision = revision
+        self.counts = counts
+        self.images = images
+        self.frames = frames            # Text frames
+        self.overset = overset          # Characters that don't fit in the last box of their story
+
+
+class DocumentStats:
+    """Word, character, paragraph, page, image and overset counts of a PageManager"""
+    def __init__(self, page_manager):
+        self.page_manager = page_manager
+        self._pages = {}                # page uid -> _PageCounts
+        self.pages_counted = 0
+
+    def refresh(self, deadline=None):
+        """Recount the pages changed (or added) since the last call.
+
+        Stops once past `deadline` (a perf_counter() time); returns True if pages are left.
+        """
+        pages = self.page_manager.pages
+        for page in pages:
+            entry = self._pages.get(page.uid)
+            if entry is None or entry.revision != page.revision:
+                if deadline is not None and time.perf_counter() > deadline:
+                    return True
+                self._pages[page.uid] = self._count_page(page)
+        if len(self._pages) > len(pages):
+            uids = {page.uid for page in pages}
+            for uid in [uid for uid in self._pages if uid not in uids]:
+                del self._pages[uid]
+        return False
+
+    def pending(self):
+        """Whether pages changed since the last refresh are still to be recounted"""
+        counted = self._pages
+        return any(page.uid not in counted or counted[page.uid].revision != page.revision
+                   for page in self.page_manager.pages)
+
+    def _count_page(self, page):
+        self.pages_counted += 1
+        totals = [0, 0, 0, 0]
+        images = frames = overset = 0
+        if page.is_materialized():
+            for item in page.scene.items():
+                if isinstance(item, ImageItem):
+                    images += 1
+                elif isinstance(item, TextBox):
+                    frames += 1
+                    for i, value in enumerate(box_stats(item).counts()):
+                        totals[i] += value
+                    if _continued_word(item):
+                        totals[0] -= 1
+                    if item.next_box is None:
+                        split = overflow_offset(item)
+                        if split is not None:
+                            overset += item.document().characterCount() - 1 - split
+            return _PageCounts(page.revision, tuple(totals), images, frames, overset)
+        # Not built: count the stored stories (overset text needs a layout, so it counts as none)
+        for item in page.to_record().walk_items():
+            if item.kind == "image":
+                images += 1
+            elif item.story is not None:
+                frames += 1
+                for i, value in enumerate(count_text(item.story.plain_text())):
+                    totals[i] += value
+        return _PageCounts(page.revision, tuple(totals), images, frames, overset)
+
+    def page_stats(self, page):
+        """Counts of one page, as a dict"""
+        entry = self._pages.get(page.uid)
+        if entry is None or entry.revision != page.revision:
+            entry = self._pages[page.uid] = self._count_page(page)
+        stats = as_dict(entry.counts)
+        stats.update(images=entry.images, frames=entry.frames, overset=entry.overset)
+        return stats
+
+    def totals(self, deadline=None):
+        """Document counts as a dict, with "complete" False if `deadline` stopped the recount early"""
+        complete = not self.refresh(deadline)
+        totals = [0, 0, 0, 0]
+        images = frames = overset = 0
+        for entry in self._pages.values():
+            for i, value in enumerate(entry.counts):
+                totals[i] += value
+            images += entry.images
+            frames += entry.frames
+            overset += entry.overset
+        stats = as_dict(totals)
+        stats.update(pages=self.page_manager.page_count(), images=images, frames=frames, overset=overset,
+                     complete=complete)
+        return stats
+
+    def summary(self, deadline=None):
+        """Status bar text: the word count of the document"""
+        stats = self.totals(deadline)
+        return f"Words: {stats['words']}" + ("" if stats["complete"] else "…")
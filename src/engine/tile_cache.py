@@ -0,0 +1,209 @@
+"""Tiled backing store for rendered pages.
+
+Pages are rendered into TILE_SIZE x TILE_SIZE pixmaps at a fixed set of
+zoom buckets, so repainting a page (scrolling past it, or drawing it at a
+zoom close to a bucket) blits pixmaps instead of laying out and painting
+Nastaliq text again. Missing tiles are requested while drawing and
+rendered from the event loop in time slices of at most `slice_ms`; until
+then a tile from another bucket or a plain page is drawn.
+
+Tiles are invalidated exactly: the cache watches the scene of every page
+it holds tiles for and drops only the tiles intersecting the rects
+reported by QGraphicsScene.changed. Memory is capped, least recently used
+tiles going first.
+"""
+import functools
+import math
+import time
+import weakref
+from collections import OrderedDict
+
+from PyQt6.QtCore import Qt, QObject, QRectF, QTimer, pyqtSignal
+from PyQt6.QtGui import QImage, QPixmap, QPainter, QColor
+
+TILE_SIZE = 256
+ZOOM_BUCKETS = (0.25, 0.5, 1.0, 2.0, 4.0)
+MAX_QUEUED = 256
+
+
+def zoom_bucket(scale):
+    """Smallest bucket at least as fine as `scale` device pixels per page unit"""
+    for bucket in ZOOM_BUCKETS:
+        if bucket >= scale:
+            return bucket
+    return ZOOM_BUCKETS[-1]
+
+
+class TileCache(QObject):
+    """Rendered page tiles keyed by (page uid, bucket, column, row)"""
+    # page uid of a freshly rendered tile
+    tile_ready = pyqtSignal(str)
+
+    def __init__(self, memory_cap=96 * 1024 * 1024, slice_ms=8.0, parent=None):
+        super().__init__(parent)
+        self.memory_cap = memory_cap
+        self.slice_ms = slice_ms
+        self.tiles = OrderedDict()  # key -> QPixmap, least recently used first
+        self._page_keys = {}        # page uid -> set of keys
+        self._scenes = weakref.WeakValueDictionary()  # page uid -> watched scene
+        self._queue = OrderedDict()  # key -> page
+        self.hits = 0
+        self.misses = 0
+        self.rendered = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._render_slice)
+
+    def draw_page(self, painter, page, target, exposed, scale):
+        """Draw `page` into `target` (scene coordinates) from tiles, limited to `exposed`.
+
+        `scale` is the device pixels per page unit the painter draws at.
+        Returns True if every needed tile was cached.
+        """
+        bucket = zoom_bucket(scale)
+        step = TILE_SIZE / bucket  # Tile side in page units
+        area = exposed.intersected(target).translated(-target.left(), -target.top())
+        area = area.intersected(QRectF(0, 0, page.width, page.height))
+        if area.isEmpty():
+            return True
+        self._watch(page)
+
+        complete = True
+        first_col, last_col = int(area.left() // step), int(math.ceil(area.right() / step))
+        first_row, last_row = int(area.top() // step), int(math.ceil(area.bottom() / step))
+        for row in range(first_row, last_row):
+            for col in range(first_col, last_col):
+                tile_rect = QRectF(target.left() + col * step, target.top() + row * step, step, step)
+                key = (page.uid, bucket, col, row)
+                pixmap = self.tiles.get(key)
+                if pixmap is not None:
+                    self.hits += 1
+                    self.tiles.move_to_end(key)
+                    painter.drawPixmap(tile_rect, pixmap, QRectF(pixmap.rect()))
+                    continue
+                self.misses += 1
+                complete = False
+                self._request(key, page)
+                self._draw_fallback(painter, page, target, tile_rect)
+        return complete
+
+    def _draw_fallback(self, painter, page, target, tile_rect):
+        # Any bucket's tiles covering the area, scaled; else a blank page
+        page_rect = tile_rect.intersected(target)
+        painter.save()
+        painter.setClipRect(page_rect)
+        painter.fillRect(page_rect, QColor("white"))
+        for bucket in ZOOM_BUCKETS:
+            step = TILE_SIZE / bucket
+            local = page_rect.translated(-target.left(), -target.top())
+            for row in range(int(local.top() // step), int(math.ceil(local.bottom() / step))):
+                for col in range(int(local.left() // step), int(math.ceil(local.right() / step))):
+                    pixmap = self.tiles.get((page.uid, bucket, col, row))
+                    if pixmap is not None:
+                        rect = QRectF(target.left() + col * step, target.top() + row * step, step, step)
+                        painter.drawPixmap(rect, pixmap, QRectF(pixmap.rect()))
+        painter.restore()
+
+    def _request(self, key, page):
+        self._queue[key] = page
+        self._queue.move_to_end(key)
+        # Requests that old have scrolled out of view long ago
+        while len(self._queue) > MAX_QUEUED:
+            self._queue.popitem(last=False)
+        if not self._timer.isActive():
+            self._timer.start(0)
+
+    def _render_slice(self):
+        start = time.perf_counter()
+        ready = set()
+        while self._queue and (time.perf_counter() - start) * 1000 < self.slice_ms:
+            # Most recently requested first: that is what is on screen now
+            key, page = self._queue.popitem(last=True)
+            if key in self.tiles:
+                continue
+            self._store(key, self._render_tile(page, key))
+            ready.add(key[0])
+        for uid in ready:
+            self.tile_ready.emit(uid)
+        if self._queue:
+            self._timer.start(0)
+
+    def _render_tile(self, page, key):
+        uid, bucket, col, row = key
+        step = TILE_SIZE / bucket
+        source = QRectF(col * step, row * step, step, step).intersected(
+            QRectF(0, 0, page.width, page.height))
+        image = QImage(TILE_SIZE, TILE_SIZE, QImage.Format.Format_ARGB32_Premultiplied)
+        image.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(image)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+        painter.setRenderHint(QPainter.RenderHint.TextAntialiasing)
+        target = QRectF((source.left() - col * step) * bucket, (source.top() - row * step) * bucket,
+                        source.width() * bucket, source.height() * bucket)
+        page.render(painter, target, source)
+        painter.end()
+        return QPixmap.fromImage(image)
+
+    def _store(self, key, pixmap):
+        self.tiles[key] = pixmap
+        self._page_keys.setdefault(key[0], set()).add(key)
+        self.rendered += 1
+        tile_bytes = TILE_SIZE * TILE_SIZE * 4
+        while len(self.tiles) * tile_bytes > self.memory_cap:
+            old_key, _ = self.tiles.popitem(last=False)
+            self._page_keys[old_key[0]].discard(old_key)
+
+    def _watch(self, page):
+        scene = page.scene
+        if self._scenes.get(page.uid) is not scene:
+            self._scenes[page.uid] = scene
+            scene.changed.connect(functools.partial(self._scene_changed, page.uid))
+
+    def _scene_changed(self, uid, rects):
+        for rect in rects:
+            self.invalidate(uid, rect)
+
+    def invalidate(self, uid, rect=None):
+        """Drop the tiles of page `uid` intersecting `rect` (page coordinates), or all of them"""
+        keys = self._page_keys.get(uid)
+        if not keys:
+            return
+        for key in list(keys):
+            _, bucket, col, row = key
+            step = TILE_SIZE / bucket
+            if rect is None or rect.intersects(QRectF(col * step, row * step, step, step)):
+                keys.discard(key)
+                self.tiles.pop(key, None)
+
+    def clear(self):
+        """Drop every tile (e.g. when pages would render differently now)"""
+        self.tiles.clear()
+        self._page_keys.clear()
+        self._queue.clear()
+
+    def memory_used(self):
+        return len(self.tiles) * TILE_SIZE * TILE_SIZE * 4
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"tiles": len(self.tiles), "memory_used": self.memory_used(),
+                "memory_cap": self.memory_cap, "hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0, "rendered": self.rendered,
+                "queued": len(self._queue)}
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Tile cache: {stats['tiles']} tiles, {stats['memory_used'] / (1024 * 1024):.1f} of "
+                f"{stats['memory_cap'] / (1024 * 1024):.0f} MB, {stats['hits']} hits / "
+                f"{stats['misses']} misses ({stats['hit_rate']:.0%})")
+
+
+_shared_cache = None
+
+
+def shared_tile_cache():
+    """The tile cache shared by all document views"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = TileCache()
+    return _shared_cache
@@ -0,0 +1,496 @@
+from PyQt6.QtWidgets import QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QGraphicsPolygonItem
+from PyQt6.QtCore import QRectF, QLineF
+from PyQt6.QtGui import QPolygonF, QPen, QBrush
+from collections import deque
+import time
+
+
+def _item_cost(item):
+    """Rough estimate of the memory kept alive by holding a reference to an item"""
+    from src.engine.text_box import TextBox
+
+    if isinstance(item, TextBox):
+        # QTextDocument keeps roughly two bytes per character plus block overhead
+        return 512 + item.document().characterCount() * 2
+    return 256
+
+
+def capture_geometry(item):
+    """Capture the geometry of an item so it can be restored later"""
+    from src.engine.text_box import TextBox
+
+    state = {"pos": item.pos(), "rotation": item.rotation()}
+    if isinstance(item, TextBox):
+        state["width"] = item.textWidth()
+        state["height"] = item.box_height
+    elif isinstance(item, (QGraphicsRectItem, QGraphicsEllipseItem)):
+        state["rect"] = QRectF(item.rect())
+    elif isinstance(item, QGraphicsLineItem):
+        state["line"] = QLineF(item.line())
+    elif isinstance(item, QGraphicsPolygonItem):
+        state["polygon"] = QPolygonF(item.polygon())
+    return state
+
+
+def apply_geometry(item, state):
+    """Restore geometry captured with capture_geometry()"""
+    from src.engine.text_box import TextBox
+
+    item.setPos(state["pos"])
+    item.setRotation(state["rotation"])
+    if isinstance(item, TextBox):
+        item.setTextWidth(state["width"])
+        item.box_height = state["height"]
+    elif "rect" in state:
+        item.setRect(state["rect"])
+    elif "line" in state:
+        item.setLine(state["line"])
+    elif "polygon" in state:
+        item.setPolygon(state["polygon"])
+    if hasattr(item, 'update_handles'):
+        item.update_handles()
+
+
+class UndoCommand:
+    """A single recorded change to the document.
+
+    Commands are pushed *after* the change has been applied, so pushing
+    never re-executes the operation. Each command only keeps the delta it
+    needs to go back and forth.
+    """
+    # Commands with the same non-None merge_key may be merged into one step
+    merge_key = None
+    # Set by UndoStack when the command is pushed
+    recorded_cost = 0
+
+    def __init__(self, text=""):
+        self.text = text
+
+    def undo(self):
+        raise NotImplementedError
+
+    def redo(self):
+        raise NotImplementedError
+
+    def merge_with(self, other):
+        """Absorb a following command of the same kind. Return True on success."""
+        return False
+
+    def cost(self):
+        """Approximate number of bytes held by this command"""
+        return 64
+
+    def scenes(self):
+        """Scenes touched by this command"""
+        return set()
+
+
+def _scenes_of(items):
+    return {item.scene() for item in items if item.scene() is not None}
+
+
+class AddItemsCommand(UndoCommand):
+    """Items were added to a scene"""
+    def __init__(self, scene, items, text="Add"):
+        super().__init__(text)
+        self.scene = scene
+        self.items = list(items)
+
+    def undo(self):
+        for item in self.items:
+            if item.scene() is self.scene:
+                self.scene.removeItem(item)
+
+    def redo(self):
+        for item in self.items:
+            if item.scene() is None:
+                self.scene.addItem(item)
+
+    def cost(self):
+        return 64 + sum(_item_cost(item) for item in self.items)
+
+    def scenes(self):
+        return {self.scene}
+
+
+class RemoveItemsCommand(AddItemsCommand):
+    """Items were removed from a scene (the items are kept alive for undo)"""
+    def __init__(self, scene, items, text="Delete"):
+        super().__init__(scene, items, text)
+
+    def undo(self):
+        AddItemsCommand.redo(self)
+
+    def redo(self):
+        AddItemsCommand.undo(self)
+
+
+class GeometryCommand(UndoCommand):
+    """Items were moved, resized or rotated"""
+    def __init__(self, changes, text="Move", merge_key=None):
+        super().__init__(text)
+        # List of (item, before_state, after_state)
+        self.changes = list(changes)
+        self.merge_key = merge_key
+
+    def undo(self):
+        for item, before, after in self.changes:
+            apply_geometry(item, before)
+
+    def redo(self):
+        for item, before, after in self.changes:
+            apply_geometry(item, after)
+
+    def merge_with(self, other):
+        if [c[0] for c in self.changes] != [c[0] for c in other.changes]:
+            return False
+        self.changes = [(item, before, other_after)
+                        for (item, before, _), (_, _, other_after) in zip(self.changes, other.changes)]
+        return True
+
+    def cost(self):
+        return 64 + 96 * len(self.changes)
+
+    def scenes(self):
+        return _scenes_of(item for item, _, _ in self.changes)
+
+
+class PropertyCommand(UndoCommand):
+    """A single property (pen, brush, z-value, ...) changed on several items.
+
+    `setter` is the name of the item method used to apply a value, e.g.
+    "setPen" or "setZValue".
+    """
+    def __init__(self, items, setter, before, after, text="Change", merge=False):
+        super().__init__(text)
+        self.items = list(items)
+        self.setter = setter
+        self.before = list(before)
+        self.after = list(after)
+        self.merge_key = setter if merge else None
+
+    def _apply(self, values):
+        for item, value in zip(self.items, values):
+            getattr(item, self.setter)(_copy_value(value))
+            if hasattr(item, 'update_handles'):
+                item.update_handles()
+
+    def undo(self):
+        self._apply(self.before)
+
+    def redo(self):
+        self._apply(self.after)
+
+    def merge_with(self, other):
+        if other.setter != self.setter or other.items != self.items:
+            return False
+        self.after = other.after
+        return True
+
+    def cost(self):
+        return 64 + 48 * len(self.items)
+
+    def scenes(self):
+        return _scenes_of(self.items)
+
+
+class GroupCommand(UndoCommand):
+    """Items were grouped into a QGraphicsItemGroup.
+
+    The group object is kept alive between undo and redo so that other
+    commands referring to it stay valid.
+    """
+    def __init__(self, scene, group, items=None, text="Group"):
+        super().__init__(text)
+        self.scene = scene
+        self.group = group
+        self.items = list(items) if items is not None else list(group.childItems())
+
+    def _group(self):
+        if self.group.scene() is None:
+            self.scene.addItem(self.group)
+        for item in self.items:
+            self.group.addToGroup(item)
+
+    def _ungroup(self):
+        for item in self.items:
+            self.group.removeFromGroup(item)
+        if self.group.scene() is self.scene:
+            self.scene.removeItem(self.group)
+
+    def undo(self):
+        self._ungroup()
+
+    def redo(self):
+        self._group()
+
+    def cost(self):
+        return 128 + 16 * len(self.items)
+
+    def scenes(self):
+        return {self.scene}
+
+
+class UngroupCommand(GroupCommand):
+    """A group was dissolved back into its child items"""
+    def __init__(self, scene, group, text="Ungroup"):
+        super().__init__(scene, group, text=text)
+
+    def undo(self):
+        self._group()
+
+    def redo(self):
+        self._ungroup()
+
+
+class MacroCommand(UndoCommand):
+    """Several commands that undo and redo as one step"""
+    def __init__(self, commands, text="Edit"):
+        super().__init__(text)
+        self.commands = list(commands)
+
+    def undo(self):
+        for command in reversed(self.commands):
+            command.undo()
+
+    def redo(self):
+        for command in self.commands:
+            command.redo()
+
+    def cost(self):
+        return 64 + sum(command.cost() for command in self.commands)
+
+    def scenes(self):
+        return set().union(*(command.scenes() for command in self.commands))
+
+
+class TextEditCommand(UndoCommand):
+    """Edits of linked text boxes, undone through their documents' own undo steps.
+
+    Typing in a box of a story, and the text flow then moves between its
+    boxes, change several documents; each change is one undo step of its
+    document. They are recorded in order and undone in reverse. If a
+    document's history no longer matches the recorded steps (edited or
+    cleared since), the command is skipped rather than half applied.
+    """
+    def __init__(self, box, text="Typing", merge_key=None):
+        super().__init__(text)
+        self.merge_key = merge_key
+        # [box, undo steps of its document with the step done, ... and undone (known once undone)]
+        self.steps = [[box, box.document().availableUndoSteps(), None]]
+        # box -> [story_continues before the edits, ... after them (known once undone)]
+        self.continues = {box: [box.story_continues, None]}
+        self.skipped = False            # The last undo/redo found the documents changed and did nothing
+
+    def _applies(self, steps, count):
+        """Whether every document is at the undo step the first of `steps` on it expects"""
+        seen = set()
+        for step in steps:
+            box = step[0]
+            if box in seen:
+                continue
+            seen.add(box)
+            if box.scene() is None or box.document().availableUndoSteps() != step[count]:
+                return False
+        return True
+
+    def undo(self):
+        # All or nothing: text flow moves cut from one document and paste into another
+        steps = self.steps[::-1]
+        self.skipped = not self._applies(steps, 1)
+        if self.skipped:
+            return
+        for step in steps:
+            document = step[0].document()
+            document.undo()
+            step[2] = document.availableUndoSteps()
+        for box, continues in self.continues.items():
+            continues[1] = box.story_continues
+            box.story_continues = continues[0]
+
+    def redo(self):
+        self.skipped = not self._applies(self.steps, 2)
+        if self.skipped:
+            return
+        for step in self.steps:
+            document = step[0].document()
+            document.redo()
+            step[1] = document.availableUndoSteps()
+        for box, continues in self.continues.items():
+            continues[0] = box.story_continues
+            box.story_continues = continues[1]
+
+    def merge_with(self, other):
+        if not isinstance(other, TextEditCommand):
+            return False
+        self.steps.extend(other.steps)
+        for box, continues in other.continues.items():
+            self.continues.setdefault(box, continues)
+        return True
+
+    def cost(self):
+        # The text itself is kept by the documents' undo stacks
+        return 64 + 32 * (len(self.steps) + len(self.continues))
+
+    def scenes(self):
+        return {box.scene() for box, _, _ in self.steps if box.scene() is not None}
+
+
+def _copy_value(value):
+    """Return a detached copy of Qt value types so later edits don't alias"""
+    if isinstance(value, QPen):
+        return QPen(value)
+    if isinstance(value, QBrush):
+        return QBrush(value)
+    return value
+
+
+def _after_last_use(commands, scene):
+    """The commands after the last one touching `scene` (the end of a stack is nearest the present)"""
+    for index in range(len(commands) - 1, -1, -1):
+        if scene in commands[index].scenes():
+            return commands[index + 1:]
+    return commands
+
+
+class UndoStack:
+    """Undo/redo history made of delta commands.
+
+    History is bounded by an approximate memory budget instead of a fixed
+    number of steps: the oldest commands are dropped once the commands on
+    both stacks hold more than `memory_budget` bytes.
+    """
+    def __init__(self, memory_budget=8 * 1024 * 1024, merge_interval=1.5):
+        self.memory_budget = memory_budget
+        self.merge_interval = merge_interval  # Seconds between edits that may still merge
+        self.undo_commands = deque()
+        self.redo_commands = []
+        self._memory_used = 0
+        self._last_push_time = 0.0
+        self._top_open = False  # Nothing undone or redone since the top command was pushed
+        self.on_changed = None  # Optional callback invoked after every change
+
+    def push(self, command, merge=True):
+        """Record a command that has already been applied"""
+        now = time.monotonic()
+        self._drop_redo()
+
+        top = self.undo_commands[-1] if self.undo_commands else None
+        if (merge and top is not None and command.merge_key is not None
+                and top.merge_key == command.merge_key
+                and now - self._last_push_time <= self.merge_interval):
+            if top.merge_with(command):
+                self._memory_used -= top.recorded_cost
+                top.recorded_cost = top.cost()
+                self._memory_used += top.recorded_cost
+                self._last_push_time = now
+                self._notify()
+                return
+
+        # Costs are frozen at push time so the running total stays consistent
+        command.recorded_cost = command.cost()
+        self.undo_commands.append(command)
+        self._memory_used += command.recorded_cost
+        self._last_push_time = now
+        self._top_open = True
+        self._trim()
+        self._notify()
+
+    def extend_top(self, command):
+        """Record `command` as part of the latest step, which it follows from
+        (e.g. text flowed between boxes after an edit), regardless of merge_key and time.
+
+        Only while that step is the last thing done; returns False if it was undone or redone since.
+        """
+        if not self._top_open or not self.undo_commands:
+            return False
+        top = self.undo_commands[-1]
+        last = top.commands[-1] if isinstance(top, MacroCommand) else top
+        if not (command.merge_key is not None and last.merge_key == command.merge_key
+                and last.merge_with(command)):
+            if isinstance(top, MacroCommand):
+                top.commands.append(command)
+            else:
+                top = self.undo_commands[-1] = MacroCommand([top, command], top.text)
+        self._memory_used -= top.recorded_cost
+        top.recorded_cost = top.cost()
+        self._memory_used += top.recorded_cost
+        self._notify()
+        return True
+
+    def undo(self):
+        """Undo the latest command and return it (None if there was nothing to undo)"""
+        if not self.undo_commands:
+            return None
+        command = self.undo_commands.pop()
+        command.undo()
+        self.redo_commands.append(command)
+        # Never merge into a command that has been undone and redone
+        self._last_push_time = 0.0
+        self._top_open = False
+        self._notify()
+        return command
+
+    def redo(self):
+        """Redo the latest undone command and return it"""
+        if not self.redo_commands:
+            return None
+        command = self.redo_commands.pop()
+        command.redo()
+        self.undo_commands.append(command)
+        self._last_push_time = 0.0
+        self._top_open = False
+        self._notify()
+        return command
+
+    def can_undo(self):
+        return bool(self.undo_commands)
+
+    def can_redo(self):
+        return bool(self.redo_commands)
+
+    def clear(self):
+        self.undo_commands.clear()
+        self.redo_commands.clear()
+        self._memory_used = 0
+        self._top_open = False
+        self._notify()
+
+    def memory_used(self):
+        return self._memory_used
+
+    def uses_scene(self, scene):
+        """True if any undo or redo command refers to items of `scene`"""
+        return any(scene in c.scenes() for c in self.undo_commands) or \
+            any(scene in c.scenes() for c in self.redo_commands)
+
+    def discard_scene(self, scene):
+        """Forget the history that can no longer be replayed once a scene goes away.
+
+        Steps around a discarded one were recorded against the state it left,
+        so history is cut at the step touching `scene` nearest to the present
+        on both sides, dropping everything past it.
+        """
+        kept_undo = _after_last_use(list(self.undo_commands), scene)
+        kept_redo = _after_last_use(self.redo_commands, scene)
+        if len(kept_undo) == len(self.undo_commands) and len(kept_redo) == len(self.redo_commands):
+            return
+        self.undo_commands = deque(kept_undo)
+        self.redo_commands = kept_redo
+        self._top_open = False
+        self._memory_used = sum(c.recorded_cost for c in kept_undo) + sum(c.recorded_cost for c in kept_redo)
+        self._notify()
+
+    def _drop_redo(self):
+        for command in self.redo_commands:
+            self._memory_used -= command.recorded_cost
+        self.redo_commands.clear()
+
+    def _trim(self):
+        # Always keep the most recent step, even if it alone exceeds the budget
+        while self._memory_used > self.memory_budget and len(self.undo_commands) > 1:
+            self._memory_used -= self.undo_commands.popleft().recorded_cost
+
+    def _notify(self):
+        if self.on_changed:
+            self.on_changed()
@@ -0,0 +1,411 @@
+"""Zip based .upg document container.
+
+Layout of a container::
+
+    manifest/<generation>.json    page order, sizes and entry names (highest generation wins)
+    pages/<uid>-<revision>.json   one entry per page
+    assets/<sha256><ext>          image bytes, shared by every item that uses them
+
+Saving appends only the pages that changed since the last save plus any
+new assets, followed by a new manifest. Entries left behind by older
+revisions are dropped by compacting once they outweigh the live data.
+
+Appending rewrites the zip's central directory, so the old one is first
+kept in a small journal next to the file; an append that fails or is
+cut short is rolled back from it, leaving the document as last saved.
+"""
+import functools
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+
+from src.engine.serializer import write_page
+
+FORMAT_NAME = "page26"
+FORMAT_VERSION = 1
+
+MANIFEST_DIR = "manifest/"
+PAGES_DIR = "pages/"
+ASSETS_DIR = "assets/"
+
+# Compact once stale entries are larger than this and larger than the live data
+COMPACT_MIN_GARBAGE = 1024 * 1024
+
+# Journal of the central directory an append replaces, removed once the append is on disk
+APPEND_JOURNAL_SUFFIX = ".append"
+
+# Extracted assets are content addressed, so every open document can share them
+ASSET_CACHE_DIR = os.path.join(tempfile.gettempdir(), "page26-assets")
+
+_hash_cache = {}  # (path, size, mtime) -> asset name
+
+
+def is_container(path):
+    """True if `path` is a zip based .upg container (as opposed to a legacy flat file)"""
+    return zipfile.is_zipfile(path)
+
+
+def file_identity(path):
+    """(absolute path, size, mtime) of a file, or None if it can't be read"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (os.path.abspath(path), stat.st_size, stat.st_mtime)
+
+
+def known_asset_name(identity):
+    """Asset name already worked out for a file_identity(), or None"""
+    return _hash_cache.get(identity)
+
+
+def remember_asset_name(identity, name):
+    _hash_cache[identity] = name
+
+
+def hash_asset_file(path):
+    """Content addressed entry name for the file at `path` (reads all of it; raises OSError)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest() + os.path.splitext(path)[1].lower()
+
+
+def asset_name_for_file(path):
+    """Content addressed entry name for an image file, or None if it can't be read"""
+    identity = file_identity(path)
+    if identity is None:
+        return None
+    name = _hash_cache.get(identity)
+    if name is None:
+        try:
+            name = hash_asset_file(path)
+        except OSError:
+            return None
+        _hash_cache[identity] = name
+    return name
+
+
+def read_page_entry(path, entry):
+    """Open the container at `path` and parse a single page entry"""
+    with zipfile.ZipFile(path, 'r') as zf:
+        return _read_page(zf, entry)
+
+
+def _walk_items(items):
+    """Yield items and, recursively, the children of groups"""
+    for item in items:
+        yield item
+        yield from _walk_items(item.get("children", []))
+
+
+def _read_page(zf, entry):
+    data = json.loads(zf.read(entry).decode('utf-8'))
+    for item in _walk_items(data.get("items", [])):
+        asset = item.get("image_asset")
+        if asset:
+            item["image_path"] = _extract_asset(zf, asset)
+    return data
+
+
+def _extract_asset(zf, name):
+    target = os.path.join(ASSET_CACHE_DIR, name)
+    if not os.path.exists(target):
+        os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+        tmp = target + ".part"
+        with zf.open(ASSETS_DIR + name) as src, open(tmp, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.replace(tmp, target)
+        # Known content: skip hashing it again when the document is saved
+        stat = os.stat(target)
+        _hash_cache[(os.path.abspath(target), stat.st_size, stat.st_mtime)] = name
+    return target
+
+
+def restore_torn_append(path):
+    """Roll back an append to `path` that didn't finish, if there was one"""
+    journal = path + APPEND_JOURNAL_SUFFIX
+    if not os.path.exists(journal):
+        return False
+    with open(journal, 'rb') as f:
+        data = f.read()
+    offset = int.from_bytes(data[:8], 'little')
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(data[8:])
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+    os.remove(journal)
+    return True
+
+
+def _write_append_journal(path, offset):
+    """Keep the central directory from `offset` on, which appending to `path` overwrites"""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        tail = f.read()
+    # Swapped in whole: a journal cut short would roll back to a broken file
+    journal = path + APPEND_JOURNAL_SUFFIX
+    with open(journal + ".tmp", 'wb') as f:
+        f.write(offset.to_bytes(8, 'little') + tail)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(journal + ".tmp", journal)
+
+
+def _latest_manifest_name(names):
+    manifests = [n for n in names if n.startswith(MANIFEST_DIR) and n.endswith(".json")]
+    if not manifests:
+        return None
+    return max(manifests, key=lambda n: int(os.path.splitext(os.path.basename(n))[0]))
+
+
+class UpgReader:
+    """Reads a .upg container. Only the manifest is parsed up front."""
+    def __init__(self, path):
+        self.path = path
+        restore_torn_append(path)
+        self.zip = zipfile.ZipFile(path, 'r')
+        manifest_name = _latest_manifest_name(self.zip.namelist())
+        if manifest_name is None:
+            self.zip.close()
+            raise ValueError(f"{path} is not a page26 document (no manifest)")
+        self.manifest = json.loads(self.zip.read(manifest_name).decode('utf-8'))
+        if self.manifest.get("version", 1) > FORMAT_VERSION:
+            self.zip.close()
+            raise ValueError(f"{path} was written by a newer version of page26")
+
+    def page_count(self):
+        return len(self.manifest.get("pages", []))
+
+    def page_infos(self):
+        """Manifest records for every page, in document order"""
+        return list(self.manifest.get("pages", []))
+
+    def read_page(self, entry):
+        """Parse one page entry, resolving asset references to local files"""
+        return _read_page(self.zip, entry)
+
+    def page_loader(self, entry):
+        """Callable that parses `entry` later, even after this reader is closed"""
+        return functools.partial(read_page_entry, self.path, entry)
+
+    def asset_path(self, name):
+        """Extract an asset (once) and return its path on disk"""
+        return _extract_asset(self.zip, name)
+
+    def close(self):
+        self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class UpgWriter:
+    """Writes a PageManager to a .upg container.
+
+    Pages must provide `uid`, `revision`, `container_entry`, `is_dirty()`,
+    `to_dict()` and `mark_saved(entry)`.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.pages_written = 0
+        self.assets_written = 0
+        self._page_assets = {}  # page entry -> asset names it references
+        self._manifest = None   # latest manifest of the existing container
+
+    def save(self, page_manager):
+        """Save the document, appending only what changed when possible"""
+        if os.path.exists(self.path):
+            restore_torn_append(self.path)
+        existing = self._existing_entries()
+        pages = page_manager.pages
+        reusable = existing is not None and all(
+            page.is_dirty() or page.container_entry in existing for page in pages)
+
+        if reusable:
+            self._save_incremental(page_manager, existing)
+        else:
+            self._save_full(page_manager)
+        # Clean pages can be re-read from here from now on
+        page_manager.container_path = self.path
+
+    def _existing_entries(self):
+        if not os.path.exists(self.path) or not is_container(self.path):
+            return None
+        try:
+            with zipfile.ZipFile(self.path, 'r') as zf:
+                manifest_name = _latest_manifest_name(zf.namelist())
+                if manifest_name is None:
+                    return None
+                manifest = json.loads(zf.read(manifest_name).decode('utf-8'))
+                self._manifest = manifest
+                for info in manifest.get("pages", []):
+                    self._page_assets[info["entry"]] = info.get("assets", [])
+                return {info.filename: info.compress_size for info in zf.infolist()}
+        except (zipfile.BadZipFile, ValueError, KeyError):
+            return None
+
+    def _save_incremental(self, page_manager, existing):
+        pages = page_manager.pages
+        if not any(page.is_dirty() for page in pages) and self._manifest_matches(page_manager):
+            return
+        generation = self._next_generation(existing)
+        page_entries = []
+        with open(self.path, 'r+b') as f:
+            # Pages and assets go in first and the manifest last, all or nothing
+            with zipfile.ZipFile(f, 'r') as zf:
+                _write_append_journal(self.path, zf.start_dir)
+            try:
+                with zipfile.ZipFile(f, 'a', zipfile.ZIP_DEFLATED) as zf:
+                    names = set(existing)
+                    for page in pages:
+                        if page.is_dirty() or page.container_entry not in names:
+                            entry = self._write_page(zf, page, names)
+                        else:
+                            entry = page.container_entry
+                        page_entries.append(entry)
+                    self._write_manifest(zf, page_manager, page_entries, generation)
+                f.flush()
+                os.fsync(f.fileno())
+            except Exception:
+                f.close()
+                restore_torn_append(self.path)
+                raise
+        os.remove(self.path + APPEND_JOURNAL_SUFFIX)
+
+        for page, entry in zip(pages, page_entries):
+            page.mark_saved(entry)
+
+        if self._needs_compaction(page_entries):
+            self._save_full(page_manager)
+
+    def _manifest_matches(self, page_manager):
+        """Whether the latest manifest already lists these pages, in this order"""
+        manifest = self._manifest
+        if manifest is None or manifest.get("current_page") != page_manager.current_page_index:
+            return False
+        stored = [(info.get("uid"), info.get("entry"), info.get("width"), info.get("height"))
+                  for info in manifest.get("pages", [])]
+        return stored == [(page.uid, page.container_entry, page.width, page.height)
+                          for page in page_manager.pages]
+
+    def _save_full(self, page_manager):
+        if not self._page_assets:
+            self._existing_entries()
+        # Write next to the target and swap in atomically
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix=".upg-", suffix=".tmp", dir=directory)
+        os.close(fd)
+        old = None
+        if os.path.exists(self.path) and is_container(self.path):
+            old = zipfile.ZipFile(self.path, 'r')
+        page_entries = []
+        try:
+            with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+                names = set()
+                old_names = set(old.namelist()) if old else set()
+                for page in page_manager.pages:
+                    if old and not page.is_dirty() and page.container_entry in old_names:
+                        # Unchanged page: carry the stored entry (and its assets) over
+                        entry = page.container_entry
+                        zf.writestr(entry, old.read(entry))
+                        names.add(entry)
+                        for asset in self._page_assets.get(entry, []):
+                            if ASSETS_DIR + asset not in names and ASSETS_DIR + asset in old_names:
+                                zf.writestr(ASSETS_DIR + asset, old.read(ASSETS_DIR + asset))
+                                names.add(ASSETS_DIR + asset)
+                    else:
+                        entry = self._write_page(zf, page, names)
+                    page_entries.append(entry)
+                self._write_manifest(zf, page_manager, page_entries, 1)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        finally:
+            if old:
+                old.close()
+        if os.path.exists(self.path):
+            shutil.copymode(self.path, tmp_path)
+        os.replace(tmp_path, self.path)
+
+        for page, entry in zip(page_manager.pages, page_entries):
+            page.mark_saved(entry)
+
+    def _write_page(self, zf, page, names):
+        entry = f"{PAGES_DIR}{page.uid}-{page.revision}.json"
+        suffix = 1
+        while entry in names:
+            # Same revision saved again (e.g. after Save As): keep the name unique
+            entry = f"{PAGES_DIR}{page.uid}-{page.revision}-{suffix}.json"
+            suffix += 1
+
+        files = {}  # asset name -> image file
+
+        def prepare_item(data):
+            for item in _walk_items([data]):
+                path = item.get("image_path")
+                if not path:
+                    continue
+                asset = asset_name_for_file(path)
+                if asset is not None:
+                    item["image_asset"] = asset
+                    files.setdefault(asset, path)
+
+        # The entry is streamed an item at a time; its images follow once it is closed
+        with zf.open(entry, 'w') as raw, io.TextIOWrapper(raw, encoding='utf-8') as fp:
+            write_page(page, fp, prepare_item)
+        names.add(entry)
+        for asset, path in files.items():
+            if ASSETS_DIR + asset not in names:
+                zf.write(path, ASSETS_DIR + asset)
+                names.add(ASSETS_DIR + asset)
+                self.assets_written += 1
+        self._page_assets[entry] = sorted(files)
+        self.pages_written += 1
+        return entry
+
+    def _write_manifest(self, zf, page_manager, page_entries, generation):
+        manifest = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "generation": generation,
+            "current_page": page_manager.current_page_index,
+            "pages": [
+                {"uid": page.uid, "entry": entry, "revision": page.revision,
+                 "width": page.width, "height": page.height,
+                 "assets": self._page_assets.get(entry, [])}
+                for page, entry in zip(page_manager.pages, page_entries)
+            ]
+        }
+        zf.writestr(f"{MANIFEST_DIR}{generation}.json", json.dumps(manifest, ensure_ascii=False))
+
+    def _next_generation(self, existing):
+        latest = _latest_manifest_name(existing)
+        return int(os.path.splitext(os.path.basename(latest))[0]) + 1
+
+    def _needs_compaction(self, page_entries):
+        with zipfile.ZipFile(self.path, 'r') as zf:
+            infos = zf.infolist()
+            live = set(page_entries) | {_latest_manifest_name(zf.namelist())}
+        for entry in page_entries:
+            live.update(ASSETS_DIR + asset for asset in self._page_assets.get(entry, []))
+        live_size = sum(info.compress_size for info in infos if info.filename in live)
+        garbage = sum(info.compress_size for info in infos if info.filename not in live)
+        return garbage > COMPACT_MIN_GARBAGE and garbage > live_size
+
+
+def save_container(path, page_manager):
+    """Save `page_manager` to `path`, returning (pages_written, assets_written)"""
+    writer = UpgWriter(path)
+    writer.save(page_manager)
+    return writer.pages_written, writer.assets_written
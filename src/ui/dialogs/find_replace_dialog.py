@@ -3,9 +3,10 @@ from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel,
 from PyQt6.QtCore import Qt, pyqtSignal
 
 class FindReplaceDialog(QDialog):
-    find_next = pyqtSignal(str, bool, bool) # text, case_sensitive, backward
-    replace = pyqtSignal(str, str, bool, bool) # find_text, replace_text, case, backward
-    replace_all = pyqtSignal(str, str, bool) # find_text, replace_text, case
+    find_next = pyqtSignal(str, bool, bool, bool) # text, case_sensitive, backward, ignore_diacritics
+    replace = pyqtSignal(str, str, bool, bool, bool) # find_text, replace_text, case, backward, diacritics
+    replace_all = pyqtSignal(str, str, bool, bool, bool) # find_text, replace_text, case, diacritics, regex
+    highlight_all = pyqtSignal(str, bool, bool) # text ("" to clear), case, diacritics
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -35,19 +36,33 @@ class FindReplaceDialog(QDialog):
         options_layout = QVBoxLayout()
         self.case_check = QCheckBox("Match case")
         self.backward_check = QCheckBox("Search backward")
+        # Urdu text is usually written without aerab: match it either way
+        self.diacritics_check = QCheckBox("Ignore diacritics (aerab)")
+        self.diacritics_check.setChecked(True)
+        # Regular expressions only apply to Replace All (with \1 etc. in the replacement)
+        self.regex_check = QCheckBox("Regular expression (Replace All)")
         options_layout.addWidget(self.case_check)
         options_layout.addWidget(self.backward_check)
+        options_layout.addWidget(self.diacritics_check)
+        options_layout.addWidget(self.regex_check)
         options_group.setLayout(options_layout)
         layout.addWidget(options_group)
+
+        # Match count of the last search
+        self.count_label = QLabel("")
+        layout.addWidget(self.count_label)
         
         # Buttons
         btn_layout = QHBoxLayout()
         self.btn_find = QPushButton("Find Next")
         self.btn_replace = QPushButton("Replace")
         self.btn_replace_all = QPushButton("Replace All")
+        self.btn_highlight = QPushButton("Highlight All")
+        self.btn_highlight.setCheckable(True)
         self.btn_close = QPushButton("Close")
         
         btn_layout.addWidget(self.btn_find)
+        btn_layout.addWidget(self.btn_highlight)
         btn_layout.addWidget(self.btn_replace)
         btn_layout.addWidget(self.btn_replace_all)
         btn_layout.addWidget(self.btn_close)
@@ -59,21 +74,54 @@ class FindReplaceDialog(QDialog):
         self.btn_find.clicked.connect(self.on_find)
         self.btn_replace.clicked.connect(self.on_replace)
         self.btn_replace_all.clicked.connect(self.on_replace_all)
+        self.btn_highlight.toggled.connect(self.on_highlight)
         self.btn_close.clicked.connect(self.close)
+        # Highlights follow the search as it is edited
+        self.find_input.textChanged.connect(self.on_options_changed)
+        self.case_check.toggled.connect(self.on_options_changed)
+        self.diacritics_check.toggled.connect(self.on_options_changed)
+        self.regex_check.toggled.connect(self.on_regex_toggled)
 
     def on_find(self):
         text = self.find_input.text()
         if text:
-            self.find_next.emit(text, self.case_check.isChecked(), self.backward_check.isChecked())
+            self.find_next.emit(text, self.case_check.isChecked(), self.backward_check.isChecked(),
+                                self.diacritics_check.isChecked())
 
     def on_replace(self):
         find_text = self.find_input.text()
         replace_text = self.replace_input.text()
         if find_text:
-            self.replace.emit(find_text, replace_text, self.case_check.isChecked(), self.backward_check.isChecked())
+            self.replace.emit(find_text, replace_text, self.case_check.isChecked(), self.backward_check.isChecked(),
+                              self.diacritics_check.isChecked())
 
     def on_replace_all(self):
         find_text = self.find_input.text()
         replace_text = self.replace_input.text()
         if find_text:
-            self.replace_all.emit(find_text, replace_text, self.case_check.isChecked())
+            self.replace_all.emit(find_text, replace_text, self.case_check.isChecked(),
+                                  self.diacritics_check.isChecked(), self.regex_check.isChecked())
+
+    def on_highlight(self, checked):
+        text = self.find_input.text() if checked else ""
+        self.highlight_all.emit(text, self.case_check.isChecked(), self.diacritics_check.isChecked())
+
+    def on_regex_toggled(self, checked):
+        for button in (self.btn_find, self.btn_replace, self.btn_highlight):
+            button.setEnabled(not checked)
+        self.diacritics_check.setEnabled(not checked)
+        if checked:
+            self.btn_highlight.setChecked(False)
+
+    def on_options_changed(self):
+        self.count_label.setText("")
+        if self.btn_highlight.isChecked():
+            self.on_highlight(True)
+
+    def set_match_count(self, text):
+        self.count_label.setText(text)
+
+    def hideEvent(self, event):
+        # Highlights go with the dialog
+        self.btn_highlight.setChecked(False)
+        super().hideEvent(event)
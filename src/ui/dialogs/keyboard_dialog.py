@@ -0,0 +1,52 @@
+from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox,
+                             QListWidget, QDialogButtonBox)
+
+from src.engine.keyboard_layout import available_layouts, load_layout
+
+
+class KeyboardPreferencesDialog(QDialog):
+    """Pick the keyboard layout Urdu is typed with, showing the key sequences it maps"""
+    def __init__(self, current_layout, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Keyboard Preferences")
+        self.resize(420, 480)
+        self.init_ui(current_layout)
+
+    def init_ui(self, current_layout):
+        layout = QVBoxLayout(self)
+
+        layout_row = QHBoxLayout()
+        layout_row.addWidget(QLabel("Layout:"))
+        self.layout_combo = QComboBox()
+        for name, title in available_layouts().items():
+            self.layout_combo.addItem(title, name)
+        index = self.layout_combo.findData(current_layout)
+        if index >= 0:
+            self.layout_combo.setCurrentIndex(index)
+        self.layout_combo.currentIndexChanged.connect(self.update_keys)
+        layout_row.addWidget(self.layout_combo, 1)
+        layout.addLayout(layout_row)
+
+        # Key sequences of the selected layout
+        layout.addWidget(QLabel("Keys:"))
+        self.keys_list = QListWidget()
+        layout.addWidget(self.keys_list)
+        self.update_keys()
+
+        buttons = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addWidget(buttons)
+
+    def update_keys(self):
+        self.keys_list.clear()
+        name = self.get_layout()
+        if name is None:
+            return
+        sequences = load_layout(name).sequences
+        for sequence in sorted(sequences, key=lambda s: (len(s), s.lower(), s)):
+            shown = sequence.replace(" ", "Space")
+            self.keys_list.addItem(f"{shown}  →  {sequences[sequence]}")
+
+    def get_layout(self):
+        return self.layout_combo.currentData()
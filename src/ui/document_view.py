@@ -1,25 +1,76 @@
-from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QFileDialog, QGraphicsRectItem, QGraphicsPixmapItem, QGraphicsLineItem, QGraphicsProxyWidget, QGraphicsItem, QGraphicsItemGroup
-from PyQt6.QtCore import Qt, QRectF, QPointF
-from PyQt6.QtGui import QFont, QPainter, QColor, QBrush, QPen, QPixmap, QTextCursor, QAction
+from PyQt6.QtWidgets import QGraphicsView, QGraphicsScene, QFileDialog, QGraphicsRectItem, QGraphicsLineItem, QGraphicsProxyWidget, QGraphicsItem, QGraphicsItemGroup
+from PyQt6.QtCore import Qt, QRectF, QPointF, QTimer
+from PyQt6.QtGui import QFont, QPainter, QColor, QBrush, QPen, QTextCursor, QAction
 from PyQt6.QtPrintSupport import QPrinter
-from src.engine.input_handler import InputHandler
+from src.engine.input_handler import InputHandler, TRACE_KEYS, logger
 from src.engine.text_box import TextBox
-from src.engine.page_manager import PageManager
-from src.engine.shape_items import ResizableRectItem, ResizableEllipseItem, ResizableLineItem, PolygonItem
+from src.engine.page_manager import PageManager, mark_scene_dirty
+from src.engine.upg_container import UpgReader, is_container, save_container
+from src.engine.autosave import JournalReader
+from src.engine.serializer import read_document, is_stream_header
+from src.engine.tile_cache import shared_tile_cache
+from src.engine.text_flow import shared_story_flow, story_head
+from src.engine.text_import import TextImport
+from src.engine.latency import LatencyRecorder
+from src.engine.search_index import SearchIndex, normalize
+from src.engine.batch_replace import BatchReplace
+from src.engine.text_stats import DocumentStats
+from src.engine.asset_store import device_scale
+from src.engine.shape_items import ResizableRectItem, ResizableEllipseItem, ResizableLineItem, PolygonItem, ImageItem
+from src.engine.undo_stack import (UndoStack, AddItemsCommand, RemoveItemsCommand, GeometryCommand,
+                                   PropertyCommand, GroupCommand, UngroupCommand, TextEditCommand, capture_geometry)
+import io
+import time
+
+# Space between pages in the continuous and spread layouts
+PAGE_GAP = 24
+# Pages this far (in viewport heights) outside the viewport are built ahead of time
+PREFETCH_MARGIN = 0.5
 
 class DocumentView(QGraphicsView):
     def __init__(self, font_family, page_settings=None, parent=None):
         super().__init__(parent)
+        # Page layout: "single" (one page at a time), "continuous" (pages stacked
+        # vertically) or "spread" (two pages side by side, rows stacked)
+        self.page_layout = "single"
+        self._layout_cache = None
+        self._tracking_page = False
+        self.on_page_changed = None  # Called when the page under the viewport changes
+        self.on_cursor_moved = None  # Called with the viewport cursor position, None on leaving
+        self.on_contents_changed = None  # Called when pages, text or the text selection may have changed
+        # Pages other than the current one are drawn from cached tiles
+        self.tile_cache = shared_tile_cache()
+        self.tile_cache.tile_ready.connect(self._tile_ready)
         self.font_family = font_family
         self.input_handler = InputHandler()
+        self._typing = None  # [box, characters to delete, text] waiting to be inserted
+        self.latency = LatencyRecorder()  # Keystroke-to-paint timings of this document
         
-        # Undo/Redo Stack
-        self.undo_stack = []
-        self.redo_stack = []
-        self.max_undo_steps = 50
+        # Undo/Redo history (delta commands, bounded by memory rather than step count)
+        self.undo_stack = UndoStack()
+        self._press_geometry = {}  # Item geometry captured on mouse press
         
         # Page Manager
         self.page_manager = PageManager()
+        self.page_manager.hibernation_guard = self._keep_page_live
+        self.page_manager.on_hibernated = self._page_hibernated
+        # The current page's scene was released while the window was inactive (see wake)
+        self._parked = False
+        # Find / highlight-all over every page
+        self.search_index = SearchIndex(self.page_manager)
+        self.search_highlight = None  # (text, case_sensitive, ignore_diacritics) being highlighted
+        self._highlighted = {}  # page uid -> (revision, scene) its boxes were highlighted at
+        self._highlight_timer = QTimer(self)
+        self._highlight_timer.setInterval(300)
+        self._highlight_timer.timeout.connect(self._refresh_search_highlights)
+        self._replacing = None  # BatchReplace in progress
+        self._importing = None  # TextImport in progress
+        # Undo steps of linked text boxes go on the undo stack (off while history is replayed)
+        self._recording_text = True
+        self.page_manager.on_text_step = self._record_text_step
+        self.page_manager.on_modified = self._contents_changed
+        # Word / character counts, kept per box and page as text is edited
+        self.text_stats = DocumentStats(self.page_manager)
         self.scene = self.page_manager.get_current_page().scene
         self.setScene(self.scene)
         
@@ -71,28 +122,128 @@ class DocumentView(QGraphicsView):
         # Zoom
         self.zoom_level = 1.0
 
-    def save_state(self):
-        """Save current state to undo stack"""
-        if len(self.undo_stack) >= self.max_undo_steps:
-            self.undo_stack.pop(0)
-        self.undo_stack.append(self.get_content())
-        self.redo_stack.clear()
+    def push_command(self, command, merge=True):
+        """Record an already applied change on the undo stack"""
+        self.undo_stack.push(command, merge)
+        self._mark_command_dirty(command)
+
+    def _keep_page_live(self, page, in_view=True):
+        """Pages in view of the active window, or that the undo history or a running Replace All
+        refers to, can't be hibernated"""
+        pages = self.page_manager.pages
+        if in_view and any(pages[index] is page for index in self.visible_pages()):
+            return True
+        if self.undo_stack.uses_scene(page.scene):
+            return True
+        return bool(self._replacing and page.scene in self._replacing.scenes)
+
+    def _page_hibernated(self, page):
+        if page is self.page_manager.get_current_page():
+            # The view is left on the emptied scene until it is needed again
+            self._parked = True
+            self.viewport().update()
+
+    def wake(self):
+        """Show the current page again if hibernation released it while the window was inactive"""
+        if not self._parked:
+            return
+        center = self.mapToScene(self.viewport().rect().center())
+        self.scene = self.page_manager.get_current_page().scene
+        self.setScene(self.scene)
+        self._prepare_scene()
+        self._apply_page_layout()
+        self._tracking_page = True
+        self.centerOn(center)
+        self._tracking_page = False
+
+    def _mark_command_dirty(self, command):
+        if command:
+            for scene in command.scenes():
+                mark_scene_dirty(scene)
+
+    def _editing_text_box(self):
+        """Return the text box currently being edited, if any"""
+        item = self.scene.focusItem()
+        if isinstance(item, TextBox) and item.hasFocus():
+            return item
+        return None
+
+    def _record_text_step(self, box):
+        """A linked box's document took an undo step: keep it on the undo stack.
+
+        Text the flow moves after an edit is part of that edit's step.
+        """
+        if self._replacing or self._importing or not self._recording_text:
+            return
+        command = TextEditCommand(box, merge_key=("text", id(story_head(box))))
+        if shared_story_flow().flowing:
+            self.undo_stack.extend_top(command)
+        else:
+            self.push_command(command)
+
+    def _own_text_history(self, text_box):
+        """True if undo acts on the box's own text history (linked boxes use the undo stack)"""
+        return text_box is not None and text_box.next_box is None and text_box.prev_box is None
 
     def undo(self):
         """Undo last action"""
-        if self.undo_stack:
-            current_state = self.get_content()
-            self.redo_stack.append(current_state)
-            previous_state = self.undo_stack.pop()
-            self.set_content(previous_state)
+        # While typing, undo acts on the text history of the edited box first
+        self.flush_typing()
+        self.input_handler.reset()
+        shared_story_flow().flush()
+        text_box = self._editing_text_box()
+        if self._own_text_history(text_box) and text_box.document().isUndoAvailable():
+            text_box.document().undo()
+            return
+        self._recording_text = False
+        try:
+            command = self.undo_stack.undo()
+        finally:
+            self._recording_text = True
+        self._mark_command_dirty(command)
+        self._show_live_page()
 
     def redo(self):
         """Redo last undone action"""
-        if self.redo_stack:
-            current_state = self.get_content()
-            self.undo_stack.append(current_state)
-            next_state = self.redo_stack.pop()
-            self.set_content(next_state)
+        shared_story_flow().flush()
+        text_box = self._editing_text_box()
+        if self._own_text_history(text_box) and text_box.document().isRedoAvailable():
+            text_box.document().redo()
+            return
+        self._recording_text = False
+        try:
+            command = self.undo_stack.redo()
+        finally:
+            self._recording_text = True
+        self._mark_command_dirty(command)
+        self._show_live_page()
+
+    def _show_live_page(self):
+        """Undo may take the page on view out of the document: show the current page instead"""
+        if getattr(self.scene, 'page', None) not in self.page_manager.pages:
+            self.switch_page(self.page_manager.current_page_index)
+
+    def _push_geometry_changes(self, items_before, text="Move", merge_key=None):
+        """Push a GeometryCommand for the items whose geometry changed"""
+        changes = []
+        for item, before in items_before.items():
+            if item.scene() is not self.scene:
+                continue
+            after = capture_geometry(item)
+            if after != before:
+                changes.append((item, before, after))
+        if changes:
+            self.push_command(GeometryCommand(changes, text, merge_key))
+
+    def _push_z_change(self, items, before, text, merge=False):
+        after = [item.zValue() for item in items]
+        if after != before:
+            self.push_command(PropertyCommand(items, "setZValue", before, after, text, merge=merge))
+
+    def _push_pen_change(self, items, before, text):
+        after = [item.pen() for item in items]
+        if after != before:
+            self.push_command(PropertyCommand(items, "setPen", before, after, text, merge=True))
 
     def init_ui(self):
         # Set background
@@ -103,10 +254,7 @@ class DocumentView(QGraphicsView):
         
         # Initial page already has white background from PageManager
         # Add initial text box (Body Text)
-        body_width = self.page_width - self.margin_left - self.margin_right
-        body_height = self.page_height - self.margin_top - self.margin_bottom
-        
-        text_box = self.add_text_box(self.margin_left, self.margin_top, width=body_width, height=body_height, locked=True)
+        text_box = self.add_body_text_box()
         
         # Clear any initial text selection to avoid grey disabled selection
         self.clear_text_selections()
@@ -119,12 +267,18 @@ class DocumentView(QGraphicsView):
         
         # Connect selection change to main window update
         self.scene.selectionChanged.connect(self.on_selection_changed)
+        self.scene.view_connected = True
 
     def on_selection_changed(self):
         # Notify main window to update ribbon
         window = self.window()
         if hasattr(window, 'update_ribbon_context'):
             window.update_ribbon_context()
+        self._contents_changed()
+
+    def _contents_changed(self):
+        if self.on_contents_changed:
+            self.on_contents_changed()
         
     def draw_guides(self):
         """Draws grey dashed lines for margins"""
@@ -150,43 +304,202 @@ class DocumentView(QGraphicsView):
         line_bottom.setPen(pen)
         self.scene.addItem(line_bottom)
     
+    def _prepare_scene(self):
+        """Hook the current page's scene and its text boxes up to this view"""
+        self._parked = False
+        # Simple check: count line items. If < 4, draw guides.
+        line_count = sum(1 for item in self.scene.items() if isinstance(item, QGraphicsLineItem))
+        if line_count < 4:
+            self.draw_guides()
+
+        # Boxes created by Page.from_dict don't know about this view yet
+        for item in self.scene.items():
+            if isinstance(item, TextBox):
+                item.installEventFilter(self)
+                item.on_link_clicked = self.start_linking
+
+        if not getattr(self.scene, 'view_connected', False):
+            self.scene.selectionChanged.connect(self.on_selection_changed)
+            self.scene.view_connected = True
+
+        if self.search_highlight is not None:
+            self._apply_search_highlights(self.page_manager.get_current_page())
+
     def switch_page(self, page_index):
         """Switch to a different page - FIXED: Proper implementation"""
         if self.page_manager.set_current_page(page_index):
             self.scene = self.page_manager.get_current_page().scene
             self.setScene(self.scene)
-            
-            # Ensure guides are drawn on the new page
-            # We check if guides exist by looking for QGraphicsLineItem with specific pen
-            # Or simpler: just try to draw them. To avoid duplicates, we can clear lines first or check.
-            # Since Page objects persist, we should check if guides are already there.
-            # For now, let's just clear all QGraphicsLineItems that match our guide style and redraw.
-            # Actually, Page scene items persist. Let's add a flag to Page or just check.
-            
-            # Simple check: count line items. If < 4, draw guides.
-            line_count = sum(1 for item in self.scene.items() if isinstance(item, QGraphicsLineItem))
-            if line_count < 4:
-                self.draw_guides()
-                
+            self._prepare_scene()
+            self._apply_page_layout()
+            self._scroll_to_page_top()
             return True
         return False
         
     def delete_current_page(self):
         """Delete current page"""
         current_index = self.page_manager.current_page_index
+        deleted_scene = self.scene
         if self.page_manager.delete_page(current_index):
+            self.undo_stack.discard_scene(deleted_scene)
             # Refresh view with new current page
             self.scene = self.page_manager.get_current_page().scene
             self.setScene(self.scene)
-            
-            # Ensure guides are drawn
-            line_count = sum(1 for item in self.scene.items() if isinstance(item, QGraphicsLineItem))
-            if line_count < 4:
-                self.draw_guides()
-                
+            self._prepare_scene()
+            self._apply_page_layout()
             return True
         return False
     
+    # Continuous / spread page layout
+    #
+    # Each page keeps its own scene. The view shows the scene of the current
+    # page, with its scene rect grown to cover the whole layout (offset so the
+    # page itself stays at 0,0); the other visible pages are rendered into the
+    # background. Whenever another page comes under the middle of the
+    # viewport, it becomes the current page and the view swaps to its scene
+    # without moving anything on screen.
+
+    def set_page_layout(self, layout):
+        """Show one page at a time ("single"), or all pages "continuous"ly or as "spread"s"""
+        if layout == self.page_layout:
+            return
+        self.page_layout = layout
+        self._apply_page_layout()
+        self._scroll_to_page_top()
+        self.viewport().update()
+
+    def page_rects(self):
+        """Rect of every page in layout coordinates, and their bounding rect"""
+        pages = self.page_manager.pages
+        key = (self.page_layout, tuple((page.width, page.height) for page in pages))
+        if self._layout_cache is not None and self._layout_cache[0] == key:
+            return self._layout_cache[1], self._layout_cache[2]
+
+        per_row = 2 if self.page_layout == "spread" else 1
+        rects = []
+        bounds = QRectF()
+        y = 0.0
+        for start in range(0, len(pages), per_row):
+            row = pages[start:start + per_row]
+            x = 0.0
+            for page in row:
+                rect = QRectF(x, y, page.width, page.height)
+                rects.append(rect)
+                bounds = bounds.united(rect)
+                x += page.width + PAGE_GAP
+            y += max(page.height for page in row) + PAGE_GAP
+        self._layout_cache = (key, rects, bounds)
+        return rects, bounds
+
+    def _page_offset(self):
+        """Layout position of the current page (scene coordinates are relative to it)"""
+        if self.page_layout == "single":
+            return QPointF(0, 0)
+        rects, _ = self.page_rects()
+        return rects[self.page_manager.current_page_index].topLeft()
+
+    def _apply_page_layout(self):
+        page = self.page_manager.get_current_page()
+        if self.page_layout == "single":
+            self.scene.setSceneRect(0, 0, page.width, page.height)
+            return
+        _, bounds = self.page_rects()
+        bounds = bounds.adjusted(-PAGE_GAP, -PAGE_GAP, PAGE_GAP, PAGE_GAP)
+        self.scene.setSceneRect(bounds.translated(-self._page_offset()))
+
+    def _scroll_to_page_top(self):
+        if self.page_layout == "single":
+            return
+        page = self.page_manager.get_current_page()
+        visible = self.mapToScene(self.viewport().rect()).boundingRect()
+        self._tracking_page = True
+        self.centerOn(page.width / 2, visible.height() / 2 - PAGE_GAP)
+        self._tracking_page = False
+
+    def visible_pages(self, margin=0.0):
+        """Indices of the pages intersecting the viewport, grown by `margin` viewport heights"""
+        if self.page_layout == "single":
+            return [self.page_manager.current_page_index]
+        visible = self.mapToScene(self.viewport().rect()).boundingRect()
+        extra = visible.height() * margin
+        visible = visible.adjusted(0, -extra, 0, extra).translated(self._page_offset())
+        rects, _ = self.page_rects()
+        return [index for index, rect in enumerate(rects) if rect.intersects(visible)]
+
+    def page_at(self, view_pos):
+        """Index of the page under a viewport position (None between pages)"""
+        point = self.mapToScene(view_pos) + self._page_offset()
+        rects, _ = self.page_rects()
+        for index in self.visible_pages():
+            if rects[index].contains(point):
+                return index
+        return None
+
+    def _make_page_current(self, index):
+        """Swap to another page's scene keeping the view where it is"""
+        if index == self.page_manager.current_page_index:
+            return
+        offset = self._page_offset()
+        center = self.mapToScene(self.viewport().rect().center()) + offset
+        self._tracking_page = True
+        self.page_manager.set_current_page(index)
+        self.scene = self.page_manager.get_current_page().scene
+        self.setScene(self.scene)
+        self._prepare_scene()
+        self._apply_page_layout()
+        self.centerOn(center - self._page_offset())
+        self._tracking_page = False
+        if self.on_page_changed:
+            self.on_page_changed()
+        window = self.window()
+        if hasattr(window, 'update_page_label'):
+            window.update_page_label()
+
+    def scrollContentsBy(self, dx, dy):
+        super().scrollContentsBy(dx, dy)
+        if self.page_layout == "single" or self._tracking_page:
+            return
+        # The scene being torn down detaches itself from the view
+        if QGraphicsView.scene(self) is None:
+            return
+        # Don't swap scenes under an item being dragged
+        if self.scene.mouseGrabberItem() is not None:
+            return
+        index = self.page_at(self.viewport().rect().center())
+        if index is not None:
+            self._make_page_current(index)
+        pages = self.page_manager.pages
+        self.page_manager.prefetch([pages[i] for i in self.visible_pages(PREFETCH_MARGIN)])
+
+    def drawBackground(self, painter, rect):
+        super().drawBackground(painter, rect)
+        if self._parked:
+            # Painting is a use of the page: build it again (a blank page until then)
+            page = self.page_manager.get_current_page()
+            painter.fillRect(QRectF(0, 0, page.width, page.height), QColor("white"))
+            QTimer.singleShot(0, self.wake)
+        if self.page_layout == "single":
+            return
+        # The other pages in view; the current one is the scene itself
+        offset = self._page_offset()
+        rects, _ = self.page_rects()
+        current = self.page_manager.current_page_index
+        scale = device_scale(painter)
+        for index in self.visible_pages():
+            if index == current:
+                continue
+            target = rects[index].translated(-offset)
+            if not target.intersects(rect):
+                continue
+            page = self.page_manager.pages[index]
+            page.touch()
+            self.tile_cache.draw_page(painter, page, target, rect, scale)
+
+    def _tile_ready(self, uid):
+        pages = self.page_manager.pages
+        if any(pages[index].uid == uid for index in self.visible_pages()):
+            self.viewport().update()
+
     def set_zoom(self, zoom_factor):
         """Set zoom level (1.0 = 100%)"""
         self.resetTransform()
@@ -197,8 +510,15 @@ class DocumentView(QGraphicsView):
         if hasattr(self, 'on_zoom_changed') and self.on_zoom_changed:
             self.on_zoom_changed(zoom_factor)
 
-    def add_text_box(self, x, y, width=300, height=200, locked=True):
-        """Create text box with lock option"""
+    def add_body_text_box(self, scene=None):
+        """Create the locked text box that fills a page between its margins"""
+        body_width = self.page_width - self.margin_left - self.margin_right
+        body_height = self.page_height - self.margin_top - self.margin_bottom
+        return self.add_text_box(self.margin_left, self.margin_top, width=body_width, height=body_height,
+                                 locked=True, scene=scene)
+
+    def add_text_box(self, x, y, width=300, height=200, locked=True, scene=None):
+        """Create text box with lock option (on the current page unless `scene` is given)"""
         urdu_text = "یہ اردو متن ہے۔ آپ اس میں کسی بھی حرف یا لفظ کو منتخب کر سکتے ہیں۔"
         tb = TextBox(urdu_text, self.current_font_family, locked=locked)
         tb.setPos(x, y)
@@ -228,22 +548,81 @@ class DocumentView(QGraphicsView):
         # Set up linking callback
         tb.on_link_clicked = self.start_linking
         
-        self.scene.addItem(tb)
+        (scene or self.scene).addItem(tb)
         return tb
     
+    def import_text_file(self, path):
+        """Set up a streaming import of a UTF-8 text file (see TextImport); call start() on the result.
+
+        The text goes in at the cursor of the box being edited, or at the end
+        of the current page's body box. Boxes that fill up continue on new
+        pages inserted after the current one. The finished import is one undo step.
+        """
+        target = self._editing_text_box() or self.active_text_box
+        if target is None:
+            target = next((item for item in self.scene.items() if isinstance(item, TextBox) and item.is_locked),
+                          None) or self.add_body_text_box()
+            cursor = target.textCursor()
+            cursor.movePosition(QTextCursor.MoveOperation.End)
+            target.setTextCursor(cursor)
+        page_index = self.page_manager.current_page_index
+
+        def new_box():
+            nonlocal page_index
+            page_index += 1
+            page = self.page_manager.add_page(page_index)
+            box = self.add_body_text_box(scene=page.scene)
+            box.document().clear()
+            return box
+
+        # Guard first: nothing the import does to a linked target is a text step of its own
+        self._importing = True
+        try:
+            self._importing = TextImport(path, target, new_box, self.page_manager, record=self._import_finished)
+        except Exception:
+            self._importing = None
+            raise
+        return self._importing
+
+    def _import_finished(self, command):
+        self._importing = None
+        self.push_command(command, merge=False)
+
     def start_linking(self, source_box):
         self.linking_source = source_box
         self.setCursor(Qt.CursorShape.CrossCursor)
 
     def finish_linking(self, target_box):
-        if self.linking_source and self.linking_source != target_box:
-            self.linking_source.next_box = target_box
-            target_box.prev_box = self.linking_source
-            self.linking_source.update_handles()
+        source = self.linking_source
+        # A box has one box before and after it, and chains can't loop
+        if (source and source is not target_box and source.next_box is None
+                and target_box.prev_box is None and target_box is not story_head(source)):
+            source.next_box = target_box
+            target_box.prev_box = source
+            source.update_handles()
+            # Linking isn't an undo step, so the text it moves settles now, unrecorded
+            flow = shared_story_flow()
+            flow.schedule(source)
+            self._recording_text = False
+            try:
+                flow.flush()
+            finally:
+                self._recording_text = True
         
         self.linking_source = None
         self.setCursor(Qt.CursorShape.ArrowCursor)
 
+    def unlink(self, box):
+        """Break the link after `box`; the text on either side stays where it is"""
+        following = box.next_box
+        if following is None:
+            return
+        shared_story_flow().flush()
+        box.next_box = None
+        following.prev_box = None
+        box.story_continues = False
+        box.update_handles()
+
     def set_tool(self, tool_name):
         self.current_tool = tool_name
         self.linking_source = None
@@ -282,25 +661,24 @@ class DocumentView(QGraphicsView):
     # we might need to rethink or just dump the text of all boxes.
     # For this step, I will implement a basic JSON serializer for the boxes.
 
-    def get_content(self):
-        # Serialize scene to JSON
-        import json
-        data = []
-        for item in self.scene.items():
-            if isinstance(item, TextBox):
-                data.append({
-                    "type": "text",
-                    "x": item.x(),
-                    "y": item.y(),
-                    "content": item.toHtml(),
-                    "width": item.textWidth()
-                })
-            # Add image handling later
-        return json.dumps(data)
+    def read_content(self, fp):
+        """Replace the document with a JSON Lines stream written by earlier versions (see serializer)"""
+        read_document(fp, self.page_manager)
+        self.undo_stack.clear()
+        self.active_text_box = None
+        self.scene = self.page_manager.get_page(self.page_manager.current_page_index).scene
+        self.setScene(self.scene)
+        self._prepare_scene()
+        self._apply_page_layout()
 
     def set_content(self, content):
         # Deserialize
         import json
+        if is_stream_header(content.split("\n", 1)[0]):
+            self.read_content(io.StringIO(content))
+            return
+        # The scene is rebuilt from scratch, so recorded deltas no longer apply
+        self.undo_stack.clear()
         try:
             data = json.loads(content)
             self.scene.clear()
@@ -310,6 +688,7 @@ class DocumentView(QGraphicsView):
             page_item.setBrush(QBrush(QColor("white")))
             page_item.setPen(QPen(Qt.GlobalColor.black))
             self.scene.addItem(page_item)
+            self.page_manager.get_current_page().background = page_item
             
             for item_data in data:
                 if item_data["type"] == "text":
@@ -323,73 +702,156 @@ class DocumentView(QGraphicsView):
             page_item = QGraphicsRectItem(0, 0, self.page_width, self.page_height)
             page_item.setBrush(QBrush(QColor("white")))
             self.scene.addItem(page_item)
+            self.page_manager.get_current_page().background = page_item
             
             tb = self.add_text_box(50, 50)
             tb.setHtml(content)
 
+    def save_document(self, path):
+        """Save every page to a .upg container, rewriting only changed pages.
+
+        Returns (pages_written, assets_written).
+        """
+        shared_story_flow().flush()
+        return save_container(path, self.page_manager)
+
+    def load_document(self, path):
+        """Load a .upg container, falling back to the legacy flat JSON/HTML format"""
+        if not is_container(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                if is_stream_header(f.readline()):
+                    f.seek(0)
+                    self.read_content(f)
+                else:
+                    f.seek(0)
+                    self.set_content(f.read())
+            return
+
+        with UpgReader(path) as reader:
+            self._load_pages(reader)
+
+    def recover_document(self, journal_path):
+        """Load the pages saved in an autosave recovery journal.
+
+        Returns the path of the document the journal belongs to (None if it was untitled).
+        """
+        with JournalReader(journal_path) as reader:
+            self._load_pages(reader)
+            return reader.document_path
+
+    def _load_pages(self, reader):
+        self.page_manager.load_container(reader)
+        self.undo_stack.clear()
+        self.active_text_box = None
+        self.scene = self.page_manager.get_page(self.page_manager.current_page_index).scene
+        self.setScene(self.scene)
+        self._prepare_scene()
+        self._apply_page_layout()
+
     def export_pdf(self, file_path):
         printer = QPrinter(QPrinter.PrinterMode.HighResolution)
         printer.setOutputFormat(QPrinter.OutputFormat.PdfFormat)
         printer.setOutputFileName(file_path)
         
         # Render the scene
+        shared_story_flow().flush()
         painter = QPainter(printer)
-        self.scene.render(painter)
+        self.page_manager.get_current_page().render(painter)
         painter.end()
 
     def set_language(self, lang):
         """FIXED: Properly set language for input handler"""
+        self.flush_typing()
         self.input_handler.set_language(lang)
         self.current_language = lang
 
     def eventFilter(self, obj, event):
         # Input handling for TextBox documents
         if event.type() == event.Type.KeyPress:
-            # DEBUG: Print language state
-            print(f"DEBUG: KeyPress event, language={self.input_handler.current_language}, key='{event.text()}'")
-            
-            # Use input handler's language setting
-            if self.input_handler.current_language == 'UR':
+            key_time = time.perf_counter()
+            if TRACE_KEYS:
+                logger.debug("key press %r, language %s", event.text(), self.input_handler.current_language)
+
+            if self.input_handler.current_language == 'UR' and isinstance(obj, TextBox):
                 # Ignore modifier keys alone
                 if event.key() in (Qt.Key.Key_Shift, Qt.Key.Key_Control, Qt.Key.Key_Alt, Qt.Key.Key_Meta):
                     return False
-                    
-                # Allow control shortcuts (Copy/Paste/Select All)
-                if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
-                    if event.key() in (Qt.Key.Key_A, Qt.Key.Key_C, Qt.Key.Key_V, Qt.Key.Key_X):
-                        return False
-                        
-                mapped_char = self.input_handler.process_key(event)
-                print(f"DEBUG: Mapped '{event.text()}' to '{mapped_char}'")
-                
-                if mapped_char and mapped_char != event.text():  # Only if mapping changed
-                    focus_item = self.scene.focusItem()
-                    print(f"DEBUG: Focus item: {type(focus_item)}")
-                    
-                    if isinstance(focus_item, TextBox):
-                        cursor = focus_item.textCursor()
-                        
-                        # CRITICAL FIX: Set cursor format to use Urdu font BEFORE inserting
-                        fmt = cursor.charFormat()
-                        fmt.setFontFamily(self.current_font_family)
-                        fmt.setFontPointSize(self.current_font_size)
-                        cursor.setCharFormat(fmt)
-                        
-                        # Insert the Urdu character
-                        cursor.insertText(mapped_char)
-                        focus_item.setTextCursor(cursor)
-                        print(f"DEBUG: Successfully inserted '{mapped_char}'")
+
+                # Shortcuts go to their handlers
+                if not event.modifiers() & (Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.AltModifier
+                                            | Qt.KeyboardModifier.MetaModifier):
+                    edit = self.input_handler.process_key(event)
+                    if edit is not None:
+                        self.latency.key_mapped(obj, key_time, batched=True)
+                        self._queue_typing(obj, *edit)
                         return True  # Block default handler
-                        
-                # If no mapping or same character, let default handler process
-                return False
-        
+
+            # Anything else (editing keys, unmapped characters) sees the text typed so far
+            self.flush_typing()
+            self.input_handler.reset()
+            if isinstance(obj, TextBox):
+                self.latency.key_mapped(obj, key_time, batched=False)
+            return False
+
         elif event.type() == event.Type.FocusIn:
             if isinstance(obj, TextBox):
                 self.active_text_box = obj
+        elif event.type() == event.Type.FocusOut:
+            self.flush_typing()
+            self.input_handler.reset()
                 
         return super().eventFilter(obj, event)
 
+    def _queue_typing(self, box, delete, text):
+        """Add a layout edit to the typing batch, inserted into `box` from the event loop.
+
+        Keys that arrive together (fast typing, auto-repeat, a busy UI)
+        become one insert in one edit block, and provisional text replaced
+        within the batch never reaches the document.
+        """
+        if self._typing is not None and self._typing[0] is not box:
+            self.flush_typing()
+        if self._typing is None:
+            self._typing = [box, 0, ""]
+            QTimer.singleShot(0, self.flush_typing)
+        pending = self._typing[2]
+        replaced = min(delete, len(pending))
+        self._typing[1] += delete - replaced
+        self._typing[2] = pending[:len(pending) - replaced] + text
+
+    def flush_typing(self):
+        """Insert the typing batch"""
+        if self._typing is None:
+            return
+        box, delete, text = self._typing
+        self._typing = None
+        self.latency.edit_started(box)
+        if box.scene() is None or not (delete or text):
+            self.latency.edit_finished()
+            return
+        cursor = box.textCursor()
+        cursor.beginEditBlock()
+        if delete:
+            # Provisional text typed for the sequence in progress
+            cursor.clearSelection()
+            cursor.setPosition(max(0, cursor.position() - delete), QTextCursor.MoveMode.KeepAnchor)
+            cursor.removeSelectedText()
+        # Urdu text is typed in the document's Urdu font
+        fmt = cursor.charFormat()
+        fmt.setFontFamily(self.current_font_family)
+        fmt.setFontPointSize(self.current_font_size)
+        cursor.insertText(text, fmt)
+        cursor.endEditBlock()
+        self.latency.edit_finished()
+        box.setTextCursor(cursor)
+        if TRACE_KEYS:
+            logger.debug("inserted %r after deleting %d", text, delete)
+
+    def set_keyboard_layout(self, name):
+        """Type Urdu through the keyboard layout `name`"""
+        self.flush_typing()
+        self.input_handler.set_layout(name)
+
     # Formatting proxies
     def _apply_char_format(self, format_func):
         # Use active_text_box if available, otherwise focusItem
@@ -520,6 +982,8 @@ class DocumentView(QGraphicsView):
             return
             
         super().keyPressEvent(event)
+        # Keys move the caret and extend text selections without changing any page
+        self._contents_changed()
 
     def set_line_height(self, height):
         """Set line height for selected text box"""
@@ -599,7 +1063,9 @@ class DocumentView(QGraphicsView):
                 
                 pen.setWidth(settings["width"])
                 pen.setColor(settings["color"])
+                before = [item.pen()]
                 item.setPen(pen)
+                self._push_pen_change([item], before, "Border")
                 
             elif isinstance(item, TextBox):
                 # TextBox border
@@ -646,7 +1112,8 @@ class DocumentView(QGraphicsView):
         """Insert new text box at mouse position"""
         # Get current mouse position in scene coordinates
         pos = self.mapToScene(self.viewport().rect().center())
-        self.add_text_box(pos.x(), pos.y(), width=200, height=100, locked=False)
+        tb = self.add_text_box(pos.x(), pos.y(), width=200, height=100, locked=False)
+        self.push_command(AddItemsCommand(self.scene, [tb], "Insert Text Box"))
 
     def set_show_invisibles(self, enabled):
         """Toggle visibility of invisible characters (spaces, tabs, etc.)"""
@@ -676,28 +1143,19 @@ class DocumentView(QGraphicsView):
         table_item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
         table_item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
         self.scene.addItem(table_item)
-        self.save_state()
+        self.push_command(AddItemsCommand(self.scene, [table_item], "Insert Table"))
 
     def insert_image(self, file_path):
-        """Insert an image from file"""
-        pixmap = QPixmap(file_path)
-        if pixmap.isNull():
+        """Insert an image from file (decoded in the background at display resolution)"""
+        item = ImageItem()
+        if not item.set_image(file_path):
             return
             
         pos = self.mapToScene(self.viewport().rect().center())
-        
-        # Create a pixmap item
-        # We might want to wrap it in a resizable item or just add it directly
-        # For now, let's use a simple QGraphicsPixmapItem but make it movable/selectable
-        
-        # Better: Use a custom ResizableImageItem if we had one, or just a QGraphicsPixmapItem
-        item = QGraphicsPixmapItem(pixmap)
         item.setPos(pos)
-        item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
-        item.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
         
         self.scene.addItem(item)
-        self.save_state()
+        self.push_command(AddItemsCommand(self.scene, [item], "Insert Image"))
 
     def select_all(self):
         """Select all items in the scene"""
@@ -723,8 +1181,9 @@ class DocumentView(QGraphicsView):
 
         for item in items_to_delete:
             self.scene.removeItem(item)
-            
-        self.save_state()
+
+        if items_to_delete:
+            self.push_command(RemoveItemsCommand(self.scene, items_to_delete))
 
     def duplicate_selected(self):
         """Duplicate selected items"""
@@ -733,7 +1192,7 @@ class DocumentView(QGraphicsView):
         for item in self.scene.selectedItems():
             if isinstance(item, TextBox):
                 # Clone text box
-                new_tb = self.add_text_box(item.x() + offset, item.y() + offset, item.textWidth(), locked=item.locked)
+                new_tb = self.add_text_box(item.x() + offset, item.y() + offset, item.textWidth(), locked=item.is_locked)
                 new_tb.setHtml(item.toHtml())
                 new_items.append(new_tb)
             elif isinstance(item, ResizableRectItem):
@@ -750,32 +1209,40 @@ class DocumentView(QGraphicsView):
         self.scene.clearSelection()
         for item in new_items:
             item.setSelected(True)
-        self.save_state()
+        if new_items:
+            self.push_command(AddItemsCommand(self.scene, new_items, "Duplicate"))
 
     def bring_to_front(self):
         """Bring selected items one step forward"""
-        for item in self.scene.selectedItems():
+        items = self.scene.selectedItems()
+        before = [item.zValue() for item in items]
+        for item in items:
             z = item.zValue()
             item.setZValue(z + 1)
-        self.save_state()
+        self._push_z_change(items, before, "Bring Forward", merge=True)
 
     def send_to_back(self):
         """Send selected items one step backward"""
-        for item in self.scene.selectedItems():
+        items = self.scene.selectedItems()
+        before = [item.zValue() for item in items]
+        for item in items:
             z = item.zValue()
             item.setZValue(z - 1)
-        self.save_state()
+        self._push_z_change(items, before, "Send Backward", merge=True)
 
     def top_most(self):
         """Bring selected items to the very top"""
         # Find max Z
         max_z = 0
         for item in self.scene.items():
-            max_z = max(max_z, item.zValue())
+            if item is not self.scene.selection_overlay:
+                max_z = max(max_z, item.zValue())
         
-        for item in self.scene.selectedItems():
+        items = self.scene.selectedItems()
+        before = [item.zValue() for item in items]
+        for item in items:
             item.setZValue(max_z + 1)
-        self.save_state()
+        self._push_z_change(items, before, "Bring to Front")
 
     def bottom_most(self):
         """Send selected items to the very bottom"""
@@ -784,9 +1251,11 @@ class DocumentView(QGraphicsView):
         for item in self.scene.items():
             min_z = min(min_z, item.zValue())
             
-        for item in self.scene.selectedItems():
+        items = self.scene.selectedItems()
+        before = [item.zValue() for item in items]
+        for item in items:
             item.setZValue(min_z - 1)
-        self.save_state()
+        self._push_z_change(items, before, "Send to Back")
 
     def group_selected(self):
         """Group selected items"""
@@ -796,14 +1265,16 @@ class DocumentView(QGraphicsView):
             group.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsMovable)
             group.setFlag(QGraphicsItem.GraphicsItemFlag.ItemIsSelectable)
             group.setSelected(True)
-            self.save_state()
+            self.push_command(GroupCommand(self.scene, group, selected))
 
     def ungroup_selected(self):
         """Ungroup selected items"""
         for item in self.scene.selectedItems():
             if isinstance(item, QGraphicsItemGroup):
-                self.scene.destroyItemGroup(item)
-        self.save_state()
+                # Dissolve through the command so the group object survives for undo
+                command = UngroupCommand(self.scene, item)
+                command.redo()
+                self.push_command(command)
         
     def lock_guides(self):
         """Lock/Unlock guides"""
@@ -835,10 +1306,19 @@ class DocumentView(QGraphicsView):
         self.clearFocus()
 
     def mousePressEvent(self, event):
+        # Clicks move the caret: finish what was typed before them
+        self.flush_typing()
+        self.input_handler.reset()
         if event.button() != Qt.MouseButton.LeftButton:
             super().mousePressEvent(event)
             return
 
+        if self.page_layout != "single":
+            # Clicking another visible page makes it the one being edited
+            index = self.page_at(event.pos())
+            if index is not None:
+                self._make_page_current(index)
+
         scene_pos = self.mapToScene(event.pos())          # QPointF in scene coords
         view_pos = event.pos()                             # QPoint in view coords (for itemAt)
 
@@ -871,6 +1351,19 @@ class DocumentView(QGraphicsView):
             event.accept()
             return
 
+        # === TOOL: Linking text boxes ===
+        if isinstance(item_at_pos, TextBox) and (self.linking_source or self.current_tool == "link"):
+            if self.linking_source:
+                self.finish_linking(item_at_pos)
+            else:
+                self.start_linking(item_at_pos)
+            event.accept()
+            return
+        if self.current_tool == "unlink" and isinstance(item_at_pos, TextBox):
+            self.unlink(item_at_pos)
+            event.accept()
+            return
+
         # === TOOL: Shape / Text Box Creation ===
         if self.current_tool == "rect":
             from src.engine.shape_items import ResizableRectItem
@@ -928,48 +1421,108 @@ class DocumentView(QGraphicsView):
         # Let Qt handle selection/move/resize for pointer tool and other cases
         super().mousePressEvent(event)
 
-    def find_text(self, text, case_sensitive, backward):
-        """Find text in text boxes"""
-        flags = QTextCursor.FindFlag(0)
-        if case_sensitive:
-            flags |= QTextCursor.FindFlag.FindCaseSensitively
-        if backward:
-            flags |= QTextCursor.FindFlag.FindBackward
-
-        # Start from active text box or first text box
-        start_item = self.active_text_box if self.active_text_box else None
-        
-        # If no active item, find the first text box
-        if not start_item:
-            for item in self.scene.items():
-                if isinstance(item, TextBox):
-                    start_item = item
-                    break
-        
-        if not start_item:
-            return False
-
-        # Search in current item
-        cursor = start_item.textCursor()
-        found = start_item.find(text, flags)
-        
-        if found:
-            self.active_text_box = start_item
-            start_item.setFocus()
-            return True
-            
-        # If not found in current, search other boxes?
-        # For now, just return False or implement global search later
-        return False
-
-    def replace_text(self, find_text, replace_text, case_sensitive, backward):
+        # Remember geometry of everything the drag may move or resize
+        tracked = set(self.scene.selectedItems())
+        if item_at_pos:
+            tracked.add(item_at_pos.topLevelItem())
+        self._press_geometry = {item: capture_geometry(item) for item in tracked}
+
+    def find_text(self, text, case_sensitive, backward, ignore_diacritics=True):
+        """Select the next (or previous) match in the document, wrapping around.
+
+        Returns (match number, match count), None if there is no match.
+        """
+        index = self.search_index
+        options = (case_sensitive, ignore_diacritics)
+        pages = self.page_manager.pages
+        box = self.active_text_box
+        page = getattr(box.scene(), 'page', None) if box is not None and box.scene() is not None else None
+        if page in pages:
+            frame = index.boxes(page).index(box)
+            cursor = box.textCursor()
+            position = cursor.selectionStart() + (1 if cursor.hasSelection() and not backward else 0)
+        else:
+            # From the top (or bottom) of the current page
+            page = self.page_manager.get_current_page()
+            frame, position = (-1, 0) if not backward else (len(index.boxes(page)), 0)
+
+        found, matches = index.neighbour(text, page, frame, position, backward, *options)
+        if found is None:
+            return None
+        match = matches[found]
+
+        # A page read from its record is read again from its boxes
+        target = match.page
+        ordinal = found - next(i for i, m in enumerate(matches) if m.page is target)
+        boxes = index.boxes(target)
+        matches = index.find_all(text, *options)
+        first = next((i for i, m in enumerate(matches) if m.page is target), None)
+        if first is None:
+            return None
+        found = first + ordinal
+        if found >= len(matches) or matches[found].page is not target:
+            found = first
+        match = matches[found]
+        start, end = index.span(match, *options)
+
+        page_index = pages.index(target)
+        if page_index != self.page_manager.current_page_index:
+            self.switch_page(page_index)
+        box = boxes[match.frame]
+        end = min(end, box.document().characterCount() - 1)
+        cursor = box.textCursor()
+        cursor.setPosition(start)
+        cursor.setPosition(end, QTextCursor.MoveMode.KeepAnchor)
+        box.setTextCursor(cursor)
+        box.setFocus()
+        self.active_text_box = box
+        self.ensureVisible(box)
+        return found + 1, len(matches)
+
+    def count_matches(self, text, case_sensitive, ignore_diacritics=True):
+        return self.search_index.count(text, case_sensitive, ignore_diacritics)
+
+    def highlight_all(self, text, case_sensitive, ignore_diacritics=True):
+        """Mark every match of `text` (nothing if empty) on the pages being shown. Returns the match count."""
+        self.search_highlight = (text, case_sensitive, ignore_diacritics) if text else None
+        self._highlighted.clear()
+        for page in self.page_manager.pages:
+            if page.is_materialized():
+                self._apply_search_highlights(page)
+        if self.search_highlight is None:
+            self._highlight_timer.stop()
+            return 0
+        self._highlight_timer.start()
+        return self.search_index.count(text, case_sensitive, ignore_diacritics)
+
+    def _apply_search_highlights(self, page):
+        if self.search_highlight is None:
+            for box in self.search_index.boxes(page):
+                box.set_search_highlights([])
+            return
+        boxes = self.search_index.boxes(page)
+        ranges = [[] for _ in boxes]
+        for frame, start, end in self.search_index.matches_on(page, *self.search_highlight):
+            ranges[frame].append((start, end))
+        for box, box_ranges in zip(boxes, ranges):
+            box.set_search_highlights(box_ranges)
+        self._highlighted[page.uid] = (page.revision, page.scene)
+
+    def _refresh_search_highlights(self):
+        """Re-mark pages edited or rebuilt since they were highlighted"""
+        for page in self.page_manager.pages:
+            if page.is_materialized() and self._highlighted.get(page.uid) != (page.revision, page.scene):
+                self._apply_search_highlights(page)
+
+    def replace_text(self, find_text, replace_text, case_sensitive, backward, ignore_diacritics=True):
         """Replace current selection if it matches, then find next"""
         if self.active_text_box and self.active_text_box.textCursor().hasSelection():
             cursor = self.active_text_box.textCursor()
             selected = cursor.selectedText()
             
-            # Verify selection matches find_text (handling case)
-            match = selected == find_text if case_sensitive else selected.lower() == find_text.lower()
+            # Verify selection matches find_text (as the search compares them)
+            match = (normalize(selected, case_sensitive, ignore_diacritics)
+                     == normalize(find_text, case_sensitive, ignore_diacritics))
             
             if match:
                 cursor.insertText(replace_text)
@@ -977,28 +1530,36 @@ class DocumentView(QGraphicsView):
         
         return False
 
-    def replace_all_text(self, find_text, replace_text, case_sensitive):
-        """Replace all occurrences in all text boxes"""
-        count = 0
-        flags = QTextCursor.FindFlag(0)
-        if case_sensitive:
-            flags |= QTextCursor.FindFlag.FindCaseSensitively
-            
-        for item in self.scene.items():
-            if isinstance(item, TextBox):
-                # Move cursor to start
-                cursor = item.textCursor()
-                cursor.movePosition(QTextCursor.MoveOperation.Start)
-                item.setTextCursor(cursor)
-                
-                while item.find(find_text, flags):
-                    cursor = item.textCursor()
-                    cursor.insertText(replace_text)
-                    count += 1
-        return count
+    def replace_all_text(self, find_text, replace_text, case_sensitive, ignore_diacritics=True, regex=False):
+        """Set up a Replace All over every page (see BatchReplace); call start() on the result.
+
+        Pages in view are replaced first, the rest in the background. Once
+        finished, everything replaced is one step on the undo stack.
+        Raises re.error for an invalid regular expression.
+        """
+        self.flush_typing()
+        self.input_handler.reset()
+        batch = BatchReplace(self.search_index, find_text, replace_text, case_sensitive, ignore_diacritics, regex,
+                             first_pages=[self.page_manager.pages[index] for index in self.visible_pages()],
+                             record=self._replace_finished)
+        self._replacing = batch
+        return batch
+
+    def _replace_finished(self, command):
+        self._replacing = None
+        if command:
+            self.push_command(command, merge=False)
+
+    def leaveEvent(self, event):
+        if self.on_cursor_moved:
+            self.on_cursor_moved(None)
+        super().leaveEvent(event)
 
     def mouseMoveEvent(self, event):
         """Handle mouse move for shape resizing during creation"""
+        if self.on_cursor_moved:
+            self.on_cursor_moved(event.position())
+
         if self.temp_item and self.shape_start_pos:
             scene_pos = self.mapToScene(event.pos())
             
@@ -1101,13 +1662,13 @@ class DocumentView(QGraphicsView):
                     self.scene.clearSelection()
                     tb.setSelected(True)
 
-                self.save_state()
+                self.push_command(AddItemsCommand(self.scene, [tb], "Insert Text Box"))
 
             elif isinstance(self.temp_item, (ResizableRectItem, ResizableEllipseItem, ResizableLineItem, PolygonItem)):
                 # Finalize the shape and select it so handles show
                 self.scene.clearSelection()
                 self.temp_item.setSelected(True)
-                self.save_state()
+                self.push_command(AddItemsCommand(self.scene, [self.temp_item], "Draw Shape"))
 
             self.temp_item = None
             self.shape_start_pos = None
@@ -1121,37 +1682,50 @@ class DocumentView(QGraphicsView):
 
         super().mouseReleaseEvent(event)
 
+        if self._press_geometry:
+            self._push_geometry_changes(self._press_geometry)
+            self._press_geometry = {}
+        self._contents_changed()
+
     def set_shape_width(self, width):
         """Set width for selected shape"""
-        for item in self.scene.selectedItems():
-            if hasattr(item, 'setRect'):
-                rect = item.rect()
-                item.setRect(rect.x(), rect.y(), width, rect.height())
-                item.update_handles()
+        items = [item for item in self.scene.selectedItems() if hasattr(item, 'setRect')]
+        before = {item: capture_geometry(item) for item in items}
+        for item in items:
+            rect = item.rect()
+            item.setRect(rect.x(), rect.y(), width, rect.height())
+            item.update_handles()
+        self._push_geometry_changes(before, "Resize", merge_key="shape-size")
 
     def set_shape_height(self, height):
         """Set height for selected shape"""
-        for item in self.scene.selectedItems():
-            if hasattr(item, 'setRect'):
-                rect = item.rect()
-                item.setRect(rect.x(), rect.y(), rect.width(), height)
-                item.update_handles()
+        items = [item for item in self.scene.selectedItems() if hasattr(item, 'setRect')]
+        before = {item: capture_geometry(item) for item in items}
+        for item in items:
+            rect = item.rect()
+            item.setRect(rect.x(), rect.y(), rect.width(), height)
+            item.update_handles()
+        self._push_geometry_changes(before, "Resize", merge_key="shape-size")
 
     def set_border_width(self, width):
         """Set border width for selected shape"""
-        for item in self.scene.selectedItems():
-            if hasattr(item, 'setPen'):
-                pen = item.pen()
-                pen.setWidth(width)
-                item.setPen(pen)
+        items = [item for item in self.scene.selectedItems() if hasattr(item, 'setPen')]
+        before = [item.pen() for item in items]
+        for item in items:
+            pen = item.pen()
+            pen.setWidth(width)
+            item.setPen(pen)
+        self._push_pen_change(items, before, "Border Width")
 
     def set_border_color(self, color):
         """Set border color for selected shape"""
-        for item in self.scene.selectedItems():
-            if hasattr(item, 'setPen'):
-                pen = item.pen()
-                pen.setColor(color)
-                item.setPen(pen)
+        items = [item for item in self.scene.selectedItems() if hasattr(item, 'setPen')]
+        before = [item.pen() for item in items]
+        for item in items:
+            pen = item.pen()
+            pen.setColor(color)
+            item.setPen(pen)
+        self._push_pen_change(items, before, "Border Color")
 
     def set_border_style(self, style):
         """Set border style for selected shape"""
@@ -1161,16 +1735,21 @@ class DocumentView(QGraphicsView):
             "Dotted": Qt.PenStyle.DotLine,
             "None": Qt.PenStyle.NoPen
         }
-        for item in self.scene.selectedItems():
-            if hasattr(item, 'setPen'):
-                pen = item.pen()
-                pen.setStyle(style_map.get(style, Qt.PenStyle.SolidLine))
-                item.setPen(pen)
+        items = [item for item in self.scene.selectedItems() if hasattr(item, 'setPen')]
+        before = [item.pen() for item in items]
+        for item in items:
+            pen = item.pen()
+            pen.setStyle(style_map.get(style, Qt.PenStyle.SolidLine))
+            item.setPen(pen)
+        self._push_pen_change(items, before, "Border Style")
 
     def set_rotation(self, angle):
         """Set rotation angle for selected shape"""
-        for item in self.scene.selectedItems():
+        items = self.scene.selectedItems()
+        before = {item: capture_geometry(item) for item in items}
+        for item in items:
             item.setRotation(angle)
+        self._push_geometry_changes(before, "Rotate", merge_key="rotation")
 
     def set_polygon_sides(self, sides):
         """Set polygon sides for future polygon creation"""
@@ -44,23 +44,53 @@ class DocumentWindow(QMdiSubWindow):
         
         # Connect Zoom
         self.document_view.on_zoom_changed = self.update_ruler_zoom
+        # In continuous layouts the rulers follow the page under the viewport
+        self.document_view.on_page_changed = self.update_ruler_origin
+
+        # Rulers mark the cursor position over the page
+        self.document_view.on_cursor_moved = self.update_ruler_markers
         
+        # Path of the .upg file this window was loaded from / saved to
+        self.file_path = None
+
         # Set window title based on document name (todo)
         self.setWindowTitle("Untitled")
         
     def update_h_ruler(self, scroll_val):
-        # Ruler should show 0 at the page's left edge, not the scene's left edge
-        # Since page starts at (0,0) in scene, offset is just the scroll value
-        self.h_ruler.set_offset(scroll_val)
+        self.update_ruler_origin()
         
     def update_v_ruler(self, scroll_val):
-        # Ruler should show 0 at the page's top edge, not the scene's top edge
-        self.v_ruler.set_offset(scroll_val)
+        self.update_ruler_origin()
+
+    def update_ruler_origin(self):
+        # Rulers show 0 at the current page's top left corner, which is (0,0) in
+        # its scene wherever it is in the view (centred, or within a continuous layout)
+        view = self.document_view
+        origin = view.mapFromScene(0, 0)
+        self.h_ruler.set_offset(0)
+        self.h_ruler.set_page_offset(origin.x() + view.frameWidth())
+        self.v_ruler.set_offset(0)
+        self.v_ruler.set_page_offset(origin.y() + view.frameWidth())
         
     def update_ruler_zoom(self, zoom):
         self.h_ruler.set_zoom(zoom)
         self.v_ruler.set_zoom(zoom)
+        self.update_ruler_origin()
         
+    def update_ruler_markers(self, pos):
+        # `pos` is in viewport coordinates, None once the cursor leaves the view
+        if pos is None:
+            self.h_ruler.set_marker(None)
+            self.v_ruler.set_marker(None)
+            return
+        frame = self.document_view.frameWidth()
+        self.h_ruler.set_marker(pos.x() + frame)
+        self.v_ruler.set_marker(pos.y() + frame)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.update_ruler_origin()
+
     def closeEvent(self, event):
         # Todo: Check for unsaved changes
         super().closeEvent(event)
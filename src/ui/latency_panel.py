@@ -0,0 +1,136 @@
+from PyQt6.QtWidgets import (QDockWidget, QWidget, QVBoxLayout, QHBoxLayout, QTableWidget, QTableWidgetItem,
+                             QHeaderView, QLabel, QPushButton, QFileDialog, QMessageBox)
+from PyQt6.QtCore import Qt, QTimer, QRectF
+from PyQt6.QtGui import QPainter, QColor
+
+from src.engine.latency import STAGES, BUCKETS_MS, PERCENTILES
+
+ROWS = STAGES + ("total",)
+COLUMNS = ("Keys",) + tuple(f"p{p}" for p in PERCENTILES) + ("Max",)
+
+
+class _Histogram(QWidget):
+    """Bar chart of the total latency histogram"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.counts = []
+        self.setMinimumHeight(110)
+
+    def set_counts(self, counts):
+        self.counts = counts
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        rect = self.rect().adjusted(4, 4, -4, -18)
+        painter.fillRect(self.rect(), QColor("white"))
+        if not self.counts or rect.width() <= 0:
+            painter.end()
+            return
+        labels = [f"≤{edge}" for edge in BUCKETS_MS] + [f">{BUCKETS_MS[-1]}"]
+        peak = max(self.counts) or 1
+        step = rect.width() / len(self.counts)
+        for i, count in enumerate(self.counts):
+            height = rect.height() * count / peak
+            bar = QRectF(rect.left() + i * step + 1, rect.bottom() - height, step - 2, height)
+            # Buckets past one frame at 60 Hz are what operators notice
+            painter.fillRect(bar, QColor("#4a90d9") if i < BUCKETS_MS.index(16) + 1 else QColor("#d9534f"))
+            painter.setPen(QColor("#555555"))
+            painter.drawText(QRectF(rect.left() + i * step, rect.bottom() + 2, step, 14),
+                             Qt.AlignmentFlag.AlignCenter, labels[i])
+        painter.end()
+
+
+class LatencyPanel(QDockWidget):
+    """Developer panel showing the keystroke-to-paint latency of the active document.
+
+    Percentiles are over the document's rolling window of recent keys
+    (see src.engine.latency). The report can be exported as JSON to
+    compare builds.
+    """
+    def __init__(self, parent=None):
+        super().__init__("Typing Latency", parent)
+        self.document_view = None
+        self.document_title = None
+
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+
+        self.table = QTableWidget(len(ROWS), len(COLUMNS))
+        self.table.setHorizontalHeaderLabels(COLUMNS)
+        self.table.setVerticalHeaderLabels([row.capitalize() for row in ROWS])
+        self.table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
+        layout.addWidget(self.table)
+
+        layout.addWidget(QLabel("Total latency (ms):"))
+        self.histogram = _Histogram()
+        layout.addWidget(self.histogram)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        buttons = QHBoxLayout()
+        self.reset_button = QPushButton("Reset")
+        self.reset_button.clicked.connect(self.reset)
+        self.export_button = QPushButton("Export JSON...")
+        self.export_button.clicked.connect(self.export_json)
+        buttons.addWidget(self.reset_button)
+        buttons.addStretch()
+        buttons.addWidget(self.export_button)
+        layout.addLayout(buttons)
+
+        self.setWidget(widget)
+
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setInterval(500)
+        self._refresh_timer.timeout.connect(self.refresh)
+        self._refresh_timer.start()
+
+    def set_document_view(self, document_view, title=None):
+        self.document_view = document_view
+        self.document_title = title
+        self.refresh()
+
+    def refresh(self):
+        if not self.isVisible():
+            return
+        if self.document_view is None:
+            self.table.clearContents()
+            self.histogram.set_counts([])
+            self.status_label.setText("No document")
+            return
+        recorder = self.document_view.latency
+        stats = recorder.stats()
+        for row, stage in enumerate(ROWS):
+            entry = stats[stage]
+            values = [entry["count"]] + [entry[f"p{p}"] for p in PERCENTILES] + [entry["max"]]
+            for column, value in enumerate(values):
+                if value is None:
+                    text = "–"
+                elif column == 0:
+                    text = str(value)
+                else:
+                    text = f"{value:.2f}"
+                item = QTableWidgetItem(text)
+                item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, column, item)
+        self.histogram.set_counts(stats["total"]["histogram"])
+        self.status_label.setText(f"{recorder.recorded} keys recorded, {recorder.dropped} never painted")
+
+    def reset(self):
+        if self.document_view is not None:
+            self.document_view.latency.clear()
+            self.refresh()
+
+    def export_json(self):
+        if self.document_view is None:
+            return
+        file_path, _ = QFileDialog.getSaveFileName(self, "Export Typing Latency", "latency.json",
+                                                   "JSON Files (*.json)")
+        if not file_path:
+            return
+        try:
+            self.document_view.latency.export_json(file_path, self.document_title)
+        except (OSError, TypeError, ValueError) as e:
+            QMessageBox.critical(self, "Export Error", f"Failed to export latency report: {e}")
@@ -2,7 +2,7 @@ from PyQt6.QtWidgets import (QMainWindow, QMdiArea, QStatusBar, QLabel, QPushBut
                              QMessageBox, QFileDialog, QDockWidget, QToolBar, 
                              QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QFontComboBox, 
                              QSpinBox, QDoubleSpinBox, QToolButton, QFrame, QButtonGroup, 
-                             QApplication, QGraphicsView, QColorDialog, QSlider)
+                             QApplication, QGraphicsView, QColorDialog, QSlider, QProgressDialog)
 from PyQt6.QtCore import Qt, QSize, QTimer
 from PyQt6.QtGui import QIcon, QKeySequence, QActionGroup, QFont, QAction
 from src.ui.dialogs.new_document_dialog import NewDocumentDialog
@@ -12,7 +12,21 @@ from src.ui.dialogs.paragraph_dialog import ParagraphDialog
 from src.ui.dialogs.character_dialog import CharacterDialog
 from src.ui.dialogs.paragraph_dialog import ParagraphDialog
 from src.ui.dialogs.find_replace_dialog import FindReplaceDialog
+from src.engine.autosave import AutosaveManager, JournalReader, find_journals, discard_journal
+from src.engine.hibernation import HibernationManager
+from src.engine.tile_cache import shared_tile_cache
+from src.engine.text_layout import shared_paragraph_layouts
+from src.engine.level_of_detail import GREEK_BELOW_PX, greek_below_px, set_greek_below_px
+from src.engine.text_flow import shared_story_flow
+from src.engine.keyboard_layout import DEFAULT_LAYOUT
+from src.engine.text_box import TextBox
+from src.engine.text_stats import count_text, COUNT_SLICE_MS
+from src.ui.page_navigator import PageNavigator
+from src.ui.latency_panel import LatencyPanel
 import qtawesome as qta
+import os
+import re
+import time
 
 class MainWindow(QMainWindow):
     def __init__(self, default_font, font_families):
@@ -31,6 +45,7 @@ class MainWindow(QMainWindow):
         self.load_recent_files()
         
         self.current_lang = 'UR'
+        self.keyboard_layout = DEFAULT_LAYOUT
         
         self.init_ui()
         
@@ -139,14 +154,103 @@ class MainWindow(QMainWindow):
         # Connect MDI subwindow activation to update UI
         self.mdi_area.subWindowActivated.connect(self.update_ui_from_active_window)
 
-    def get_active_document_view(self):
+        # Autosave unsaved pages into recovery journals; offer journals left by a crash
+        self.autosave = AutosaveManager(self.open_documents, parent=self)
+        QTimer.singleShot(0, self.offer_recovery)
+
+        # Release the scenes of pages (and background documents) nobody is looking at
+        self.hibernation = HibernationManager(self.hibernation_documents, parent=self)
+
+        # Page thumbnails, created on first use (Window > Pages)
+        self.page_navigator = None
+        self.latency_panel = None
+
+        # The status bar word count follows edits and selection, batched per event loop pass
+        self._word_count_pending = QTimer(self)
+        self._word_count_pending.setSingleShot(True)
+        self._word_count_pending.setInterval(0)
+        self._word_count_pending.timeout.connect(self.update_word_count)
+
+    def get_active_document_window(self):
         active_sub = self.mdi_area.activeSubWindow()
         if active_sub and isinstance(active_sub, DocumentWindow):
+            return active_sub
+        return None
+
+    def open_documents(self):
+        """(window, file_path, page_manager) for every open document (used by autosave)"""
+        for sub in self.mdi_area.subWindowList():
+            if isinstance(sub, DocumentWindow):
+                yield sub, sub.file_path, sub.document_view.page_manager
+
+    def hibernation_documents(self):
+        """(window, page_manager, active) for every open document (used by hibernation)"""
+        active = self.mdi_area.activeSubWindow()
+        for sub in self.mdi_area.subWindowList():
+            if isinstance(sub, DocumentWindow):
+                yield sub, sub.document_view.page_manager, sub is active
+
+    def offer_recovery(self):
+        """Offer to restore documents that were not saved before the last session ended"""
+        journals = find_journals()
+        if not journals:
+            return
+        names = "\n".join(self._journal_title(path) for path in journals)
+        answer = QMessageBox.question(
+            self, "Recover Documents",
+            f"page26 did not close properly. Recover the unsaved changes of these documents?\n\n{names}",
+            QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.Discard | QMessageBox.StandardButton.Cancel)
+        if answer == QMessageBox.StandardButton.Cancel:
+            return  # Asked again next time
+        for path in journals:
+            if answer == QMessageBox.StandardButton.Yes:
+                try:
+                    self.recover_document(path)
+                except Exception as e:
+                    # Keep the journal: it is the only copy of the unsaved work
+                    self.statusBar().showMessage(f"Error recovering {path}: {str(e)}")
+                    continue
+            discard_journal(path)
+
+    def _journal_title(self, journal_path):
+        try:
+            document = JournalReader(journal_path).document_path
+        except Exception:
+            document = None
+        return document or "Untitled"
+
+    def recover_document(self, journal_path):
+        sub = DocumentWindow(self.default_font, self.font_families)
+        try:
+            document_path = sub.document_view.recover_document(journal_path)
+        except Exception:
+            sub.deleteLater()
+            raise
+        self.mdi_area.addSubWindow(sub)
+        sub.show()
+        sub.file_path = document_path
+        sub.setWindowTitle(f"{document_path or 'Untitled'} (Recovered)")
+        sub.document_view.set_language(self.current_lang)
+        sub.document_view.set_keyboard_layout(self.keyboard_layout)
+        self.update_page_label()
+        self.statusBar().showMessage(f"Recovered: {document_path or 'Untitled'}")
+
+    def closeEvent(self, event):
+        # A normal exit leaves nothing to recover
+        self.autosave.shutdown()
+        super().closeEvent(event)
+
+    def get_active_document_view(self):
+        active_sub = self.get_active_document_window()
+        if active_sub:
             return active_sub.document_view
         return None
 
     def update_ui_from_active_window(self, window):
         if window and isinstance(window, DocumentWindow):
+            # Its page may have been hibernated while another window was active
+            window.document_view.wake()
+
             # Update zoom slider
             self.zoom_slider.blockSignals(True)
             self.zoom_slider.setValue(int(window.document_view.zoom_level * 100))
@@ -156,23 +260,19 @@ class MainWindow(QMainWindow):
             # Update page label
             self.update_page_label()
             
-            # Update word count
+            # Update word count (then kept current by the view's change notifications)
+            window.document_view.on_contents_changed = self.schedule_word_count
             self.update_word_count()
             
-            # Connect to selection changes if not already connected
-            # We need a way to know when selection changes in the active view
-            # For now, we'll update on window activation and maybe add a timer or signal later
-            try:
-                # Disconnect first to avoid duplicates if possible, or check connection
-                # Ideally DocumentView should have a signal 'selectionChanged'
-                # Let's assume we can connect to the scene's selectionChanged
-                window.document_view.scene.selectionChanged.connect(self.update_word_count)
-            except:
-                pass
-            
             # Update language state if needed (though it's global for now)
             # window.document_view.set_language(self.current_lang)
             
+        if window and isinstance(window, DocumentWindow):
+            self.apply_page_layout()
+        if self.page_navigator:
+            self.page_navigator.set_document_view(self.get_active_document_view())
+        if self.latency_panel:
+            self.update_latency_panel()
         self.update_menus_state()
 
     def on_zoom_changed(self, value):
@@ -190,45 +290,37 @@ class MainWindow(QMainWindow):
             self.page_label.setText(f" Page {current}/{total} ")
         else:
             self.page_label.setText(" Page 0/0 ")
+        self.page_label.setToolTip(f"{self.hibernation.summary()}\n{shared_tile_cache().summary()}\n"
+                                   f"{shared_paragraph_layouts().summary()}")
+
+    def schedule_word_count(self):
+        """Update the word count once the current batch of changes is done"""
+        if not self._word_count_pending.isActive():
+            self._word_count_pending.start()
 
     def update_word_count(self):
+        """Show the word count of the text selection, or else of the document.
+
+        Counts come from the view's DocumentStats, which only recounts what
+        changed; a large document not yet counted is counted a slice per call,
+        with the next slice scheduled until the count is complete.
+        """
         doc_view = self.get_active_document_view()
         if not doc_view:
-            self.word_count_label.setText(" Words: 0 ")
-            return
-
-        word_count = 0
-        is_selection = False
-        
-        # Check for selected text boxes
-        selected_items = doc_view.scene.selectedItems()
-        from src.engine.text_box import TextBox
-        
-        # If text is selected within a text box (requires access to text cursor)
-        # This is tricky without direct access to the active text cursor
-        # But we can check if any text box has focus and selection
-        
-        focus_item = doc_view.scene.focusItem()
-        if isinstance(focus_item, TextBox) and focus_item.textCursor().hasSelection():
-            # Count words in selection
-            text = focus_item.textCursor().selectedText()
-            # Simple split by whitespace
-            words = text.split()
-            word_count = len(words)
-            is_selection = True
+            text = " Words: 0 "
         else:
-            # Count words in all text boxes on current page
-            # We need to iterate items on the current page
-            # Assuming doc_view.page_manager.get_current_page_items() exists or we iterate scene items
-            # For now, iterate scene items and check if they are TextBoxes
-            for item in doc_view.scene.items():
-                if isinstance(item, TextBox):
-                    text = item.toPlainText()
-                    words = text.split()
-                    word_count += len(words)
-        
-        prefix = "Selected Words:" if is_selection else "Words:"
-        self.word_count_label.setText(f" {prefix} {word_count} ")
+            focus_item = doc_view.scene.focusItem()
+            if isinstance(focus_item, TextBox) and focus_item.textCursor().hasSelection():
+                words = count_text(focus_item.textCursor().selectedText())[0]
+                text = f" Selected Words: {words} "
+            else:
+                deadline = time.perf_counter() + COUNT_SLICE_MS / 1000.0
+                stats = doc_view.text_stats
+                text = f" {stats.summary(deadline)} "
+                if stats.pending():
+                    self.schedule_word_count()
+        if self.word_count_label.text() != text:
+            self.word_count_label.setText(text)
 
     def new_document(self):
         # Show New Document Dialog
@@ -243,6 +335,7 @@ class MainWindow(QMainWindow):
             
             # Apply current language setting
             sub.document_view.set_language(self.current_lang)
+            sub.document_view.set_keyboard_layout(self.keyboard_layout)
 
     def create_menu(self):
         menu_bar = self.menuBar()
@@ -449,6 +542,7 @@ class MainWindow(QMainWindow):
         self.addAction(self.action_zoom_200)
         self.addAction(self.action_inc_font)
         self.addAction(self.action_dec_font)
+        self.action_continuous_pages = QAction("&Continuous Pages", self, checkable=True)
         self.action_facing_pages = QAction("&Facing Pages", self, checkable=True)
         self.action_hide_ribbon = QAction("Hide &Ribbon", self, checkable=True)
         self.action_hide_tools = QAction("Hide &Tools", self, checkable=True)
@@ -457,8 +551,11 @@ class MainWindow(QMainWindow):
         self.action_show_invisibles = QAction("Show &Invisibles", self, checkable=True)
         self.action_snap_guides = QAction("Snap to &Guides", self, checkable=True)
         self.action_snap_guides.setShortcut("F9")
+        self.action_greek_text = QAction("Greek Small &Text", self, checkable=True)
+        self.action_greek_text.setChecked(greek_below_px() > 0)
         
         # Connect actions
+        self.action_continuous_pages.toggled.connect(self.toggle_continuous_pages)
         self.action_facing_pages.toggled.connect(self.toggle_facing_pages)
         self.action_hide_ribbon.toggled.connect(self.toggle_ribbon)
         self.action_hide_tools.toggled.connect(self.toggle_tools)
@@ -466,6 +563,7 @@ class MainWindow(QMainWindow):
         self.action_hide_guides.toggled.connect(self.toggle_guides)
         self.action_show_invisibles.toggled.connect(self.toggle_invisibles)
         self.action_snap_guides.toggled.connect(self.toggle_snap_guides)
+        self.action_greek_text.toggled.connect(self.toggle_greek_text)
         
         # Add to menu
         self.view_menu.addAction(self.action_fit_window)
@@ -473,6 +571,7 @@ class MainWindow(QMainWindow):
         self.view_menu.addAction(self.action_actual_size)
         self.view_menu.addAction(self.action_zoom_200)
         self.view_menu.addSeparator()
+        self.view_menu.addAction(self.action_continuous_pages)
         self.view_menu.addAction(self.action_facing_pages)
         self.view_menu.addSeparator()
         self.view_menu.addAction(self.action_hide_ribbon)
@@ -481,6 +580,7 @@ class MainWindow(QMainWindow):
         self.view_menu.addAction(self.action_hide_guides)
         self.view_menu.addAction(self.action_show_invisibles)
         self.view_menu.addAction(self.action_snap_guides)
+        self.view_menu.addAction(self.action_greek_text)
 
     def create_insert_menu(self, menu_bar):
         self.insert_menu = menu_bar.addMenu("&Insert")
@@ -618,17 +718,20 @@ class MainWindow(QMainWindow):
         self.action_close_all.setShortcut("F12")
         self.action_window_page = QAction("&Page", self)
         self.action_window_page.setShortcut("Ctrl+F12")
+        self.action_window_latency = QAction("Typing &Latency", self)
         
         # Connect actions
         self.action_cascade.triggered.connect(self.cascade_windows)
         self.action_tile.triggered.connect(self.tile_windows)
         self.action_close_all.triggered.connect(self.close_all_windows)
         self.action_window_page.triggered.connect(self.show_page_window)
+        self.action_window_latency.triggered.connect(self.show_latency_panel)
         
         self.window_menu.addAction(self.action_cascade)
         self.window_menu.addAction(self.action_tile)
         self.window_menu.addAction(self.action_close_all)
         self.window_menu.addAction(self.action_window_page)
+        self.window_menu.addAction(self.action_window_latency)
         
         # Will be populated with open windows
         self.windows_menu = self.window_menu
@@ -721,17 +824,18 @@ class MainWindow(QMainWindow):
         file_path, _ = QFileDialog.getOpenFileName(self, "Open Document", "", "page26 Files (*.upg);;All Files (*)")
         if file_path:
             try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    
-                    # Create new window
-                    sub = DocumentWindow(self.default_font, self.font_families)
-                    self.mdi_area.addSubWindow(sub)
-                    sub.show()
-                    
-                    # Set content
-                    sub.document_view.set_content(content)
-                    sub.setWindowTitle(file_path)
+                # Create new window
+                sub = DocumentWindow(self.default_font, self.font_families)
+                self.mdi_area.addSubWindow(sub)
+                sub.show()
+                
+                # Load content (.upg container or legacy flat file)
+                sub.document_view.load_document(file_path)
+                sub.file_path = file_path
+                sub.setWindowTitle(file_path)
+                sub.document_view.set_language(self.current_lang)
+                sub.document_view.set_keyboard_layout(self.keyboard_layout)
+                self.update_page_label()
                     
                 self.statusBar().showMessage(f"Opened: {file_path}")
             except Exception as e:
@@ -744,14 +848,8 @@ class MainWindow(QMainWindow):
             return
             
         # If document already has a path, save directly
-        if hasattr(window, 'file_path') and window.file_path:
-            try:
-                content = window.document_view.get_content()
-                with open(window.file_path, 'w', encoding='utf-8') as f:
-                    f.write(content)
-                self.statusBar().showMessage(f"Saved: {window.file_path}")
-            except Exception as e:
-                self.statusBar().showMessage(f"Error saving: {str(e)}")
+        if window.file_path:
+            self._save_to_path(window.file_path, window.document_view)
         else:
             self.save_document_as()
 
@@ -765,11 +863,16 @@ class MainWindow(QMainWindow):
             self._save_to_path(file_path, doc_view)
 
     def _save_to_path(self, path, doc_view):
+        if not path.lower().endswith('.upg'):
+            path += '.upg'
         try:
-            content = doc_view.get_content()
-            with open(path, 'w', encoding='utf-8') as f:
-                f.write(content)
-            self.statusBar().showMessage(f"Saved: {path}")
+            pages_written, assets_written = doc_view.save_document(path)
+            window = self.get_active_document_window()
+            if window and window.document_view is doc_view:
+                window.file_path = path
+                window.setWindowTitle(path)
+                self.autosave.document_saved(window)
+            self.statusBar().showMessage(f"Saved: {path} ({pages_written} page(s) written)")
         except Exception as e:
             self.statusBar().showMessage(f"Error saving file: {str(e)}")
 
@@ -1485,20 +1588,7 @@ class MainWindow(QMainWindow):
                  QMessageBox.information(self, "Import", "Image import not fully implemented in view.")
         else:
             # Text import
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text = f.read()
-                
-                # Insert into active text box or new one
-                if doc_view.active_text_box:
-                    cursor = doc_view.active_text_box.textCursor()
-                    cursor.insertText(text)
-                else:
-                    # Create new text box
-                    tb = doc_view.add_text_box(50, 50)
-                    tb.setPlainText(text)
-            except Exception as e:
-                QMessageBox.critical(self, "Import Error", f"Failed to import file: {str(e)}")
+            self.start_text_import(doc_view, file_path)
 
     def export_document(self):
         """Export document to PDF"""
@@ -1518,7 +1608,46 @@ class MainWindow(QMainWindow):
                 QMessageBox.critical(self, "Export Error", f"Failed to export: {str(e)}")
 
     def place_content(self):
-        self.statusBar().showMessage("Place - Not implemented yet")
+        """Place a text file at the cursor, flowing it onto new pages as boxes fill up"""
+        doc_view = self.get_active_document_view()
+        if not doc_view:
+            return
+        file_path, _ = QFileDialog.getOpenFileName(self, "Place Text", "", "Text Files (*.txt);;All Files (*)")
+        if file_path:
+            self.start_text_import(doc_view, file_path)
+
+    def start_text_import(self, doc_view, file_path):
+        """Stream a text file into the document with a progress dialog that can cancel it"""
+        try:
+            text_import = doc_view.import_text_file(file_path)
+        except OSError as e:
+            QMessageBox.critical(self, "Import Error", f"Failed to import file: {str(e)}")
+            return
+        progress = QProgressDialog(f"Importing {os.path.basename(file_path)}...", "Cancel", 0, 1000, self)
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(text_import.cancel)
+
+        def on_progress(read_bytes, total_bytes, boxes):
+            progress.setValue(int(1000 * read_bytes / total_bytes) if total_bytes else 0)
+            progress.setLabelText(f"Importing {os.path.basename(file_path)}... ({boxes} pages)")
+
+        def on_finished(finished_import):
+            progress.canceled.disconnect(finished_import.cancel)
+            progress.close()
+            self.update_page_label()
+            if self.page_navigator:
+                self.page_navigator.refresh()
+            if finished_import.error:
+                QMessageBox.critical(self, "Import Error", f"Failed to import file: {finished_import.error}")
+            elif finished_import.cancelled:
+                self.statusBar().showMessage(f"Import cancelled after {len(finished_import.boxes)} pages")
+            else:
+                self.statusBar().showMessage(f"Imported: {file_path} ({len(finished_import.boxes)} pages)")
+
+        text_import.on_progress = on_progress
+        text_import.on_finished = on_finished
+        text_import.start()
 
     def print_document(self):
         """Print document"""
@@ -1533,7 +1662,7 @@ class MainWindow(QMainWindow):
             try:
                 # Render scene to printer
                 painter = QPainter(printer)
-                doc_view.scene.render(painter)
+                doc_view.page_manager.get_current_page().render(painter)
                 painter.end()
                 self.statusBar().showMessage("Printing completed")
             except Exception as e:
@@ -1552,15 +1681,9 @@ class MainWindow(QMainWindow):
     def check_spelling(self):
         self.statusBar().showMessage("Spelling - Not implemented yet")
         
-    def show_word_count(self):
-        self.statusBar().showMessage("Word Count - Not implemented yet")
-        
     def edit_links(self):
         self.statusBar().showMessage("Edit Links - Not implemented yet")
         
-    def show_keyboard_preferences(self):
-        self.statusBar().showMessage("Keyboard Preferences - Not implemented yet")
-        
     def cascade_windows(self):
         self.mdi_area.cascadeSubWindows()
         
@@ -1571,7 +1694,28 @@ class MainWindow(QMainWindow):
         self.mdi_area.closeAllSubWindows()
         
     def show_page_window(self):
-        self.statusBar().showMessage("Page Window - Not implemented yet")
+        if self.page_navigator is None:
+            self.page_navigator = PageNavigator(self)
+            self.page_navigator.on_page_changed = self.update_page_label
+            self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.page_navigator)
+        else:
+            self.page_navigator.setVisible(not self.page_navigator.isVisible())
+        self.page_navigator.set_document_view(self.get_active_document_view())
+
+    def show_latency_panel(self):
+        if self.latency_panel is None:
+            self.latency_panel = LatencyPanel(self)
+            self.addDockWidget(Qt.DockWidgetArea.RightDockWidgetArea, self.latency_panel)
+        else:
+            self.latency_panel.setVisible(not self.latency_panel.isVisible())
+        self.update_latency_panel()
+
+    def update_latency_panel(self):
+        sub = self.get_active_document_window()
+        if sub:
+            self.latency_panel.set_document_view(sub.document_view, sub.file_path or sub.windowTitle())
+        else:
+            self.latency_panel.set_document_view(None)
         
     def show_help_contents(self):
         self.statusBar().showMessage("Help Contents - Not implemented yet")
@@ -1597,36 +1741,79 @@ class MainWindow(QMainWindow):
             self.find_dialog.find_next.connect(self.on_find_next)
             self.find_dialog.replace.connect(self.on_replace)
             self.find_dialog.replace_all.connect(self.on_replace_all)
+            self.find_dialog.highlight_all.connect(self.on_highlight_all)
+
+        doc_view = self.get_active_document_view()
+        if doc_view:
+            # Index the document while the search is being typed
+            doc_view.search_index.warm()
         
         self.find_dialog.show()
         self.find_dialog.raise_()
         self.find_dialog.activateWindow()
 
-    def on_find_next(self, text, case_sensitive, backward):
+    def on_find_next(self, text, case_sensitive, backward, ignore_diacritics=True):
         doc_view = self.get_active_document_view()
         if doc_view:
-            found = doc_view.find_text(text, case_sensitive, backward)
+            found = doc_view.find_text(text, case_sensitive, backward, ignore_diacritics)
             if not found:
                 self.statusBar().showMessage(f"Text '{text}' not found.")
+                self.find_dialog.set_match_count("No matches")
             else:
-                self.statusBar().showMessage(f"Found '{text}'")
+                number, total = found
+                self.statusBar().showMessage(f"Found '{text}' ({number} of {total})")
+                self.find_dialog.set_match_count(f"Match {number} of {total}")
 
-    def on_replace(self, find_text, replace_text, case_sensitive, backward):
+    def on_replace(self, find_text, replace_text, case_sensitive, backward, ignore_diacritics=True):
         doc_view = self.get_active_document_view()
         if doc_view:
-            success = doc_view.replace_text(find_text, replace_text, case_sensitive, backward)
+            success = doc_view.replace_text(find_text, replace_text, case_sensitive, backward, ignore_diacritics)
             if success:
                 self.statusBar().showMessage("Replaced")
-                # Find next occurrence
-                self.on_find_next(find_text, case_sensitive, backward)
-            else:
-                self.statusBar().showMessage(f"Text '{find_text}' not found.")
+            # Find next occurrence (or the first one, if the selection wasn't a match)
+            self.on_find_next(find_text, case_sensitive, backward, ignore_diacritics)
 
-    def on_replace_all(self, find_text, replace_text, case_sensitive):
+    def on_replace_all(self, find_text, replace_text, case_sensitive, ignore_diacritics=True, regex=False):
         doc_view = self.get_active_document_view()
         if doc_view:
-            count = doc_view.replace_all_text(find_text, replace_text, case_sensitive)
-            self.statusBar().showMessage(f"Replaced {count} occurrences.")
+            self.start_replace_all(doc_view, find_text, replace_text, case_sensitive, ignore_diacritics, regex)
+
+    def start_replace_all(self, doc_view, find_text, replace_text, case_sensitive, ignore_diacritics, regex):
+        """Replace every match in the document, with a progress dialog while pages out of view are done"""
+        try:
+            batch = doc_view.replace_all_text(find_text, replace_text, case_sensitive, ignore_diacritics, regex)
+        except re.error as e:
+            QMessageBox.warning(self, "Replace All", f"Invalid regular expression: {e}")
+            return
+        progress = QProgressDialog("Replacing...", "Cancel", 0, 1000, self)
+        progress.setWindowModality(Qt.WindowModality.WindowModal)
+        progress.setMinimumDuration(500)
+        progress.canceled.connect(batch.cancel)
+
+        def on_progress(pages_done, pages_total, replaced):
+            progress.setValue(int(1000 * pages_done / pages_total) if pages_total else 0)
+            progress.setLabelText(f"Replacing... ({replaced} on {pages_done} of {pages_total} pages)")
+
+        def on_finished(finished_batch):
+            progress.canceled.disconnect(finished_batch.cancel)
+            progress.close()
+            message = f"Replaced {finished_batch.replaced} occurrences."
+            if finished_batch.cancelled:
+                message = f"Replace All cancelled: replaced {finished_batch.replaced} occurrences."
+            self.statusBar().showMessage(message)
+            if hasattr(self, 'find_dialog'):
+                self.find_dialog.set_match_count(message)
+            self.update_page_label()
+
+        batch.on_progress = on_progress
+        batch.on_finished = on_finished
+        batch.start()
+
+    def on_highlight_all(self, text, case_sensitive, ignore_diacritics):
+        doc_view = self.get_active_document_view()
+        if doc_view:
+            count = doc_view.highlight_all(text, case_sensitive, ignore_diacritics)
+            self.find_dialog.set_match_count(f"{count} matches" if text else "")
 
     def app_preferences(self):
         self.statusBar().showMessage("Application Preferences - Not implemented yet")
@@ -1711,23 +1898,7 @@ class MainWindow(QMainWindow):
             "Text Files (*.txt);;All Files (*)"
         )
         if file_path:
-            try:
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    text_content = f.read()
-                    
-                # Add to active text box or create new one
-                active_item = doc_view.scene.focusItem()
-                if isinstance(active_item, TextBox):
-                    cursor = active_item.textCursor()
-                    cursor.insertText(text_content)
-                else:
-                    # Create new text box with imported text
-                    tb = doc_view.add_text_box(100, 100, locked=False)
-                    tb.setPlainText(text_content)
-                    
-                self.statusBar().showMessage(f"Imported: {file_path}")
-            except Exception as e:
-                self.statusBar().showMessage(f"Import error: {str(e)}")
+            self.start_text_import(doc_view, file_path)
 
     def import_picture(self):
         self.insert_image_active()
@@ -1754,8 +1925,9 @@ class MainWindow(QMainWindow):
         
         if dialog.exec() == QPrintDialog.DialogCode.Accepted:
             # Render scene to printer
+            shared_story_flow().flush()
             painter = QPainter(printer)
-            doc_view.scene.render(painter)
+            doc_view.page_manager.get_current_page().render(painter)
             painter.end()
             self.statusBar().showMessage("Document sent to printer")
 
@@ -1767,12 +1939,19 @@ class MainWindow(QMainWindow):
         if doc_view:
             doc_view.undo()
             self.statusBar().showMessage("Undo")
+            # Undoing an import takes its pages out
+            self.update_page_label()
+            if self.page_navigator:
+                self.page_navigator.refresh()
 
     def redo(self):
         doc_view = self.get_active_document_view()
         if doc_view:
             doc_view.redo()
             self.statusBar().showMessage("Redo")
+            self.update_page_label()
+            if self.page_navigator:
+                self.page_navigator.refresh()
 
     def cut(self):
         doc_view = self.get_active_document_view()
@@ -1894,8 +2073,30 @@ class MainWindow(QMainWindow):
             doc_view.set_snap_to_guides(checked)
             self.statusBar().showMessage(f"Snap to guides {'enabled' if checked else 'disabled'}")
             
+    def toggle_greek_text(self, checked):
+        """Draw illegibly small text as grey bars (or always in full)"""
+        set_greek_below_px(GREEK_BELOW_PX if checked else 0)
+        # Tiles of other pages were rendered with the previous setting
+        shared_tile_cache().clear()
+        for sub in self.mdi_area.subWindowList():
+            if isinstance(sub, DocumentWindow):
+                sub.document_view.viewport().update()
+
+    def toggle_continuous_pages(self, checked):
+        self.apply_page_layout()
+
     def toggle_facing_pages(self, checked):
-        self.statusBar().showMessage(f"Facing pages {'enabled' if checked else 'disabled'} - Not implemented yet")
+        self.apply_page_layout()
+
+    def apply_page_layout(self):
+        """Lay out the active document's pages as chosen in the View menu"""
+        if self.action_facing_pages.isChecked():
+            layout = "spread"
+        elif self.action_continuous_pages.isChecked():
+            layout = "continuous"
+        else:
+            layout = "single"
+        self.set_page_display(layout)
 
     def toggle_grid(self, checked):
         self.statusBar().showMessage(f"Grid {'shown' if checked else 'hidden'} - Not implemented yet")
@@ -1907,7 +2108,11 @@ class MainWindow(QMainWindow):
         self.statusBar().showMessage(f"Non-printing characters {'shown' if checked else 'hidden'} - Not implemented yet")
 
     def set_page_display(self, mode):
-        self.statusBar().showMessage(f"Page display: {mode} - Not implemented yet")
+        window = self.get_active_document_window()
+        if window:
+            window.document_view.set_page_layout(mode)
+            window.update_ruler_origin()
+            self.update_page_label()
 
     def cut(self):
         doc_view = self.get_active_document_view()
@@ -2022,7 +2227,24 @@ class MainWindow(QMainWindow):
         self.statusBar().showMessage("Spelling check - Not implemented yet")
 
     def show_word_count(self):
-        self.statusBar().showMessage("Word count - Not implemented yet")
+        doc_view = self.get_active_document_view()
+        if not doc_view:
+            return
+        stats = doc_view.text_stats.totals()
+        lines = [f"Pages: {stats['pages']}",
+                 f"Words: {stats['words']}",
+                 f"Characters (no spaces): {stats['characters_no_spaces']}",
+                 f"Characters (with spaces): {stats['characters']}",
+                 f"Paragraphs: {stats['paragraphs']}",
+                 f"Text frames: {stats['frames']}",
+                 f"Images: {stats['images']}"]
+        if stats["overset"]:
+            lines.append(f"Overset characters: {stats['overset']}")
+        text_box = doc_view._editing_text_box()
+        if text_box and text_box.textCursor().hasSelection():
+            words, characters = count_text(text_box.textCursor().selectedText())[:2]
+            lines.append(f"\nSelection: {words} words, {characters} characters")
+        QMessageBox.information(self, "Word Count", "\n".join(lines))
 
     def group_objects(self):
         doc_view = self.get_active_document_view()
@@ -2049,7 +2271,16 @@ class MainWindow(QMainWindow):
         self.toggle_language(None)
 
     def show_keyboard_preferences(self):
-        self.statusBar().showMessage("Keyboard preferences - Not implemented yet")
+        """Choose the keyboard layout Urdu is typed with, in every open document"""
+        from src.ui.dialogs.keyboard_dialog import KeyboardPreferencesDialog
+
+        dialog = KeyboardPreferencesDialog(self.keyboard_layout, self)
+        if dialog.exec() and dialog.get_layout():
+            self.keyboard_layout = dialog.get_layout()
+            for sub in self.mdi_area.subWindowList():
+                if isinstance(sub, DocumentWindow):
+                    sub.document_view.set_keyboard_layout(self.keyboard_layout)
+            self.statusBar().showMessage(f"Keyboard layout: {dialog.layout_combo.currentText()}")
 
     def show_hyphenation_dialog(self):
         """Show hyphenation settings dialog"""
@@ -0,0 +1,247 @@
+from PyQt6.QtWidgets import QDockWidget, QListView, QAbstractItemView
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QSize, QPoint, QTimer, QElapsedTimer
+from PyQt6.QtGui import QPixmap, QColor, QPainter, QPen
+from collections import OrderedDict
+
+THUMBNAIL_WIDTH = 110
+# Milliseconds of thumbnail rendering per event loop turn
+RENDER_SLICE_MS = 12
+
+
+class ThumbnailCache:
+    """Rendered thumbnails by page uid, remembering which page revision they show"""
+    def __init__(self, max_entries=400):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # uid -> (revision, QPixmap)
+
+    def get(self, page):
+        """(pixmap, up_to_date) for a page, pixmap None if it was never rendered"""
+        entry = self._entries.get(page.uid)
+        if entry is None:
+            return None, False
+        self._entries.move_to_end(page.uid)
+        revision, pixmap = entry
+        return pixmap, revision == page.revision
+
+    def put(self, page, pixmap):
+        self._entries[page.uid] = (page.revision, pixmap)
+        self._entries.move_to_end(page.uid)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class PageListModel(QAbstractListModel):
+    """Pages of a PageManager as list rows; thumbnails come from the navigator's cache"""
+    def __init__(self, navigator):
+        super().__init__()
+        self.navigator = navigator
+        self.page_manager = None
+        self._uids = []
+
+    def set_page_manager(self, page_manager):
+        self.beginResetModel()
+        self.page_manager = page_manager
+        self._uids = [page.uid for page in page_manager.pages] if page_manager else []
+        self.endResetModel()
+
+    def sync(self):
+        """Reset if pages were added, removed or reordered elsewhere"""
+        uids = [page.uid for page in self.page_manager.pages] if self.page_manager else []
+        if uids != self._uids:
+            self.set_page_manager(self.page_manager)
+            return True
+        return False
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._uids)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or self.page_manager is None:
+            return None
+        page = self.page_manager.pages[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return str(page.page_number)
+        if role == Qt.ItemDataRole.DecorationRole:
+            # Only rows being painted ask for this, so only visible pages get rendered
+            return self.navigator.thumbnail_for(page, index.row())
+        return None
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if index.isValid():
+            flags |= Qt.ItemFlag.ItemIsDragEnabled
+        return flags | Qt.ItemFlag.ItemIsDropEnabled
+
+    def supportedDropActions(self):
+        return Qt.DropAction.MoveAction
+
+
+class _ThumbnailList(QListView):
+    """List view that turns a drop into PageManager.move_page"""
+    def __init__(self, navigator):
+        super().__init__()
+        self.navigator = navigator
+
+    def dropEvent(self, event):
+        source = self.currentIndex().row()
+        target = self.indexAt(event.position().toPoint()).row()
+        if target < 0:
+            target = self.model().rowCount() - 1
+        if source >= 0:
+            self.navigator.move_page(source, target)
+        # Report a copy so the view doesn't remove the source row itself
+        event.setDropAction(Qt.DropAction.CopyAction)
+        event.accept()
+
+
+class PageNavigator(QDockWidget):
+    """Docked list of page thumbnails for the active document.
+
+    The list is virtualized: thumbnails are only requested for rows that
+    are painted. Missing or outdated thumbnails are queued and rendered in
+    short slices from the event loop (scenes can only be rendered on the
+    GUI thread), skipping pages that scrolled out of view meanwhile.
+    Until then a placeholder or the previous revision's thumbnail is shown.
+    """
+    def __init__(self, parent=None):
+        super().__init__("Pages", parent)
+        self.document_view = None
+        self.on_page_changed = None  # Called after the navigator switched or moved pages
+        self.cache = ThumbnailCache()
+        self._queue = OrderedDict()  # page uid -> row when queued
+
+        self.model = PageListModel(self)
+        self.list_view = _ThumbnailList(self)
+        self.list_view.setModel(self.model)
+        self.list_view.setUniformItemSizes(True)
+        self.list_view.setIconSize(self._thumbnail_size())
+        self.list_view.setSpacing(4)
+        self.list_view.setDragDropMode(QAbstractItemView.DragDropMode.InternalMove)
+        self.list_view.setDefaultDropAction(Qt.DropAction.MoveAction)
+        self.list_view.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.list_view.clicked.connect(self._on_clicked)
+        self.setWidget(self.list_view)
+
+        self._placeholder = self._make_placeholder()
+
+        self._render_timer = QTimer(self)
+        self._render_timer.setSingleShot(True)
+        self._render_timer.timeout.connect(self._render_slice)
+
+        # Pages change without telling anyone: recheck the visible rows now and then
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(500)
+        self._poll_timer.timeout.connect(self.refresh)
+        self._poll_timer.start()
+
+    def _thumbnail_size(self):
+        return QSize(THUMBNAIL_WIDTH, int(THUMBNAIL_WIDTH * 1123 / 794))
+
+    def _make_placeholder(self):
+        size = self._thumbnail_size()
+        pixmap = QPixmap(size)
+        pixmap.fill(QColor("white"))
+        painter = QPainter(pixmap)
+        painter.setPen(QPen(QColor("#cccccc")))
+        painter.drawRect(0, 0, size.width() - 1, size.height() - 1)
+        painter.end()
+        return pixmap
+
+    def set_document_view(self, document_view):
+        if document_view is self.document_view:
+            return
+        self.document_view = document_view
+        self._queue.clear()
+        self.model.set_page_manager(document_view.page_manager if document_view else None)
+        self._select_current()
+
+    def thumbnail_for(self, page, row):
+        pixmap, up_to_date = self.cache.get(page)
+        if not up_to_date:
+            self._queue[page.uid] = row
+            if not self._render_timer.isActive():
+                self._render_timer.start(0)
+        return pixmap if pixmap is not None else self._placeholder
+
+    def _row_at(self, y, step):
+        # The probe may land in the spacing between rows, so walk a few pixels
+        x = self.list_view.viewport().rect().center().x()
+        for offset in range(0, 2 * self.list_view.spacing() + 2):
+            index = self.list_view.indexAt(QPoint(x, y + offset * step))
+            if index.isValid():
+                return index.row()
+        return -1
+
+    def _visible_rows(self):
+        if self.model.rowCount() == 0 or not self.list_view.isVisible():
+            return range(0)
+        viewport = self.list_view.viewport().rect()
+        first = self._row_at(viewport.top(), 1)
+        last = self._row_at(viewport.bottom(), -1)
+        if first < 0:
+            return range(0)
+        if last < 0:
+            last = self.model.rowCount() - 1
+        return range(first, last + 1)
+
+    def _render_slice(self):
+        if self.document_view is None:
+            self._queue.clear()
+            return
+        pages = self.document_view.page_manager.pages
+        visible = self._visible_rows()
+        timer = QElapsedTimer()
+        timer.start()
+        while self._queue and timer.elapsed() < RENDER_SLICE_MS:
+            uid, row = self._queue.popitem(last=False)
+            # Pages scrolled out of view (or moved/deleted) are not rendered
+            if row not in visible or row >= len(pages) or pages[row].uid != uid:
+                continue
+            page = pages[row]
+            image = page.get_thumbnail(THUMBNAIL_WIDTH)
+            self.cache.put(page, QPixmap.fromImage(image))
+            index = self.model.index(row)
+            self.model.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+        if self._queue:
+            self._render_timer.start(0)
+
+    def refresh(self):
+        """Pick up added/removed/reordered pages and edits on visible pages"""
+        if self.document_view is None or not self.isVisible():
+            return
+        if self.model.sync():
+            self._select_current()
+            return
+        pages = self.document_view.page_manager.pages
+        for row in self._visible_rows():
+            pixmap, up_to_date = self.cache.get(pages[row])
+            if pixmap is not None and not up_to_date:
+                index = self.model.index(row)
+                self.model.dataChanged.emit(index, index, [Qt.ItemDataRole.DecorationRole])
+        self._select_current()
+
+    def _select_current(self):
+        if self.document_view is None:
+            return
+        index = self.model.index(self.document_view.page_manager.current_page_index)
+        if index.isValid() and self.list_view.currentIndex() != index:
+            self.list_view.setCurrentIndex(index)
+
+    def _on_clicked(self, index):
+        if self.document_view and self.document_view.switch_page(index.row()):
+            if self.on_page_changed:
+                self.on_page_changed()
+
+    def move_page(self, source, target):
+        if self.document_view is None or source == target:
+            return
+        if self.document_view.page_manager.move_page(source, target):
+            self.model.sync()
+            self._select_current()
+            if self.on_page_changed:
+                self.on_page_changed()
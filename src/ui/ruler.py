@@ -1,8 +1,15 @@
 from PyQt6.QtWidgets import QWidget, QMenu
 from PyQt6.QtCore import Qt, QSize, QPoint
-from PyQt6.QtGui import QPainter, QPen, QColor, QFont, QFontMetrics, QAction
+from PyQt6.QtGui import QPainter, QPen, QColor, QFont, QFontMetrics, QAction, QPixmap
+import math
 
 class Ruler(QWidget):
+    """Ruler drawn from a pre-rendered strip of ticks and labels.
+
+    The strip is rendered once per unit, zoom, orientation and device pixel
+    ratio (plus whenever scrolling runs past its margin); scrolling shifts
+    the pixels already on screen and blits the strip into the exposed edge.
+    """
     # Unit conversion factors (to pixels at 96 DPI)
     UNITS = {
         'inches': 96.0,      # 96 pixels per inch
@@ -11,6 +18,16 @@ class Ruler(QWidget):
         'feet': 1152.0,      # 1152 pixels per foot (12 inches)
         'pixels': 1.0        # 1:1
     }
+    # (major step, medium step) in each unit; minor ticks are skipped for a cleaner look
+    TICK_STEPS = {
+        'inches': (1.0, 0.5),
+        'mm': (10.0, 5.0),     # 1 cm, 5 mm
+        'cm': (1.0, 0.5),
+        'feet': (1.0, 0.5),    # 1 foot, 6 inches
+        'pixels': (100.0, 50.0)
+    }
+    BACKGROUND = QColor("#f8f8f8")
+    MARKER_COLOR = QColor("#3070d0")
     
     def __init__(self, orientation=Qt.Orientation.Horizontal, parent=None):
         super().__init__(parent)
@@ -19,6 +36,14 @@ class Ruler(QWidget):
         self.offset = 0
         self.unit = 'inches'  # Default unit
         self.page_offset = 0  # Offset to page origin in scene coordinates
+        self.marker = None  # Cursor position along the ruler, in widget pixels
+
+        # Pre-rendered ticks covering medium tick indices _strip_first.._strip_last
+        self._strip = None
+        self._strip_key = None
+        self._strip_first = 0
+        self._strip_last = -1
+        self.strips_rendered = 0
         
         if self.orientation == Qt.Orientation.Horizontal:
             self.setFixedHeight(18)
@@ -39,130 +64,149 @@ class Ruler(QWidget):
         
     def set_offset(self, offset):
         """Set scroll offset"""
+        self._move_origin(self.page_offset - offset)
         self.offset = offset
-        self.update()
     
     def set_page_offset(self, page_offset):
         """Set the position of page origin in scene coordinates"""
+        self._move_origin(page_offset - self.offset)
         self.page_offset = page_offset
-        self.update()
-        
-    def paintEvent(self, event):
-        painter = QPainter(self)
+
+    def set_marker(self, pos):
+        """Mark the cursor position (widget pixels along the ruler), or clear it with None"""
+        if pos == self.marker:
+            return
+        self._update_marker()
+        self.marker = pos
+        self._update_marker()
+
+    def _update_marker(self):
+        # Only the few pixels under the marker line need repainting
+        if self.marker is None:
+            return
+        pos = int(self.marker)
+        if self.orientation == Qt.Orientation.Horizontal:
+            self.update(pos - 1, 0, 3, self.height())
+        else:
+            self.update(0, pos - 1, self.width(), 3)
+
+    def _move_origin(self, origin):
+        # Scrolling shifts what is already on screen; only the exposed edge gets repainted
+        delta = origin - (self.page_offset - self.offset)
+        if delta == 0:
+            return
+        if delta != int(delta) or not self.isVisible():
+            self.update()
+            return
+        delta = int(delta)
+        if self.orientation == Qt.Orientation.Horizontal:
+            self.scroll(delta, 0)
+        else:
+            self.scroll(0, delta)
+        # The marker stays where the cursor is, not with the ticks
+        if self.marker is not None:
+            self.marker += delta
+            self._update_marker()
+            self.marker -= delta
+            self._update_marker()
+
+    def mouseMoveEvent(self, event):
+        pos = event.position()
+        self.set_marker(pos.x() if self.orientation == Qt.Orientation.Horizontal else pos.y())
+        super().mouseMoveEvent(event)
+
+    def leaveEvent(self, event):
+        self.set_marker(None)
+        super().leaveEvent(event)
+
+    def _length(self):
+        return self.width() if self.orientation == Qt.Orientation.Horizontal else self.height()
+
+    def _thickness(self):
+        return self.height() if self.orientation == Qt.Orientation.Horizontal else self.width()
+
+    def _ensure_strip(self, px_per_medium):
+        """Make sure the cached strip covers the visible ticks, rendering a new one if not"""
+        origin = self.page_offset - self.offset
+        first_visible = math.floor((-10 - origin) / px_per_medium)
+        last_visible = math.ceil((self._length() + 10 - origin) / px_per_medium)
+        dpr = self.devicePixelRatioF()
+        key = (self.unit, self.zoom, self.orientation, dpr, self._thickness())
+        if (key == self._strip_key and self._strip_first <= first_visible - 2
+                and last_visible <= self._strip_last):
+            return
+
+        # A screenful of margin on each side, so scrolling rarely needs a new strip
+        span = last_visible - first_visible
+        self._strip_key = key
+        self._strip_first = first_visible - span - 2
+        self._strip_last = last_visible + span
+        self._strip = self._render_strip(px_per_medium, dpr)
+        self.strips_rendered += 1
+
+    def _render_strip(self, px_per_medium, dpr):
+        major_step, medium_step = self.TICK_STEPS[self.unit]
+        length = int((self._strip_last - self._strip_first) * px_per_medium) + 1
+        thickness = self._thickness()
+        horizontal = self.orientation == Qt.Orientation.Horizontal
+        size = QSize(length, thickness) if horizontal else QSize(thickness, length)
+
+        pixmap = QPixmap(size * dpr)
+        pixmap.setDevicePixelRatio(dpr)
+        pixmap.fill(self.BACKGROUND)
+        painter = QPainter(pixmap)
         painter.setRenderHint(QPainter.RenderHint.Antialiasing, False)
-        
-        # Background
-        painter.fillRect(self.rect(), QColor("#f8f8f8"))
-        
+
         # Border
         painter.setPen(QPen(QColor("#ddd")))
-        if self.orientation == Qt.Orientation.Horizontal:
-            painter.drawLine(0, self.height()-1, self.width(), self.height()-1)
+        if horizontal:
+            painter.drawLine(0, thickness - 1, length, thickness - 1)
         else:
-            painter.drawLine(self.width()-1, 0, self.width()-1, self.height())
-            
-        # Ticks and Numbers
+            painter.drawLine(thickness - 1, 0, thickness - 1, length)
+
+        # Ticks and Numbers: every other medium tick is a major one
         painter.setPen(QPen(QColor("#888")))
         font = self.font()
         font.setPointSize(6)
         painter.setFont(font)
-        
-        # Pixels per unit at current zoom
-        px_per_unit = self.UNITS[self.unit] * self.zoom
-        
-        # Determine tick spacing based on unit
-        if self.unit == 'inches':
-            major_step = 1.0  # 1 inch
-            medium_step = 0.5  # 1/2 inch
-            minor_step = 0.125  # 1/8 inch
-        elif self.unit == 'mm':
-            major_step = 10.0  # 1 cm
-            medium_step = 5.0  # 5 mm
-            minor_step = 1.0  # 1 mm
-        elif self.unit == 'cm':
-            major_step = 1.0  # 1 cm
-            medium_step = 0.5  # 0.5 cm
-            minor_step = 0.1  # 1 mm
-        elif self.unit == 'feet':
-            major_step = 1.0  # 1 foot
-            medium_step = 0.5  # 6 inches
-            minor_step = 0.0833  # 1 inch
-        else:  # pixels
-            major_step = 100.0
-            medium_step = 50.0
-            minor_step = 10.0
-        
-        if self.orientation == Qt.Orientation.Horizontal:
-            # Calculate range including negative values
-            # visible_start in scene pixels = offset
-            # page_origin in scene pixels = page_offset (usually 0)
-            # unit_position = (scene_pixel - page_offset) / px_per_unit
-            
-            scene_start = self.offset
-            scene_end = self.offset + self.width()
-            
-            # Convert to unit positions relative to page origin
-            start_unit = (scene_start - self.page_offset) / px_per_unit
-            end_unit = (scene_end - self.page_offset) / px_per_unit
-            
-            # Find tick range
-            start_tick = int(start_unit / minor_step) - 1
-            end_tick = int(end_unit / minor_step) + 2
-            
-            for i in range(start_tick, end_tick):
-                unit_val = i * minor_step
-                scene_px = (unit_val * px_per_unit) + self.page_offset
-                px_pos = scene_px - self.offset
-                
-                if px_pos < -10 or px_pos > self.width() + 10:
-                    continue
-                
-                # Determine tick type
-                is_major = abs(unit_val % major_step) < 0.001
-                is_medium = abs(unit_val % medium_step) < 0.001
-                
-                if is_major:
-                    painter.drawLine(int(px_pos), 0, int(px_pos), 12)
-                    # Draw number
-                    if self.unit in ['inches', 'feet', 'cm']:
-                        text = f"{int(unit_val)}" if unit_val == int(unit_val) else f"{unit_val:.1f}"
-                    else:
-                        text = str(int(unit_val))
-                    painter.drawText(int(px_pos) + 2, 9, text)
-                elif is_medium:
-                    painter.drawLine(int(px_pos), 8, int(px_pos), 12)
-                # Skip minor ticks for cleaner look
-                    
-        else:  # Vertical
-            scene_start = self.offset
-            scene_end = self.offset + self.height()
-            
-            start_unit = (scene_start - self.page_offset) / px_per_unit
-            end_unit = (scene_end - self.page_offset) / px_per_unit
-            
-            start_tick = int(start_unit / minor_step) - 1
-            end_tick = int(end_unit / minor_step) + 2
-            
-            for i in range(start_tick, end_tick):
-                unit_val = i * minor_step
-                scene_px = (unit_val * px_per_unit) + self.page_offset
-                px_pos = scene_px - self.offset
-                
-                if px_pos < -10 or px_pos > self.height() + 10:
-                    continue
-                
-                is_major = abs(unit_val % major_step) < 0.001
-                is_medium = abs(unit_val % medium_step) < 0.001
-                
-                if is_major:
-                    painter.drawLine(0, int(px_pos), 12, int(px_pos))
-                    if self.unit in ['inches', 'feet', 'cm']:
-                        text = f"{int(unit_val)}" if unit_val == int(unit_val) else f"{unit_val:.1f}"
-                    else:
-                        text = str(int(unit_val))
-                    painter.drawText(2, int(px_pos) + 7, text)
-                elif is_medium:
-                    painter.drawLine(8, int(px_pos), 12, int(px_pos))
+        for i in range(self._strip_first, self._strip_last + 1):
+            px_pos = int((i - self._strip_first) * px_per_medium)
+            if i % 2 == 0:
+                text = str(int(i // 2 * major_step))
+                if horizontal:
+                    painter.drawLine(px_pos, 0, px_pos, 12)
+                    painter.drawText(px_pos + 2, 9, text)
+                else:
+                    painter.drawLine(0, px_pos, 12, px_pos)
+                    painter.drawText(2, px_pos + 7, text)
+            elif horizontal:
+                painter.drawLine(px_pos, 8, px_pos, 12)
+            else:
+                painter.drawLine(8, px_pos, 12, px_pos)
+        painter.end()
+        return pixmap
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), self.BACKGROUND)
+
+        # Pixels per medium tick at current zoom
+        px_per_medium = self.UNITS[self.unit] * self.zoom * self.TICK_STEPS[self.unit][1]
+        if px_per_medium > 0:
+            self._ensure_strip(px_per_medium)
+            start = round(self.page_offset - self.offset + self._strip_first * px_per_medium)
+            if self.orientation == Qt.Orientation.Horizontal:
+                painter.drawPixmap(start, 0, self._strip)
+            else:
+                painter.drawPixmap(0, start, self._strip)
+
+        if self.marker is not None:
+            painter.setPen(QPen(self.MARKER_COLOR))
+            pos = int(self.marker)
+            if self.orientation == Qt.Orientation.Horizontal:
+                painter.drawLine(pos, 0, pos, self.height())
+            else:
+                painter.drawLine(0, pos, self.width(), pos)
     
     def contextMenuEvent(self, event):
         """Show context menu for unit selection"""
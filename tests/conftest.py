@@ -0,0 +1,28 @@
+import os
+import sys
+
+import pytest
+
+# Tests run without a display
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PyQt6.QtWidgets import QApplication  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def qapp():
+    app = QApplication.instance() or QApplication(sys.argv)
+    yield app
+
+
+@pytest.fixture
+def view(qapp):
+    """A DocumentView with one empty page"""
+    from src.engine.text_flow import shared_story_flow
+    from src.ui.document_view import DocumentView
+
+    view = DocumentView("Arial")
+    yield view
+    shared_story_flow().flush()
+    view.deleteLater()
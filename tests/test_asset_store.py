@@ -0,0 +1,85 @@
+import shutil
+
+from PyQt6.QtGui import QColor, QImage
+
+from src.engine import upg_container
+from src.engine.asset_store import AssetStore
+
+
+class _User:
+    def __init__(self):
+        self.image_asset = None
+        self.updates = 0
+
+    def update(self):
+        self.updates += 1
+
+
+def _image(tmp_path, name="scan.png", color="red"):
+    image = QImage(64, 48, QImage.Format.Format_RGB32)
+    image.fill(QColor(color))
+    path = str(tmp_path / name)
+    image.save(path)
+    return path
+
+
+def _acquire(store, path):
+    user = _User()
+    user.image_asset = store.acquire(path, user)
+    return user
+
+
+def _settle(qapp, store):
+    store.thread_pool.waitForDone()
+    qapp.processEvents()
+
+
+def test_acquire_leaves_hashing_to_the_decoder(qapp, tmp_path, monkeypatch):
+    path = _image(tmp_path)
+    hashed = []
+    original = upg_container.hash_asset_file
+    monkeypatch.setattr("src.engine.asset_store.hash_asset_file",
+                        lambda p: hashed.append(p) or original(p))
+    store = AssetStore()
+    user = _acquire(store, path)
+    asset = user.image_asset
+    assert asset.key.startswith("file:") and not hashed
+    assert asset.is_valid()
+
+    assert asset.proxy(0) is None
+    _settle(qapp, store)
+    assert hashed == [path]
+    assert asset.key == upg_container.asset_name_for_file(path)
+    assert store.assets == {asset.key: asset}
+    assert asset.proxy(0) is not None
+    # Known now: the same file gets the content named asset straight away
+    assert _acquire(store, path).image_asset is asset
+
+
+def test_a_copy_joins_the_asset_with_the_same_bytes(qapp, tmp_path):
+    path = _image(tmp_path)
+    copy = str(tmp_path / "copy.png")
+    shutil.copy(path, copy)
+    store = AssetStore()
+    first = _acquire(store, path)
+    first.image_asset.proxy(0)
+    _settle(qapp, store)
+
+    second = _acquire(store, copy)
+    assert second.image_asset is not first.image_asset
+    second.image_asset.proxy(1)
+    _settle(qapp, store)
+    assert second.image_asset is first.image_asset
+    assert second.updates and len(store.assets) == 1
+    assert second.image_asset.proxy(1) is not None
+
+
+def test_different_images_stay_apart(qapp, tmp_path):
+    store = AssetStore()
+    red = _acquire(store, _image(tmp_path, "red.png", "red"))
+    blue = _acquire(store, _image(tmp_path, "blue.png", "blue"))
+    red.image_asset.proxy(0)
+    blue.image_asset.proxy(0)
+    _settle(qapp, store)
+    assert red.image_asset is not blue.image_asset
+    assert len(store.assets) == 2
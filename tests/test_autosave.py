@@ -0,0 +1,91 @@
+import concurrent.futures
+
+import pytest
+
+from src.engine import autosave
+from src.engine.autosave import AutosaveManager, JournalReader, find_journals
+from src.engine.page_manager import PageManager
+from src.engine.text_box import TextBox
+from src.engine.upg_container import save_container
+
+
+def _text_box(page, text):
+    box = TextBox(font_family="Arial", locked=False)
+    page.scene.addItem(box)
+    box.setPlainText(text)
+    return box
+
+
+def _autosave(page_manager, document_path=None):
+    """Run autosave over one document until it has nothing left to write"""
+    # A budget no tick reaches, so a slow machine doesn't spread the work over more ticks
+    manager = AutosaveManager(lambda: [("doc", document_path, page_manager)], idle_delay=0,
+                              tick_budget_ms=60000)
+    manager.timer.stop()
+    manager.tick()
+    session = manager.session_for("doc")
+    if session.future is not None:
+        concurrent.futures.wait([session.future])
+        manager.tick()
+    return manager
+
+
+def _recovered_texts(journal):
+    page_manager = PageManager()
+    with JournalReader(journal) as reader:
+        page_manager.load_container(reader)
+    return [[item.toPlainText() for item in page.scene.items() if isinstance(item, TextBox)]
+            for page in page_manager.pages]
+
+
+def test_untitled_document_recovers_every_page(tmp_path, monkeypatch):
+    monkeypatch.setattr(autosave, "RECOVERY_DIR", str(tmp_path / "recovery"))
+    page_manager = PageManager()
+    page_manager.add_page()
+    page_manager.add_page()
+    _text_box(page_manager.pages[1], "page two")
+    # Page 1 and 3 were never edited nor saved
+    assert not page_manager.pages[0].is_dirty() and page_manager.pages[0].container_entry is None
+
+    _autosave(page_manager)
+    journals = find_journals()
+    assert len(journals) == 1
+    assert _recovered_texts(journals[0]) == [[], ["page two"], []]
+
+
+def test_saved_document_recovers_edits_over_saved_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(autosave, "RECOVERY_DIR", str(tmp_path / "recovery"))
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    page_manager.add_page()
+    _text_box(page_manager.pages[0], "saved")
+    box = _text_box(page_manager.pages[1], "before")
+    save_container(path, page_manager)
+    box.setPlainText("after")
+    page_manager.add_page()     # Blank and never saved
+
+    _autosave(page_manager, path)
+    assert _recovered_texts(find_journals()[0]) == [["saved"], ["after"], []]
+
+
+def test_untitled_document_without_edits_writes_no_journal(tmp_path, monkeypatch):
+    monkeypatch.setattr(autosave, "RECOVERY_DIR", str(tmp_path / "recovery"))
+    page_manager = PageManager()
+    page_manager.add_page()
+    _autosave(page_manager)
+    assert find_journals() == []
+
+
+def test_journal_of_a_missing_document_fails_to_open(tmp_path, monkeypatch):
+    monkeypatch.setattr(autosave, "RECOVERY_DIR", str(tmp_path / "recovery"))
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    page_manager.add_page()
+    box = _text_box(page_manager.pages[0], "saved")
+    save_container(path, page_manager)
+    box.setPlainText("edited")
+    _autosave(page_manager, path)
+    (tmp_path / "doc.upg").unlink()
+
+    with pytest.raises(ValueError):
+        JournalReader(find_journals()[0])
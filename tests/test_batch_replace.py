@@ -0,0 +1,91 @@
+import re
+
+import pytest
+
+from src.engine.text_flow import shared_story_flow
+
+
+def _fill(view, pages):
+    boxes = []
+    for index in range(pages):
+        if index:
+            view.page_manager.add_page()
+        page = view.page_manager.get_page(index)
+        box = view.add_text_box(50, 50, 400, 300, scene=page.scene)
+        box.setPlainText(f"کتاب ایک كتاب ہے۔ نمبر {index}\nدوسری سطر کتاب")
+        boxes.append(box)
+    view.undo_stack.clear()
+    return boxes
+
+
+def _replace_all(qapp, view, find_text, replace_text, regex=False):
+    batch = view.replace_all_text(find_text, replace_text, False, regex=regex)
+    done = []
+    batch.on_finished = done.append
+    batch.start()
+    while not done:
+        qapp.processEvents()
+    shared_story_flow().flush()
+    return batch
+
+
+def _texts(boxes):
+    return [box.document().toRawText() for box in boxes]
+
+
+def test_replace_all_is_one_undo_step(qapp, view):
+    boxes = _fill(view, 5)
+    before = _texts(boxes)
+    batch = _replace_all(qapp, view, "کتاب", "KITAB")
+    after = _texts(boxes)
+    # Diacritics and letter variants are ignored by default: کتاب and كتاب both match
+    assert batch.replaced == 15
+    assert all(text.count("KITAB") == 3 for text in after)
+    assert len(view.undo_stack.undo_commands) == 1
+
+    view.undo()
+    assert _texts(boxes) == before
+    view.redo()
+    assert _texts(boxes) == after
+    view.undo()
+    assert _texts(boxes) == before
+
+
+def test_regex_replace_all_undo(qapp, view):
+    boxes = _fill(view, 3)
+    before = _texts(boxes)
+    _replace_all(qapp, view, r"نمبر (\d+)", r"N\1!", regex=True)
+    assert "N2!" in boxes[2].document().toRawText()
+    view.undo()
+    assert _texts(boxes) == before
+
+
+def test_cancelled_replace_all_still_undoes(qapp, view):
+    boxes = _fill(view, 5)
+    before = _texts(boxes)
+    batch = view.replace_all_text("کتاب", "K", False)
+    done = []
+    batch.on_finished = done.append
+    batch.start()
+    batch.cancel()
+    while not done:
+        qapp.processEvents()
+    view.undo()
+    assert _texts(boxes) == before
+
+
+def test_undo_skips_stories_edited_since(qapp, view):
+    boxes = _fill(view, 3)
+    before = _texts(boxes)
+    batch = _replace_all(qapp, view, "کتاب", "K")
+    boxes[1].textCursor().insertText("zz")
+    boxes[1].document().clearUndoRedoStacks()
+    edited = boxes[1].document().toRawText()
+    view.undo()
+    assert batch.command.skipped == 1
+    assert _texts(boxes) == [before[0], edited, before[2]]
+
+
+def test_invalid_regex_raises(view):
+    with pytest.raises(re.error):
+        view.replace_all_text("(", "x", False, regex=True)
@@ -0,0 +1,45 @@
+from src.engine.hibernation import HibernationManager
+from src.engine.text_box import TextBox
+from src.engine.undo_stack import AddItemsCommand
+
+
+def _manager(view, active):
+    manager = HibernationManager(lambda: [(view, view.page_manager, active)], memory_budget=0, min_idle=0.0)
+    manager.timer.stop()
+    return manager
+
+
+def _page_with_text(view, text):
+    box = view.add_text_box(10, 10, 300, 200, scene=view.scene)
+    box.setPlainText(text)
+    view.undo_stack.clear()
+    return view.page_manager.get_current_page()
+
+
+def test_the_active_window_keeps_its_page(qapp, view):
+    page = _page_with_text(view, "kept")
+    _manager(view, active=True).tick()
+    assert page.is_materialized()
+    assert not view.page_manager.hibernate_page(page)
+
+
+def test_an_inactive_window_gives_its_page_up_and_builds_it_when_woken(qapp, view):
+    page = _page_with_text(view, "released")
+    manager = _manager(view, active=False)
+    manager.tick()
+    assert not page.is_materialized() and manager.pages_hibernated == 1
+    assert view._parked
+
+    view.wake()
+    assert page.is_materialized() and not view._parked
+    assert view.scene is page.scene and view.scene is type(view).scene(view)
+    boxes = [item for item in view.scene.items() if isinstance(item, TextBox)]
+    assert "released" in [box.toPlainText() for box in boxes]
+
+
+def test_an_inactive_window_keeps_pages_its_undo_history_uses(qapp, view):
+    page = _page_with_text(view, "edited")
+    box = next(item for item in view.scene.items() if isinstance(item, TextBox))
+    view.push_command(AddItemsCommand(view.scene, [box], "Insert Text Box"))
+    _manager(view, active=False).tick()
+    assert page.is_materialized() and not view._parked
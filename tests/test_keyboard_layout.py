@@ -0,0 +1,86 @@
+import json
+
+import pytest
+
+from src.engine.keyboard_layout import KeyboardLayout, KeySequencer, available_layouts, load_layout
+
+ZABAR = "\u064e"
+
+
+@pytest.fixture
+def layout(tmp_path):
+    path = tmp_path / "test.json"
+    path.write_text(json.dumps({
+        "title": "Test",
+        "keys": {"k": "ک", "h": "ہ", "a": "ا", "c": "ث", "kh": "خ", "ch": "چ", "chh": "چھ"},
+        "dead_keys": {"`": {"a": ZABAR, "`": "`"}},
+    }), encoding="utf-8")
+    return KeyboardLayout.from_file(str(path))
+
+
+def _type(sequencer, keys):
+    return [sequencer.feed(key) for key in keys]
+
+
+def test_single_keys_type_their_letters(layout):
+    assert _type(KeySequencer(layout), "ha") == [(0, "ہ"), (0, "ا")]
+
+
+def test_a_digraph_replaces_the_letter_typed_for_its_first_key(layout):
+    assert _type(KeySequencer(layout), "kh") == [(0, "ک"), (1, "خ")]
+
+
+def test_a_trigraph_replaces_the_digraph_before_it(layout):
+    assert _type(KeySequencer(layout), "chh") == [(0, "ث"), (1, "چ"), (1, "چھ")]
+
+
+def test_a_finished_sequence_starts_over(layout):
+    sequencer = KeySequencer(layout)
+    assert _type(sequencer, "khh") == [(0, "ک"), (1, "خ"), (0, "ہ")]
+    assert sequencer.state == 0 and sequencer.provisional == 0
+
+
+def test_a_broken_sequence_keeps_what_it_typed(layout):
+    # "ka" isn't a sequence: ک stays and "a" starts afresh
+    assert _type(KeySequencer(layout), "ka") == [(0, "ک"), (0, "ا")]
+    # "ch" went on to "chh"; "a" after it keeps چ
+    assert _type(KeySequencer(layout), "cha") == [(0, "ث"), (1, "چ"), (0, "ا")]
+
+
+def test_a_key_outside_the_layout_ends_the_sequence(layout):
+    sequencer = KeySequencer(layout)
+    assert _type(sequencer, "kz") == [(0, "ک"), None]
+    # The next "h" is a key of its own, not the end of "kh"
+    assert sequencer.feed("h") == (0, "ہ")
+
+
+def test_dead_keys_type_nothing_until_the_next_key(layout):
+    sequencer = KeySequencer(layout)
+    assert _type(sequencer, "`a") == [(0, ""), (0, ZABAR)]
+    assert _type(sequencer, "``") == [(0, ""), (0, "`")]
+
+
+def test_a_dead_key_followed_by_another_key_is_dropped(layout):
+    sequencer = KeySequencer(layout)
+    assert _type(sequencer, "`k") == [(0, ""), (0, "ک")]
+    assert sequencer.provisional == 1
+
+
+def test_reset_forgets_the_sequence_in_progress(layout):
+    sequencer = KeySequencer(layout)
+    sequencer.feed("k")
+    sequencer.reset()
+    assert sequencer.feed("h") == (0, "ہ")
+
+
+def test_shipped_layouts_compile():
+    layouts = available_layouts()
+    assert "phonetic" in layouts
+    for name in layouts:
+        layout = load_layout(name)
+        sequencer = KeySequencer(layout)
+        for sequence, text in layout.sequences.items():
+            sequencer.reset()
+            edits = _type(sequencer, sequence)
+            assert None not in edits
+            assert edits[-1][1] == text
@@ -0,0 +1,122 @@
+import unicodedata
+
+import pytest
+
+from src.engine.search_index import normalize, offset_map, _match_end
+
+ZABAR = "\u064e"
+ZER = "\u0650"
+HAMZA_ABOVE = "\u0654"
+URDU_YEH = "ی"
+KEHEH = "ک"
+HEH_GOAL = "ہ"
+
+
+@pytest.mark.parametrize("arabic, urdu", [
+    ("ي", URDU_YEH),  # Arabic yeh
+    ("ى", URDU_YEH),  # Alef maqsura
+    ("ك", KEHEH),  # Arabic kaf
+    ("ه", HEH_GOAL),  # Arabic heh
+    ("ە", HEH_GOAL),  # Ae
+])
+def test_arabic_letters_fold_into_urdu_ones(arabic, urdu):
+    assert normalize("ب" + arabic) == "ب" + urdu
+
+
+def test_bari_yeh_and_do_chashmi_heh_stay_distinct():
+    assert normalize("ے") == "ے"
+    assert normalize("ھ") == "ھ"
+    assert normalize("ے") != normalize(URDU_YEH)
+    assert normalize("ھ") != normalize(HEH_GOAL)
+
+
+@pytest.mark.parametrize("form, letters", [
+    ("\ufef2", URDU_YEH),  # Yeh final form, folded as well
+    ("\ufb8f", KEHEH),  # Keheh final form
+    ("\ufeeb", HEH_GOAL),  # Heh initial form
+    ("\ufefb", "لا"),  # Lam-alef ligature
+])
+def test_presentation_forms_become_their_letters(form, letters):
+    assert normalize(form) == letters
+
+
+@pytest.mark.parametrize("precomposed, parts", [
+    ("أ", "ا" + HAMZA_ABOVE),  # Alef with hamza above
+    ("آ", "ا\u0653"),  # Alef with madda
+    ("ئ", URDU_YEH + HAMZA_ABOVE),  # Yeh with hamza: the yeh is folded too
+    ("ۂ", HEH_GOAL + HAMZA_ABOVE),  # Heh goal with hamza
+])
+def test_hamza_and_madda_letters_decompose(precomposed, parts):
+    assert normalize(precomposed) == parts
+    # Typed as letter + mark, they match the precomposed form
+    assert normalize(unicodedata.normalize("NFD", precomposed)) == parts
+
+
+def test_hamza_is_kept_when_aerab_are_ignored():
+    assert normalize("ا" + HAMZA_ABOVE, ignore_diacritics=True) == "ا" + HAMZA_ABOVE
+
+
+def test_aerab_are_ignored_unless_asked_for():
+    word = "ب" + ZABAR + "اب" + ZER
+    assert normalize(word) == "باب"
+    assert normalize(word, ignore_diacritics=False) == word
+    assert normalize("ا\u0670") == "ا"     # Superscript alef
+
+
+def test_joiners_tatweel_and_bidi_marks_are_ignored():
+    assert normalize("ب\u200c\u0640ب\u200f") == "بب"
+
+
+def test_paragraph_separators_become_line_breaks():
+    assert normalize("a\u2029b\u2028c") == "a\nb\nc"
+
+
+def test_case_is_folded_unless_case_sensitive():
+    assert normalize("Page") == "page"
+    assert normalize("Page", case_sensitive=True) == "Page"
+
+
+@pytest.mark.parametrize("text, options", [
+    ("ب" + ZABAR + "ا\u200cب", {}),
+    ("أبئ", {}),
+    ("\ufefbب\u0640", {}),
+    ("Straße " + "ب" + ZER, {"ignore_diacritics": False}),
+    ("Straße", {"case_sensitive": True}),
+])
+def test_offset_map_points_each_normalized_character_at_its_source(text, options):
+    normalized = normalize(text, **options)
+    offsets = offset_map(text, **options)
+    assert len(offsets) == len(normalized) + 1
+    assert offsets[-1] == len(text)
+    assert offsets == sorted(offsets)
+    for i, ch in enumerate(normalized):
+        assert ch in normalize(text[offsets[i]], **options)
+
+
+def test_offset_map_skips_ignored_characters():
+    text = "ب" + ZABAR + "ا"
+    assert offset_map(text) == [0, 2, 3]
+    # Both halves of a decomposed hamza letter point at it
+    assert offset_map("أب") == [0, 0, 1, 2]
+
+
+def test_match_end_takes_the_ignored_marks_of_the_last_letter_along():
+    text = "باب" + ZABAR + ZER + " ب"
+    offsets = offset_map(text)
+    needle = normalize("باب")
+    start = normalize(text).index(needle)
+    assert _match_end(text, offsets, start + len(needle)) == 5
+
+
+def test_match_end_stops_at_the_next_letter():
+    text = "بابا"
+    offsets = offset_map(text)
+    assert _match_end(text, offsets, 2) == 2
+
+
+def test_match_end_of_a_decomposed_letter_covers_it_once():
+    # The match "alef" ends inside the precomposed alef-hamza: the letter is taken whole
+    text = "أب"
+    offsets = offset_map(text)
+    assert _match_end(text, offsets, 1) == 1
+    assert _match_end(text, offsets, 2) == 1
@@ -0,0 +1,125 @@
+from PyQt6.QtGui import QTextDocument
+
+from src.engine.text_flow import shared_story_flow, story_boxes, overflow_offset
+from src.engine.batch_replace import story_text
+from src.engine.undo_stack import TextEditCommand
+
+
+def _linked_boxes(view, text):
+    first = view.add_text_box(10, 10, 300, 200, scene=view.scene)
+    second = view.add_text_box(10, 300, 300, 200, scene=view.scene)
+    first.setPlainText(text)
+    second.setPlainText("")
+    view.linking_source = first
+    view.finish_linking(second)
+    view.undo_stack.clear()
+    return first, second
+
+
+def _state(*boxes):
+    return tuple(box.toPlainText() for box in boxes)
+
+
+def _type(qapp, box, position, text):
+    box.setFocus()
+    cursor = box.textCursor()
+    cursor.setPosition(position)
+    cursor.insertText(text)
+    qapp.processEvents()
+    shared_story_flow().flush()
+
+
+def test_linking_flows_the_overflow_into_the_next_box(view):
+    first, second = _linked_boxes(view, "alpha " * 200)
+    assert second.toPlainText()
+    assert overflow_offset(first) is None
+    assert story_boxes(first) == [first, second]
+    assert story_text([first, second]) == "alpha " * 200
+
+
+def test_typing_and_the_flow_it_causes_are_one_undo_step(qapp, view):
+    first, second = _linked_boxes(view, "alpha " * 40)
+    before = _state(first, second)
+    _type(qapp, first, 0, "NEW TEXT " * 10)
+    after = _state(first, second)
+    assert after[1] != before[1]
+    assert len(view.undo_stack.undo_commands) == 1
+    assert isinstance(view.undo_stack.undo_commands[-1], TextEditCommand)
+
+    view.undo()
+    shared_story_flow().flush()
+    assert _state(first, second) == before
+    view.redo()
+    shared_story_flow().flush()
+    assert _state(first, second) == after
+
+
+def test_separate_edits_undo_one_at_a_time(qapp, view):
+    first, second = _linked_boxes(view, "alpha " * 40)
+    states = [_state(first, second)]
+    for text in ("x", "y"):
+        _type(qapp, second, 0, text)
+        view.undo_stack._last_push_time = 0.0   # Past the merge window
+        states.append(_state(first, second))
+
+    for expected in reversed(states[:-1]):
+        view.undo()
+        shared_story_flow().flush()
+        assert _state(first, second) == expected
+    for expected in states[1:]:
+        view.redo()
+        shared_story_flow().flush()
+        assert _state(first, second) == expected
+
+
+def test_undo_is_skipped_when_a_box_lost_its_history(qapp, view):
+    first, second = _linked_boxes(view, "alpha " * 40)
+    _type(qapp, first, 0, "NEW ")
+    command = view.undo_stack.undo_commands[-1]
+    first.document().clearUndoRedoStacks()
+    current = _state(first, second)
+    view.undo()
+    assert command.skipped
+    assert _state(first, second) == current
+
+
+def _chain(view, count):
+    boxes = [view.add_text_box(10, 10 + 120 * i, 300, 100, scene=view.scene) for i in range(count)]
+    for box in boxes:
+        box.setPlainText("")
+    for box, following in zip(boxes, boxes[1:]):
+        box.next_box, following.prev_box = following, box
+    return boxes
+
+
+def test_text_carried_to_a_removed_box_goes_back_to_the_box_before(view):
+    boxes = _chain(view, 3)
+    flow = shared_story_flow()
+    flow.flush()
+    text = "".join(f"line {i} " * 8 for i in range(60))
+    flow.hold()
+    boxes[0].setPlainText(text)
+    flow.flow_box(boxes[0])
+    assert boxes[1] in flow.carries
+    view.scene.removeItem(boxes[1])
+    flow.release()
+    flow.flush()
+
+    assert not flow.carries
+    assert story_text([boxes[0], boxes[1], boxes[2]]).replace(" ", "") == text
+    assert boxes[0].toPlainText().startswith("line 0") and overflow_offset(boxes[0]) is not None
+
+
+def test_text_carried_to_a_removed_head_stays_with_it(view):
+    boxes = _chain(view, 2)
+    flow = shared_story_flow()
+    flow.flush()
+    carry_text = "carried " * 20
+    # Text waiting in front of the head, e.g. poured back from a removed box after it
+    carry = QTextDocument()
+    carry.setPlainText(carry_text)
+    boxes[0].setPlainText("own")
+    flow.carries[boxes[0]] = (carry, True)
+    view.scene.removeItem(boxes[0])
+    flow.flow_box(boxes[0])
+    assert boxes[0].toPlainText() == carry_text + "own"
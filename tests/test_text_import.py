@@ -0,0 +1,98 @@
+from PyQt6.QtGui import QTextCursor
+
+from src.engine.text_flow import shared_story_flow, story_boxes
+from src.engine.text_import import TextImportCommand
+from src.engine.undo_stack import TextEditCommand
+
+
+def _write(tmp_path, text):
+    path = tmp_path / "text.txt"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def _import(qapp, view, path):
+    batch = view.import_text_file(path)
+    batch.start()
+    while not batch.finished:
+        qapp.processEvents()
+    shared_story_flow().flush()
+    return batch
+
+
+def _box(view, text):
+    box = view.add_text_box(10, 10, 300, 200, scene=view.scene)
+    box.setPlainText(text)
+    box.document().clearUndoRedoStacks()
+    view.undo_stack.clear()
+    return box
+
+
+def _type_at_end(box, text):
+    cursor = box.textCursor()
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    cursor.insertText(text)
+    box.setTextCursor(cursor)
+
+
+def test_import_keeps_the_target_history(qapp, view, tmp_path):
+    box = _box(view, "start")
+    box.setFocus()
+    _type_at_end(box, " typed")
+
+    _import(qapp, view, _write(tmp_path, "imported\n"))
+    assert box.toPlainText() == "start typedimported\n"
+    assert isinstance(view.undo_stack.undo_commands[-1], TextImportCommand)
+
+    view.scene.clearFocus()
+    view.undo()
+    assert box.toPlainText() == "start typed"
+    # Typing before the import can still be undone
+    box.document().undo()
+    assert box.toPlainText() == "start"
+
+
+def test_import_into_a_linked_box_is_one_step_after_earlier_typing(qapp, view, tmp_path):
+    box = _box(view, "")
+    following = _box(view, "")
+    view.linking_source = box
+    view.finish_linking(following)
+    view.undo_stack.clear()
+    box.setFocus()
+    _type_at_end(box, "typed")
+    qapp.processEvents()
+    assert [type(c) for c in view.undo_stack.undo_commands] == [TextEditCommand]
+    view.undo_stack._last_push_time = 0.0   # Past the merge window
+
+    batch = _import(qapp, view, _write(tmp_path, "imported line\n" * 10))
+    # The import, with the flow into the box linked after it, is one step
+    assert len(view.undo_stack.undo_commands) == 2
+    assert following.toPlainText()
+
+    view.scene.clearFocus()
+    view.undo()
+    assert not batch.command.skipped
+    assert box.toPlainText() == "typed" and box.next_box is following
+    assert following.toPlainText() == ""
+    view.undo()
+    assert not view.undo_stack.redo_commands[-1].skipped
+    assert box.toPlainText() == ""
+
+
+def test_import_over_several_pages_undoes_and_redoes(qapp, view, tmp_path):
+    box = _box(view, "")
+    box.setFocus()
+    text = "".join(f"paragraph {i} " * 12 + "\n" for i in range(200))
+    _import(qapp, view, _write(tmp_path, text))
+    pages = view.page_manager.page_count()
+    assert pages > 2
+    boxes = story_boxes(box)
+    imported = [b.toPlainText() for b in boxes]
+
+    view.scene.clearFocus()
+    view.undo()
+    assert view.page_manager.page_count() == 1
+    assert box.toPlainText() == "" and box.next_box is None
+    view.redo()
+    assert view.page_manager.page_count() == pages
+    assert [b.toPlainText() for b in story_boxes(box)] == imported
@@ -0,0 +1,155 @@
+import pytest
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QFont, QTextBlockFormat, QTextCharFormat, QTextCursor, QTextDocument
+
+from src.engine.text_layout import ParagraphLayouts
+
+URDU = "یہ ایک جملہ ہے جو اردو میں لکھا گیا ہے اور یہ کافی لمبا ہے تاکہ کئی سطروں میں ٹوٹ جائے۔ "
+ENGLISH = "The quick brown fox jumps over the lazy dog again and again. "
+
+
+def _document(text):
+    document = QTextDocument()
+    document.setDefaultFont(QFont("Arial", 24))
+    document.setTextWidth(300)
+    QTextCursor(document).insertText(text)
+    return document
+
+
+def _set_block_format(document, **properties):
+    block_format = QTextBlockFormat()
+    for name, value in properties.items():
+        getattr(block_format, name)(*value)
+    cursor = QTextCursor(document)
+    cursor.select(QTextCursor.SelectionType.Document)
+    cursor.mergeBlockFormat(block_format)
+
+
+def _qt_lines(document):
+    """(offset, length, top, height, x, width) of every line as Qt's document layout places it"""
+    layout = document.documentLayout()
+    margin = document.documentMargin()
+    lines = []
+    block = document.begin()
+    while block.isValid():
+        layout.blockBoundingRect(block)
+        block_layout = block.layout()
+        top = block_layout.position().y() - margin
+        for i in range(block_layout.lineCount()):
+            line = block_layout.lineAt(i)
+            rect = line.naturalTextRect()
+            lines.append((block.position() + line.textStart(), line.textLength(), round(top + line.y(), 2),
+                          round(line.height(), 2), round(block_layout.position().x() + rect.x(), 2),
+                          round(rect.width(), 2)))
+        block = block.next()
+    return lines
+
+
+def _cached_lines(layouts, document):
+    margin = document.documentMargin()
+    return [(block.position() + line.start, line.length, round(top + line.top, 2), round(line.height, 2),
+             round(margin + line.x, 2), round(line.width, 2))
+            for block, lines, top in layouts.document_lines(document) for line in lines.lines]
+
+
+def _plain():
+    return _document((ENGLISH * 3 + "\n") * 3)
+
+
+def _mixed():
+    return _document((URDU * 2 + "\n" + ENGLISH + URDU + "\n") * 2)
+
+
+def _formatted():
+    document = _document(ENGLISH * 2)
+    cursor = QTextCursor(document)
+    cursor.movePosition(QTextCursor.MoveOperation.End)
+    bigger = QTextCharFormat()
+    bigger.setFontPointSize(36)
+    cursor.insertText(ENGLISH, bigger)
+    cursor.insertText("\n" + URDU)
+    return document
+
+
+def _line_spacing():
+    document = _document((ENGLISH * 2 + "\n") * 3 + URDU)
+    _set_block_format(document, setLineHeight=(80, 1))
+    return document
+
+
+def _margins():
+    document = _document((ENGLISH * 2 + "\n") * 2 + URDU * 2)
+    _set_block_format(document, setLeftMargin=(20,), setRightMargin=(10,), setTextIndent=(30,),
+                      setTopMargin=(7,), setBottomMargin=(11,))
+    return document
+
+
+def _aligned_right():
+    document = _document(ENGLISH * 2 + "\n" + URDU * 2)
+    _set_block_format(document, setAlignment=(Qt.AlignmentFlag.AlignRight,), setTextIndent=(15,))
+    return document
+
+
+def _justified():
+    document = _document(ENGLISH * 2 + "\n" + URDU * 2)
+    _set_block_format(document, setAlignment=(Qt.AlignmentFlag.AlignJustify,))
+    return document
+
+
+@pytest.mark.parametrize("make", [_plain, _mixed, _formatted, _line_spacing, _margins, _aligned_right,
+                                  _justified])
+def test_lines_are_placed_as_qt_lays_the_document_out(qapp, make):
+    document = make()
+    layouts = ParagraphLayouts()
+    assert _cached_lines(layouts, document) == _qt_lines(document)
+    size = document.documentLayout().documentSize().height() - 2 * document.documentMargin()
+    assert layouts.text_height(document) == pytest.approx(size, abs=0.01)
+
+
+def test_only_changed_paragraphs_are_shaped_again(qapp):
+    document = _document("\n".join(f"{i}. " + ENGLISH * 2 for i in range(5)))
+    layouts = ParagraphLayouts()
+    list(layouts.document_lines(document))
+    assert layouts.stats()["misses"] == 5
+
+    cursor = QTextCursor(document.findBlockByNumber(2))
+    cursor.insertText("Edited. ")
+    list(layouts.document_lines(document))
+    stats = layouts.stats()
+    assert (stats["misses"], stats["hits"]) == (6, 4)
+
+
+def test_new_widths_reuse_the_shaped_paragraph(qapp):
+    document = _document("\n".join(f"{i}. " + ENGLISH + URDU for i in range(3)))
+    layouts = ParagraphLayouts()
+    narrow = _cached_lines(layouts, document)
+    list(layouts.document_lines(document, 500))
+    assert layouts.stats()["width_misses"] == document.blockCount()
+    # Back at the first width the lines are known
+    assert _cached_lines(layouts, document) == narrow
+    assert layouts.stats()["hits"] == document.blockCount()
+    assert layouts.stats()["misses"] == document.blockCount()
+
+
+def test_a_changed_format_is_a_different_paragraph(qapp):
+    document = _plain()
+    layouts = ParagraphLayouts()
+    before = _cached_lines(layouts, document)
+    cursor = QTextCursor(document)
+    cursor.select(QTextCursor.SelectionType.Document)
+    bigger = QTextCharFormat()
+    bigger.setFontPointSize(36)
+    cursor.mergeCharFormat(bigger)
+    after = _cached_lines(layouts, document)
+    assert after == _qt_lines(document) and after != before
+
+
+def test_resize_drag_lays_the_document_out_once_it_ends(qapp, view):
+    box = view.add_text_box(10, 10, 300, 200, scene=view.scene)
+    box.setPlainText(ENGLISH * 3)
+    box.begin_handle_drag(3, box.mapToScene(QPointF(300, 100)))
+    box.drag_handle(box.mapToScene(QPointF(400, 100)))
+    assert box.boundingRect().width() == 400
+    assert box.textWidth() == 300
+    box.end_handle_drag()
+    assert box.drag_width is None and box.textWidth() == 400
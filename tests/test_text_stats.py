@@ -0,0 +1,119 @@
+import random
+
+import pytest
+from PyQt6.QtGui import QTextCursor, QTextDocument
+
+from src.engine.text_stats import TextStats, count_paragraph, count_text
+
+ZWNJ = "\u200c"
+ZABAR = "\u064e"
+
+
+@pytest.mark.parametrize("text, words", [
+    ("", 0),
+    ("   ", 0),
+    ("one two  three", 3),
+    ("کتاب" + ZWNJ + "وں", 1),         # Joiners stay inside the word
+    ("ک" + ZABAR + "تاب", 1),            # So do aerab
+    ("یہ کتاب ہے۔وہ قلم ہے", 6),         # Full stop separates words
+    ("ایک،دو؛تین؟", 3),
+    ("page 26", 2),
+])
+def test_words(text, words):
+    assert count_paragraph(text)[0] == words
+
+
+def test_characters_spaces_and_paragraphs():
+    assert count_paragraph("ab c") == (2, 4, 3, 1)
+    # A paragraph of spaces has characters but isn't counted as a paragraph
+    assert count_paragraph("  ") == (0, 2, 0, 0)
+    assert count_paragraph("") == (0, 0, 0, 0)
+
+
+def test_count_text_adds_up_its_paragraphs():
+    assert count_text("one two\n\nthree\u2029four") == (4, 16, 15, 3)
+
+
+def _document(text):
+    document = QTextDocument()
+    document.setPlainText(text)
+    return document
+
+
+def _full_count(document):
+    return count_text(document.toRawText())
+
+
+def test_counts_match_the_text(qapp):
+    document = _document("یہ کتاب ہے\n\nsecond paragraph here")
+    assert TextStats(document).counts() == _full_count(document)
+
+
+def test_typing_recounts_only_its_paragraph(qapp):
+    document = _document("\n".join(f"paragraph {i}" for i in range(20)))
+    stats = TextStats(document)
+    stats.counts()
+    assert stats.recounted == 20
+
+    cursor = QTextCursor(document.findBlockByNumber(7))
+    cursor.movePosition(QTextCursor.MoveOperation.EndOfBlock)
+    cursor.insertText(" more words")
+    assert stats.counts() == _full_count(document)
+    assert stats.recounted == 21
+
+
+@pytest.mark.parametrize("edit", [
+    "split", "join", "remove_paragraphs", "paste_paragraphs", "replace_all", "undo",
+])
+def test_incremental_counts_follow_edits(qapp, edit):
+    document = _document("first paragraph\nsecond one here\nthird\n\nfifth کتاب ہے")
+    stats = TextStats(document)
+    stats.counts()
+    cursor = QTextCursor(document)
+    if edit == "split":
+        cursor.setPosition(6)
+        cursor.insertBlock()
+    elif edit == "join":
+        cursor.setPosition(document.findBlockByNumber(1).position())
+        cursor.deletePreviousChar()
+    elif edit == "remove_paragraphs":
+        cursor.setPosition(3)
+        cursor.setPosition(document.findBlockByNumber(3).position(), QTextCursor.MoveMode.KeepAnchor)
+        cursor.removeSelectedText()
+    elif edit == "paste_paragraphs":
+        cursor.setPosition(10)
+        cursor.insertText("pasted\nlines of\n\ntext ")
+    elif edit == "replace_all":
+        cursor.select(QTextCursor.SelectionType.Document)
+        cursor.insertText("all new")
+    elif edit == "undo":
+        cursor.setPosition(5)
+        cursor.insertText(" x\ny z")
+        document.undo()
+    assert stats.counts() == _full_count(document)
+
+
+def test_random_edits_keep_the_counts(qapp):
+    rng = random.Random(26)
+    pieces = ["word ", "کتاب", "\n", " ", "ہے۔", ZWNJ, ZABAR, "\n\n", "two words"]
+    document = _document("start")
+    stats = TextStats(document)
+    stats.counts()
+    for _ in range(300):
+        cursor = QTextCursor(document)
+        end = document.characterCount() - 1
+        cursor.setPosition(rng.randint(0, end))
+        if rng.random() < 0.35:
+            cursor.setPosition(rng.randint(0, end), QTextCursor.MoveMode.KeepAnchor)
+            cursor.removeSelectedText()
+        else:
+            cursor.insertText(rng.choice(pieces))
+        assert stats.counts() == _full_count(document)
+
+
+def test_changes_before_the_first_count_are_not_tracked(qapp):
+    document = _document("one")
+    stats = TextStats(document)
+    QTextCursor(document).insertText("zero ")
+    assert stats.recounted == 0
+    assert stats.counts() == _full_count(document)
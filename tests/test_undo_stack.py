@@ -0,0 +1,216 @@
+from PyQt6.QtCore import QPointF, QRectF
+from PyQt6.QtGui import QPen, QColor
+from PyQt6.QtWidgets import QGraphicsScene, QGraphicsRectItem
+
+from src.engine import undo_stack as undo_module
+from src.engine.undo_stack import (UndoStack, AddItemsCommand, RemoveItemsCommand, GeometryCommand,
+                                   PropertyCommand, GroupCommand, UngroupCommand, MacroCommand,
+                                   capture_geometry)
+
+
+def _rect(scene=None):
+    item = QGraphicsRectItem(QRectF(0, 0, 10, 10))
+    if scene is not None:
+        scene.addItem(item)
+    return item
+
+
+def _move(item, x, y):
+    before = capture_geometry(item)
+    item.setPos(QPointF(x, y))
+    return GeometryCommand([(item, before, capture_geometry(item))], merge_key=("move", id(item)))
+
+
+def test_add_and_remove_round_trip():
+    scene = QGraphicsScene()
+    stack = UndoStack()
+    item = _rect(scene)
+    stack.push(AddItemsCommand(scene, [item]))
+    stack.undo()
+    assert item.scene() is None
+    stack.redo()
+    assert item.scene() is scene
+
+    scene.removeItem(item)
+    stack.push(RemoveItemsCommand(scene, [item]))
+    stack.undo()
+    assert item.scene() is scene
+    stack.redo()
+    assert item.scene() is None
+
+
+def test_geometry_round_trip():
+    scene = QGraphicsScene()
+    stack = UndoStack()
+    item = _rect(scene)
+    stack.push(_move(item, 30, 40))
+    stack.undo()
+    assert item.pos() == QPointF(0, 0)
+    stack.redo()
+    assert item.pos() == QPointF(30, 40)
+
+
+def test_property_round_trip():
+    scene = QGraphicsScene()
+    stack = UndoStack()
+    item = _rect(scene)
+    before, after = QPen(QColor("black")), QPen(QColor("red"), 3)
+    item.setPen(after)
+    stack.push(PropertyCommand([item], "setPen", [before], [after]))
+    stack.undo()
+    assert item.pen().color() == QColor("black")
+    stack.redo()
+    assert item.pen().color() == QColor("red") and item.pen().width() == 3
+
+
+def test_group_round_trip():
+    scene = QGraphicsScene()
+    stack = UndoStack()
+    items = [_rect(scene), _rect(scene)]
+    group = scene.createItemGroup(items)
+    stack.push(GroupCommand(scene, group, items))
+    stack.undo()
+    assert group.scene() is None and all(item.parentItem() is None for item in items)
+    stack.redo()
+    assert group.scene() is scene and all(item.parentItem() is group for item in items)
+
+
+def test_ungroup_round_trip():
+    scene = QGraphicsScene()
+    stack = UndoStack()
+    items = [_rect(scene), _rect(scene)]
+    group = scene.createItemGroup(items)
+    command = UngroupCommand(scene, group)
+    command.redo()
+    stack.push(command)
+    assert group.scene() is None and all(item.parentItem() is None for item in items)
+    stack.undo()
+    assert group.scene() is scene and all(item.parentItem() is group for item in items)
+    stack.redo()
+    assert all(item.parentItem() is None for item in items)
+
+
+def test_macro_undoes_in_reverse_order():
+    scene = QGraphicsScene()
+    stack = UndoStack()
+    item = _rect(scene)
+    first, second = _move(item, 10, 0), _move(item, 20, 0)
+    stack.push(MacroCommand([first, second]))
+    stack.undo()
+    assert item.pos() == QPointF(0, 0)
+    stack.redo()
+    assert item.pos() == QPointF(20, 0)
+
+
+def test_merges_only_within_the_merge_window(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(undo_module.time, "monotonic", lambda: now[0])
+    scene = QGraphicsScene()
+    stack = UndoStack(merge_interval=1.5)
+    item = _rect(scene)
+    stack.push(_move(item, 10, 0))
+    now[0] += 1.0
+    stack.push(_move(item, 20, 0))
+    assert len(stack.undo_commands) == 1
+    now[0] += 2.0
+    stack.push(_move(item, 30, 0))
+    assert len(stack.undo_commands) == 2
+
+    stack.undo()
+    assert item.pos() == QPointF(20, 0)
+    stack.undo()
+    assert item.pos() == QPointF(0, 0)
+
+
+def test_no_merge_into_a_redone_command(monkeypatch):
+    monkeypatch.setattr(undo_module.time, "monotonic", lambda: 100.0)
+    scene = QGraphicsScene()
+    stack = UndoStack()
+    item = _rect(scene)
+    stack.push(_move(item, 10, 0))
+    stack.undo()
+    stack.redo()
+    stack.push(_move(item, 20, 0))
+    assert len(stack.undo_commands) == 2
+
+
+def test_memory_budget_drops_oldest_steps():
+    scene = QGraphicsScene()
+    item = _rect(scene)
+    step_cost = PropertyCommand([item], "setZValue", [0], [1]).cost()
+    stack = UndoStack(memory_budget=step_cost * 3)
+    for z in range(10):
+        stack.push(PropertyCommand([item], "setZValue", [z], [z + 1]), merge=False)
+    assert len(stack.undo_commands) == 3
+    assert stack.memory_used() <= stack.memory_budget
+    assert stack.undo_commands[0].after == [8]
+
+
+def test_memory_budget_keeps_the_latest_step():
+    scene = QGraphicsScene()
+    stack = UndoStack(memory_budget=10)
+    stack.push(AddItemsCommand(scene, [_rect(scene)]))
+    assert len(stack.undo_commands) == 1
+
+
+def test_new_push_drops_redo_memory():
+    scene = QGraphicsScene()
+    stack = UndoStack()
+    item = _rect(scene)
+    stack.push(_move(item, 10, 0), merge=False)
+    stack.push(_move(item, 20, 0), merge=False)
+    stack.undo()
+    stack.push(_move(item, 30, 0), merge=False)
+    assert not stack.can_redo()
+    assert stack.memory_used() == sum(c.recorded_cost for c in stack.undo_commands)
+
+
+def test_extend_top_joins_the_latest_step():
+    scene = QGraphicsScene()
+    stack = UndoStack()
+    item, other = _rect(scene), _rect(scene)
+    stack.push(_move(item, 10, 0))
+    assert stack.extend_top(_move(other, 5, 5))
+    assert len(stack.undo_commands) == 1
+    stack.undo()
+    assert item.pos() == QPointF(0, 0) and other.pos() == QPointF(0, 0)
+    # Not once the step has been undone or redone
+    stack.redo()
+    assert not stack.extend_top(_move(other, 9, 9))
+
+
+def test_discard_scene_cuts_history_at_its_latest_step():
+    kept, gone = QGraphicsScene(), QGraphicsScene()
+    stack = UndoStack()
+    item, other = _rect(kept), _rect(gone)
+    stack.push(_move(item, 10, 0), merge=False)
+    stack.push(_move(other, 10, 0), merge=False)
+    stack.push(_move(item, 20, 0), merge=False)
+    stack.push(_move(item, 30, 0), merge=False)
+    stack.undo()
+    stack.push(_move(other, 5, 0), merge=False)   # Drops the redo step
+    stack.push(_move(item, 40, 0), merge=False)
+    stack.undo()
+
+    stack.discard_scene(gone)
+    # Undo stops at the discarded step instead of replaying older moves around it
+    assert len(stack.undo_commands) == 0
+    assert [c.changes[0][0] for c in stack.redo_commands] == [item]
+    assert stack.memory_used() == stack.redo_commands[0].recorded_cost
+    stack.redo()
+    assert item.pos() == QPointF(40, 0)
+
+
+def test_discard_scene_keeps_redo_steps_before_its_first_use():
+    kept, gone = QGraphicsScene(), QGraphicsScene()
+    stack = UndoStack()
+    item, other = _rect(kept), _rect(gone)
+    stack.push(_move(item, 10, 0), merge=False)
+    stack.push(_move(other, 10, 0), merge=False)
+    stack.push(_move(item, 20, 0), merge=False)
+    stack.undo()
+    stack.undo()
+    stack.discard_scene(gone)
+    assert list(stack.undo_commands) and not stack.redo_commands
+    stack.undo()
+    assert item.pos() == QPointF(0, 0)
@@ -0,0 +1,203 @@
+import json
+import os
+import zipfile
+
+import pytest
+
+from PyQt6.QtGui import QImage, QColor
+
+from src.engine.page_manager import PageManager
+from src.engine.shape_items import ImageItem
+from src.engine.text_box import TextBox
+from src.engine.text_flow import shared_story_flow, story_boxes
+from src.engine.batch_replace import story_text
+from src.engine.upg_container import (save_container, UpgReader, UpgWriter, MANIFEST_DIR, APPEND_JOURNAL_SUFFIX,
+                                      _write_append_journal)
+
+
+def _text_box(page, text):
+    box = TextBox(font_family="Arial", locked=False)
+    box.setTextWidth(300)
+    box.box_height = 200
+    page.scene.addItem(box)
+    box.setPlainText(text)
+    return box
+
+
+def _texts(page_manager):
+    return [sorted(item.toPlainText() for item in page.scene.items() if isinstance(item, TextBox))
+            for page in page_manager.pages]
+
+
+def _load(path):
+    page_manager = PageManager()
+    with UpgReader(path) as reader:
+        page_manager.load_container(reader)
+        texts = _texts(page_manager)
+    return page_manager, texts
+
+
+def _manifests(path):
+    with zipfile.ZipFile(path) as zf:
+        return sorted(name for name in zf.namelist() if name.startswith(MANIFEST_DIR))
+
+
+def test_save_and_load(tmp_path):
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    page_manager.add_page()
+    _text_box(page_manager.pages[0], "پہلا صفحہ")
+    _text_box(page_manager.pages[1], "second page")
+    page_manager.current_page_index = 1
+
+    assert save_container(path, page_manager) == (2, 0)
+    loaded, texts = _load(path)
+    assert texts == [["پہلا صفحہ"], ["second page"]]
+    assert loaded.current_page_index == 1
+    assert [page.uid for page in loaded.pages] == [page.uid for page in page_manager.pages]
+    assert not any(page.is_dirty() for page in page_manager.pages)
+
+
+def test_incremental_save_appends_changed_pages_only(tmp_path):
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    page_manager.add_page()
+    _text_box(page_manager.pages[0], "one")
+    box = _text_box(page_manager.pages[1], "two")
+    save_container(path, page_manager)
+
+    box.setPlainText("two, edited")
+    writer = UpgWriter(path)
+    writer.save(page_manager)
+    assert writer.pages_written == 1
+    assert _manifests(path) == [MANIFEST_DIR + "1.json", MANIFEST_DIR + "2.json"]
+    assert _load(path)[1] == [["one"], ["two, edited"]]
+
+
+def test_save_without_changes_leaves_the_file_alone(tmp_path):
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    _text_box(page_manager.pages[0], "one")
+    save_container(path, page_manager)
+    size, mtime = os.path.getsize(path), os.stat(path).st_mtime_ns
+
+    assert save_container(path, page_manager) == (0, 0)
+    assert _manifests(path) == [MANIFEST_DIR + "1.json"]
+    assert (os.path.getsize(path), os.stat(path).st_mtime_ns) == (size, mtime)
+
+
+def test_reordered_pages_get_a_new_manifest(tmp_path):
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    page_manager.add_page()
+    _text_box(page_manager.pages[0], "one")
+    _text_box(page_manager.pages[1], "two")
+    save_container(path, page_manager)
+
+    page_manager.move_page(1, 0)
+    assert save_container(path, page_manager) == (0, 0)
+    assert _load(path)[1] == [["two"], ["one"]]
+
+
+def test_failed_incremental_save_keeps_the_old_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    box = _text_box(page_manager.pages[0], "one")
+    save_container(path, page_manager)
+    with open(path, 'rb') as f:
+        saved = f.read()
+
+    box.setPlainText("changed")
+
+    def fail(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(UpgWriter, "_write_manifest", fail)
+    with pytest.raises(OSError):
+        save_container(path, page_manager)
+    with open(path, 'rb') as f:
+        assert f.read() == saved
+    assert [name for name in os.listdir(tmp_path) if name != "doc.upg"] == []
+
+
+
+def test_incremental_save_appends_in_place(tmp_path):
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    box = _text_box(page_manager.pages[0], "one")
+    save_container(path, page_manager)
+    with zipfile.ZipFile(path) as zf:
+        offset = zf.start_dir
+    with open(path, 'rb') as f:
+        entries = f.read(offset)
+    inode = os.stat(path).st_ino
+
+    box.setPlainText("two")
+    save_container(path, page_manager)
+    with open(path, 'rb') as f:
+        assert f.read(offset) == entries
+    assert os.stat(path).st_ino == inode
+    assert not os.path.exists(path + APPEND_JOURNAL_SUFFIX)
+
+
+def test_torn_append_is_rolled_back_on_open(tmp_path):
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    _text_box(page_manager.pages[0], "one")
+    save_container(path, page_manager)
+    with zipfile.ZipFile(path) as zf:
+        offset = zf.start_dir
+    # A save that died after overwriting the central directory
+    _write_append_journal(path, offset)
+    with open(path, 'r+b') as f:
+        f.seek(offset)
+        f.write(b"half a page entry" * 64)
+        f.truncate()
+
+    assert _load(path)[1] == [["one"]]
+    assert not os.path.exists(path + APPEND_JOURNAL_SUFFIX)
+
+
+
+def test_page_entries_hold_the_page_and_its_images(tmp_path):
+    path = str(tmp_path / "doc.upg")
+    image_path = str(tmp_path / "red.png")
+    image = QImage(8, 8, QImage.Format.Format_RGB32)
+    image.fill(QColor("red"))
+    image.save(image_path)
+    page_manager = PageManager()
+    page = page_manager.pages[0]
+    _text_box(page, "caption")
+    page.scene.addItem(ImageItem(image_path))
+    page.scene.addItem(ImageItem(image_path))
+
+    assert save_container(path, page_manager) == (1, 1)
+    with zipfile.ZipFile(path) as zf:
+        stored = json.loads(zf.read(page.container_entry).decode('utf-8'))
+    expected = page.to_dict()
+    assert [item.get("type") for item in stored["items"]] == [item.get("type") for item in expected["items"]]
+    assets = {item["image_asset"] for item in stored["items"] if "image_path" in item}
+    assert len(assets) == 1
+    assert {key: stored[key] for key in ("uid", "width", "height", "page_number")} == \
+        {key: expected[key] for key in ("uid", "width", "height", "page_number")}
+
+
+def test_linked_boxes_survive_save_and_load(tmp_path):
+    path = str(tmp_path / "doc.upg")
+    page_manager = PageManager()
+    page_manager.add_page()
+    first = _text_box(page_manager.pages[0], "")
+    second = _text_box(page_manager.pages[1], "")
+    first.next_box, second.prev_box = second, first
+    first.setPlainText("alpha beta gamma " * 60)
+    shared_story_flow().flush()
+    text = story_text(story_boxes(first))
+    assert second.document().characterCount() > 1
+    save_container(path, page_manager)
+
+    loaded = PageManager()
+    with UpgReader(path) as reader:
+        loaded.load_container(reader)
+        box = next(item for item in loaded.pages[1].scene.items() if isinstance(item, TextBox))
+        boxes = story_boxes(box)
+    assert len(boxes) == 2
+    assert story_text(boxes) == text